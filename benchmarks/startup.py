@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+from argparse import ArgumentParser
+import subprocess
+import json
+import time
+import sys
+import os
+
+__author__ = 'adamkoziol'
+
+# Maximum time in seconds, above the start up time of the interpreter, of each path through the entry point
+budget = 0.5
+
+script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'geneseekr', 'GeneSeekr')
+
+# Packages that must not be imported until a subcommand runs
+heavy = ['genemethods', 'olctools', 'numpy', 'Bio', 'xlsxwriter', 'geneseekr.blast', 'geneseekr.kma']
+
+# Runs the entry point with the supplied arguments, and writes the heavy packages that were imported as the last line of
+# stderr. A run_name other than __main__ imports the script without running the command group
+probe = '''
+import runpy
+import json
+import sys
+script, run_name, args = sys.argv[1], sys.argv[2], sys.argv[3:]
+sys.argv = [script] + args
+try:
+    runpy.run_path(script, run_name=run_name)
+except SystemExit:
+    pass
+finally:
+    sys.stderr.write('\\n' + json.dumps(sorted(name for name in {heavy} if name in sys.modules)) + '\\n')
+'''.format(heavy=heavy)
+
+# Name: (run name, arguments) of the timed paths through the entry point
+cases = [
+    ('import', ('GeneSeekr', ['blastn'])),
+    ('--help', ('__main__', ['--help'])),
+    ('blastn --help', ('__main__', ['blastn', '--help'])),
+    ('blastn --version', ('__main__', ['blastn', '--version'])),
+    ('usage error', ('__main__', ['blastn'])),
+]
+
+# Paths that must not import the heavy packages. Usage errors are shown with the olctools helper, which loads them
+light = ['import', '--help', 'blastn --help', 'blastn --version']
+
+
+def measure(run_name, args, repeats):
+    """
+    Time a path through the entry point in a new interpreter
+    :param run_name: __main__ to run the command group, or another name to only import the script
+    :param args: List of command line arguments
+    :param repeats: Number of times to run the command. The fastest run is reported
+    :return: Fastest elapsed time in seconds, list of heavy packages that were imported
+    """
+    elapsed = list()
+    imported = list()
+    env = dict(os.environ)
+    # The geneseekr package is imported from this checkout
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [os.path.dirname(os.path.dirname(script)),
+                                                      env.get('PYTHONPATH')]))
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', probe, script, run_name] + args,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE,
+                                universal_newlines=True,
+                                env=env)
+        elapsed.append(time.perf_counter() - start)
+        imported = json.loads(result.stderr.rstrip().splitlines()[-1])
+    return min(elapsed), imported
+
+
+def interpreter(repeats):
+    """
+    :param repeats: Number of times to start the interpreter
+    :return: Fastest time in seconds to start, and exit the interpreter
+    """
+    elapsed = list()
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'pass'])
+        elapsed.append(time.perf_counter() - start)
+    return min(elapsed)
+
+
+def startup(budget=budget, repeats=3):
+    """
+    Time each path through the entry point, and check it against the budget
+    :param budget: Maximum time in seconds, above the start up time of the interpreter, of each path
+    :param repeats: Number of times to run each path
+    :return: List of (name, time in seconds above the interpreter start up, heavy packages imported) of each path,
+    list of the failures
+    """
+    baseline = interpreter(repeats)
+    results = list()
+    failures = list()
+    for name, (run_name, args) in cases:
+        elapsed, imported = measure(run_name=run_name,
+                                    args=args,
+                                    repeats=repeats)
+        elapsed = max(elapsed - baseline, 0)
+        results.append((name, elapsed, imported))
+        if elapsed > budget:
+            failures.append('{name} took {elapsed:.3f} s, which is over the budget of {budget:.3f} s'
+                            .format(name=name,
+                                    elapsed=elapsed,
+                                    budget=budget))
+        if imported and name in light:
+            failures.append('{name} imported {packages}'.format(name=name,
+                                                                packages=', '.join(imported)))
+    return results, failures
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark the start up time of the GeneSeekr entry point. Exits with an error '
+                                        'if importing the script, --help, --version, or a usage error goes over the '
+                                        'budget, or if importing the script, --help, or --version imports the analysis '
+                                        'packages')
+    parser.add_argument('-b', '--budget',
+                        type=float,
+                        default=budget,
+                        help='Maximum time (s) of each path above the start up time of the interpreter. Default is '
+                             '{budget}'.format(budget=budget))
+    parser.add_argument('-n', '--repeats',
+                        type=int,
+                        default=3,
+                        help='Number of times to run each path. The fastest run is reported. Default is 3')
+    args = parser.parse_args()
+    results, failures = startup(budget=args.budget,
+                                repeats=args.repeats)
+    print('path\ttime (s)\theavy imports')
+    for name, elapsed, imported in results:
+        print('{name}\t{elapsed:.3f}\t{imported}'.format(name=name,
+                                                         elapsed=elapsed,
+                                                         imported=', '.join(imported) if imported else 'none'))
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,602 @@
+#!/usr/bin/env python3
+from Bio.Data.CodonTable import standard_dna_table
+from argparse import ArgumentParser
+from csv import DictReader
+from glob import glob
+import subprocess
+import platform
+import tempfile
+import random
+import shutil
+import json
+import math
+import time
+import sys
+import os
+
+__author__ = 'adamkoziol'
+
+script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'geneseekr', 'GeneSeekr')
+
+programs = ['blastn', 'blastp', 'blastx', 'tblastn', 'tblastx', 'kma']
+
+# Molecule type of the samples, and of the targets of each subcommand
+queries = {'blastn': 'nt', 'blastp': 'aa', 'blastx': 'nt', 'tblastn': 'aa', 'tblastx': 'nt', 'kma': 'nt'}
+databases = {'blastn': 'nt', 'blastp': 'aa', 'blastx': 'aa', 'tblastn': 'nt', 'tblastx': 'nt', 'kma': 'nt'}
+# The percent match of the nucleotide searches is a nucleotide identity. The other searches compare amino acids
+levels = {'blastn': 'nt', 'blastp': 'aa', 'blastx': 'aa', 'tblastn': 'aa', 'tblastx': 'aa', 'kma': 'nt'}
+
+# Codons of each amino acid. Asparagine is left out of the synthetic proteins, as the genemethods target parser
+# removes every N from the targets (it treats all targets as nucleotide sequences)
+codons = dict()
+for codon, amino_acid in sorted(standard_dna_table.forward_table.items()):
+    if amino_acid != 'N':
+        codons.setdefault(amino_acid, list()).append(codon)
+amino_acids = sorted(codons)
+
+complement = str.maketrans('ACGT', 'TGCA')
+
+
+class Gene(object):
+    """
+    Protein, and its coding sequence
+    """
+
+    def __init__(self, name, protein, nucleotide):
+        """
+        :param name: Name of the gene
+        :param protein: String of the amino acid sequence
+        :param nucleotide: String of the coding sequence
+        """
+        self.name = name
+        self.protein = protein
+        self.nucleotide = nucleotide
+
+
+def random_gene(generator, name, minimum=100, maximum=500):
+    """
+    Create a gene with a random protein sequence, and random codons
+    :param generator: random.Random object
+    :param name: Name of the gene
+    :param minimum: Minimum length of the protein
+    :param maximum: Maximum length of the protein
+    :return: Gene object
+    """
+    protein = 'M' + ''.join(generator.choices(amino_acids, k=generator.randint(minimum, maximum) - 1))
+    return Gene(name=name,
+                protein=protein,
+                nucleotide=''.join(generator.choice(codons[amino_acid]) for amino_acid in protein))
+
+
+def variant(generator, gene, identity):
+    """
+    Plant a variant of a gene with a known amino acid identity. Substituted residues are encoded with a random codon,
+    and the codons of the other residues are unchanged
+    :param generator: random.Random object
+    :param gene: Gene object
+    :param identity: Percent amino acid identity of the variant to the gene
+    :return: Gene object of the variant, percent nucleotide identity of the variant to the gene
+    """
+    protein = list(gene.protein)
+    nucleotide = [gene.nucleotide[i:i + 3] for i in range(0, len(gene.nucleotide), 3)]
+    # The start codon is kept, so the variant still starts with methionine
+    for position in generator.sample(range(1, len(protein)), round(len(protein) * (100 - identity) / 100)):
+        protein[position] = generator.choice([amino_acid for amino_acid in amino_acids
+                                              if amino_acid != protein[position]])
+        nucleotide[position] = generator.choice(codons[protein[position]])
+    planted = Gene(name=gene.name,
+                   protein=''.join(protein),
+                   nucleotide=''.join(nucleotide))
+    matches = sum(1 for original, new in zip(gene.nucleotide, planted.nucleotide) if original == new)
+    return planted, 100 * matches / len(gene.nucleotide)
+
+
+def protein_identity(gene, planted):
+    """
+    :param gene: Gene object
+    :param planted: Gene object of the variant
+    :return: Percent amino acid identity of the variant to the gene
+    """
+    return 100 * sum(1 for original, new in zip(gene.protein, planted.protein) if original == new) / len(gene.protein)
+
+
+def write_fasta(path, records):
+    """
+    :param path: Name and path of the FASTA file
+    :param records: Iterable of (name, sequence) tuples
+    """
+    with open(path, 'w') as fasta:
+        for name, sequence in records:
+            fasta.write('>{name}\n'.format(name=name))
+            for i in range(0, len(sequence), 80):
+                fasta.write(sequence[i:i + 80] + '\n')
+
+
+def targets(count, seed=0):
+    """
+    Create a seeded set of target genes
+    :param count: Number of targets
+    :param seed: Seed of the random number generator
+    :return: List of Gene objects
+    """
+    generator = random.Random('{seed}_targets_{count}'.format(seed=seed,
+                                                               count=count))
+    return [random_gene(generator=generator,
+                        name='target_{index:05d}'.format(index=index)) for index in range(count)]
+
+
+def sample(genes, index, genome_size=100000, contigs=10, planted=10, identities=(100, 99, 95, 90, 85), seed=0):
+    """
+    Create a seeded synthetic sample with variants of some of the targets planted at known identities
+    :param genes: List of Gene objects of the targets
+    :param index: Number of the sample
+    :param genome_size: Length of the nucleotide genome. The protein samples have a third as many residues
+    :param contigs: Number of contigs of the nucleotide genome
+    :param planted: Number of targets to plant in the sample
+    :param identities: Amino acid identities of the planted variants. The identities are used in turn
+    :param seed: Seed of the random number generator
+    :return: Name of the sample, list of (name, sequence) of the contigs, list of (name, sequence) of the proteins,
+    dictionary of target: dictionary of the nucleotide (nt) and amino acid (aa) identities of the planted variants
+    """
+    generator = random.Random('{seed}_sample_{targets}_{index}'.format(seed=seed,
+                                                                       targets=len(genes),
+                                                                       index=index))
+    name = 'sample_{index:04d}'.format(index=index)
+    truth = dict()
+    variants = list()
+    for number, gene in enumerate(generator.sample(genes, min(planted, len(genes)))):
+        planted_gene, nucleotide_identity = variant(generator=generator,
+                                                    gene=gene,
+                                                    identity=identities[number % len(identities)])
+        variants.append(planted_gene)
+        truth[gene.name] = {'nt': nucleotide_identity,
+                            'aa': protein_identity(gene=gene,
+                                                   planted=planted_gene)}
+    # Insert the variants, in either orientation, between random sequences in the contigs
+    background = genome_size - sum(len(gene.nucleotide) for gene in variants)
+    pieces = [list() for _ in range(contigs)]
+    for gene in variants:
+        sequence = gene.nucleotide if generator.random() < 0.5 else gene.nucleotide.translate(complement)[::-1]
+        pieces[generator.randrange(contigs)].append(sequence)
+    contig_records = list()
+    for number, genes_in_contig in enumerate(pieces):
+        spacers = [''.join(generator.choices('ACGT', k=max(background // contigs // (len(genes_in_contig) + 1), 1)))
+                   for _ in range(len(genes_in_contig) + 1)]
+        sequence = spacers[0] + ''.join(gene + spacer for gene, spacer in zip(genes_in_contig, spacers[1:]))
+        contig_records.append(('{name}_contig_{number}'.format(name=name, number=number), sequence))
+    # The protein samples are the variants shuffled among random proteins
+    proteins = [(gene.name, gene.protein) for gene in variants]
+    for number in range(max(genome_size // 3 // 300 - len(variants), 0)):
+        proteins.append(('protein_{number}'.format(number=number),
+                         random_gene(generator=generator, name=None).protein))
+    generator.shuffle(proteins)
+    protein_records = [('{name}_protein_{number}'.format(name=name, number=number), protein)
+                       for number, (_, protein) in enumerate(proteins)]
+    return name, contig_records, protein_records, truth
+
+
+def dataset(workdir, target_count, sample_count, genome_size=100000, planted=10, identities=(100, 99, 95, 90, 85),
+            seed=0):
+    """
+    Create (if necessary) the targets, and the nucleotide and protein samples of a benchmark
+    :param workdir: Folder in which the data are stored
+    :param target_count: Number of targets
+    :param sample_count: Number of samples. Larger sets of samples include the smaller sets
+    :param genome_size: Length of the nucleotide genome of each sample
+    :param planted: Number of targets to plant in each sample
+    :param identities: Amino acid identities of the planted variants
+    :param seed: Seed of the random number generator
+    :return: Dictionary of molecule type: targets FASTA, dictionary of molecule type: list of sample FASTA files,
+    dictionary of sample name: truth
+    """
+    folder = os.path.join(workdir, 'data', 'targets_{count}'.format(count=target_count))
+    os.makedirs(folder, exist_ok=True)
+    target_files = {moltype: os.path.join(folder, 'targets_{moltype}.tfa'.format(moltype=moltype))
+                    for moltype in ['nt', 'aa']}
+    truthfile = os.path.join(folder, 'truth.json')
+    try:
+        with open(truthfile) as truth_json:
+            truth = json.load(truth_json)
+    except FileNotFoundError:
+        truth = dict()
+    genes = None
+    if not all(os.path.isfile(target_file) for target_file in target_files.values()):
+        genes = targets(count=target_count,
+                        seed=seed)
+        write_fasta(target_files['nt'], [(gene.name, gene.nucleotide) for gene in genes])
+        write_fasta(target_files['aa'], [(gene.name, gene.protein) for gene in genes])
+    sample_files = {'nt': list(), 'aa': list()}
+    for index in range(sample_count):
+        name = 'sample_{index:04d}'.format(index=index)
+        files = {moltype: os.path.join(folder, moltype, '{name}.fasta'.format(name=name)) for moltype in sample_files}
+        if name not in truth or not all(os.path.isfile(path) for path in files.values()):
+            genes = genes if genes is not None else targets(count=target_count,
+                                                            seed=seed)
+            name, contig_records, protein_records, truth[name] = sample(genes=genes,
+                                                                        index=index,
+                                                                        genome_size=genome_size,
+                                                                        planted=planted,
+                                                                        identities=identities,
+                                                                        seed=seed)
+            for moltype, records in [('nt', contig_records), ('aa', protein_records)]:
+                os.makedirs(os.path.dirname(files[moltype]), exist_ok=True)
+                write_fasta(files[moltype], records)
+        for moltype in sample_files:
+            sample_files[moltype].append(files[moltype])
+    with open(truthfile, 'w') as truth_json:
+        json.dump(truth, truth_json)
+    return target_files, sample_files, {name: truth[name] for name in sorted(truth)[:sample_count]}
+
+
+def link(source, destination):
+    """
+    Hard link a file, or copy it if the file system does not support links
+    """
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+def run(program, sequencepath, targetpath, reportpath, cutoff=70, threads=None, shards=1):
+    """
+    Run a subcommand in a new process
+    :param program: Name of the subcommand
+    :param sequencepath: Folder of the samples
+    :param targetpath: Folder of the targets
+    :param reportpath: Folder of the reports
+    :param cutoff: Minimum percent match of the reported hits
+    :param threads: Optional number of threads
+    :param shards: Number of database shards of the BLAST subcommands
+    :return: Elapsed time in seconds, peak resident set size in bytes of the process and its subprocesses, exit code
+    """
+    command = [sys.executable, script, program, '-s', sequencepath, '-t', targetpath, '-r', reportpath,
+               '-c', str(cutoff)]
+    if threads:
+        command += ['-n', str(threads)]
+    if shards > 1:
+        command += ['--shards', str(shards)]
+    env = dict(os.environ)
+    # The geneseekr package is imported from this checkout
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [os.path.dirname(os.path.dirname(script)),
+                                                      env.get('PYTHONPATH')]))
+    os.makedirs(reportpath, exist_ok=True)
+    with open(os.path.join(reportpath, 'benchmark.log'), 'w') as log:
+        start = time.perf_counter()
+        process = subprocess.Popen(command,
+                                   stdout=log,
+                                   stderr=subprocess.STDOUT,
+                                   env=env)
+        # wait4 reports the peak memory of the process, and of the searches it ran
+        _, status, usage = os.wait4(process.pid, 0)
+        elapsed = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    maxrss = usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+    return elapsed, maxrss, process.returncode
+
+
+def reported(reportpath, program, cutoff=70):
+    """
+    Find the targets in the reports of each sample
+    :param reportpath: Folder of the reports
+    :param program: Name of the subcommand
+    :param cutoff: Minimum percent match
+    :return: Dictionary of sample name: set of the reported targets
+    """
+    found = dict()
+    suffix = '_{program}_geneseekr.tsv'.format(program=program)
+    for report in glob(os.path.join(reportpath, '**', '*' + suffix), recursive=True):
+        name = os.path.basename(report)[:-len(suffix)]
+        with open(report) as tsv:
+            found[name] = {row['subject_id'] for row in DictReader(tsv, dialect='excel-tab')
+                           if row['percent_match'] and float(row['percent_match']) >= cutoff}
+    return found
+
+
+def measure(workdir, program, sample_count, target_count, genome_size=100000, planted=10,
+            identities=(100, 99, 95, 90, 85), cutoff=70, threads=None, seed=0, shards=1):
+    """
+    Time a subcommand on a synthetic data set, and check the planted targets were found
+    :return: Dictionary of the result
+    """
+    target_files, sample_files, truth = dataset(workdir=workdir,
+                                                target_count=target_count,
+                                                sample_count=sample_count,
+                                                genome_size=genome_size,
+                                                planted=planted,
+                                                identities=identities,
+                                                seed=seed)
+    # Every run starts from the targets alone, so the time to prepare the databases is included
+    rundir = os.path.join(workdir, 'runs', '{program}_{samples}_{targets}_{shards}'.format(program=program,
+                                                                                            samples=sample_count,
+                                                                                            targets=target_count,
+                                                                                            shards=shards))
+    shutil.rmtree(rundir, ignore_errors=True)
+    sequencepath = os.path.join(rundir, 'sequences')
+    targetpath = os.path.join(rundir, 'targets')
+    reportpath = os.path.join(rundir, 'reports')
+    for folder in [sequencepath, targetpath]:
+        os.makedirs(folder)
+    for sample_file in sample_files[queries[program]]:
+        link(sample_file, os.path.join(sequencepath, os.path.basename(sample_file)))
+    link(target_files[databases[program]], os.path.join(targetpath, 'targets.tfa'))
+    elapsed, maxrss, exit_code = run(program=program,
+                                     sequencepath=sequencepath,
+                                     targetpath=targetpath,
+                                     reportpath=reportpath,
+                                     cutoff=cutoff,
+                                     threads=threads,
+                                     shards=shards)
+    found = reported(reportpath=reportpath,
+                     program=program,
+                     cutoff=cutoff)
+    expected = found_count = unexpected = 0
+    for name, planted_targets in truth.items():
+        hits = found.get(name, set())
+        wanted = {target for target, identity in planted_targets.items() if identity[levels[program]] >= cutoff}
+        expected += len(wanted)
+        found_count += len(wanted & hits)
+        unexpected += len(hits - set(planted_targets))
+    residues = sum(os.path.getsize(sample_file) for sample_file in sample_files[queries[program]])
+    shutil.rmtree(rundir)
+    return {
+        'program': program,
+        'samples': sample_count,
+        'targets': target_count,
+        'shards': shards,
+        'seconds': elapsed,
+        'samples_per_second': sample_count / elapsed,
+        'bytes_per_second': residues / elapsed,
+        'peak_rss': maxrss,
+        'planted': expected,
+        'found': found_count,
+        'unexpected': unexpected,
+        'recall': found_count / expected if expected else None,
+        'exit_code': exit_code
+    }
+
+
+def scaling(results):
+    """
+    Calculate the scaling exponents between consecutive sizes: the slope of log(time) against log(samples) with the
+    targets fixed, and against log(targets) with the samples fixed. An exponent of 1 is linear scaling. The speed-up
+    of each number of database shards is relative to the unsharded run with the same samples, and targets
+    :param results: List of result dictionaries
+    :return: Dictionary of samples/targets: list of dictionaries of the exponents, and of shards: list of dictionaries
+    of the speed-ups
+    """
+    curves = {'samples': list(), 'targets': list(), 'shards': list()}
+    for variable, fixed in [('samples', 'targets'), ('targets', 'samples')]:
+        groups = dict()
+        for result in results:
+            groups.setdefault((result['program'], result[fixed], result.get('shards', 1)), list()).append(result)
+        for (program, value, shards), group in sorted(groups.items()):
+            group = sorted(group, key=lambda result: result[variable])
+            for first, second in zip(group, group[1:]):
+                curves[variable].append({
+                    'program': program,
+                    fixed: value,
+                    'shards': shards,
+                    variable: [first[variable], second[variable]],
+                    'exponent': math.log(second['seconds'] / first['seconds']) /
+                    math.log(second[variable] / first[variable])
+                })
+    unsharded = {(result['program'], result['samples'], result['targets']): result for result in results
+                 if result.get('shards', 1) == 1}
+    for result in results:
+        baseline = unsharded.get((result['program'], result['samples'], result['targets']))
+        if result.get('shards', 1) > 1 and baseline is not None:
+            curves['shards'].append({
+                'program': result['program'],
+                'samples': result['samples'],
+                'targets': result['targets'],
+                'shards': result['shards'],
+                'speedup': baseline['seconds'] / result['seconds'],
+                # Sharded searches must report the same targets as the search of the complete database
+                'same_recall': result['recall'] == baseline['recall'] and
+                result['unexpected'] == baseline['unexpected']
+            })
+    return curves
+
+
+def compare(results, baseline, tolerance=0.25):
+    """
+    Compare the results to a stored baseline
+    :param results: List of result dictionaries
+    :param baseline: Dictionary of a previous benchmark report
+    :param tolerance: Allowed fractional increase of the time, and of the peak memory
+    :return: List of the regressions
+    """
+    previous = {(result['program'], result['samples'], result['targets'], result.get('shards', 1)): result
+                for result in baseline['results']}
+    regressions = list()
+    for result in results:
+        key = (result['program'], result['samples'], result['targets'], result.get('shards', 1))
+        if key not in previous:
+            continue
+        label = '{program} with {samples} samples, and {targets} targets'.format(program=key[0],
+                                                                                 samples=key[1],
+                                                                                 targets=key[2])
+        if key[3] > 1:
+            label += ' in {shards} shards'.format(shards=key[3])
+        for metric in ['seconds', 'peak_rss']:
+            if result[metric] > previous[key][metric] * (1 + tolerance):
+                regressions.append('{label}: {metric} increased from {old:.4g} to {new:.4g}'
+                                   .format(label=label,
+                                           metric=metric,
+                                           old=previous[key][metric],
+                                           new=result[metric]))
+        if (previous[key]['recall'] or 0) > (result['recall'] or 0):
+            regressions.append('{label}: recall decreased from {old} to {new}'.format(label=label,
+                                                                                       old=previous[key]['recall'],
+                                                                                       new=result['recall']))
+    return regressions
+
+
+def environment():
+    """
+    :return: Dictionary describing the machine, and the versions of Python, and BLAST
+    """
+    try:
+        blast = subprocess.run(['blastn', '-version'],
+                               stdout=subprocess.PIPE,
+                               universal_newlines=True).stdout.splitlines()[0]
+    except (OSError, IndexError):
+        blast = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'blast': blast
+    }
+
+
+def benchmark(workdir, programs=programs, samples=(1, 10, 100, 1000), targets=(10, 1000, 50000), genome_size=100000,
+              planted=10, identities=(100, 99, 95, 90, 85), cutoff=70, threads=None, seed=0, shards=(1,)):
+    """
+    Time each subcommand with each number of samples, and of targets. The BLAST subcommands are also timed with each
+    number of database shards
+    :return: Dictionary of the benchmark report
+    """
+    results = list()
+    for target_count in targets:
+        for sample_count in samples:
+            for program in programs:
+                # kma does not search BLAST databases, so it is not sharded
+                for shard_count in shards if program != 'kma' else [1]:
+                    results.append(measure(workdir=workdir,
+                                           program=program,
+                                           sample_count=sample_count,
+                                           target_count=target_count,
+                                           genome_size=genome_size,
+                                           planted=planted,
+                                           identities=identities,
+                                           cutoff=cutoff,
+                                           threads=threads,
+                                           seed=seed,
+                                           shards=shard_count))
+    return {
+        'settings': {
+            'genome_size': genome_size,
+            'planted': planted,
+            'identities': list(identities),
+            'cutoff': cutoff,
+            'threads': threads,
+            'seed': seed,
+            'shards': list(shards)
+        },
+        'environment': environment(),
+        'results': results,
+        'scaling': scaling(results)
+    }
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark the GeneSeekr subcommands with seeded synthetic samples and '
+                                        'targets. Variants of the targets are planted in the samples at known '
+                                        'identities, and the time, throughput, peak memory, and recall of each run are '
+                                        'written as JSON. The complete default grid takes many hours. Use -p, -s, and '
+                                        '-t to run part of it')
+    parser.add_argument('-o', '--output',
+                        default='benchmark.json',
+                        help='JSON file of the results. Default is benchmark.json')
+    parser.add_argument('-b', '--baseline',
+                        help='JSON file of a previous run to compare against. Exits with an error if a run is slower, '
+                             'uses more memory, or has a lower recall than the baseline')
+    parser.add_argument('--tolerance',
+                        type=float,
+                        default=0.25,
+                        help='Allowed fractional increase of the time, and of the peak memory over the baseline. '
+                             'Default is 0.25')
+    parser.add_argument('-w', '--workdir',
+                        help='Folder in which to store the synthetic data. Data are reused by later runs with the '
+                             'same seed. Defaults to a temporary folder that is removed afterwards')
+    parser.add_argument('-p', '--programs',
+                        nargs='+',
+                        choices=programs,
+                        default=programs,
+                        help='Subcommands to benchmark. Default is all of them')
+    parser.add_argument('-s', '--samples',
+                        type=int,
+                        nargs='+',
+                        default=[1, 10, 100, 1000],
+                        help='Numbers of samples. Default is 1 10 100 1000')
+    parser.add_argument('-t', '--targets',
+                        type=int,
+                        nargs='+',
+                        default=[10, 1000, 50000],
+                        help='Numbers of targets. Default is 10 1000 50000')
+    parser.add_argument('-g', '--genome_size',
+                        type=int,
+                        default=100000,
+                        help='Length of the synthetic genome of each sample. Default is 100000')
+    parser.add_argument('--planted',
+                        type=int,
+                        default=10,
+                        help='Number of target variants planted in each sample. Default is 10')
+    parser.add_argument('-i', '--identities',
+                        type=float,
+                        nargs='+',
+                        default=[100, 99, 95, 90, 85],
+                        help='Amino acid identities of the planted variants. Default is 100 99 95 90 85')
+    parser.add_argument('-c', '--cutoff',
+                        type=int,
+                        default=70,
+                        help='Cutoff passed to the subcommands. Default is 70')
+    parser.add_argument('-n', '--numthreads',
+                        type=int,
+                        help='Number of threads passed to the subcommands. Defaults to the subcommand default')
+    parser.add_argument('--seed',
+                        type=int,
+                        default=0,
+                        help='Seed of the synthetic data. Default is 0')
+    parser.add_argument('--shards',
+                        type=int,
+                        nargs='+',
+                        default=[1],
+                        help='Numbers of database shards of the BLAST subcommands e.g. 1 2 4 8 to measure how the '
+                             'speed scales with the number of shards. Default is 1')
+    args = parser.parse_args()
+    workdir = args.workdir if args.workdir else tempfile.mkdtemp()
+    try:
+        report = benchmark(workdir=workdir,
+                           programs=args.programs,
+                           samples=args.samples,
+                           targets=args.targets,
+                           genome_size=args.genome_size,
+                           planted=args.planted,
+                           identities=args.identities,
+                           cutoff=args.cutoff,
+                           threads=args.numthreads,
+                           seed=args.seed,
+                           shards=args.shards)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir)
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=4)
+    print('program\tsamples\ttargets\tshards\ttime (s)\tsamples/s\tpeak RSS (MB)\trecall')
+    for result in report['results']:
+        print('{program}\t{samples}\t{targets}\t{shards}\t{seconds:.2f}\t{samples_per_second:.2f}\t{rss:.1f}\t{recall}'
+              .format(rss=result['peak_rss'] / 1048576,
+                      **result))
+    for curve in report['scaling']['shards']:
+        print('{program} with {samples} samples, and {targets} targets: {speedup:.2f}x faster in {shards} shards'
+              .format(**curve))
+    failures = ['{program} with {samples} samples, and {targets} targets exited with {exit_code}'.format(**result)
+                for result in report['results'] if result['exit_code']]
+    failures += ['{program} with {samples} samples, and {targets} targets found different targets in {shards} shards'
+                 .format(**curve) for curve in report['scaling']['shards'] if not curve['same_recall']]
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            failures += compare(results=report['results'],
+                                baseline=json.load(baseline),
+                                tolerance=args.tolerance)
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+from olctools.accessoryFunctions.accessoryFunctions import GenObject, MetadataObject
+from genemethods.geneseekr.geneseekr import GeneSeekr as LegacyGeneSeekr
+from geneseekr.methods import GeneSeekr
+from geneseekr.hits import HitTable
+from argparse import ArgumentParser
+import tempfile
+import random
+import shutil
+import time
+import os
+
+__author__ = 'adamkoziol'
+
+fieldnames = ['query_id', 'subject_id', 'positives', 'mismatches', 'gaps', 'evalue', 'bit_score', 'subject_length',
+              'alignment_length', 'query_start', 'query_end', 'subject_start', 'subject_end', 'percent_match',
+              'query_sequence', 'subject_sequence']
+
+
+def synthetic_report(report, hits, alleles=4, seed=0):
+    """
+    Create a header-annotated BLAST report of a single contig with hits to a series of loci, with several alleles of
+    each locus hitting at slightly different positions, as in a cgMLST analysis
+    :param report: Name and path of the report to create
+    :param hits: Total number of hits
+    :param alleles: Number of hits to each locus
+    :param seed: Seed of the random number generator
+    """
+    generator = random.Random(seed)
+    with open(report, 'w') as blast_report:
+        blast_report.write('\t'.join(fieldnames) + '\n')
+        for number in range(hits):
+            locus = number // alleles
+            length = 900 + locus % 300
+            start = locus * 1500 + generator.randint(0, 60)
+            end = start + length - generator.randint(0, 60)
+            positives = length - generator.randint(0, 30)
+            values = ['contig_1', 'locus{locus}_{allele}'.format(locus=locus, allele=number % alleles), positives, 0,
+                      0, '0.0', positives * 2, length, end - start, start, end, 1, end - start, 0, 'A', 'A']
+            # Reverse some hits, so both orientations are represented
+            if locus % 2:
+                values[9], values[10] = end, start
+            blast_report.write('\t'.join(str(value) for value in values) + '\t\n')
+
+
+def sample_metadata(report):
+    """
+    :param report: Name and path of the BLAST report
+    :return: List containing the metadata object of a single sample
+    """
+    sample = MetadataObject()
+    sample.name = 'benchmark'
+    sample.general = GenObject()
+    setattr(sample, 'cgmlst', GenObject())
+    sample.cgmlst.report = report
+    return [sample]
+
+
+def run(methods, report):
+    """
+    Time the parsing and filtering of a report
+    :param methods: GeneSeekr class with the unique_parse_blast and filter_unique methods
+    :param report: Name and path of the BLAST report
+    :return: Elapsed time in seconds, metadata object of the sample
+    """
+    metadata = sample_metadata(report)
+    start = time.perf_counter()
+    metadata = methods.unique_parse_blast(metadata=metadata,
+                                          analysistype='cgmlst',
+                                          fieldnames=fieldnames,
+                                          cutoff=90,
+                                          program='blastn')
+    metadata = methods.filter_unique(metadata=metadata,
+                                     analysistype='cgmlst')
+    return time.perf_counter() - start, metadata[0]
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark the --unique overlap resolution with synthetic BLAST reports')
+    parser.add_argument('-n', '--hits',
+                        type=int,
+                        nargs='+',
+                        default=[1000, 10000, 50000],
+                        help='Number of hits on the contig. Default is 1000 10000 50000')
+    parser.add_argument('-l', '--legacy_max',
+                        type=int,
+                        default=10000,
+                        help='Only run the genemethods implementation with up to this many hits, as it scales '
+                             'quadratically (10000 hits take roughly an hour). Default is 10000')
+    args = parser.parse_args()
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        print('hits\tlegacy (s)\tindexed (s)\tspeedup')
+        for hits in args.hits:
+            report = os.path.join(tmp_dir, '{hits}.tsv'.format(hits=hits))
+            synthetic_report(report=report,
+                             hits=hits)
+            indexed, sample = run(methods=GeneSeekr, report=report)
+            if hits <= args.legacy_max:
+                legacy, legacy_sample = run(methods=LegacyGeneSeekr, report=report)
+                # The indexed implementation must find exactly the same best hits
+                assert sample.cgmlst.queryranges == legacy_sample.cgmlst.queryranges
+                assert sample.cgmlst.blastresults == legacy_sample.cgmlst.blastresults
+                assert sample.cgmlst.blastlist == \
+                    [{key: row[key] for key in HitTable.fieldnames} for row in legacy_sample.cgmlst.blastlist]
+                print('{hits}\t{legacy:.3f}\t{indexed:.3f}\t{speedup:.1f}x'.format(hits=hits,
+                                                                                   legacy=legacy,
+                                                                                   indexed=indexed,
+                                                                                   speedup=legacy / indexed))
+            else:
+                print('{hits}\tNA\t{indexed:.3f}\tNA'.format(hits=hits,
+                                                             indexed=indexed))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+from geneseekr.kmer import bit_score, format_bit_score, format_evalue, kmer_codes, reverse_complement, REWARD
+from geneseekr.karlin import expect_value, search_space
+from geneseekr.faidx import IndexedFasta
+import hashlib
+import logging
+import numpy
+import os
+
+__author__ = 'adamkoziol'
+
+
+def digest(sequence):
+    """
+    Hash a sequence to a 64-bit integer
+    :param sequence: String of the sequence
+    :return: Integer of the hash
+    """
+    return int.from_bytes(hashlib.blake2b(sequence.encode(), digest_size=8).digest(), 'little')
+
+
+def locus(allele):
+    """
+    Find the locus of an allele with the delimiter used by the MLST reporter e.g. adk_1 and AEJV01_03887_1 are alleles
+    of adk and AEJV01_03887
+    :param allele: Name of the allele
+    :return: Name of the locus
+    """
+    for splitter in ['_', '-']:
+        if splitter in allele:
+            return allele.rsplit(splitter, 1)[0]
+    return allele
+
+
+class AlleleIndex(object):
+    """
+    Exact-match index of the alleles of a typing scheme. Each allele is keyed by its first k-mer (the anchor), its
+    length, and a hash of its sequence. The index is stored next to the combined targets file, so it is only created
+    once for a scheme. An assembly is scanned for the anchors, and the sequence following each anchor is only hashed
+    once for every allele length that shares the anchor, so the loci that match an allele exactly, and in full, are
+    found without any alignments
+    """
+
+    def main(self):
+        """
+        Load the index from disk if it is current. Otherwise, create, and save it
+        """
+        if os.path.isfile(self.indexfile) and os.path.getmtime(self.indexfile) >= os.path.getmtime(self.fasta):
+            self.load()
+        else:
+            logging.info('Creating exact-match allele index of {fasta}'.format(fasta=self.fasta))
+            self.build()
+            self.save()
+
+    def build(self):
+        """
+        Find the anchor, length, and hash of every allele. Alleles that are shorter than the anchor, or have ambiguous
+        bases in the anchor cannot be indexed
+        """
+        anchors = list()
+        lengths = list()
+        digests = list()
+        target_ids = list()
+        self.indexed = numpy.zeros(len(self.targets), dtype=bool)
+        for target_id, name in enumerate(self.targets):
+            self.names.append(name)
+            sequence = self.targets.sequence(name).upper()
+            self.database_length += len(sequence)
+            anchor, _ = kmer_codes(sequence[:self.anchor_size], self.anchor_size)
+            if not len(anchor):
+                continue
+            anchors.append(anchor[0])
+            lengths.append(len(sequence))
+            digests.append(digest(sequence))
+            target_ids.append(target_id)
+            self.indexed[target_id] = True
+        # Sort the alleles by anchor, then length, then hash, so each can be found with a binary search
+        self.anchors = numpy.array(anchors, dtype=numpy.uint64)
+        self.lengths = numpy.array(lengths, dtype=numpy.int64)
+        self.digests = numpy.array(digests, dtype=numpy.uint64)
+        order = numpy.lexsort((self.digests, self.lengths, self.anchors))
+        self.anchors = self.anchors[order]
+        self.lengths = self.lengths[order]
+        self.digests = self.digests[order]
+        self.target_ids = numpy.array(target_ids, dtype=numpy.int64)[order]
+
+    def save(self):
+        """
+        Write the index arrays to disk
+        """
+        numpy.savez(self.indexfile,
+                    names=numpy.array(self.names, dtype=str),
+                    indexed=self.indexed,
+                    anchors=self.anchors,
+                    lengths=self.lengths,
+                    digests=self.digests,
+                    target_ids=self.target_ids,
+                    database_length=numpy.array(self.database_length, dtype=numpy.int64))
+        # numpy.savez appends .npz to file names that do not already have the extension
+        if not os.path.isfile(self.indexfile):
+            os.rename(self.indexfile + '.npz', self.indexfile)
+
+    def load(self):
+        """
+        Read the index arrays from disk
+        """
+        with numpy.load(self.indexfile) as index:
+            self.names = index['names'].tolist()
+            self.indexed = index['indexed']
+            self.anchors = index['anchors']
+            self.lengths = index['lengths']
+            self.digests = index['digests']
+            self.target_ids = index['target_ids']
+            self.database_length = int(index['database_length'])
+
+    def search(self, sequence):
+        """
+        Find every allele present in full in a sequence
+        :param sequence: Upper case string of the sequence
+        :return: List of (target index, 0-based start) of the matches
+        """
+        matches = list()
+        kmers, positions = kmer_codes(sequence, self.anchor_size)
+        if not len(kmers) or not len(self.anchors):
+            return matches
+        index = numpy.searchsorted(self.anchors, kmers)
+        index[index == len(self.anchors)] = 0
+        found = self.anchors[index] == kmers
+        for kmer, position in zip(kmers[found].tolist(), positions[found].tolist()):
+            first = int(numpy.searchsorted(self.anchors, numpy.uint64(kmer), side='left'))
+            last = int(numpy.searchsorted(self.anchors, numpy.uint64(kmer), side='right'))
+            lengths = self.lengths[first:last]
+            # Hash the sequence after the anchor once for each length of allele with the anchor
+            for length in numpy.unique(lengths).tolist():
+                if position + length > len(sequence):
+                    break
+                low = first + int(numpy.searchsorted(lengths, length, side='left'))
+                high = first + int(numpy.searchsorted(lengths, length, side='right'))
+                candidate = sequence[position:position + length]
+                key = numpy.uint64(digest(candidate))
+                start = low + int(numpy.searchsorted(self.digests[low:high], key, side='left'))
+                end = low + int(numpy.searchsorted(self.digests[low:high], key, side='right'))
+                for target_id in self.target_ids[start:end].tolist():
+                    # Confirm the match, so that a collision of the hashes cannot call an allele
+                    if self.targets.sequence(self.names[target_id]).upper() == candidate:
+                        matches.append((target_id, position))
+        return matches
+
+    def calls(self, fasta):
+        """
+        Find the loci of a sample that can be called without an alignment. A locus is only called if it has a single
+        exact match: one allele, at one location, and no other part of the assembly shares a k-mer with the allele.
+        Loci with several exact matches (e.g. an allele that contains another, or a duplicated gene), loci with a
+        second, inexact copy elsewhere in the assembly, and loci with alleles that cannot be indexed are left to BLAST
+        :param fasta: Name and path of the assembly of the sample
+        :return: Dictionary of locus: (target index, contig, contig length, strand, 0-based start of the match on the
+        strand)
+        """
+        matches = dict()
+        assembly = IndexedFasta(fasta)
+        try:
+            for contig in assembly:
+                sequence = assembly.sequence(contig).upper()
+                seen = set()
+                for strand, query in ((1, sequence), (-1, reverse_complement(sequence))):
+                    for target_id, start in self.search(query):
+                        length = len(query)
+                        # Palindromic alleles match both strands at the same location. Only count these once
+                        low = start if strand == 1 else length - start - self.allele_length(target_id)
+                        if (target_id, low) in seen:
+                            continue
+                        seen.add((target_id, low))
+                        matches.setdefault(locus(self.names[target_id]), list())\
+                            .append((target_id, contig, length, strand, start))
+            unindexed = {locus(name) for name, indexed in zip(self.names, self.indexed.tolist()) if not indexed}
+            calls = {name: hits[0] for name, hits in matches.items() if len(hits) == 1 and name not in unindexed}
+            for name in self.neighbours(assembly=assembly,
+                                        calls=calls):
+                del calls[name]
+        finally:
+            assembly.close()
+        return calls
+
+    def neighbours(self, assembly, calls):
+        """
+        Find the called loci with k-mers elsewhere in the assembly. BLAST would also report these other locations
+        (e.g. a second copy of the gene with a different allele), and the hits of the other alleles of the locus are
+        not searched once the locus is called
+        :param assembly: IndexedFasta object of the assembly of the sample
+        :param calls: Dictionary of locus: call returned by calls
+        :return: Set of the names of the loci with k-mers outside of their exact match
+        """
+        names = sorted(calls)
+        if not names:
+            return set()
+        kmers = list()
+        loci = list()
+        for number, name in enumerate(names):
+            sequence = self.targets.sequence(self.names[calls[name][0]]).upper()
+            for strand in (sequence, reverse_complement(sequence)):
+                codes, _ = kmer_codes(strand, self.neighbour_size)
+                kmers.append(codes)
+                loci.append(numpy.full(len(codes), number, dtype=numpy.int64))
+        kmers = numpy.concatenate(kmers)
+        loci = numpy.concatenate(loci)
+        order = numpy.lexsort((loci, kmers))
+        kmers = kmers[order]
+        loci = loci[order]
+        # K-mers shared by the alleles of several loci are found outside of the exact match of at least one of them
+        shared = numpy.nonzero((kmers[1:] == kmers[:-1]) & (loci[1:] != loci[:-1]))[0]
+        nearby = set(loci[shared].tolist()) | set(loci[shared + 1].tolist())
+        # The forward-strand coordinates of each exact match
+        contigs = numpy.array([calls[name][1] for name in names])
+        lows = numpy.zeros(len(names), dtype=numpy.int64)
+        highs = numpy.zeros(len(names), dtype=numpy.int64)
+        for number, name in enumerate(names):
+            target_id, _, length, strand, start = calls[name]
+            allele_length = self.allele_length(target_id)
+            lows[number] = start if strand == 1 else length - start - allele_length
+            highs[number] = lows[number] + allele_length
+        for contig in assembly:
+            codes, positions = kmer_codes(assembly.sequence(contig).upper(), self.neighbour_size)
+            if not len(codes):
+                continue
+            index = numpy.searchsorted(kmers, codes)
+            index[index == len(kmers)] = 0
+            found = kmers[index] == codes
+            hits = loci[index[found]]
+            positions = positions[found]
+            inside = (contigs[hits] == contig) & (positions >= lows[hits]) & \
+                (positions + self.neighbour_size <= highs[hits])
+            nearby.update(hits[~inside].tolist())
+        return {names[number] for number in nearby}
+
+    def allele_length(self, target_id):
+        """
+        :param target_id: Index of the allele
+        :return: Length of the allele
+        """
+        return self.targets.index[self.names[target_id]][0]
+
+    def hit(self, call):
+        """
+        Create the BLAST tabular (outfmt 6) line of an exact match. The columns are the same as those of the BLAST
+        analyses. The bit score and e-value are calculated with the blastn scoring parameters in the effective search
+        space of the contig against the complete scheme, as BLAST does
+        :param call: (target index, contig, contig length, strand, 0-based start) of the match
+        :return: Tab-delimited line without the percent match column
+        """
+        target_id, contig, contig_length, strand, start = call
+        length = self.allele_length(target_id)
+        score = length * REWARD
+        # BLAST reports query coordinates on the forward strand of the contig, and reverses the subject coordinates of
+        # matches to the reverse strand. The aligned sequences are also on the forward strand of the contig
+        sequence = self.targets.sequence(self.names[target_id]).upper()
+        if strand == 1:
+            query_start, query_end = start + 1, start + length
+            subject_start, subject_end = 1, length
+        else:
+            query_start, query_end = contig_length - start - length + 1, contig_length - start
+            subject_start, subject_end = length, 1
+            sequence = reverse_complement(sequence)
+        values = [contig, self.names[target_id], length, 0, 0,
+                  format_evalue(expect_value(score=score,
+                                             space=search_space(query_length=contig_length,
+                                                                database_length=self.database_length,
+                                                                sequences=len(self.names)))),
+                  format_bit_score(bit_score(score)), length, length, query_start, query_end, subject_start,
+                  subject_end, sequence, sequence]
+        return '\t'.join(str(value) for value in values) + '\n'
+
+    def close(self):
+        """
+        Close the memory-mapped targets file
+        """
+        self.targets.close()
+
+    def __init__(self, fasta, anchor_size=31, neighbour_size=20):
+        """
+        :param fasta: Name and path of the FASTA file of alleles e.g. combinedtargets.fasta
+        :param anchor_size: Length of the k-mer at the start of each allele used to find the candidate matches. Must
+        be between 8 and 31
+        :param neighbour_size: Length of the k-mers of the called alleles that must not be found elsewhere in the
+        assembly. Every hit reported by the typing analyses (99% identity, and at least ~40 bp) of a copy of the allele
+        has a run of this many identical bases. Must be between 8 and 31
+        """
+        assert 8 <= anchor_size <= 31, 'The anchor size must be between 8 and 31, not {k}'.format(k=anchor_size)
+        assert 8 <= neighbour_size <= 31, 'The neighbour k-mer size must be between 8 and 31, not {k}'\
+            .format(k=neighbour_size)
+        self.fasta = fasta
+        self.anchor_size = anchor_size
+        self.neighbour_size = neighbour_size
+        self.indexfile = '{base}.alleles.k{k}.npz'.format(base=os.path.splitext(fasta)[0],
+                                                          k=anchor_size)
+        self.targets = IndexedFasta(fasta)
+        self.names = list()
+        self.database_length = 0
+        self.indexed = numpy.zeros(0, dtype=bool)
+        self.anchors = numpy.zeros(0, dtype=numpy.uint64)
+        self.lengths = numpy.zeros(0, dtype=numpy.int64)
+        self.digests = numpy.zeros(0, dtype=numpy.uint64)
+        self.target_ids = numpy.zeros(0, dtype=numpy.int64)
@@ -0,0 +1,1163 @@
+#!/usr/bin/env python3
+from olctools.accessoryFunctions.accessoryFunctions import GenObject, make_path, MetadataObject
+from genemethods.geneseekr import blast
+from geneseekr.compression import compressed_glob, feed, open_compressed, uncompressed_name
+from geneseekr.scheduler import threads_per_job
+from geneseekr.executor import ProcessExecutor
+from geneseekr.reports import parquet_available
+from geneseekr.alleles import AlleleIndex, locus
+from geneseekr.dbcache import DatabaseCache
+from geneseekr.sketch import TargetSketch
+from geneseekr.karlin import relaxed_evalue, search_space
+from geneseekr.shards import TargetShards
+from geneseekr.faidx import IndexedFasta
+from geneseekr.tabular import TabularParser
+from geneseekr.workqueue import WorkQueue
+from geneseekr.store import ResultStore
+from geneseekr.timing import Profiler
+from geneseekr.methods import GeneSeekr
+from geneseekr.manifest import Manifest
+from Bio import SeqIO
+from glob import glob
+import subprocess
+import tempfile
+import logging
+import shutil
+import math
+import shlex
+import io
+import os
+
+__author__ = 'adamkoziol'
+
+# The custom outfmt 6 of the genemethods BLAST analyses. Workers create the command lines of searches themselves, so the
+# format is never read from the work queue
+OUTFMT = "'6 qseqid sseqid positive mismatch gaps evalue bitscore slen length qstart qend sstart send qseq sseq'"
+BLAST_PROGRAMS = ['blastn', 'blastp', 'blastx', 'tblastn', 'tblastx']
+BLASTN_TASKS = ['blastn', 'blastn-short', 'dc-megablast', 'megablast']
+# Fields of the searches, and of the work items, created by BLAST.work_item
+SEARCH_FIELDS = {'program', 'query', 'db', 'settings', 'threads', 'dbsize'}
+WORK_ITEM_FIELDS = {'name', 'search', 'reports', 'exacthits', 'tags', 'stdin', 'parser'}
+# BLAST parameters of the searches created by BLAST.blast_settings. The percent identity and task are only used by
+# blastn
+SETTINGS_FIELDS = {'evalue', 'num_alignments', 'perc_identity', 'task'}
+
+
+class BLAST(blast.BLAST):
+    """
+    Extends the genemethods BLAST pipeline with the GeneSeekr-specific options
+    """
+
+    def seekr(self):
+        """
+        Run the methods in the proper order. With --profile, the resources used by each stage are recorded, and
+        written to the report path
+        """
+        for stage in [self.blast_db, self.run_blast, self.parseable_blast_outputs, self.parse_results,
+                      self.create_reports]:
+            with self.profiler.stage(stage.__name__):
+                stage()
+        if self.store:
+            with self.profiler.stage('store_results'):
+                self.store_results()
+        if self.export:
+            with self.profiler.stage('export_fasta'):
+                self.export_fasta()
+        self.clean_object()
+        self.profiler.write(self.reportpath)
+
+    def blast_db(self):
+        """
+        Make blast databases (if necessary). If a database cache is in use, the databases are created in (or
+        retrieved from) the cache, and the samples are updated to use the cached copies. With --shards, each database
+        is also split into shards
+        """
+        if not self.cachepath:
+            logging.info('Creating {at} blast databases as required'.format(at=self.analysistype))
+            self.makeblastdb(fastas=sorted(set(sample[self.analysistype].combinedtargets for sample in self.metadata
+                                               if sample[self.analysistype].combinedtargets != 'NA')))
+        else:
+            logging.info('Retrieving {at} blast databases from the cache'.format(at=self.analysistype))
+            cache = DatabaseCache(cachepath=self.cachepath,
+                                  max_size=self.cachesize,
+                                  timeout=self.timeout,
+                                  retries=self.retries)
+            databases = dict()
+            for sample in self.metadata:
+                combinedtargets = sample[self.analysistype].combinedtargets
+                if combinedtargets == 'NA':
+                    continue
+                if combinedtargets not in databases:
+                    databases[combinedtargets] = cache.database(targets=sample[self.analysistype].targets,
+                                                                combinedtargets=combinedtargets,
+                                                                program=self.program)
+                # run_blast uses the combined targets file (without the extension) as the database
+                sample[self.analysistype].combinedtargets = databases[combinedtargets]
+        if self.shards > 1:
+            with self.profiler.stage('shard_databases'):
+                self.shard_databases()
+
+    def makeblastdb(self, fastas):
+        """
+        Create the BLAST databases of FASTA files that do not already have one. The databases are created in parallel
+        :param fastas: List of the names and paths of the FASTA files
+        """
+        executor = self.executor()
+        for fasta in fastas:
+            command = DatabaseCache.makeblastdb_command(fasta=fasta,
+                                                        program=self.program)
+            if command:
+                executor.add(name=fasta,
+                             command=command)
+        for fasta, seconds in executor.run().items():
+            self.profiler.add(name='makeblastdb',
+                              wall=seconds)
+            if not executor.results[fasta]['success']:
+                logging.error('Could not create the BLAST database of {fasta}'.format(fasta=fasta))
+
+    def shard_databases(self):
+        """
+        Split each database into shards of similar size (or with all the alleles of each locus in the same shard), and
+        create the BLAST databases of the shards. The shards are stored next to the combined targets file (in the cache
+        entry with a database cache), so they are only created once for a set of targets
+        """
+        logging.info('Splitting the {at} databases into {count} shards by {by}'.format(at=self.analysistype,
+                                                                                      count=self.shards,
+                                                                                      by=self.shard_by))
+        for combinedtargets in sorted(set(sample[self.analysistype].combinedtargets for sample in self.metadata)):
+            if combinedtargets == 'NA':
+                continue
+            shards = TargetShards(fasta=combinedtargets,
+                                  count=self.shards,
+                                  by=self.shard_by)
+            shards.main()
+            self.shardsets[combinedtargets] = shards
+        self.makeblastdb(fastas=[fasta for shards in self.shardsets.values() for fasta in shards.files])
+
+    def executor(self):
+        """
+        :return: ProcessExecutor object that runs the external programs of the analysis with the cores, timeout, and
+        retries of the analysis
+        """
+        return ProcessExecutor(cpus=self.cpus,
+                               timeout=self.timeout,
+                               retries=self.retries)
+
+    def run_blast(self):
+        """
+        Perform BLAST analyses. Several searches are run at once, and the cores are divided between them based on the
+        size of the database and of the query. In batch mode, samples are combined into chunks that are searched with
+        a single BLAST call each. The loci of typing schemes that match an allele exactly are called without BLAST,
+        and with the pre-filter, each sample is only searched against the targets that share enough k-mers with it.
+        Samples are searched against each shard of sharded databases in parallel, and the hits of the shards are merged
+        """
+        logging.info('Performing {program} analyses on {at} targets'.format(program=self.program,
+                                                                            at=self.analysistype))
+        settings = self.blast_settings()
+        parser = self.tabular_parser()
+        # Group the samples that still require analyses by database
+        databases = dict()
+        for sample in self.metadata:
+            make_path(sample[self.analysistype].reportdir)
+            sample[self.analysistype].report = os.path.join(
+                sample[self.analysistype].reportdir, '{name}_{program}_{at}.tsv'.format(name=sample.name,
+                                                                                        program=self.program,
+                                                                                        at=self.analysistype))
+            if sample[self.analysistype].combinedtargets != 'NA' and not self.reusable(sample):
+                databases.setdefault(sample[self.analysistype].combinedtargets, list()).append(sample)
+        tmp_dir = os.path.join(self.reportpath, 'tmp_batch')
+        skipped = list()
+        if self.exact or self.prefilter:
+            with self.profiler.stage('reduce_databases'):
+                databases, skipped = self.reduce_databases(databases=databases,
+                                                           tmp_dir=tmp_dir,
+                                                           parser=parser)
+        executor = self.executor()
+        jobs = dict()
+        items = dict()
+        # Dictionary of the name of each search: name of its job. The job of a sample has one search per shard
+        parts = dict()
+        # Number of searches, which share the cores. Each batch of samples is searched against every shard
+        searchcount = 0
+        for combinedtargets, samples in databases.items():
+            shards = self.shardsets.get(combinedtargets)
+            searchcount += math.ceil(len(samples) / self.batchsize) * (len(shards.files) if shards is not None else 1)
+        for combinedtargets, samples in databases.items():
+            database_size = os.path.getsize(combinedtargets)
+            shards = self.shardsets.get(combinedtargets)
+            # Length, and number of sequences of the complete database of the searches of a part of it (the shards,
+            # a reduced database, or the shards of a reduced database)
+            complete = self.complete_size(combinedtargets)
+            for i in range(0, len(samples), self.batchsize):
+                chunk = samples[i:i + self.batchsize]
+                name = chunk[0].name if len(chunk) == 1 else 'batch_{count}'.format(count=len(jobs))
+                jobs[name] = chunk
+                search_settings = settings
+                search_parser = parser
+                if complete is not None:
+                    # BLAST calculates the e-values of a search of part of a database in a larger search space than
+                    # that of the complete database, even with the size of the complete database. These searches use a
+                    # relaxed threshold, and the e-values of their hits are recalculated, and filtered, once they
+                    # complete. The shards are also searched without the cutoff, which is applied once their hits are
+                    # merged
+                    evalue = relaxed_evalue(evalue=settings['evalue'],
+                                            query_length=sum(sum(self.contig_lengths(sample).values())
+                                                             for sample in chunk),
+                                            database_length=complete[0],
+                                            sequences=complete[1],
+                                            program=self.program)
+                    search_settings = dict(settings, evalue=str(evalue))
+                    search_parser = TabularParser(fieldnames=self.fieldnames,
+                                                  program=self.program,
+                                                  cutoff=0 if shards is not None else parser.cutoff,
+                                                  evalue=evalue)
+                # Tuples of the name, database, report suffix, database size, and parser of each search. The searches
+                # of part of a database use the size of the complete database
+                searches = [(name, combinedtargets, str(), complete[0] if complete else None, search_parser)]
+                if shards is not None:
+                    searches = [('{name}_shard{index}'.format(name=name, index=index), fasta,
+                                 '.shard{index}'.format(index=index), complete[0], search_parser)
+                                for index, fasta in enumerate(shards.files)]
+                threads = threads_per_job(database_size=database_size / len(searches),
+                                          query_size=sum(os.path.getsize(sample.general.bestassemblyfile)
+                                                         for sample in chunk),
+                                          cpus=self.cpus,
+                                          jobs=searchcount)
+                for search, fasta, suffix, dbsize, search_parser in searches:
+                    parts[search] = name
+                    job = dict(samples=chunk,
+                               jobname=search,
+                               db=os.path.splitext(fasta)[0],
+                               tmp_dir=tmp_dir,
+                               settings=search_settings,
+                               parser=search_parser,
+                               num_threads=threads,
+                               dbsize=dbsize,
+                               suffix=suffix)
+                    items[search] = self.work_item(**job)
+                    if not self.queuepath:
+                        self.add_search(executor=executor,
+                                        item=items[search],
+                                        threads=threads)
+        times = self.distribute(items) if self.queuepath else executor.run()
+        for name, result in executor.results.items():
+            if not result['success']:
+                logging.warning('The search of {name} failed. It will be run again on the next run'.format(name=name))
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        sharded = {combinedtargets: samples for combinedtargets, samples in databases.items()
+                   if combinedtargets in self.shardsets}
+        if sharded:
+            with self.profiler.stage('merge_shards'):
+                self.merge_shards(databases=sharded,
+                                  settings=settings)
+        # The hits of sharded reduced databases are recalculated as the shards are merged
+        reduced = {combinedtargets: samples for combinedtargets, samples in databases.items()
+                   if combinedtargets in self.dbsizes and combinedtargets not in self.shardsets}
+        if reduced:
+            with self.profiler.stage('rescale_reduced'):
+                self.rescale_reduced(databases=reduced)
+        # The shards of a sample are searched at the same time, so a job takes as long as the search of its slowest
+        # shard
+        seconds = dict()
+        for search, search_seconds in times.items():
+            seconds[parts[search]] = max(search_seconds, seconds.get(parts[search], 0))
+        # Record the wall time of the search of every sample. Samples in a batch share the time of the batch
+        for name, job_seconds in seconds.items():
+            for sample in jobs[name]:
+                sample[self.analysistype].blasttime = float('{:0.2f}'.format(job_seconds))
+            self.profiler.add(name=name,
+                              wall=job_seconds,
+                              sample=name if len(jobs[name]) == 1 else None)
+        self.update_manifest([sample for samples in jobs.values() for sample in samples] + skipped)
+
+    def merge_shards(self, databases, settings):
+        """
+        Merge the reports of the searches of each sample against the shards of its database. Samples without the
+        reports of every shard (e.g. because a search failed) do not get a report, so they are searched again on the
+        next run
+        :param databases: Dictionary of the (reduced) combined targets file of sharded databases: list of metadata
+        objects of the samples searched against its shards
+        :param settings: Dictionary of BLAST parameters
+        """
+        logging.info('Merging the hits of the {at} database shards'.format(at=self.analysistype))
+        parser = self.tabular_parser()
+        for combinedtargets, samples in databases.items():
+            shards = self.shardsets[combinedtargets]
+            database_length, sequences = self.complete_size(combinedtargets)
+            for sample in samples:
+                report = sample[self.analysistype].report
+                shard_reports = ['{report}.shard{index}'.format(report=report, index=index)
+                                 for index in range(len(shards.files))]
+                if not all(os.path.isfile(shard_report) for shard_report in shard_reports):
+                    for shard_report in shard_reports:
+                        try:
+                            os.remove(shard_report)
+                        except FileNotFoundError:
+                            pass
+                    continue
+                # Hits are listed in the order of the contigs in the assembly, as they are by a search of the complete
+                # database
+                lengths = self.contig_lengths(sample)
+                contigs = {contig: index for index, contig in enumerate(lengths)}
+                shards.merge(shard_reports=shard_reports,
+                             report=report,
+                             header=parser.header(),
+                             exacthits=self.exacthits.get(report, list()),
+                             contigs=contigs,
+                             limit=settings['num_alignments'],
+                             cutoff=parser.cutoff,
+                             rescale=self.rescaler(parser=parser,
+                                                   lengths=lengths,
+                                                   database_length=database_length,
+                                                   sequences=sequences))
+
+    def complete_size(self, combinedtargets):
+        """
+        Find the size of the complete database of the searches of part of a database
+        :param combinedtargets: Name and path of the (reduced) combined targets file searched by the samples
+        :return: Tuple of the length, and number of sequences of the complete database, or None if the complete
+        database is searched
+        """
+        if combinedtargets in self.dbsizes:
+            return self.dbsizes[combinedtargets]
+        shards = self.shardsets.get(combinedtargets)
+        if shards is not None:
+            return shards.dbsize, len(shards.names)
+        return None
+
+    def rescale_reduced(self, databases):
+        """
+        Recalculate the e-values of the hits of the searches of reduced databases in the search space of the complete
+        database, and remove the hits above the e-value threshold. The exact matches at the start of the reports
+        already have the e-values of the complete database
+        :param databases: Dictionary of reduced combined targets file: list of metadata objects of the samples searched
+        against it
+        """
+        parser = self.tabular_parser()
+        for combinedtargets, samples in databases.items():
+            database_length, sequences = self.dbsizes[combinedtargets]
+            for sample in samples:
+                report = sample[self.analysistype].report
+                # The reports of failed searches are not created
+                if not os.path.isfile(report):
+                    continue
+                rescale = self.rescaler(parser=parser,
+                                        lengths=self.contig_lengths(sample),
+                                        database_length=database_length,
+                                        sequences=sequences)
+                with open(report) as hits, open(report + '.tmp', 'w') as rescaled:
+                    for _ in range(len(self.exacthits.get(report, list())) + 1):
+                        rescaled.write(next(hits))
+                    for line in hits:
+                        line = rescale(line)
+                        if line is not None:
+                            rescaled.write(line)
+                os.rename(report + '.tmp', report)
+
+    def rescaler(self, parser, lengths, database_length, sequences):
+        """
+        Create the function that recalculates the e-values of the hits of a sample in the search space of a complete
+        database
+        :param parser: TabularParser object with the e-value threshold of the analysis
+        :param lengths: Dictionary of contig name: length of the assembly of the sample
+        :param database_length: Total length of the sequences in the complete database
+        :param sequences: Number of sequences in the complete database
+        :return: Function that returns a line of an annotated report with the new e-value, or None if the hit is above
+        the e-value threshold
+        """
+        spaces = {contig: search_space(query_length=length,
+                                       database_length=database_length,
+                                       sequences=sequences,
+                                       program=self.program)
+                  for contig, length in lengths.items()}
+        return lambda line: parser.rescale(line=line,
+                                           space=spaces[line.split('\t', 1)[0]])
+
+    @staticmethod
+    def contig_lengths(sample):
+        """
+        :param sample: Metadata object of the sample
+        :return: Dictionary of contig name: length of the contigs of the assembly of the sample, in the order of the
+        assembly
+        """
+        assembly = IndexedFasta(sample.general.bestassemblyfile)
+        lengths = {contig: assembly.index[contig][0] for contig in assembly}
+        assembly.close()
+        return lengths
+
+    def reduce_databases(self, databases, tmp_dir, parser):
+        """
+        Reduce the database searched for each sample. The loci of typing schemes that match an allele exactly, and in
+        full, are called directly, so their alleles do not need to be searched. With the pre-filter, only the targets
+        whose minimizer sketches are contained in the sample are searched. Samples with the same set of remaining
+        targets share a database. The e-values of the hits are recalculated in the search space of the complete database
+        by rescale_reduced, so they are the same as those of complete searches
+        :param databases: Dictionary of combined targets file: list of metadata objects of the samples to search
+        :param tmp_dir: Folder in which to create the reduced databases
+        :param parser: TabularParser object used to filter and annotate the hits
+        :return: Dictionary of (reduced) combined targets file: list of metadata objects of the samples to search, and a
+        list of the samples without any targets left to search. The reports of these samples are written here
+        """
+        subset_dir = os.path.join(tmp_dir, 'subsets')
+        subsets = dict()
+        filtered = dict()
+        skipped = list()
+        for combinedtargets, samples in databases.items():
+            targets = IndexedFasta(combinedtargets)
+            dbsize = sum(length for length, _, _, _ in targets.index.values())
+            alleles = sketch = None
+            if self.exact:
+                logging.info('Calling exact {at} allele matches'.format(at=self.analysistype))
+                alleles = self.target_index(cls=AlleleIndex,
+                                            fasta=combinedtargets)
+            if self.prefilter:
+                logging.info('Pre-filtering {at} targets'.format(at=self.analysistype))
+                sketch = self.target_index(cls=TargetSketch,
+                                           fasta=combinedtargets)
+            for sample in samples:
+                keep = list(targets)
+                if alleles is not None:
+                    keep = self.exact_matches(sample=sample,
+                                              alleles=alleles,
+                                              parser=parser,
+                                              names=keep)
+                if sketch is not None:
+                    candidates = set(sketch.select(fasta=sample.general.bestassemblyfile,
+                                                   cutoff=self.cutoff))
+                    keep = [name for name in keep if name in candidates]
+                    sample[self.analysistype].prefiltertargets = len(keep)
+                logging.debug('{name}: {keep} of {total} targets left to search'.format(name=sample.name,
+                                                                                       keep=len(keep),
+                                                                                       total=len(targets)))
+                if not keep:
+                    # Nothing is left to search, so the report only has the exact matches (if any)
+                    with open(sample[self.analysistype].report, 'w') as report:
+                        report.write(parser.header())
+                        report.writelines(self.exacthits.get(sample[self.analysistype].report, list()))
+                    skipped.append(sample)
+                    continue
+                if len(keep) == len(targets):
+                    filtered.setdefault(combinedtargets, list()).append(sample)
+                    continue
+                key = (combinedtargets, tuple(keep))
+                if key not in subsets:
+                    make_path(subset_dir)
+                    subsets[key] = os.path.join(subset_dir, 'subset_{count}.fasta'.format(count=len(subsets)))
+                    with open(subsets[key], 'w') as subset:
+                        for name in keep:
+                            subset.write('>{header}\n{sequence}\n'.format(header=targets.header(name),
+                                                                          sequence=targets.sequence(name)))
+                    self.dbsizes[subsets[key]] = (dbsize, len(targets.index))
+                filtered.setdefault(subsets[key], list()).append(sample)
+            if alleles is not None:
+                alleles.close()
+            targets.close()
+        # The subsets of sharded databases are also sharded
+        fastas = sorted(subsets.values())
+        if self.shards > 1:
+            for subset in sorted(subsets.values()):
+                shards = TargetShards(fasta=subset,
+                                      count=self.shards,
+                                      by=self.shard_by)
+                shards.main()
+                self.shardsets[subset] = shards
+            fastas = [fasta for subset in sorted(subsets.values()) for fasta in self.shardsets[subset].files]
+        # The databases of the subsets are created in parallel
+        self.makeblastdb(fastas=fastas)
+        return filtered, skipped
+
+    def target_index(self, cls, fasta, **kwargs):
+        """
+        Create (or load) an index of a combined targets file. A server keeps the indices of previous jobs in memory
+        :param cls: Class of the index e.g. TargetSketch
+        :param fasta: Name and path of the combined targets file
+        :param kwargs: Other arguments used to create the index
+        :return: Index object
+        """
+        if self.warmcache is not None:
+            return self.warmcache.get(cls=cls,
+                                      fasta=fasta,
+                                      **kwargs)
+        index = cls(fasta=fasta, **kwargs)
+        index.main()
+        return index
+
+    def exact_matches(self, sample, alleles, parser, names):
+        """
+        Call the loci of a sample that match an allele exactly, and in full. The hits are stored, so that they can be
+        added to the report of the sample ahead of the BLAST hits
+        :param sample: Metadata object of the sample
+        :param alleles: AlleleIndex object of the typing scheme
+        :param parser: TabularParser object used to filter and annotate the hits
+        :param names: List of the names of the targets to search
+        :return: List of the names of the targets that still need to be searched
+        """
+        calls = alleles.calls(fasta=sample.general.bestassemblyfile)
+        hits = list()
+        for call in calls.values():
+            values = parser.row(alleles.hit(call))
+            if values is not None:
+                hits.append(parser.line(values))
+        self.exacthits[sample[self.analysistype].report] = hits
+        sample[self.analysistype].exactloci = len(calls)
+        return [name for name in names if locus(name) not in calls]
+
+    def manifest_entry(self, sample):
+        """
+        Create the manifest entry of the inputs and settings of the analysis of a sample
+        :param sample: Metadata object of the sample
+        :return: Dictionary of the inputs and settings
+        """
+        entry = {
+            'sample': self.manifest.fingerprint(sample.general.bestassemblyfile),
+            'database': self.manifest.fingerprint(sample[self.analysistype].combinedtargets),
+            'program': self.program,
+            'analysistype': self.analysistype,
+            'cutoff': self.cutoff,
+            'evalue': self.blast_settings()['evalue'],
+            'unique': self.unique
+        }
+        # Pre-filtered searches can miss divergent hits, and the reports of exact matches do not have the hits of the
+        # other alleles of the called loci, so these reports are kept apart from those of complete searches
+        if self.prefilter:
+            entry['prefilter'] = True
+        if self.exact:
+            entry['exact'] = True
+        # Hits of single-pass multi-analysis searches have rescaled e-values
+        if self.merged:
+            entry['merged'] = self.merged
+        # The e-values of the hits of the shards are recalculated in the search space of the complete database. Those
+        # of blastp, blastx, and tblastn are calculated from the rounded bit scores, so they can differ slightly from
+        # those of complete searches
+        if self.shards > 1:
+            entry['shards'] = [self.shards, self.shard_by]
+        return entry
+
+    def run_parameters(self):
+        """
+        :return: Dictionary of the inputs and settings of the run stored with the results
+        """
+        return {
+            'program': self.program,
+            'analysistype': self.analysistype,
+            'sequencepath': os.path.abspath(self.sequencepath),
+            'targetpath': os.path.abspath(self.targetpath),
+            'reportpath': os.path.abspath(self.reportpath),
+            'cutoff': self.cutoff,
+            'evalue': self.blast_settings()['evalue'],
+            'unique': bool(self.unique),
+            'align': bool(self.align),
+            'prefilter': bool(self.prefilter),
+            'exact': bool(self.exact),
+            'merged': self.merged,
+            'shards': self.shards,
+            'shard_by': self.shard_by
+        }
+
+    def sample_results(self, sample):
+        """
+        Extract the hits, and the allele calls of typing analyses of a sample for the results store
+        :param sample: Metadata object of the sample
+        :return: Dictionary of the results of the sample
+        """
+        try:
+            blastlist = sample[self.analysistype].blastlist
+        except AttributeError:
+            blastlist = list()
+        try:
+            blastresults = sample[self.analysistype].blastresults
+        except AttributeError:
+            blastresults = dict()
+        hits = list()
+        for hit in blastlist if not isinstance(blastlist, str) else list():
+            hits.append({
+                'target': hit['subject_id'],
+                'percent_match': float(hit['percent_match']),
+                'percent_identity': float(hit.get('percentidentity', hit['percent_match'])),
+                'alignment_fraction': float(hit.get('alignment_fraction', 1)),
+                'contig': hit['query_id'],
+                'query_start': int(hit['query_start']),
+                'query_end': int(hit['query_end']),
+                'subject_start': int(hit['subject_start']),
+                'subject_end': int(hit['subject_end']),
+                'subject_length': int(hit['subject_length']),
+                'evalue': float(hit['evalue']),
+                'bit_score': float(hit['bit_score'])
+            })
+        # The best hit of each allele of a typing scheme is the allele call
+        alleles = list()
+        if 'mlst' in self.analysistype.lower() and isinstance(blastresults, dict):
+            alleles = [(locus(allele), allele, float(percent)) for allele, percent in sorted(blastresults.items())]
+        return {
+            'name': sample.name,
+            'analysistype': self.analysistype,
+            'program': self.program,
+            'assembly': os.path.abspath(str(sample.general.bestassemblyfile)),
+            'hits': hits,
+            'alleles': alleles
+        }
+
+    def store_results(self):
+        """
+        Write the results of the samples, and the parameters of the run to the results store
+        """
+        logging.info('Storing the {at} results in {store}'.format(at=self.analysistype,
+                                                                  store=self.store))
+        with ResultStore(path=self.store) as store:
+            run = store.add_run(program=self.program,
+                                analysistype=self.analysistype,
+                                parameters=self.run_parameters())
+            store.add_samples(run=run,
+                              results=(self.sample_results(sample) for sample in self.metadata))
+
+    def reusable(self, sample):
+        """
+        Determine whether the report of a sample from a previous run can be reused. Reports created with different
+        inputs or settings (or by an interrupted run) are removed
+        :param sample: Metadata object of the sample
+        :return: Boolean of whether the report can be reused
+        """
+        report = sample[self.analysistype].report
+        if self.manifest.current(report=report,
+                                 entry=self.manifest_entry(sample)):
+            logging.debug('Reusing {report}'.format(report=report))
+            return True
+        try:
+            os.remove(report)
+        except FileNotFoundError:
+            pass
+        return False
+
+    def update_manifest(self, samples):
+        """
+        Record the inputs and settings of the samples with new reports in the manifest
+        :param samples: List of metadata objects of the samples that were analysed
+        """
+        for sample in samples:
+            if os.path.isfile(sample[self.analysistype].report):
+                self.manifest.update(report=sample[self.analysistype].report,
+                                     entry=self.manifest_entry(sample))
+        self.manifest.save()
+
+    def tabular_parser(self):
+        """
+        Create the parser used to filter and annotate the BLAST outputs with the current cutoff and e-value
+        :return: TabularParser object
+        """
+        return TabularParser(fieldnames=self.fieldnames,
+                             program=self.program,
+                             cutoff=self.cutoff,
+                             evalue=self.blast_settings()['evalue'])
+
+    def parseable_blast_outputs(self):
+        """
+        The reports created by run_blast already have headers and the percent match column. Only reports from
+        previous runs that lack them are annotated
+        """
+        logging.info('Adding headers to {program} .tsv outputs as required'.format(program=self.program))
+        parser = self.tabular_parser()
+        for sample in self.metadata:
+            with self.profiler.stage(sample.name,
+                                     sample=sample.name):
+                try:
+                    parser.annotate(report=sample[self.analysistype].report)
+                except AttributeError:
+                    pass
+
+    def blast_settings(self):
+        """
+        Determine the analysis-specific BLAST parameters. These are the same values used by the genemethods
+        run_blast method
+        :return: Dictionary of BLAST parameters
+        """
+        settings = {
+            'evalue': self.evalue,
+            'num_alignments': 1000000,
+            'perc_identity': 70,
+            'task': 'blastn'
+        }
+        if 'mlst' in self.analysistype.lower():
+            settings.update({'evalue': '1E-10', 'perc_identity': 99})
+        elif 'sixteens' in self.analysistype:
+            settings.update({'evalue': '1E-20', 'num_alignments': 5000, 'perc_identity': 99})
+        return settings
+
+    def add_search(self, executor, item, threads):
+        """
+        Add a search described by work_item to the executor. The temporary reports are created again before each
+        attempt, and are only moved into place if the search succeeds, so failed searches will be attempted again on
+        the next run
+        :param executor: ProcessExecutor object
+        :param item: Dictionary of the search
+        :param threads: Number of cores the search will use
+        """
+        parser = TabularParser(**item['parser'])
+        outputs = list()
+
+        def start():
+            outputs[:] = self.open_outputs(item=item,
+                                           parser=parser)
+            return lambda lines: parser.stream(lines=lines,
+                                               outputs=outputs,
+                                               tags=item['tags'])
+
+        def finish(success):
+            self.close_outputs(reports=item['reports'],
+                               outputs=outputs,
+                               success=success)
+        executor.add(name=item['name'],
+                     command=self.arguments(self.search_commandline(item['search'])),
+                     threads=threads,
+                     stdin=item['stdin'],
+                     start=start,
+                     finish=finish)
+
+    def work_item(self, samples, jobname, db, tmp_dir, settings, parser, num_threads, dbsize=None, suffix=str()):
+        """
+        Describe the search of one sample, or a batch of samples, so that it can be run by this process, or by a
+        GeneSeekr worker. Batches are concatenated into a single query in the temporary folder
+        :param samples: List of metadata objects of the samples in the job
+        :param jobname: Name of the job. Used to name the combined query of batches
+        :param db: Name and path of the BLAST database (without extension)
+        :param tmp_dir: Folder in which to store the combined queries of batches
+        :param settings: Dictionary of BLAST parameters
+        :param parser: TabularParser object used to filter and annotate the hits
+        :param num_threads: Number of threads to use
+        :param dbsize: Optional effective size of the database used to calculate e-values
+        :param suffix: Optional suffix of the reports e.g. of the searches of database shards. The exact matches are
+        only written to the reports without a suffix
+        :return: JSON-serialisable dictionary of the search
+        """
+        tags = None
+        stdin = None
+        if len(samples) == 1:
+            query = samples[0].general.bestassemblyfile
+            # Compressed assemblies are decompressed into the stdin of BLAST, so they are never written to disk
+            if query != uncompressed_name(query):
+                stdin = query
+                query = '-'
+        else:
+            make_path(tmp_dir)
+            query = os.path.join(tmp_dir, '{name}.fasta'.format(name=jobname))
+            tags = self.batch_query(samples=samples,
+                                    query=query)
+        # The search is described by its parameters rather than by a command line, so a worker can check them, and
+        # build the command itself
+        search = {
+            'program': self.program,
+            'query': query,
+            'db': db,
+            'settings': settings,
+            'threads': num_threads,
+            'dbsize': dbsize if dbsize else None
+        }
+        blast = self.search_commandline(search)
+        for sample in samples:
+            sample[self.analysistype].blastcommand = str(blast)
+        reports = [sample[self.analysistype].report for sample in samples]
+        return {
+            'name': jobname,
+            'search': search,
+            'reports': [report + suffix for report in reports],
+            'exacthits': [self.exacthits.get(report, list()) if not suffix else list() for report in reports],
+            'tags': tags,
+            'stdin': stdin,
+            'parser': {
+                'fieldnames': parser.fieldnames,
+                'program': parser.program,
+                'cutoff': parser.cutoff,
+                'evalue': parser.evalue
+            }
+        }
+
+    @staticmethod
+    def run_item(item):
+        """
+        Run a search described by work_item, and write the filtered, header-annotated hits to the reports of the
+        samples as BLAST outputs them. The reports are written to temporary files, and only moved into place if the
+        search succeeds, so failed searches will be attempted again on the next run
+        :param item: Dictionary of the search
+        :return: Boolean of whether the search succeeded
+        """
+        # Work items are read from a shared folder, so only well-formed searches are run
+        assert set(item).difference(WorkQueue.fields) == WORK_ITEM_FIELDS, \
+            'Invalid work item fields: {fields}'.format(fields=sorted(item))
+        arguments = BLAST.arguments(BLAST.search_commandline(item['search']))
+        parser = TabularParser(**item['parser'])
+        outputs = BLAST.open_outputs(item=item,
+                                     parser=parser)
+        return BLAST.pipe(arguments=arguments,
+                          reports=item['reports'],
+                          outputs=outputs,
+                          parse=lambda lines: parser.stream(lines=lines,
+                                                            outputs=outputs,
+                                                            tags=item['tags']),
+                          stdin=item.get('stdin'))
+
+    @staticmethod
+    def open_outputs(item, parser):
+        """
+        Create the temporary reports of a search, and write the header, and the exact matches of each sample
+        :param item: Dictionary of the search
+        :param parser: TabularParser object used to filter and annotate the hits
+        :return: List of the open temporary reports
+        """
+        outputs = [open(report + '.tmp', 'w') for report in item['reports']]
+        for output, hits in zip(outputs, item['exacthits']):
+            output.write(parser.header())
+            output.writelines(hits)
+        return outputs
+
+    @staticmethod
+    def close_outputs(reports, outputs, success):
+        """
+        Close the temporary reports of a search. The reports are moved into place if the search succeeded, and are
+        removed if it failed
+        :param reports: List of the names and paths of the reports. The temporary files have a .tmp extension
+        :param outputs: List of the open temporary reports
+        :param success: Boolean of whether the search succeeded
+        """
+        for output in outputs:
+            output.close()
+        for report in reports:
+            if success:
+                os.rename(report + '.tmp', report)
+            else:
+                try:
+                    os.remove(report + '.tmp')
+                except FileNotFoundError:
+                    pass
+
+    def distribute(self, items):
+        """
+        Add the searches to the work queue, and wait for GeneSeekr workers to run them
+        :param items: Dictionary of job name: work item
+        :return: Dictionary of job name: wall time in seconds of the search
+        """
+        queue = WorkQueue(queuepath=self.queuepath)
+        names = {queue.put(item=item, prefix=name): name for name, item in items.items()}
+        logging.info('Added {count} searches to the work queue {queue}'.format(count=len(names),
+                                                                               queue=self.queuepath))
+        times = dict()
+        # A single worker runs the searches one after another, so with a timeout, every search is complete within the
+        # timeout of each search. Searches that are not complete by then are withdrawn from the queue
+        try:
+            finished = queue.wait(names=list(names),
+                                  max_wait=self.timeout * len(names) if self.timeout else None)
+        finally:
+            queue.remove(names)
+        for itemname, (success, item) in finished.items():
+            if not success:
+                logging.warning('The search of {name} failed. It will be run again on the next run'
+                                .format(name=names[itemname]))
+            times[names[itemname]] = item.get('seconds', 0)
+        return times
+
+    @staticmethod
+    def arguments(blast):
+        """
+        Split a BLAST command line into its arguments. The searches run by this process, and by the workers are both
+        run from these arguments rather than through the shell, so the values of a search are never interpreted by a
+        shell
+        :param blast: Biopython command line object
+        :return: List of the arguments of the command
+        """
+        return shlex.split(str(blast))
+
+    @staticmethod
+    def pipe(arguments, reports, outputs, parse, stdin=None):
+        """
+        Run a BLAST search, and parse the hits as BLAST outputs them. The reports are moved into place from their
+        temporary files if the search succeeds, and are removed if it fails
+        :param arguments: List of the arguments of the BLAST command with the output directed to stdout
+        :param reports: List of the names and paths of the reports. The temporary files have a .tmp extension
+        :param outputs: List of the open temporary files. These are closed once the search completes
+        :param parse: Function that parses an iterable of lines of BLAST output, and writes the hits to the outputs
+        :param stdin: Optional name and path of a (compressed) query to decompress into the stdin of BLAST
+        :return: Boolean of whether the search succeeded
+        """
+        with tempfile.TemporaryFile() as stderr:
+            process = subprocess.Popen(arguments,
+                                       stdin=subprocess.PIPE if stdin else None,
+                                       stdout=subprocess.PIPE,
+                                       stderr=stderr)
+            if stdin:
+                feed(path=stdin,
+                     stdin=process.stdin)
+            try:
+                parse(io.TextIOWrapper(process.stdout))
+            except BaseException:
+                process.kill()
+                raise
+            finally:
+                process.stdout.close()
+                returncode = process.wait()
+                BLAST.close_outputs(reports=reports,
+                                    outputs=outputs,
+                                    success=returncode == 0)
+            if returncode:
+                stderr.seek(0)
+                logging.debug('{command} failed with return code {code}: {err}'
+                              .format(command=shlex.join(arguments),
+                                      code=returncode,
+                                      err=stderr.read().decode(errors='replace')))
+                return False
+        return True
+
+    def blast_commandline(self, query, report, db, settings, threads):
+        """
+        Create the BLAST command line of the analysis
+        :param query: Name and path of the query file
+        :param report: Name and path of the report to create
+        :param db: Name and path of the BLAST database (without extension)
+        :param settings: Dictionary of BLAST parameters
+        :param threads: Number of threads to use
+        :return: Biopython command line object
+        """
+        return self.search_commandline(search={'program': self.program,
+                                               'query': query,
+                                               'db': db,
+                                               'settings': settings,
+                                               'threads': threads,
+                                               'dbsize': None},
+                                       report=report)
+
+    @staticmethod
+    def search_commandline(search, report='-'):
+        """
+        Check the parameters of a search, and create its BLAST command line with the genemethods command line methods.
+        The parameters of searches run by workers are read from the work queue, so anything unexpected is rejected
+        :param search: Dictionary of the program, query, database, BLAST parameters, threads, and optional effective
+        database size of the search
+        :param report: Name and path of the report to create. Defaults to stdout
+        :return: Biopython command line object
+        """
+        assert isinstance(search, dict) and set(search) == SEARCH_FIELDS, \
+            'Invalid search fields: {fields}'.format(fields=sorted(search) if isinstance(search, dict) else search)
+        program = search['program']
+        assert program in BLAST_PROGRAMS, 'Invalid BLAST program: {program}'.format(program=program)
+        # Paths must not be mistaken for options. A query of '-' is read from stdin
+        for path in [search['db']] + ([search['query']] if search['query'] != '-' else list()):
+            assert isinstance(path, str) and path and not path.startswith('-'), 'Invalid path: {path}'.format(path=path)
+        settings = search['settings']
+        assert isinstance(settings, dict) and set(settings) == SETTINGS_FIELDS, \
+            'Invalid BLAST parameters: {settings}'.format(settings=settings)
+        # Raises a ValueError if the e-value is not a number
+        float(settings['evalue'])
+        assert type(settings['num_alignments']) is int and settings['num_alignments'] > 0, \
+            'Invalid number of alignments: {count}'.format(count=settings['num_alignments'])
+        assert type(settings['perc_identity']) in (int, float) and 0 <= settings['perc_identity'] <= 100, \
+            'Invalid percent identity: {pid}'.format(pid=settings['perc_identity'])
+        assert settings['task'] in BLASTN_TASKS, 'Invalid blastn task: {task}'.format(task=settings['task'])
+        assert type(search['threads']) is int and search['threads'] > 0, \
+            'Invalid number of threads: {threads}'.format(threads=search['threads'])
+        assert search['dbsize'] is None or type(search['dbsize']) is int and search['dbsize'] > 0, \
+            'Invalid database size: {dbsize}'.format(dbsize=search['dbsize'])
+        # The genemethods command line methods extract the query and output from a metadata object
+        job = MetadataObject()
+        job.general = GenObject()
+        job.general.bestassemblyfile = search['query']
+        job.search = GenObject()
+        job.search.report = report
+        commandline = getattr(GeneSeekr, '{program}_commandline'.format(program=program))
+        if program == 'blastn':
+            blast = commandline(sample=job,
+                                analysistype='search',
+                                db=search['db'],
+                                evalue=settings['evalue'],
+                                num_alignments=settings['num_alignments'],
+                                num_threads=search['threads'],
+                                outfmt=OUTFMT,
+                                perc_identity=settings['perc_identity'],
+                                task=settings['task'])
+        else:
+            blast = commandline(sample=job,
+                                analysistype='search',
+                                db=search['db'],
+                                evalue=settings['evalue'],
+                                num_alignments=settings['num_alignments'],
+                                num_threads=search['threads'],
+                                outfmt=OUTFMT)
+        if search['dbsize']:
+            blast.dbsize = search['dbsize']
+        return blast
+
+    @staticmethod
+    def compressed_targets(targetpath):
+        """
+        Create the combined targets file of a folder with gzip, bgzip, or zstd-compressed .tfa files. The targets are
+        cleaned as with combinetargets, but the .tfa files are not rewritten. Folders with a combined targets file
+        are not changed
+        :param targetpath: Folder containing the targets
+        :return: Sorted list of the compressed .tfa files
+        """
+        compressed = compressed_glob(os.path.join(targetpath, '*.tfa'))
+        if not compressed or glob(os.path.join(targetpath, '*.fasta')):
+            return compressed
+        combinedtargets = os.path.join(targetpath, 'combinedtargets.fasta')
+        logging.info('Combining the compressed targets in {path}'.format(path=targetpath))
+        idset = set()
+        with open(combinedtargets + '.tmp', 'w') as combined:
+            for target in sorted(glob(os.path.join(targetpath, '*.tfa')) + compressed):
+                with open_compressed(target, 'rt') as fasta:
+                    for record in SeqIO.parse(fasta, 'fasta'):
+                        # Replace any dashes in the record.id with underscores, and remove any dashes or 'N's from the
+                        # sequence data - makeblastdb can't handle sequences with gaps
+                        name = record.id.replace('-', '_')
+                        if name in idset:
+                            continue
+                        idset.add(name)
+                        combined.write('>{name}\n{sequence}\n'
+                                       .format(name=name,
+                                               sequence=str(record.seq).upper().replace('-', '').replace('N', '')))
+        # The combined targets file is only moved into place once it is complete
+        os.rename(combinedtargets + '.tmp', combinedtargets)
+        return compressed
+
+    @staticmethod
+    def batch_query(samples, query):
+        """
+        Concatenate the assemblies of the samples into a single FASTA file. Each contig is renamed with a unique tag,
+        so that the hits can be assigned to the correct sample and contig
+        :param samples: List of metadata objects of the samples in the chunk
+        :param query: Name and path of the combined query file to create
+        :return: Dictionary of tag: (sample index, contig name)
+        """
+        tags = dict()
+        with open(query, 'w') as combined:
+            for index, sample in enumerate(samples):
+                with open_compressed(sample.general.bestassemblyfile, 'rt') as fasta:
+                    for line in fasta:
+                        if line.startswith('>'):
+                            # BLAST uses the first word of the header as the query id
+                            contig = line[1:].split()[0] if line[1:].split() else str()
+                            tag = 'gsq{count}'.format(count=len(tags))
+                            tags[tag] = (index, contig)
+                            combined.write('>{tag}\n'.format(tag=tag))
+                        else:
+                            combined.write(line)
+                # Ensure that the next sample starts on a new line
+                combined.write('\n')
+        return tags
+
+    def __init__(self, args, analysistype='geneseekr', cutoff=70, program='blastn', genus_specific=False, unique=False,
+                 evalue='1E-05', pipeline=True):
+        # Record the time and resources used by each stage. Several analyses can share a profiler
+        try:
+            self.profiler = args.profiler
+        except AttributeError:
+            try:
+                self.profiler = Profiler(enabled=bool(args.profile))
+            except AttributeError:
+                self.profiler = Profiler(enabled=False)
+        # Finding the samples and the targets includes combining the targets
+        with self.profiler.stage('combine_targets'):
+            # The genemethods parser only finds uncompressed .tfa files, so the compressed targets are combined first
+            try:
+                compressed = self.compressed_targets(args.targetpath) if os.path.isdir(args.targetpath) else list()
+            except (AttributeError, TypeError):
+                compressed = list()
+            super().__init__(args=args,
+                             analysistype=analysistype,
+                             cutoff=cutoff,
+                             program=program,
+                             genus_specific=genus_specific,
+                             unique=unique,
+                             evalue=evalue,
+                             pipeline=pipeline)
+        self.targets.extend(compressed)
+        # The .fai indices of the assemblies, and the .gzi indices of bgzip-compressed assemblies are created next to
+        # them, and match the *.fa* pattern used to find the samples. Ensure that they are not analysed as samples
+        self.metadata[:] = [sample for sample in self.metadata
+                            if not str(sample.general.bestassemblyfile).endswith(('.fai', '.gzi'))]
+        self.strains = [strain for strain in self.strains if not strain.endswith(('.fai', '.gzi'))]
+        # The names of compressed samples also lose the extension of the uncompressed file e.g. 2018-SEQ-0552.fasta.gz
+        for sample in self.metadata:
+            assembly = str(sample.general.bestassemblyfile)
+            if assembly != uncompressed_name(assembly):
+                sample.name = os.path.splitext(uncompressed_name(os.path.basename(assembly)))[0]
+        try:
+            self.parquet = args.parquet
+        except AttributeError:
+            self.parquet = False
+        assert not self.parquet or parquet_available(), 'Parquet reports require pyarrow. Please install it e.g. ' \
+                                                        'pip install pyarrow'
+        self.geneseekr = GeneSeekr(parquet=self.parquet,
+                                   threads=self.cpus)
+        # The parsing steps process each sample on its own, so they are recorded sample by sample
+        self.profiler.instrument(obj=self.geneseekr,
+                                 stages=['makeblastdb', 'target_folders', 'parseable_blast_outputs', 'parse_blast',
+                                         'unique_parse_blast', 'filter_unique', 'sixteens_parser', 'dict_initialise',
+                                         'reporter', 'resfinder_reporter', 'virulencefinder_reporter',
+                                         'sixteens_reporter', 'gdcs_reporter', 'sero_reporter'],
+                                 samples=['parseable_blast_outputs', 'parse_blast', 'unique_parse_blast',
+                                          'filter_unique', 'dict_initialise'])
+        self.manifest = Manifest(reportpath=self.reportpath)
+        try:
+            self.cachepath = args.cachepath
+        except AttributeError:
+            self.cachepath = None
+        try:
+            self.cachesize = args.cachesize if args.cachesize else 10
+        except AttributeError:
+            self.cachesize = 10
+        try:
+            self.batchsize = args.batchsize if args.batchsize else 1
+        except AttributeError:
+            self.batchsize = 1
+        # The k-mer pre-filter compares nucleotide sequences, so it is only used for blastn analyses
+        try:
+            self.prefilter = args.prefilter and self.program == 'blastn'
+        except AttributeError:
+            self.prefilter = False
+        # Alleles of typing schemes can optionally be called from exact matches without BLAST. Loci are only called
+        # when no other part of the sample shares a k-mer with the allele, so every location of the locus that BLAST
+        # would report is still searched. The hits of the other alleles of the called loci at the exact match are not in
+        # the reports, so the reports differ from those of BLAST, but typing analyses only keep the best hit at each
+        # location, which is the exact match
+        try:
+            self.exact = args.exact and self.program == 'blastn' and 'mlst' in self.analysistype.lower() and \
+                self.unique
+        except AttributeError:
+            self.exact = False
+        # Dictionary of report: list of the annotated lines of the exact matches of the sample
+        self.exacthits = dict()
+        # Dictionary of reduced combined targets file: (length, number of sequences) of the complete database
+        self.dbsizes = dict()
+        # Large databases can be split into shards that are searched in parallel
+        try:
+            self.shards = args.shards if args.shards else 1
+        except AttributeError:
+            self.shards = 1
+        try:
+            self.shard_by = args.shard_by if args.shard_by else 'size'
+        except AttributeError:
+            self.shard_by = 'size'
+        # Dictionary of combined targets file: TargetShards object of its shards
+        self.shardsets = dict()
+        # Analyses of a MultiBLAST search that share the search of each sample
+        self.merged = list()
+        # SQLite database of the results of the runs
+        try:
+            self.store = args.store
+        except AttributeError:
+            self.store = None
+        # Searches that run for longer than the timeout are stopped. Searches that time out, or are killed, are retried
+        try:
+            self.timeout = args.timeout if args.timeout else None
+        except AttributeError:
+            self.timeout = None
+        try:
+            self.retries = args.retries if args.retries is not None else 1
+        except AttributeError:
+            self.retries = 1
+        # Folder of the work queue of distributed searches
+        try:
+            self.queuepath = args.queue
+        except AttributeError:
+            self.queuepath = None
+        # Indices of the targets kept in memory by a server between jobs
+        try:
+            self.warmcache = args.warmcache
+        except AttributeError:
+            self.warmcache = None
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+from threading import Thread
+from glob import glob
+import subprocess
+import bisect
+import shutil
+import struct
+import gzip
+import zlib
+import io
+import os
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+__author__ = 'adamkoziol'
+
+# Extensions of the compressed FASTA files. The compression is detected from the contents of the files
+extensions = ['.gz', '.bgz', '.zst']
+
+
+def compression(path):
+    """
+    Detect the compression of a file from its first bytes
+    :param path: Name and path of the file
+    :return: 'bgzip', 'gzip', 'zstd', or None for uncompressed files
+    """
+    with open(path, 'rb') as handle:
+        header = handle.read(18)
+    if header[:4] == b'\x28\xb5\x2f\xfd':
+        return 'zstd'
+    if header[:2] == b'\x1f\x8b':
+        # BGZF blocks are gzip members with a BC extra field holding the size of the block
+        if len(header) == 18 and header[3] & 4 and header[12:14] == b'BC':
+            return 'bgzip'
+        return 'gzip'
+    return None
+
+
+def uncompressed_name(path):
+    """
+    :param path: Name (and path) of a file e.g. 2018-SEQ-0552.fasta.gz
+    :return: Name without the compression extension e.g. 2018-SEQ-0552.fasta
+    """
+    base, extension = os.path.splitext(path)
+    return base if extension in extensions else path
+
+
+def compressed_glob(pattern):
+    """
+    :param pattern: Glob pattern of the uncompressed files e.g. targets/*.tfa
+    :return: Sorted list of the compressed files that match the pattern e.g. targets/beta-lactam.tfa.gz
+    """
+    return sorted(path for extension in extensions for path in glob(pattern + extension))
+
+
+class ZstdProcess(io.RawIOBase):
+    """
+    Stream of a zstd-compressed file decompressed by the zstd program. Used when the zstandard package is not installed
+    """
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        return self.process.stdout.readinto(buffer)
+
+    def close(self):
+        if not self.closed:
+            self.process.stdout.close()
+            # Stop the decompression if the stream was not read to the end
+            if self.process.poll() is None:
+                self.process.kill()
+            self.process.wait()
+        super().close()
+
+    def __init__(self, path):
+        """
+        :param path: Name and path of the compressed file
+        """
+        super().__init__()
+        assert shutil.which('zstd'), 'Reading zstd-compressed files requires the zstandard package, or the zstd ' \
+                                     'program. Please install one e.g. pip install zstandard'
+        self.process = subprocess.Popen(['zstd', '-dcq', path],
+                                        stdout=subprocess.PIPE)
+
+
+def open_compressed(path, mode='rb'):
+    """
+    Open a file that may be compressed with gzip, bgzip, or zstd. The file is decompressed as it is read, so the
+    decompressed contents are never written to disk
+    :param path: Name and path of the file
+    :param mode: 'rb' for a binary stream, or 'rt' for a text stream
+    :return: File object of the decompressed contents
+    """
+    method = compression(path)
+    if method in ['gzip', 'bgzip']:
+        handle = gzip.open(path, 'rb')
+    elif method == 'zstd':
+        if zstandard is not None:
+            handle = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'),
+                                                                                  closefd=True))
+        else:
+            handle = io.BufferedReader(ZstdProcess(path))
+    else:
+        handle = open(path, 'rb')
+    return io.TextIOWrapper(handle) if 't' in mode else handle
+
+
+def feed(path, stdin):
+    """
+    Decompress a file into the stdin of a process in a background thread
+    :param path: Name and path of the (compressed) file
+    :param stdin: Binary stdin pipe of the process
+    :return: Started Thread object
+    """
+    def copy():
+        try:
+            with open_compressed(path) as source:
+                shutil.copyfileobj(source, stdin, 1048576)
+        except BrokenPipeError:
+            # The process exited (e.g. it failed) before it read all of its input
+            pass
+        finally:
+            try:
+                stdin.close()
+            except BrokenPipeError:
+                pass
+    thread = Thread(target=copy,
+                    daemon=True)
+    thread.start()
+    return thread
+
+
+def gzi(path):
+    """
+    Find, or create, the .gzi index of a bgzip-compressed file. The index is the htslib format: the number of entries,
+    then the compressed and uncompressed offsets of the start of each block after the first, as little-endian 64-bit
+    integers. An index older than the file is replaced. If the index cannot be written, it is created in memory
+    :param path: Name and path of the bgzip-compressed file
+    :return: List of the (compressed offset, uncompressed offset) of each block, including the first
+    """
+    index_file = path + '.gzi'
+    if os.path.isfile(index_file) and os.path.getmtime(index_file) >= os.path.getmtime(path):
+        with open(index_file, 'rb') as handle:
+            count = struct.unpack('<Q', handle.read(8))[0]
+            values = struct.unpack('<{count}Q'.format(count=2 * count), handle.read(16 * count))
+        return [(0, 0)] + list(zip(values[::2], values[1::2]))
+    blocks = list()
+    compressed = uncompressed = 0
+    with open(path, 'rb') as handle:
+        while True:
+            header = handle.read(18)
+            if len(header) < 18:
+                break
+            assert header[12:14] == b'BC', '{path} is not a bgzip-compressed file'.format(path=path)
+            block_size = struct.unpack('<H', header[16:18])[0] + 1
+            handle.seek(compressed + block_size - 4)
+            size = struct.unpack('<I', handle.read(4))[0]
+            # The empty block at the end of the file is not indexed
+            if size:
+                blocks.append((compressed, uncompressed))
+            compressed += block_size
+            uncompressed += size
+            handle.seek(compressed)
+    if not blocks:
+        blocks.append((0, 0))
+    try:
+        with open(index_file + '.tmp', 'wb') as handle:
+            handle.write(struct.pack('<Q', len(blocks) - 1))
+            for entry in blocks[1:]:
+                handle.write(struct.pack('<QQ', *entry))
+        os.rename(index_file + '.tmp', index_file)
+    except OSError:
+        pass
+    return blocks
+
+
+class BGZFile(object):
+    """
+    Random access to the decompressed contents of a bgzip-compressed file. The .gzi index finds the blocks that hold a
+    range of bytes, so only those blocks are decompressed. Supports the slicing, and rfind of a memory-mapped file
+    """
+
+    def block(self, number):
+        """
+        Decompress a block. The most recently used blocks are kept, as neighbouring reads often share blocks
+        :param number: Index of the block
+        :return: Decompressed bytes of the block
+        """
+        if number not in self.cache:
+            start = self.blocks[number][0]
+            end = self.blocks[number + 1][0] if number + 1 < len(self.blocks) else None
+            self.handle.seek(start)
+            data = self.handle.read(end - start) if end is not None else self.handle.read()
+            self.cache[number] = zlib.decompressobj(31).decompress(data)
+            if len(self.cache) > 16:
+                del self.cache[next(iter(self.cache))]
+        return self.cache[number]
+
+    def read(self, start, end):
+        """
+        :param start: Offset of the first byte in the decompressed contents
+        :param end: Exclusive offset of the last byte
+        :return: Decompressed bytes
+        """
+        if start >= end:
+            return b''
+        number = bisect.bisect_right(self.offsets, start) - 1
+        chunks = list()
+        position = self.offsets[number]
+        while position < end and number < len(self.blocks):
+            data = self.block(number)
+            chunks.append(data[max(start - position, 0):end - position])
+            position += len(data)
+            number += 1
+        return b''.join(chunks)
+
+    def rfind(self, sub, start, end):
+        """
+        Find the last occurrence of a single byte in a range, reading backwards one block at a time
+        :param sub: Byte string to find e.g. b'>'
+        :param start: Offset of the start of the range
+        :param end: Exclusive offset of the end of the range
+        :return: Offset of the byte, or -1
+        """
+        while end > start:
+            window = max(start, end - 65536)
+            found = self.read(window, end).rfind(sub)
+            if found != -1:
+                return window + found
+            end = window
+        return -1
+
+    def close(self):
+        self.handle.close()
+
+    def __getitem__(self, key):
+        return self.read(key.start or 0, key.stop)
+
+    def __init__(self, path):
+        """
+        :param path: Name and path of the bgzip-compressed file
+        """
+        self.blocks = gzi(path)
+        self.offsets = [uncompressed for _, uncompressed in self.blocks]
+        self.handle = open(path, 'rb')
+        self.cache = dict()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+from geneseekr.executor import ProcessExecutor
+import tempfile
+import hashlib
+import logging
+import shutil
+import errno
+import time
+import os
+
+__author__ = 'adamkoziol'
+
+
+class DatabaseCache(object):
+    """
+    Persistent cache of BLAST databases. Each database is stored in a folder named with a hash of the contents of
+    the target files, and the type of database (nucleotide or protein), so databases are only created once for a set
+    of targets, regardless of the target folder or the number of runs
+    """
+
+    def database(self, targets, combinedtargets, program):
+        """
+        Find the cached database of the targets, and create it if necessary
+        :param targets: List of target files (.tfa) used to create the combined targets file
+        :param combinedtargets: Name and path of the combined targets file
+        :param program: BLAST program that will use the database
+        :return: Name and path of the combined targets file in the cache. The database has the same base name
+        """
+        key = self.key(targets=targets if targets else [combinedtargets],
+                       program=program)
+        entry = os.path.join(self.cachepath, key)
+        if os.path.isdir(entry):
+            logging.debug('Using cached database {entry}'.format(entry=entry))
+        else:
+            self.build(entry=entry,
+                       combinedtargets=combinedtargets,
+                       program=program)
+        # Update the last used time of the entry for the LRU eviction
+        self.touch(entry)
+        self.evict(keep=key)
+        return os.path.join(entry, os.path.basename(combinedtargets))
+
+    @staticmethod
+    def dbtype(program):
+        """
+        Determine the type of database used by a BLAST program
+        :param program: BLAST program that will use the database
+        :return: 'nucl' or 'prot'
+        """
+        return 'nucl' if program in ['blastn', 'tblastn', 'tblastx'] else 'prot'
+
+    @staticmethod
+    def makeblastdb_command(fasta, program):
+        """
+        Create the makeblastdb command of the genemethods makeblastdb method
+        :param fasta: Name and path of the combined targets file
+        :param program: BLAST program that will use the database
+        :return: Command line, or None if the database already exists
+        """
+        dbtype = DatabaseCache.dbtype(program)
+        output = os.path.splitext(fasta)[0]
+        # Large databases are split into volumes, and have an alias file (.nal/.pal) rather than a single header file
+        if any(os.path.isfile('{output}.{prefix}{ext}'.format(output=output, prefix=dbtype[0], ext=ext))
+               for ext in ['hr', 'al']):
+            return None
+        return 'makeblastdb -in {fasta} -parse_seqids -max_file_sz 2GB -dbtype {dbtype} -out {output}' \
+            .format(fasta=fasta,
+                    dbtype=dbtype,
+                    output=output)
+
+    def key(self, targets, program):
+        """
+        Hash the contents of the target files, and the database type
+        :param targets: List of target files
+        :param program: BLAST program that will use the database
+        :return: Hexadecimal digest of the hash
+        """
+        sha = hashlib.sha256(self.dbtype(program).encode())
+        # Sort the targets, so the key does not depend on the order in which the files were found
+        for target in sorted(targets, key=os.path.basename):
+            sha.update(os.path.basename(target).encode() + b'\0')
+            with open(target, 'rb') as target_file:
+                for chunk in iter(lambda: target_file.read(1048576), b''):
+                    sha.update(chunk)
+            sha.update(b'\0')
+        return sha.hexdigest()
+
+    def build(self, entry, combinedtargets, program):
+        """
+        Create the database in a temporary folder in the cache, and move it into place with an atomic rename. If
+        another process created the same database in the meantime, its copy is used, and this one is discarded
+        :param entry: Name and path of the cache entry
+        :param combinedtargets: Name and path of the combined targets file
+        :param program: BLAST program that will use the database
+        """
+        logging.info('Creating cached database {entry}'.format(entry=entry))
+        tmp_dir = tempfile.mkdtemp(prefix='.tmp_', dir=self.cachepath)
+        try:
+            fasta = os.path.join(tmp_dir, os.path.basename(combinedtargets))
+            shutil.copyfile(combinedtargets, fasta)
+            # makeblastdb runs through the executor, so it has the same timeout, and retries as the searches
+            executor = ProcessExecutor(cpus=1,
+                                       timeout=self.timeout,
+                                       retries=self.retries)
+            executor.add(name=fasta,
+                         command=self.makeblastdb_command(fasta=fasta,
+                                                          program=program))
+            executor.run()
+            # Never add a failed build to the cache
+            assert executor.results[fasta]['success'] and self.makeblastdb_command(fasta=fasta,
+                                                                                   program=program) is None, \
+                'Could not create BLAST database from {fasta}'.format(fasta=combinedtargets)
+            try:
+                os.rename(tmp_dir, entry)
+            except OSError as e:
+                # The entry was created by a concurrent run
+                if e.errno not in (errno.ENOTEMPTY, errno.EEXIST):
+                    raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    @staticmethod
+    def touch(entry):
+        """
+        Record the time that a cache entry was last used
+        :param entry: Name and path of the cache entry
+        """
+        with open(os.path.join(entry, '.last_used'), 'a'):
+            pass
+        os.utime(os.path.join(entry, '.last_used'))
+
+    def entries(self):
+        """
+        Find all the complete entries in the cache
+        :return: List of (last used time, size in bytes, key) tuples, with the least recently used entry first
+        """
+        entries = list()
+        for key in os.listdir(self.cachepath):
+            entry = os.path.join(self.cachepath, key)
+            # Ignore temporary folders of databases that are being created
+            if key.startswith('.') or not os.path.isdir(entry):
+                continue
+            try:
+                try:
+                    last_used = os.path.getmtime(os.path.join(entry, '.last_used'))
+                except FileNotFoundError:
+                    last_used = os.path.getmtime(entry)
+                size = sum(os.path.getsize(os.path.join(entry, filename)) for filename in os.listdir(entry))
+            # The entry was evicted by a concurrent run
+            except FileNotFoundError:
+                continue
+            entries.append((last_used, size, key))
+        return sorted(entries)
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used entries until the cache is smaller than the maximum size. Entries used within
+        the grace period are not removed, as they may be in use by a concurrent run
+        :param keep: Key of an entry that must not be removed
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for last_used, size, key in entries:
+            if total <= self.max_size:
+                break
+            if key == keep or time.time() - last_used < self.grace:
+                continue
+            logging.info('Removing least recently used database {key} from the cache'.format(key=key))
+            # Move the entry out of the way first, so other runs never see a partially deleted database
+            doomed = tempfile.mkdtemp(prefix='.evict_', dir=self.cachepath)
+            try:
+                os.rename(os.path.join(self.cachepath, key), os.path.join(doomed, key))
+            except FileNotFoundError:
+                pass
+            shutil.rmtree(doomed, ignore_errors=True)
+            total -= size
+
+    def __init__(self, cachepath, max_size=10, grace=3600, timeout=None, retries=1):
+        """
+        :param cachepath: Folder in which the databases are stored
+        :param max_size: Maximum size of the cache in GB
+        :param grace: Entries used within this number of seconds are never evicted
+        :param timeout: Optional number of seconds after which makeblastdb is stopped
+        :param retries: Number of times to retry makeblastdb if it fails for a transient reason
+        """
+        self.cachepath = os.path.abspath(cachepath)
+        os.makedirs(self.cachepath, exist_ok=True)
+        self.max_size = max_size * 1024 ** 3
+        self.grace = grace
+        self.timeout = timeout
+        self.retries = retries
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+from geneseekr.compression import open_compressed
+import asyncio
+import logging
+import signal
+import shlex
+import time
+import os
+
+__author__ = 'adamkoziol'
+
+
+class ProcessExecutor(object):
+    """
+    Runs external programs (e.g. BLAST searches, and makeblastdb) concurrently with asyncio. Each job declares the
+    number of threads it will use, and only starts once that many cores are free, and fewer than the maximum number
+    of processes are running. The stdout of every process is parsed as it is written, so the pipes never fill, and
+    block the program. Jobs that run for longer than the timeout are stopped, and jobs that fail for transient
+    reasons (timeouts, processes killed by a signal e.g. by the out-of-memory killer, or processes that could not be
+    started) are retried. A failed job does not stop the other jobs
+    """
+
+    def add(self, name, command, threads=1, stdin=None, start=None, finish=None):
+        """
+        Add a job to the queue
+        :param name: Name of the job to use in the timing report
+        :param command: List of the arguments of the command, or a string of a command to run through the shell
+        :param threads: Number of cores the job will use
+        :param stdin: Optional name and path of a (compressed) file to decompress into the stdin of the process
+        :param start: Optional function called before each attempt. Returns the function that parses a list of lines
+        of stdout, or None to discard stdout
+        :param finish: Optional function called with a boolean of whether the attempt succeeded after each attempt
+        """
+        self.jobs.append({
+            'name': name,
+            'command': command if isinstance(command, str) else shlex.join(command),
+            'arguments': None if isinstance(command, str) else list(command),
+            'threads': max(1, min(threads, self.cpus)),
+            'stdin': stdin,
+            'start': start,
+            'finish': finish
+        })
+
+    def run(self):
+        """
+        Run all the queued jobs, and record the wall time of each. Exceptions raised while parsing the outputs of a job
+        are raised once the other jobs have completed
+        :return: Dictionary of job name: wall time in seconds
+        """
+        # Start the largest jobs first, so the small jobs can fill in the remaining cores
+        jobs = sorted(self.jobs, key=lambda job: job['threads'], reverse=True)
+        self.jobs = list()
+        if jobs:
+            errors = asyncio.run(self.main(jobs))
+            if errors:
+                raise errors[0]
+        return self.times
+
+    async def main(self, jobs):
+        """
+        :param jobs: List of the jobs to run
+        :return: List of the exceptions raised by the jobs
+        """
+        self.condition = asyncio.Condition()
+        self.free = self.cpus
+        self.running = 0
+        self.done = 0
+        self.total = len(jobs)
+        results = await asyncio.gather(*[self.job(job) for job in jobs],
+                                       return_exceptions=True)
+        return [result for result in results if isinstance(result, BaseException)]
+
+    async def job(self, job):
+        """
+        Wait for enough free cores, then run a job, and retry it if it fails for a transient reason
+        :param job: Dictionary of the job
+        """
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.free >= job['threads'] and self.running < self.processes)
+            self.free -= job['threads']
+            self.running += 1
+        start = time.time()
+        attempt = 0
+        success = False
+        try:
+            while True:
+                attempt += 1
+                returncode, transient = await self.attempt(job)
+                success = returncode == 0
+                if success or not transient or attempt > self.retries:
+                    break
+                logging.warning('{name} failed ({reason}). Retrying (attempt {attempt} of {total})'
+                                .format(name=job['name'],
+                                        reason='timed out' if returncode is None else 'return code {code}'
+                                        .format(code=returncode),
+                                        attempt=attempt + 1,
+                                        total=self.retries + 1))
+                await asyncio.sleep(self.delay * 2 ** (attempt - 1))
+        finally:
+            self.times[job['name']] = time.time() - start
+            self.results[job['name']] = {
+                'success': success,
+                'attempts': attempt,
+                'seconds': self.times[job['name']]
+            }
+            self.done += 1
+            logging.info('{name} {status} in {seconds:.2f} seconds using {threads} thread(s) ({done} of {total} jobs '
+                         'complete)'.format(name=job['name'],
+                                            status='completed' if success else 'failed',
+                                            seconds=self.times[job['name']],
+                                            threads=job['threads'],
+                                            done=self.done,
+                                            total=self.total))
+            if self.progress is not None:
+                self.progress(job['name'], self.done, self.total)
+            async with self.condition:
+                self.free += job['threads']
+                self.running -= 1
+                self.condition.notify_all()
+
+    async def attempt(self, job):
+        """
+        Run a job once
+        :param job: Dictionary of the job
+        :return: Return code of the process (None if it timed out), and whether the failure may be transient
+        """
+        parse = job['start']() if job['start'] is not None else None
+        options = dict(stdin=asyncio.subprocess.PIPE if job['stdin'] else None,
+                       stdout=asyncio.subprocess.PIPE,
+                       stderr=asyncio.subprocess.PIPE,
+                       start_new_session=True)
+        try:
+            if job['arguments'] is not None:
+                process = await asyncio.create_subprocess_exec(*job['arguments'], **options)
+            else:
+                process = await asyncio.create_subprocess_shell(job['command'], **options)
+        except OSError as e:
+            logging.debug('Could not start {command}: {error}'.format(command=job['command'],
+                                                                    error=e))
+            if job['finish'] is not None:
+                job['finish'](False)
+            return -1, True
+        tasks = [process.wait(),
+                 self.read(process.stderr),
+                 self.consume(process.stdout, parse)]
+        if job['stdin']:
+            tasks.append(self.feed(job['stdin'], process.stdin))
+        returncode = None
+        try:
+            returncode, stderr, *_ = await asyncio.wait_for(asyncio.gather(*tasks), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            logging.debug('{command} timed out after {timeout} seconds'.format(command=job['command'],
+                                                                            timeout=self.timeout))
+            stderr = b''
+        finally:
+            if process.returncode is None:
+                # The command runs in its own session, so the programs started by the shell are also stopped
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                await process.wait()
+            if job['finish'] is not None:
+                job['finish'](returncode == 0)
+        if returncode:
+            logging.debug('{command} failed with return code {code}: {err}'
+                          .format(command=job['command'],
+                                  code=returncode,
+                                  err=stderr.decode(errors='replace')))
+        # Processes killed by a signal have negative return codes, or return codes of 128 + the signal number (up to
+        # 64 on Linux) when run by the shell. Higher codes (e.g. 255) are errors reported by the programs themselves
+        return returncode, returncode is None or returncode < 0 or 128 < returncode <= 192
+
+    @staticmethod
+    async def consume(stdout, parse):
+        """
+        Read the stdout of a process as it is written, and parse the complete lines
+        :param stdout: asyncio StreamReader of stdout
+        :param parse: Function that parses a list of lines, or None to discard stdout
+        """
+        remainder = b''
+        while True:
+            chunk = await stdout.read(65536)
+            if not chunk:
+                break
+            if parse is None:
+                continue
+            lines = (remainder + chunk).split(b'\n')
+            remainder = lines.pop()
+            parse([line.decode() + '\n' for line in lines])
+        if remainder and parse is not None:
+            parse([remainder.decode()])
+
+    @staticmethod
+    async def read(stream):
+        """
+        :param stream: asyncio StreamReader e.g. of stderr
+        :return: Bytes of the stream
+        """
+        return await stream.read()
+
+    @staticmethod
+    async def feed(path, stdin):
+        """
+        Decompress a file into the stdin of a process. The file is read in a thread, so the event loop is not blocked
+        :param path: Name and path of the (compressed) file
+        :param stdin: asyncio StreamWriter of stdin
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            with open_compressed(path) as source:
+                while True:
+                    chunk = await loop.run_in_executor(None, source.read, 1048576)
+                    if not chunk:
+                        break
+                    stdin.write(chunk)
+                    await stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # The process exited (e.g. it failed) before it read all of its input
+            pass
+        finally:
+            stdin.close()
+
+    def __init__(self, cpus, processes=None, timeout=None, retries=1, delay=1, progress=None):
+        """
+        :param cpus: Number of cores available to the jobs
+        :param processes: Maximum number of processes to run at once. Defaults to the number of cores
+        :param timeout: Optional number of seconds after which a job is stopped
+        :param retries: Number of times to retry jobs that fail for a transient reason
+        :param delay: Number of seconds to wait before the first retry. Doubles with each retry
+        :param progress: Optional function called with the name of each job, and the number of completed, and total
+        jobs as the jobs complete
+        """
+        self.cpus = max(1, cpus)
+        self.processes = max(1, processes if processes else self.cpus)
+        self.timeout = timeout
+        self.retries = max(0, retries)
+        self.delay = delay
+        self.progress = progress
+        self.jobs = list()
+        self.times = dict()
+        # Dictionary of job name: dictionary of whether the job succeeded, the number of attempts, and the wall time
+        self.results = dict()
+        self.condition = None
+        self.free = self.cpus
+        self.running = 0
+        self.done = 0
+        self.total = 0
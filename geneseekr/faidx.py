@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+from geneseekr.compression import BGZFile, compression, open_compressed
+from collections.abc import Mapping
+from Bio.SeqRecord import SeqRecord
+from Bio.Seq import Seq
+import logging
+import mmap
+import os
+
+__author__ = 'adamkoziol'
+
+
+def read_index(fasta):
+    """
+    Create the samtools-style .fai index of a FASTA file. Each line of the index has the name of the sequence, its
+    length, the byte offset of the first base, the number of bases per line, and the number of bytes per line. The
+    offsets of compressed files are offsets in the decompressed contents, as with samtools faidx of bgzip files
+    :param fasta: Name and path of the (optionally compressed) FASTA file
+    :return: List of (name, length, offset, linebases, linewidth) tuples
+    """
+    index = list()
+    name = None
+    length = offset = linebases = linewidth = 0
+    # Whether a line shorter than the others has been seen in the current record. Only the last line may be short
+    short = False
+    position = 0
+    with open_compressed(fasta) as fasta_file:
+        for line in fasta_file:
+            if line.startswith(b'>'):
+                if name is not None:
+                    index.append((name, length, offset, linebases, linewidth))
+                header = line[1:].split()
+                name = header[0].decode() if header else str()
+                length = linebases = linewidth = 0
+                short = False
+                offset = position + len(line)
+            elif name is not None:
+                bases = len(line.rstrip(b'\r\n'))
+                if bases:
+                    assert not short and (not linebases or bases <= linebases), \
+                        'Lines of {name} in {fasta} have different lengths'.format(name=name,
+                                                                                  fasta=fasta)
+                    if not linebases:
+                        linebases = bases
+                        linewidth = len(line)
+                    elif bases < linebases or len(line) != linewidth:
+                        short = True
+                    length += bases
+            position += len(line)
+    if name is not None:
+        index.append((name, length, offset, linebases, linewidth))
+    return index
+
+
+def faidx(fasta):
+    """
+    Find, or create, the .fai index of a FASTA file. An index older than the FASTA file is replaced. If the index
+    cannot be written (e.g. the folder is read-only), it is created in memory
+    :param fasta: Name and path of the FASTA file
+    :return: List of (name, length, offset, linebases, linewidth) tuples
+    """
+    fai = fasta + '.fai'
+    if os.path.isfile(fai) and os.path.getmtime(fai) >= os.path.getmtime(fasta):
+        index = list()
+        with open(fai, 'r') as fai_file:
+            for line in fai_file:
+                name, length, offset, linebases, linewidth = line.rstrip('\n').split('\t')[:5]
+                index.append((name, int(length), int(offset), int(linebases), int(linewidth)))
+        return index
+    logging.debug('Creating .fai file for {fasta}'.format(fasta=fasta))
+    index = read_index(fasta)
+    try:
+        with open(fai + '.tmp', 'w') as fai_file:
+            for entry in index:
+                fai_file.write('\t'.join(str(value) for value in entry) + '\n')
+        os.rename(fai + '.tmp', fai)
+    except OSError:
+        pass
+    return index
+
+
+class IndexedFasta(Mapping):
+    """
+    Dictionary of the sequences in a FASTA file, in the style of SeqIO.to_dict, backed by the .fai index of the file.
+    Only the index is read up front. The file is memory-mapped, and a sequence is only read when its record is
+    requested, so large sets of targets that mostly have no hits, or large assemblies of which only a few regions are
+    needed, are never parsed in full. The index is stored next to the file, so it is only created once. Only the blocks
+    of bgzip-compressed files that hold the requested sequences are decompressed (with the .gzi index). Other
+    compressed files cannot be read at random, so they are decompressed into memory
+    """
+
+    def position(self, name, base):
+        """
+        :param name: Name of the sequence
+        :param base: 0-based position in the sequence
+        :return: Byte offset of the base in the file
+        """
+        _, offset, linebases, linewidth = self.index[name]
+        return offset + (base // linebases) * linewidth + base % linebases
+
+    def region(self, name, start=0, end=None):
+        """
+        Find the bytes of a sequence, or part of a sequence, in the file without copying them. Wrapped sequences
+        include the line breaks. The view must be released before the file is closed
+        :param name: Name of the sequence
+        :param start: 0-based start of the subsequence
+        :param end: 0-based, exclusive end of the subsequence. The end of the sequence by default
+        :return: memoryview of the memory-mapped file
+        """
+        length = self.index[name][0]
+        end = length if end is None else min(end, length)
+        if start >= end:
+            return memoryview(b'')
+        data = self.mmap()
+        if isinstance(data, BGZFile):
+            return memoryview(data[self.position(name, start):self.position(name, end - 1) + 1])
+        return memoryview(data)[self.position(name, start):self.position(name, end - 1) + 1]
+
+    def sequence(self, name, start=0, end=None):
+        """
+        Extract a sequence, or part of a sequence, from the file
+        :param name: Name of the sequence
+        :param start: 0-based start of the subsequence
+        :param end: 0-based, exclusive end of the subsequence. The end of the sequence by default
+        :return: Sequence as a string
+        """
+        length = self.index[name][0]
+        end = length if end is None else min(end, length)
+        with self.region(name, start, end) as region:
+            # Line breaks only need to be removed if the region spans more than one line
+            if len(region) == max(end - start, 0):
+                return str(region, 'ascii')
+            return bytes(region).translate(None, b'\r\n').decode()
+
+    def header(self, name):
+        """
+        :param name: Name of the sequence
+        :return: Header of the sequence without the leading >
+        """
+        offset = self.index[name][1]
+        data = self.mmap()
+        start = data.rfind(b'>', 0, offset)
+        return data[start + 1:offset].rstrip(b'\r\n').decode()
+
+    def mmap(self):
+        """
+        Memory-map the file the first time that a sequence is requested
+        :return: mmap object of the file, BGZFile object of bgzip files, or bytes of the other compressed files
+        """
+        if self.map is None:
+            if self.compression == 'bgzip':
+                self.map = BGZFile(self.fasta)
+            elif self.compression:
+                with open_compressed(self.fasta) as fasta:
+                    self.map = fasta.read()
+            else:
+                with open(self.fasta, 'rb') as fasta:
+                    self.map = mmap.mmap(fasta.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.map
+
+    def close(self):
+        """
+        Close the memory-mapped file
+        """
+        if self.map is not None:
+            if not isinstance(self.map, bytes):
+                self.map.close()
+            self.map = None
+
+    def __getitem__(self, name):
+        if name not in self.index:
+            raise KeyError(name)
+        description = self.header(name)
+        return SeqRecord(Seq(self.sequence(name)),
+                         id=name,
+                         name=name,
+                         description=description)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __init__(self, fasta):
+        """
+        :param fasta: Name and path of the (optionally gzip, bgzip, or zstd-compressed) FASTA file
+        """
+        self.fasta = fasta
+        self.compression = compression(fasta)
+        # Dictionary of name: (length, offset, linebases, linewidth)
+        self.index = {name: (length, offset, linebases, linewidth)
+                      for name, length, offset, linebases, linewidth in faidx(fasta)}
+        self.map = None
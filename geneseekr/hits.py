@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+from collections.abc import Mapping
+from array import array
+import numpy as np
+
+__author__ = 'adamkoziol'
+
+
+class Hit(Mapping):
+    """
+    Read-only, dict-like view of a single row of a HitTable. The BLAST columns are returned as text, as they are by
+    csv.DictReader, and the calculated columns (e.g. percent_match, low, high) are returned as numbers, so the view
+    can be used wherever the genemethods methods expect a row dictionary
+    """
+
+    def __getitem__(self, key):
+        return self.table.value(self.number, key)
+
+    def __iter__(self):
+        return iter(self.table.fieldnames)
+
+    def __len__(self):
+        return len(self.table.fieldnames)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def __init__(self, table, number):
+        """
+        :param table: HitTable containing the hit
+        :param number: Index of the hit in the table
+        """
+        self.table = table
+        self.number = number
+
+
+class HitTable(object):
+    """
+    Columnar table of BLAST hits. Numeric columns are stored in typed arrays, subject and query ids (and the text of
+    the e-values and bit scores) are interned, and the query and subject sequences are stored in a single buffer, so a
+    hit uses a few dozen bytes plus its sequences, rather than a dictionary of strings. Iterating over the table (or
+    indexing it with an integer) yields dict-like Hit views
+    """
+    # Integer columns reported by BLAST. Returned as text
+    integers = ['positives', 'mismatches', 'gaps', 'subject_length', 'alignment_length', 'query_start', 'query_end',
+                'subject_start', 'subject_end']
+    # Columns calculated from the BLAST outputs
+    coordinates = ['low', 'high']
+    floats = ['percent_match', 'percentidentity', 'alignment_fraction']
+    # Columns reported by BLAST that are interned. The e-values and bit scores are also stored as numbers for filtering
+    interned = ['query_id', 'subject_id', 'evalue', 'bit_score']
+    sequences = ['query_sequence', 'subject_sequence']
+    fieldnames = interned[:2] + integers[:3] + interned[2:] + integers[3:] + floats[:1] + sequences + coordinates + \
+        floats[1:]
+
+    def intern(self, value):
+        """
+        :param value: String to intern
+        :return: Integer code of the string
+        """
+        try:
+            return self.codes[value]
+        except KeyError:
+            self.codes[value] = len(self.strings)
+            self.strings.append(value)
+            return self.codes[value]
+
+    def append(self, row):
+        """
+        Add a hit to the table
+        :param row: Dictionary of a BLAST hit with all the fieldnames of the table e.g. a row created by the
+        unique_parse_blast method
+        """
+        for column in self.integers + self.coordinates:
+            self.columns[column].append(int(row[column]))
+        for column in self.floats:
+            self.columns[column].append(float(row[column]))
+        for column in self.interned:
+            self.columns[column].append(self.intern(row[column]))
+        self.numbers['evalue'].append(float(row['evalue']))
+        self.numbers['bit_score'].append(float(row['bit_score']))
+        for column in self.sequences:
+            self.buffers[column].extend(row[column].encode())
+            self.offsets[column].append(len(self.buffers[column]))
+
+    def value(self, number, key):
+        """
+        Retrieve a single value from the table
+        :param number: Index of the hit
+        :param key: Name of the column
+        :return: Value of the column for the hit
+        """
+        if key in self.columns:
+            value = self.columns[key][number]
+            if key in self.interned:
+                return self.strings[value]
+            if key in self.integers:
+                return str(value)
+            return value
+        if key in self.buffers:
+            offsets = self.offsets[key]
+            return self.buffers[key][offsets[number]:offsets[number + 1]].decode()
+        raise KeyError(key)
+
+    def array(self, key):
+        """
+        :param key: Name of a column stored in a typed array
+        :return: NumPy view of the typed array. The data are not copied
+        """
+        column = self.columns[key]
+        if not len(column):
+            return np.empty(0, dtype=np.dtype(column.typecode))
+        return np.frombuffer(column, dtype=np.dtype(column.typecode))
+
+    def column(self, key):
+        """
+        Retrieve an entire column as a NumPy array. The e-value and bit score columns are numeric, and the id columns
+        are arrays of strings
+        :param key: Name of the column
+        :return: NumPy array of the column
+        """
+        if key in self.numbers:
+            return np.frombuffer(self.numbers[key], dtype=np.float64) if len(self) else np.empty(0)
+        if key in self.interned:
+            return np.array(self.strings + [None], dtype=object)[self.array(key)]
+        if key in self.columns:
+            return self.array(key)
+        raise KeyError(key)
+
+    def mask(self, identity=None, coverage=None, evalue=None):
+        """
+        Vectorised selection of hits
+        :param identity: Minimum percent match (percent identity over the subject length)
+        :param coverage: Minimum percentage of the subject length covered by the alignment
+        :param evalue: Maximum e-value
+        :return: Boolean NumPy array of the hits that pass all the supplied thresholds
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if identity is not None:
+            mask &= self.array('percent_match') >= float(identity)
+        if coverage is not None:
+            mask &= self.array('alignment_fraction') >= float(coverage)
+        if evalue is not None:
+            mask &= self.column('evalue') <= float(evalue)
+        return mask
+
+    def filter(self, identity=None, coverage=None, evalue=None):
+        """
+        Create a new table of the hits that pass the supplied thresholds
+        :param identity: Minimum percent match (percent identity over the subject length)
+        :param coverage: Minimum percentage of the subject length covered by the alignment
+        :param evalue: Maximum e-value
+        :return: Filtered HitTable
+        """
+        return self.take(np.flatnonzero(self.mask(identity=identity,
+                                                  coverage=coverage,
+                                                  evalue=evalue)))
+
+    def take(self, numbers):
+        """
+        Create a new table from a selection of hits. The interned strings are shared with this table
+        :param numbers: Iterable of the indices of the hits, in the order in which they are to appear in the new table
+        :return: HitTable
+        """
+        table = HitTable(template=self)
+        table.extend(table=self,
+                     numbers=numbers)
+        return table
+
+    def extend(self, table, numbers=None):
+        """
+        Add hits from another table
+        :param table: HitTable from which the hits are copied
+        :param numbers: Optional iterable of the indices of the hits to copy. All hits are copied by default
+        """
+        numbers = np.arange(len(table)) if numbers is None else np.asarray(numbers, dtype=np.int64)
+        translation = None
+        # Tables with different pools of interned strings need their codes translated
+        if table.codes is not self.codes:
+            translation = np.array([self.intern(string) for string in table.strings] + [0], dtype=np.int64)
+        for key, column in self.columns.items():
+            values = table.array(key)[numbers]
+            if translation is not None and key in self.interned:
+                values = translation[values]
+            column.frombytes(values.astype(np.dtype(column.typecode)).tobytes())
+        for key, column in self.numbers.items():
+            column.frombytes(table.column(key)[numbers].tobytes())
+        for key, buffer in self.buffers.items():
+            offsets = table.offsets[key]
+            for number in numbers:
+                buffer.extend(table.buffers[key][offsets[number]:offsets[number + 1]])
+                self.offsets[key].append(len(buffer))
+
+    def __len__(self):
+        return len(self.columns['subject_id'])
+
+    def __getitem__(self, number):
+        if number < 0:
+            number += len(self)
+        if not 0 <= number < len(self):
+            raise IndexError('hit index out of range')
+        return Hit(table=self,
+                   number=number)
+
+    def __iter__(self):
+        for number in range(len(self)):
+            yield Hit(table=self,
+                      number=number)
+
+    def __init__(self, template=None):
+        """
+        :param template: Optional HitTable with which to share the pool of interned strings
+        """
+        self.strings = template.strings if template is not None else list()
+        self.codes = template.codes if template is not None else dict()
+        self.columns = dict()
+        for column in self.integers + self.coordinates:
+            self.columns[column] = array('i')
+        for column in self.floats:
+            self.columns[column] = array('d')
+        for column in self.interned:
+            self.columns[column] = array('i')
+        self.numbers = {'evalue': array('d'), 'bit_score': array('d')}
+        self.buffers = {column: bytearray() for column in self.sequences}
+        self.offsets = {column: array('q', [0]) for column in self.sequences}
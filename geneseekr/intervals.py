@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+from collections import defaultdict
+from bisect import bisect_left
+
+__author__ = 'adamkoziol'
+
+
+class RangeIndex(object):
+    """
+    Index of the query ranges of the BLAST hits on a contig, used to find the best hit at each location with --unique.
+    A new hit is merged with the stored ranges that start or end within the window of its own start or end. The
+    ranges are binned by their start and end coordinates, so only the ranges in the neighbouring bins are compared,
+    rather than every range on the contig
+    """
+
+    def bins(self, coordinate):
+        """
+        :param coordinate: Start or end coordinate of a hit
+        :return: Range of the bins that may contain coordinates within the window of the coordinate
+        """
+        return range((coordinate - self.window) // self.window, (coordinate + self.window) // self.window + 1)
+
+    def candidates(self, low, high):
+        """
+        Find the stored ranges that start within the window of low, or end within the window of high
+        :param low: Start of the new hit
+        :param high: End of the new hit
+        :return: Set of the indices of the candidate ranges
+        """
+        candidates = set()
+        for number in self.bins(low):
+            candidates.update(self.starts.get(number, ()))
+        for number in self.bins(high):
+            candidates.update(self.ends.get(number, ()))
+        return candidates
+
+    def add(self, low, high):
+        """
+        Merge a hit with the stored ranges. Ranges that start slightly after the new hit are extended down to its start,
+        and ranges that end slightly before it are extended up to its end. Uses the same rules as the genemethods
+        unique_parse_blast method, so the ranges are identical
+        :param low: Start of the new hit
+        :param high: End of the new hit
+        :return: Boolean of whether the hit is at a new location, and was appended to the ranges
+        """
+        append = True
+        for number in self.candidates(low, high):
+            spot = self.ranges[number]
+            if 1 <= (spot[0] - low) <= self.window:
+                self.starts[spot[0] // self.window].discard(number)
+                spot[0] = low
+                self.starts[spot[0] // self.window].add(number)
+                append = False
+            elif 1 <= (high - spot[1]) <= self.window:
+                self.ends[spot[1] // self.window].discard(number)
+                spot[1] = high
+                self.ends[spot[1] // self.window].add(number)
+                append = False
+            elif 1 <= (low - spot[0]) <= self.window:
+                append = False
+            elif 1 <= (spot[1] - high) <= self.window:
+                append = False
+            elif low == spot[0] and high == spot[1]:
+                append = False
+        if append:
+            self.ranges.append([low, high])
+            self.index(len(self.ranges) - 1)
+        return append
+
+    def index(self, number):
+        """
+        Add a stored range to the bins
+        :param number: Index of the range in the list of ranges
+        """
+        low, high = self.ranges[number]
+        self.starts[low // self.window].add(number)
+        self.ends[high // self.window].add(number)
+
+    def __init__(self, ranges, window=100):
+        """
+        :param ranges: List of [low, high] lists. The list is updated in place as hits are added
+        :param window: Maximum distance (bp) between the ends of hits at the same location
+        """
+        self.ranges = ranges
+        self.window = window
+        self.starts = defaultdict(set)
+        self.ends = defaultdict(set)
+        for number in range(len(self.ranges)):
+            self.index(number)
+
+
+class IntervalIndex(object):
+    """
+    Static index of half-open intervals [low, high) sorted by their start. Intervals overlapping a query must start
+    after the query start minus the longest interval, and before the query end, so each query only examines the
+    intervals in that sorted window
+    """
+
+    def overlaps(self, low, high):
+        """
+        Find the intervals that share at least one position with [low, high)
+        :param low: Start of the query
+        :param high: End of the query (exclusive)
+        :return: List of the indices of the overlapping intervals, in the order that the intervals were provided
+        """
+        if low >= high:
+            return list()
+        first = bisect_left(self.lows, low - self.longest + 1)
+        last = bisect_left(self.lows, high)
+        return sorted(number for number in self.order[first:last]
+                      if self.intervals[number][1] > low and self.intervals[number][0] < self.intervals[number][1])
+
+    def __init__(self, intervals):
+        """
+        :param intervals: List of (low, high) tuples
+        """
+        self.intervals = intervals
+        self.order = sorted(range(len(intervals)), key=lambda number: intervals[number][0])
+        self.lows = [intervals[number][0] for number in self.order]
+        self.longest = max([high - low for low, high in intervals] + [0])
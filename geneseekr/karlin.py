@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+import math
+
+__author__ = 'adamkoziol'
+
+# Karlin-Altschul parameters of the scoring systems of the BLAST programs with the settings of the analyses: lambda, K,
+# H, alpha, and beta, as in the tables of blast_stat.c in the BLAST+ sources. blastn (-task blastn) uses reward 2,
+# penalty -3, gap open 5, and gap extend 2. The protein searches use BLOSUM62 with gap open 11, and gap extend 1, except
+# for tblastx, which is ungapped, and uses alpha = lambda / H, and beta = 0
+PARAMETERS = {
+    'blastn': (0.625, 0.41, 0.78, 0.8, -2),
+    'blastp': (0.267, 0.041, 0.14, 1.9, -30),
+    'blastx': (0.267, 0.041, 0.14, 1.9, -30),
+    'tblastn': (0.267, 0.041, 0.14, 1.9, -30),
+    'tblastx': (0.3176, 0.134, 0.4012, 0.3176 / 0.4012, 0)
+}
+# blastn scores, used to recover the raw score of a hit from its alignment
+REWARD = 2
+PENALTY = -3
+GAP_OPEN = 5
+GAP_EXTEND = 2
+# BLOSUM62, used to recover the raw score of the (ungapped) hits of tblastx from their alignment
+RESIDUES = 'ARNDCQEGHILKMFPSTWYVBZX*'
+BLOSUM62 = [
+    [4, -1, -2, -2, 0, -1, -1, 0, -2, -1, -1, -1, -1, -2, -1, 1, 0, -3, -2, 0, -2, -1, 0, -4],
+    [-1, 5, 0, -2, -3, 1, 0, -2, 0, -3, -2, 2, -1, -3, -2, -1, -1, -3, -2, -3, -1, 0, -1, -4],
+    [-2, 0, 6, 1, -3, 0, 0, 0, 1, -3, -3, 0, -2, -3, -2, 1, 0, -4, -2, -3, 3, 0, -1, -4],
+    [-2, -2, 1, 6, -3, 0, 2, -1, -1, -3, -4, -1, -3, -3, -1, 0, -1, -4, -3, -3, 4, 1, -1, -4],
+    [0, -3, -3, -3, 9, -3, -4, -3, -3, -1, -1, -3, -1, -2, -3, -1, -1, -2, -2, -1, -3, -3, -2, -4],
+    [-1, 1, 0, 0, -3, 5, 2, -2, 0, -3, -2, 1, 0, -3, -1, 0, -1, -2, -1, -2, 0, 3, -1, -4],
+    [-1, 0, 0, 2, -4, 2, 5, -2, 0, -3, -3, 1, -2, -3, -1, 0, -1, -3, -2, -2, 1, 4, -1, -4],
+    [0, -2, 0, -1, -3, -2, -2, 6, -2, -4, -4, -2, -3, -3, -2, 0, -2, -2, -3, -3, -1, -2, -1, -4],
+    [-2, 0, 1, -1, -3, 0, 0, -2, 8, -3, -3, -1, -2, -1, -2, -1, -2, -2, 2, -3, 0, 0, -1, -4],
+    [-1, -3, -3, -3, -1, -3, -3, -4, -3, 4, 2, -3, 1, 0, -3, -2, -1, -3, -1, 3, -3, -3, -1, -4],
+    [-1, -2, -3, -4, -1, -2, -3, -4, -3, 2, 4, -2, 2, 0, -3, -2, -1, -2, -1, 1, -4, -3, -1, -4],
+    [-1, 2, 0, -1, -3, 1, 1, -2, -1, -3, -2, 5, -1, -3, -1, 0, -1, -3, -2, -2, 0, 1, -1, -4],
+    [-1, -1, -2, -3, -1, 0, -2, -3, -2, 1, 2, -1, 5, 0, -2, -1, -1, -1, -1, 1, -3, -1, -1, -4],
+    [-2, -3, -3, -3, -2, -3, -3, -3, -1, 0, 0, -3, 0, 6, -4, -2, -2, 1, 3, -1, -3, -3, -1, -4],
+    [-1, -2, -2, -1, -3, -1, -1, -2, -2, -3, -3, -1, -2, -4, 7, -1, -1, -4, -3, -2, -2, -1, -2, -4],
+    [1, -1, 1, 0, -1, 0, 0, 0, -1, -2, -2, 0, -1, -2, -1, 4, 1, -3, -2, -2, 0, 0, 0, -4],
+    [0, -1, 0, -1, -1, -1, -1, -2, -2, -1, -1, -1, -1, -2, -1, 1, 5, -2, -2, 0, -1, -1, 0, -4],
+    [-3, -3, -4, -4, -2, -2, -3, -2, -2, -3, -2, -3, -1, 1, -4, -3, -2, 11, 2, -3, -4, -3, -2, -4],
+    [-2, -2, -2, -3, -2, -1, -2, -3, 2, -1, -1, -2, -1, 3, -3, -2, -2, 2, 7, -1, -3, -2, -1, -4],
+    [0, -3, -3, -3, -1, -2, -2, -3, -3, 3, 1, -2, 1, -1, -2, -2, 0, -3, -1, 4, -3, -2, -1, -4],
+    [-2, -1, 3, 4, -3, 0, 1, -1, 0, -3, -4, 0, -3, -3, -2, 0, -1, -4, -3, -3, 4, 1, -1, -4],
+    [-1, 0, 0, 1, -3, 3, 4, -2, 0, -3, -3, 1, -1, -3, -1, 0, -1, -3, -2, -2, 1, 4, -1, -4],
+    [0, -1, -1, -1, -2, -1, -1, -1, -1, -1, -1, -1, -1, -1, -2, 0, 0, -2, -1, -1, -1, -1, -1, -4],
+    [-4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, 1]
+]
+
+
+def lengths(query_length, database_length, program):
+    """
+    Convert the lengths of the query and of the database to the units of the search. Translated sequences are
+    searched in residues
+    :param query_length: Length of the query in bases (or residues)
+    :param database_length: Total length of the sequences in the database in bases (or residues)
+    :param program: BLAST program
+    :return: Tuple of the query, and database lengths of the search
+    """
+    if program in ['blastx', 'tblastx']:
+        query_length //= 3
+    if program in ['tblastn', 'tblastx']:
+        database_length //= 3
+    return query_length, database_length
+
+
+def length_adjustment(query_length, database_length, sequences, program='blastn'):
+    """
+    Calculate the length adjustment of a search: the expected length of an alignment with a score high enough to be
+    reported, which is removed from the query, and from each sequence in the database. This is the fixed point found
+    by BLAST_ComputeLengthAdjustment in the BLAST+ sources
+    :param query_length: Length of the query in the units of the search
+    :param database_length: Total length of the sequences in the database in the units of the search
+    :param sequences: Number of sequences in the database
+    :param program: BLAST program
+    :return: Length adjustment
+    """
+    lam, k, _, alpha, beta = PARAMETERS[program]
+    alpha_d_lambda = alpha / lam
+    log_k = math.log(k)
+    m = float(query_length)
+    n = float(database_length)
+    # The largest adjustment that leaves K * (m - ell) * (n - N * ell) > max(m, n)
+    c = n * m - max(m, n) / k
+    if c < 0:
+        return 0
+    mb = m * sequences + n
+    ell_max = 2 * c / (mb + math.sqrt(mb * mb - 4 * sequences * c))
+    ell_min = 0
+    ell_next = 0
+    converged = False
+    for iteration in range(1, 21):
+        ell = ell_next
+        ell_bar = alpha_d_lambda * (log_k + math.log((m - ell) * (n - sequences * ell))) + beta
+        if ell_bar >= ell:
+            ell_min = ell
+            if ell_bar - ell_min <= 1.0:
+                converged = True
+                break
+            if ell_min == ell_max:
+                break
+        else:
+            ell_max = ell
+        if ell_min <= ell_bar <= ell_max:
+            ell_next = ell_bar
+        else:
+            ell_next = ell_max if iteration == 1 else (ell_min + ell_max) / 2
+    adjustment = int(ell_min)
+    if converged:
+        # The fixed point may be the next integer
+        ell = math.ceil(ell_min)
+        if ell <= ell_max and \
+                alpha_d_lambda * (log_k + math.log((m - ell) * (n - sequences * ell))) + beta >= ell:
+            adjustment = int(ell)
+    return adjustment
+
+
+def search_space(query_length, database_length, sequences, program='blastn'):
+    """
+    Calculate the effective search space of a query in the same way as BLAST: the query, and each sequence in the
+    database, are shortened by the length adjustment
+    :param query_length: Length of the query sequence in bases (or residues)
+    :param database_length: Total length of the sequences in the database in bases (or residues)
+    :param sequences: Number of sequences in the database
+    :param program: BLAST program
+    :return: Effective search space
+    """
+    query_length, database_length = lengths(query_length, database_length, program)
+    adjustment = length_adjustment(query_length=query_length,
+                                   database_length=database_length,
+                                   sequences=sequences,
+                                   program=program)
+    return max(query_length - adjustment, 1) * max(database_length - sequences * adjustment, 1)
+
+
+def expect_value(score, space, program='blastn'):
+    """
+    Calculate the e-value of a raw alignment score
+    :param score: Raw alignment score
+    :param space: Effective search space
+    :param program: BLAST program
+    :return: Expect value
+    """
+    lam, k, _, _, _ = PARAMETERS[program]
+    return space * k * math.exp(-lam * score)
+
+
+def raw_score(query_sequence, subject_sequence):
+    """
+    Recover the raw blastn score of an alignment from the aligned sequences
+    :param query_sequence: Aligned query sequence, with gaps
+    :param subject_sequence: Aligned subject sequence, with gaps
+    :return: Raw score, or None if the alignment has ambiguous bases, which BLAST scores differently
+    """
+    score = 0
+    gap = None
+    for query, subject in zip(query_sequence.upper(), subject_sequence.upper()):
+        if query == '-' or subject == '-':
+            # Gaps in the query and in the subject are opened separately
+            score -= GAP_EXTEND if gap == (query == '-') else GAP_OPEN + GAP_EXTEND
+            gap = query == '-'
+            continue
+        gap = None
+        if query not in 'ACGT' or subject not in 'ACGT':
+            return None
+        score += REWARD if query == subject else PENALTY
+    return score
+
+
+def protein_score(query_sequence, subject_sequence):
+    """
+    Recover the raw BLOSUM62 score of an ungapped alignment of translated sequences e.g. a hit of tblastx
+    :param query_sequence: Aligned query sequence
+    :param subject_sequence: Aligned subject sequence
+    :return: Raw score, or None if the alignment has gaps, or residues that are not in the matrix
+    """
+    score = 0
+    for query, subject in zip(query_sequence.upper(), subject_sequence.upper()):
+        if query not in RESIDUES or subject not in RESIDUES:
+            return None
+        score += BLOSUM62[RESIDUES.index(query)][RESIDUES.index(subject)]
+    return score
+
+
+def rescale(bit_score, space, program='blastn', query_sequence=None, subject_sequence=None):
+    """
+    Calculate the e-value of a hit in a different search space e.g. that of the complete database for a hit from a
+    search of part of the database. The raw score of the hits of blastn (reward 2, penalty -3), and of tblastx
+    (ungapped BLOSUM62) is recovered from the alignment, so the e-value is the one that BLAST reports. blastp, blastx,
+    and tblastn use composition-based statistics, which rescale the scores of each subject, so the raw score cannot be
+    recovered. Their e-values, and those of blastn hits with ambiguous bases, are calculated from the bit score. BLAST
+    rounds bit scores to 0.1 bits (1 bit above 99.9), so these e-values are approximate: within 4% (40% above 99.9
+    bits, where the e-values are far below any threshold) of those of a search of the complete database
+    :param bit_score: Bit score of the hit
+    :param space: Effective search space
+    :param program: BLAST program
+    :param query_sequence: Optional aligned query sequence of the hit
+    :param subject_sequence: Optional aligned subject sequence of the hit
+    :return: Expect value
+    """
+    if program in ['blastn', 'tblastx'] and query_sequence and subject_sequence:
+        score = raw_score(query_sequence=query_sequence,
+                          subject_sequence=subject_sequence) if program == 'blastn' else \
+            protein_score(query_sequence=query_sequence,
+                          subject_sequence=subject_sequence)
+        if score is not None:
+            return expect_value(score=score,
+                                space=space,
+                                program=program)
+    return space * 2 ** -float(bit_score)
+
+
+def relaxed_evalue(evalue, query_length, database_length, sequences, program='blastn'):
+    """
+    Calculate the e-value threshold of a search of part of a database (e.g. a shard) that reports every hit that
+    passes the threshold in a search of the complete database. The searches of the parts use the length of the
+    complete database, but BLAST only removes the length adjustment of the sequences in the part, so their search
+    space is larger. The threshold is raised by the largest possible ratio of the search spaces
+    :param evalue: E-value threshold of the analysis
+    :param query_length: Total length of the queries in bases (or residues). The length adjustment grows with the
+    query length, so this is an upper bound for every query
+    :param database_length: Total length of the sequences in the complete database in bases (or residues)
+    :param sequences: Number of sequences in the complete database
+    :param program: BLAST program
+    :return: Relaxed e-value threshold
+    """
+    query_length, database_length = lengths(query_length, database_length, program)
+    adjustment = length_adjustment(query_length=query_length,
+                                   database_length=database_length,
+                                   sequences=sequences,
+                                   program=program)
+    return float(evalue) * database_length / max(database_length - sequences * adjustment, 1)
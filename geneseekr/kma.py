@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+from olctools.accessoryFunctions.accessoryFunctions import make_path
+from geneseekr.blast import BLAST
+from geneseekr.kmer import format_bit_score, format_evalue, HIT_FIELDS, KmerIndex
+from geneseekr.faidx import IndexedFasta
+from geneseekr.tabular import TabularParser
+from click import progressbar
+import logging
+import os
+
+__author__ = 'adamkoziol'
+
+
+class KMA(BLAST):
+    """
+    k-mer alignment backend. Targets are indexed by their k-mers, and exact k-mer matches between the samples and the
+    targets are used to seed alignments. The alignments are filtered and written to the same annotated reports (with
+    the same columns) by the same parser as the BLAST analyses, so all the BLAST parsing and reporting methods can be
+    reused
+    """
+
+    def blast_db(self):
+        """
+        Create (or load) the k-mer index of each combined targets file
+        """
+        logging.info('Creating {at} k-mer indices as required'.format(at=self.analysistype))
+        for sample in self.metadata:
+            combinedtargets = sample[self.analysistype].combinedtargets
+            if combinedtargets != 'NA' and combinedtargets not in self.indices:
+                self.indices[combinedtargets] = self.target_index(cls=KmerIndex,
+                                                                  fasta=combinedtargets,
+                                                                  kmer_size=self.kmer_size)
+
+    def run_blast(self):
+        """
+        Perform k-mer alignments of all the samples against the targets
+        """
+        logging.info('Performing k-mer alignments on {at} targets'.format(at=self.analysistype))
+        analysed = list()
+        with progressbar(self.metadata) as bar:
+            for sample in bar:
+                make_path(sample[self.analysistype].reportdir)
+                # Use the same report naming scheme as the BLAST analyses: reportdir/samplename_program_at.tsv
+                sample[self.analysistype].report = os.path.join(
+                    sample[self.analysistype].reportdir, '{name}_{program}_{at}.tsv'
+                    .format(name=sample.name,
+                            program=self.program,
+                            at=self.analysistype))
+                sample[self.analysistype].blastcommand = 'kma -k {k} -e {evalue} {db}'\
+                    .format(k=self.kmer_size,
+                            evalue=self.evalue,
+                            db=sample[self.analysistype].combinedtargets)
+                try:
+                    index = self.indices[sample[self.analysistype].combinedtargets]
+                except KeyError:
+                    continue
+                # Only run the alignments if there is no report from a previous run with the same inputs and settings
+                if self.reusable(sample):
+                    continue
+                with self.profiler.stage(sample.name,
+                                         sample=sample.name):
+                    self.kma(sample=sample,
+                             index=index)
+                analysed.append(sample)
+        self.update_manifest(analysed)
+
+    def manifest_entry(self, sample):
+        """
+        The reports also depend on the k-mer size
+        :param sample: Metadata object of the sample
+        :return: Dictionary of the inputs and settings
+        """
+        entry = super().manifest_entry(sample)
+        entry['kmer_size'] = self.kmer_size
+        return entry
+
+    def run_parameters(self):
+        """
+        The results also depend on the k-mer size
+        :return: Dictionary of the inputs and settings of the run
+        """
+        parameters = super().run_parameters()
+        parameters['kmer_size'] = self.kmer_size
+        return parameters
+
+    def kma(self, sample, index):
+        """
+        Align every contig in a sample to the targets, and write the hits to the sample's report
+        :param sample: Metadata object of the sample
+        :param index: KmerIndex object of the targets
+        """
+        # Write to a temporary file first, so that an interrupted analysis doesn't leave a partial report
+        tmp_report = sample[self.analysistype].report + '.tmp'
+        # Read the contigs one at a time from the memory-mapped assembly
+        assembly = IndexedFasta(sample.general.bestassemblyfile)
+        parser = self.tabular_parser()
+        with open(tmp_report, 'w') as report:
+            report.write(parser.header())
+            parser.stream(lines=self.hit_lines(assembly=assembly,
+                                               index=index),
+                          outputs=[report])
+        assembly.close()
+        os.rename(tmp_report, sample[self.analysistype].report)
+
+    def hit_lines(self, assembly, index):
+        """
+        Align every contig in an assembly to the targets
+        :param assembly: IndexedFasta object of the assembly
+        :param index: KmerIndex object of the targets
+        :return: Generator of the hits as lines of BLAST tabular output
+        """
+        for contig in assembly:
+            for hit in index.search(contig=contig,
+                                    sequence=assembly.sequence(contig),
+                                    evalue=float(self.evalue)):
+                # Format the values in the same way as the BLAST reports
+                hit['evalue'] = format_evalue(hit['evalue'])
+                hit['bit_score'] = format_bit_score(hit['bit_score'])
+                yield '\t'.join(str(hit[field]) for field in HIT_FIELDS) + '\n'
+
+    def tabular_parser(self):
+        """
+        The k-mer alignments are nucleotide:nucleotide, so the percent match is calculated with the blastn logic
+        :return: TabularParser object
+        """
+        return TabularParser(fieldnames=self.fieldnames,
+                             program='blastn',
+                             cutoff=self.cutoff,
+                             evalue=self.blast_settings()['evalue'])
+
+    def parse_results(self):
+        """
+        Parse the outputs with the blastn logic, depending on whether unique results are desired
+        """
+        logging.info('Parsing {program} results for {at} targets'.format(program=self.program,
+                                                                         at=self.analysistype))
+        if 'sixteens' in self.analysistype:
+            self.metadata = self.geneseekr.sixteens_parser(metadata=self.metadata,
+                                                           analysistype=self.analysistype,
+                                                           fieldnames=self.fieldnames,
+                                                           cutoff=self.cutoff,
+                                                           program='blastn')
+        elif self.unique:
+            self.metadata = self.geneseekr.unique_parse_blast(metadata=self.metadata,
+                                                              analysistype=self.analysistype,
+                                                              fieldnames=self.fieldnames,
+                                                              cutoff=self.cutoff,
+                                                              program='blastn')
+            self.metadata = self.geneseekr.filter_unique(metadata=self.metadata,
+                                                         analysistype=self.analysistype)
+        else:
+            self.metadata = self.geneseekr.parse_blast(metadata=self.metadata,
+                                                       analysistype=self.analysistype,
+                                                       fieldnames=self.fieldnames,
+                                                       cutoff=self.cutoff,
+                                                       program='blastn')
+
+    def __init__(self, args, analysistype='geneseekr', cutoff=70, program='kma', genus_specific=False, unique=False,
+                 evalue='1E-05', pipeline=True, kmer_size=16):
+        super().__init__(args=args,
+                         analysistype=analysistype,
+                         cutoff=cutoff,
+                         program=program,
+                         genus_specific=genus_specific,
+                         unique=unique,
+                         evalue=evalue,
+                         pipeline=pipeline)
+        try:
+            self.kmer_size = args.kmer_size if args.kmer_size else kmer_size
+        except AttributeError:
+            self.kmer_size = kmer_size
+        self.indices = dict()
@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+from geneseekr.compression import open_compressed
+from Bio import SeqIO
+import logging
+import numpy
+import math
+import os
+
+__author__ = 'adamkoziol'
+
+# Two-bit encoding of the nucleotides. All other characters (N, IUPAC ambiguity codes) are flagged with a value of 4,
+# and any k-mer that overlaps them is discarded
+ENCODE = numpy.full(256, 4, dtype=numpy.uint8)
+for _code, _base in enumerate('ACGT'):
+    ENCODE[ord(_base)] = _code
+    ENCODE[ord(_base.lower())] = _code
+COMPLEMENT = str.maketrans('ACGTNacgtn-', 'TGCANtgcan-')
+# Scoring scheme and Karlin-Altschul parameters used by blastn (-task blastn) with the default reward 2, penalty -3,
+# gap open 5, and gap extend 2. Using the same values keeps the bit scores and e-values comparable to BLAST outputs
+REWARD = 2
+PENALTY = -3
+GAP_OPEN = 5
+GAP_EXTEND = 2
+LAMBDA = 0.625
+K = 0.41
+# Fields populated for every hit. These are in the same order as the custom outfmt 6 used for the BLAST analyses, so
+# the reports can be parsed with the same methods
+HIT_FIELDS = ['query_id', 'subject_id', 'positives', 'mismatches', 'gaps', 'evalue', 'bit_score', 'subject_length',
+              'alignment_length', 'query_start', 'query_end', 'subject_start', 'subject_end', 'query_sequence',
+              'subject_sequence']
+
+
+def reverse_complement(sequence):
+    """
+    Calculate the reverse complement of a nucleotide string
+    :param sequence: String of the sequence
+    :return: String of the reverse complemented sequence
+    """
+    return sequence.translate(COMPLEMENT)[::-1]
+
+
+def kmer_codes(sequence, kmer_size):
+    """
+    Calculate the two-bit encoded integer value of every k-mer in a sequence
+    :param sequence: String of the sequence
+    :param kmer_size: Length of the k-mers
+    :return: numpy arrays of the k-mer values, and the position of each k-mer in the sequence. K-mers that overlap
+    ambiguous bases are not included
+    """
+    codes = ENCODE[numpy.frombuffer(sequence.encode(), dtype=numpy.uint8)]
+    count = len(codes) - kmer_size + 1
+    if count < 1:
+        return numpy.zeros(0, dtype=numpy.uint64), numpy.zeros(0, dtype=numpy.int64)
+    kmers = numpy.zeros(count, dtype=numpy.uint64)
+    # Shift each base into the k-mer value in turn. The loop is over the k-mer length, not the sequence length
+    for offset in range(kmer_size):
+        kmers = (kmers << numpy.uint64(2)) | (codes[offset:offset + count] & 3).astype(numpy.uint64)
+    # Use a cumulative sum of the ambiguous bases to find the windows that do not contain any
+    ambiguous = numpy.concatenate(([0], numpy.cumsum(codes == 4)))
+    valid = (ambiguous[kmer_size:] - ambiguous[:count]) == 0
+    return kmers[valid], numpy.nonzero(valid)[0]
+
+
+def bit_score(score):
+    """
+    Convert a raw alignment score to a bit score
+    :param score: Raw alignment score
+    :return: Bit score
+    """
+    return (LAMBDA * score - math.log(K)) / math.log(2)
+
+
+def expect_value(score, query_length, database_length):
+    """
+    Calculate the e-value of an alignment score
+    :param score: Raw alignment score
+    :param query_length: Length of the query sequence
+    :param database_length: Total length of all the sequences in the database
+    :return: Expect value
+    """
+    return K * query_length * database_length * math.exp(-LAMBDA * score)
+
+
+def format_evalue(evalue):
+    """
+    Format an e-value in the same way as the BLAST tabular outputs
+    :param evalue: Expect value
+    :return: String of the e-value
+    """
+    if evalue < 1.0e-180:
+        return '0.0'
+    if evalue < 0.0009:
+        return '{:.0e}'.format(evalue)
+    if evalue < 0.1:
+        return '{:.3f}'.format(evalue)
+    if evalue < 1.0:
+        return '{:.2f}'.format(evalue)
+    if evalue < 10.0:
+        return '{:.1f}'.format(evalue)
+    return '{:.0f}'.format(evalue)
+
+
+def format_bit_score(score):
+    """
+    Format a bit score in the same way as the BLAST tabular outputs. Scores above 99.9 are truncated to integers
+    :param score: Bit score
+    :return: String of the bit score
+    """
+    if score > 99999:
+        return '{:.3e}'.format(score)
+    if score > 99.9:
+        return str(int(score))
+    return '{:.1f}'.format(score)
+
+
+def banded_alignment(query, subject, low, high):
+    """
+    Semi-global, affine gap alignment restricted to a band of diagonals. The subject is aligned from end to end, while
+    the query may begin and end at any position. The diagonal of a cell is the query index minus the subject index.
+    Each row of the band is calculated with a handful of numpy operations: the match (M) and query gap (X) states only
+    depend on the previous row, and the subject gap (Y) state is a running maximum along the current row. Only the
+    scores are stored, and the traceback recovers the moves from them
+    :param query: String of the query sequence
+    :param subject: String of the subject sequence
+    :param low: Lowest diagonal to include in the band
+    :param high: Highest diagonal to include in the band
+    :return: Raw score, aligned query string, aligned subject string, start (0-based), and end (exclusive) of the
+    alignment in the query
+    """
+    negative = -numpy.inf
+    width = high - low + 1
+    length = len(query)
+    rows = len(subject)
+    open_cost = GAP_OPEN + GAP_EXTEND
+    bands = numpy.arange(width)
+    # Query column of every cell of the band, and the substitution score of the cells within the query
+    columns = numpy.arange(rows + 1)[:, None] + low + bands
+    valid = (columns >= 1) & (columns <= length)
+    query_codes = numpy.frombuffer(query.encode(), dtype=numpy.uint8)
+    subject_codes = numpy.frombuffer(subject.encode(), dtype=numpy.uint8)
+    substitution = numpy.full((rows + 1, width), negative)
+    if length:
+        identical = query_codes[numpy.clip(columns[1:] - 1, 0, length - 1)] == subject_codes[:, None]
+        substitution[1:] = numpy.where(identical, REWARD, PENALTY)
+    substitution[~valid] = negative
+    outside = numpy.where(valid, 0.0, negative)
+    match = numpy.full((rows + 1, width), negative)
+    xgap = numpy.full((rows + 1, width), negative)
+    ygap = numpy.full((rows + 1, width), negative)
+    match[0] = numpy.where((low + bands >= 0) & (low + bands <= length), 0.0, negative)
+    # Rows that are entirely within the query do not need to be masked
+    masked = ~valid.all(axis=1)
+    best = match[0].copy()
+    opened = numpy.empty(width)
+    shifted = numpy.empty(width - 1)
+    extension = GAP_EXTEND * bands
+    closing = open_cost + extension[:-1]
+    for i in range(1, rows + 1):
+        # Diagonal move from the same band in the previous row
+        numpy.add(best, substitution[i], out=match[i])
+        # Vertical move (consume a subject base) from the next band in the previous row. Opening from the X state is
+        # never better than extending it, so the best of the three states can be used
+        numpy.subtract(best[1:], open_cost, out=shifted)
+        numpy.maximum(shifted, xgap[i - 1, 1:] - GAP_EXTEND, out=xgap[i, :-1])
+        if masked[i]:
+            xgap[i] += outside[i]
+        # Horizontal move (consume a query base) from the previous band in the current row. The best gap that ends at
+        # band b opens after the M or X state of an earlier band k, and costs open + extend * (b - 1 - k)
+        numpy.maximum(match[i], xgap[i], out=best)
+        numpy.add(best, extension, out=opened)
+        numpy.maximum.accumulate(opened, out=opened)
+        numpy.subtract(opened[:-1], closing, out=ygap[i, 1:])
+        if masked[i]:
+            ygap[i] += outside[i]
+        numpy.maximum(best, ygap[i], out=best)
+    # Find the best scoring cell in the final row. Ties are resolved by band, then in the order M, X, Y
+    final = numpy.stack((match[rows], xgap[rows], ygap[rows]), axis=1)
+    band, state = divmod(int(numpy.argmax(final)), 3)
+    score = final[band, state]
+    if not numpy.isfinite(score):
+        return float(score), '', '', 0, 0
+    # Trace back through the band to create the aligned strings. The move into each cell is the first of the
+    # candidate moves (in the order M, X, Y for the M and X states, and M, Y, X for the Y state) that reproduces its
+    # score
+    i = rows
+    end = i + low + band
+    aligned_query = list()
+    aligned_subject = list()
+    while i > 0:
+        column = i + low + band
+        if state == 0:
+            aligned_query.append(query[column - 1])
+            aligned_subject.append(subject[i - 1])
+            i -= 1
+            candidates = ((match[i, band], 0), (xgap[i, band], 1), (ygap[i, band], 2))
+        elif state == 1:
+            aligned_query.append('-')
+            aligned_subject.append(subject[i - 1])
+            i -= 1
+            band += 1
+            candidates = ((match[i, band] - open_cost, 0), (xgap[i, band] - GAP_EXTEND, 1),
+                          (ygap[i, band] - open_cost, 2))
+        else:
+            aligned_query.append(query[column - 1])
+            aligned_subject.append('-')
+            band -= 1
+            candidates = ((match[i, band] - open_cost, 0), (ygap[i, band] - GAP_EXTEND, 2),
+                          (xgap[i, band] - open_cost, 1))
+        state = max(candidates, key=lambda candidate: candidate[0])[1]
+    start = low + band
+    return int(score), ''.join(reversed(aligned_query)), ''.join(reversed(aligned_subject)), start, end
+
+
+class KmerIndex(object):
+
+    def main(self):
+        """
+        Load the k-mer index of the targets from disk if it is current. Otherwise, create, and save it
+        """
+        self.read_targets()
+        if os.path.isfile(self.indexfile) and os.path.getmtime(self.indexfile) >= os.path.getmtime(self.fasta):
+            self.load()
+        else:
+            logging.info('Creating {k}-mer index of {fasta}'.format(k=self.kmer_size,
+                                                                    fasta=self.fasta))
+            self.build()
+            self.save()
+
+    def read_targets(self):
+        """
+        Read in the names and sequences of all the targets
+        """
+        with open_compressed(self.fasta, 'rt') as fasta:
+            for record in SeqIO.parse(fasta, 'fasta'):
+                self.names.append(record.id)
+                self.sequences.append(str(record.seq).upper())
+        self.database_length = sum(len(sequence) for sequence in self.sequences)
+
+    def add_targets(self, targets):
+        """
+        Index targets held in memory rather than in a FASTA file. The index is only kept in memory
+        :param targets: Iterable of (name, sequence) tuples
+        """
+        for name, sequence in targets:
+            self.names.append(name)
+            self.sequences.append(str(sequence).upper())
+        self.database_length = sum(len(sequence) for sequence in self.sequences)
+        self.build()
+
+    def build(self):
+        """
+        Create sorted arrays of every k-mer in the targets, as well as the target, and position in the target of each
+        k-mer
+        """
+        kmers = list()
+        target_ids = list()
+        positions = list()
+        for target_id, sequence in enumerate(self.sequences):
+            target_kmers, target_positions = kmer_codes(sequence, self.kmer_size)
+            kmers.append(target_kmers)
+            positions.append(target_positions)
+            target_ids.append(numpy.full(len(target_kmers), target_id, dtype=numpy.int64))
+        kmers = numpy.concatenate(kmers) if kmers else numpy.zeros(0, dtype=numpy.uint64)
+        target_ids = numpy.concatenate(target_ids) if target_ids else numpy.zeros(0, dtype=numpy.int64)
+        positions = numpy.concatenate(positions) if positions else numpy.zeros(0, dtype=numpy.int64)
+        # Sort the k-mers, so that they can be found with a binary search. Identical k-mers from different targets
+        # (e.g. alleles of the same gene) are collapsed into a single key with an offset into the posting arrays
+        order = numpy.argsort(kmers, kind='stable')
+        kmers = kmers[order]
+        self.target_ids = target_ids[order]
+        self.target_positions = positions[order]
+        self.keys, starts = numpy.unique(kmers, return_index=True)
+        self.offsets = numpy.append(starts, len(kmers)).astype(numpy.int64)
+
+    def save(self):
+        """
+        Write the index arrays to disk
+        """
+        numpy.savez(self.indexfile,
+                    keys=self.keys,
+                    offsets=self.offsets,
+                    target_ids=self.target_ids,
+                    target_positions=self.target_positions)
+        # numpy.savez appends .npz to file names that do not already have the extension
+        if not os.path.isfile(self.indexfile):
+            os.rename(self.indexfile + '.npz', self.indexfile)
+
+    def load(self):
+        """
+        Read the index arrays from disk
+        """
+        with numpy.load(self.indexfile) as index:
+            self.keys = index['keys']
+            self.offsets = index['offsets']
+            self.target_ids = index['target_ids']
+            self.target_positions = index['target_positions']
+
+    def seeds(self, sequence):
+        """
+        Find all the exact k-mer matches between a sequence and the targets
+        :param sequence: String of the query sequence
+        :return: numpy arrays of the query position, target index, and target position of every seed
+        """
+        kmers, positions = kmer_codes(sequence, self.kmer_size)
+        if not len(kmers) or not len(self.keys):
+            empty = numpy.zeros(0, dtype=numpy.int64)
+            return empty, empty, empty
+        # Binary search for each query k-mer in the sorted keys
+        index = numpy.searchsorted(self.keys, kmers)
+        index[index == len(self.keys)] = 0
+        found = self.keys[index] == kmers
+        positions = positions[found]
+        index = index[found]
+        # Expand each matching k-mer to all the target positions that share it
+        counts = self.offsets[index + 1] - self.offsets[index]
+        query_positions = numpy.repeat(positions, counts)
+        firsts = numpy.repeat(self.offsets[index], counts)
+        within = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        postings = firsts + within
+        return query_positions, self.target_ids[postings], self.target_positions[postings]
+
+    def search(self, contig, sequence, evalue=1e-5):
+        """
+        Find and align all the targets present in a contig
+        :param contig: Name of the contig
+        :param sequence: String of the contig sequence
+        :param evalue: Maximum e-value of reported alignments
+        :return: List of hit dictionaries with the keys in HIT_FIELDS
+        """
+        sequence = sequence.upper()
+        hits = list()
+        for strand, query in ((1, sequence), (-1, reverse_complement(sequence))):
+            query_positions, target_ids, target_positions = self.seeds(query)
+            if not len(query_positions):
+                continue
+            diagonals = query_positions - target_positions
+            # Group the seeds by target, and then by diagonal. A new cluster starts whenever the target changes, or
+            # there is a large jump in the diagonal (a second copy of the target in the contig)
+            order = numpy.lexsort((diagonals, target_ids))
+            target_ids = target_ids[order]
+            diagonals = diagonals[order]
+            breaks = numpy.nonzero((numpy.diff(target_ids) != 0) | (numpy.diff(diagonals) > self.max_gap))[0] + 1
+            starts = numpy.concatenate(([0], breaks))
+            ends = numpy.concatenate((breaks, [len(diagonals)]))
+            for start, end in zip(starts, ends):
+                if end - start < self.min_seeds:
+                    continue
+                hit = self.align(contig=contig,
+                                 query=query,
+                                 strand=strand,
+                                 target_id=int(target_ids[start]),
+                                 low=int(diagonals[start]),
+                                 high=int(diagonals[end - 1]))
+                if hit and hit['evalue'] <= evalue:
+                    hits.append(hit)
+        # Report the best hits first, as BLAST does
+        return sorted(hits, key=lambda hit: hit['bit_score'], reverse=True)
+
+    def align(self, contig, query, strand, target_id, low, high):
+        """
+        Align a target to the query using the diagonals of the seeds
+        :param contig: Name of the contig
+        :param query: String of the (strand-specific) query sequence
+        :param strand: 1 for the forward strand of the contig, -1 for the reverse complement
+        :param target_id: Index of the target
+        :param low: Lowest diagonal of the seeds
+        :param high: Highest diagonal of the seeds
+        :return: Hit dictionary, or None if the target does not overlap the query, or the alignment does not score
+        """
+        subject = self.sequences[target_id]
+        # Only align the portion of the target that falls within the contig
+        first = max(0, -low)
+        last = min(len(subject), len(query) - high)
+        if last - first < self.kmer_size:
+            return None
+        subject = subject[first:last]
+        if low == high:
+            # All the seeds are on the same diagonal, so an ungapped alignment is sufficient
+            start = low + first
+            end = start + len(subject)
+            aligned_query = query[start:end]
+            aligned_subject = subject
+            identical = int(numpy.count_nonzero(numpy.frombuffer(aligned_query.encode(), dtype=numpy.uint8) ==
+                                                numpy.frombuffer(aligned_subject.encode(), dtype=numpy.uint8)))
+            score = identical * REWARD + (len(subject) - identical) * PENALTY
+        else:
+            score, aligned_query, aligned_subject, start, end = \
+                banded_alignment(query=query,
+                                 subject=subject,
+                                 low=low + first - self.band,
+                                 high=high + first + self.band)
+            identical = sum(1 for q, s in zip(aligned_query, aligned_subject) if q == s)
+        # Clusters of spurious seeds produce alignments with negative scores. These are not reported
+        if score <= 0:
+            return None
+        gaps = aligned_query.count('-') + aligned_subject.count('-')
+        alignment_length = len(aligned_query)
+        # Convert the strand-specific coordinates to BLAST-style 1-based coordinates on the forward strand of the
+        # contig. Hits on the reverse strand have the subject start greater than the subject end
+        if strand == 1:
+            query_start, query_end = start + 1, end
+            subject_start, subject_end = first + 1, last
+        else:
+            query_start, query_end = len(query) - end + 1, len(query) - start
+            subject_start, subject_end = last, first + 1
+            aligned_query = reverse_complement(aligned_query)
+            aligned_subject = reverse_complement(aligned_subject)
+        return {
+            'query_id': contig,
+            'subject_id': self.names[target_id],
+            'positives': identical,
+            'mismatches': alignment_length - identical - gaps,
+            'gaps': gaps,
+            'evalue': expect_value(score=score,
+                                   query_length=len(query),
+                                   database_length=self.database_length),
+            'bit_score': bit_score(score),
+            'subject_length': len(self.sequences[target_id]),
+            'alignment_length': alignment_length,
+            'query_start': query_start,
+            'query_end': query_end,
+            'subject_start': subject_start,
+            'subject_end': subject_end,
+            'query_sequence': aligned_query,
+            'subject_sequence': aligned_subject
+        }
+
+    def __init__(self, fasta, kmer_size=16, min_seeds=2, max_gap=100, band=8):
+        """
+        :param fasta: Name and path of the FASTA file of targets e.g. combinedtargets.fasta. None for targets added
+        with add_targets
+        :param kmer_size: Length of the k-mers used to seed alignments. Must be between 8 and 31
+        :param min_seeds: Minimum number of seeds in a cluster before an alignment is attempted
+        :param max_gap: Maximum difference in diagonal between seeds in the same cluster
+        :param band: Number of diagonals added to either side of the seed diagonals for gapped alignments
+        """
+        assert 8 <= kmer_size <= 31, 'The k-mer size must be between 8 and 31, not {k}'.format(k=kmer_size)
+        self.fasta = fasta
+        self.kmer_size = kmer_size
+        self.min_seeds = min_seeds
+        self.max_gap = max_gap
+        self.band = band
+        self.indexfile = '{base}.k{k}.npz'.format(base=os.path.splitext(fasta)[0],
+                                                  k=kmer_size) if fasta else None
+        self.names = list()
+        self.sequences = list()
+        self.database_length = 0
+        self.keys = numpy.zeros(0, dtype=numpy.uint64)
+        self.offsets = numpy.zeros(1, dtype=numpy.int64)
+        self.target_ids = numpy.zeros(0, dtype=numpy.int64)
+        self.target_positions = numpy.zeros(0, dtype=numpy.int64)
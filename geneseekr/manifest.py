@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+from threading import Lock
+import hashlib
+import json
+import os
+
+__author__ = 'adamkoziol'
+
+
+class Manifest(object):
+    """
+    Record of the inputs and settings used to create each report in the report path. A report is only reused when the
+    sample file, the database, and the analysis settings all match the values stored when it was created. The hashes
+    of the files are cached with their sizes and modification times, so unchanged files are not hashed again
+    """
+
+    def fingerprint(self, path):
+        """
+        Hash the contents of a file
+        :param path: Name and path of the file
+        :return: Hexadecimal SHA-256 digest of the file
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self.lock:
+            cached = self.data['files'].get(path)
+        if cached and cached['size'] == stat.st_size and cached['mtime'] == stat.st_mtime_ns:
+            return cached['sha256']
+        sha = hashlib.sha256()
+        with open(path, 'rb') as input_file:
+            for chunk in iter(lambda: input_file.read(1048576), b''):
+                sha.update(chunk)
+        with self.lock:
+            self.data['files'][path] = {
+                'size': stat.st_size,
+                'mtime': stat.st_mtime_ns,
+                'sha256': sha.hexdigest()
+            }
+        return sha.hexdigest()
+
+    def current(self, report, entry):
+        """
+        Determine whether a report was created with the supplied inputs and settings
+        :param report: Name and path of the report
+        :param entry: Dictionary of the inputs and settings of the analysis
+        :return: Boolean of whether the report exists, and can be reused
+        """
+        with self.lock:
+            stored = self.data['reports'].get(os.path.basename(report))
+        return os.path.isfile(report) and stored == entry
+
+    def update(self, report, entry):
+        """
+        Record the inputs and settings used to create a report
+        :param report: Name and path of the report
+        :param entry: Dictionary of the inputs and settings of the analysis
+        """
+        with self.lock:
+            self.data['reports'][os.path.basename(report)] = entry
+
+    def load(self):
+        """
+        Read the manifest from the report path. Missing or unreadable manifests are treated as empty, so all the
+        reports are created again
+        """
+        try:
+            with open(self.path, 'r') as manifest:
+                data = json.load(manifest)
+            if data.get('version') == self.version:
+                self.data = data
+        except (FileNotFoundError, ValueError):
+            pass
+
+    def save(self):
+        """
+        Write the manifest to the report path. The manifest is written to a temporary file first, so an interrupted
+        run never leaves a partial manifest behind
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self.lock:
+            with open(self.path + '.tmp', 'w') as manifest:
+                json.dump(self.data, manifest, indent=4, sort_keys=True)
+            os.rename(self.path + '.tmp', self.path)
+
+    def __init__(self, reportpath):
+        """
+        :param reportpath: Folder in which the reports (and the manifest) are stored
+        """
+        self.path = os.path.join(reportpath, 'geneseekr_manifest.json')
+        self.version = 1
+        self.lock = Lock()
+        self.data = {
+            'version': self.version,
+            'files': dict(),
+            'reports': dict()
+        }
+        self.load()
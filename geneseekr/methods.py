@@ -0,0 +1,850 @@
+#!/usr/bin/env python3
+from genemethods.typingclasses.resistance import ResistanceNotes
+from genemethods.geneseekr import geneseekr
+from geneseekr.translate import align_proteins, translate
+from geneseekr.intervals import IntervalIndex, RangeIndex
+from concurrent.futures import ProcessPoolExecutor
+from geneseekr.compression import compressed_glob, open_compressed, uncompressed_name
+from geneseekr.reports import ReportWriter
+from geneseekr.hits import HitTable
+from geneseekr.faidx import IndexedFasta
+from Bio.SeqRecord import SeqRecord
+from Bio.Alphabet import IUPAC
+from Bio import SeqIO
+from csv import DictReader
+from Bio.Seq import Seq
+from glob import glob
+import numpy
+import csv
+import sys
+import os
+
+__author__ = 'adamkoziol'
+
+# Analyses with nucleotide:nucleotide alignments in their reports. The k-mer alignments (kma) are reported in the same
+# way as blastn
+NUCLEOTIDE_PROGRAMS = ['blastn', 'kma']
+
+
+class GeneSeekr(geneseekr.GeneSeekr):
+    """
+    Extends the genemethods GeneSeekr methods. The --unique overlap resolution uses interval indices rather than
+    comparing every hit on a contig with every other hit, and the hits of each contig are stored in columnar HitTables
+    rather than lists of dictionaries while they are compared. The blastlist of the best hits is the same list of
+    dictionaries as genemethods creates, so it can be modified, and serialised by the consumers of the metadata. The
+    reports are written one sample at a time, and the translations and protein alignments of --align are calculated in
+    batches, rather than with a tblastx search for every hit
+    """
+
+    @staticmethod
+    def target_folders(metadata, analysistype):
+        """
+        Create a set of all database folders used in the analyses
+        :param metadata: Metadata object
+        :param analysistype: Name of analysis type
+        :return: Lists of all target folders and files used in the analyses. Dictionary of IndexedFasta objects,
+        which only read the sequences of the targets from the (memory-mapped) files when they are requested
+        """
+        targetfolders = set()
+        targetfiles = list()
+        records = dict()
+        for sample in metadata:
+            if sample[analysistype].combinedtargets != 'NA':
+                targetfolders.add(sample[analysistype].targetpath)
+        for targetdir in targetfolders:
+            # Find all the .fasta files in each target folder
+            targetfiles = glob(os.path.join(targetdir, '*.fasta'))
+            for targetfile in targetfiles:
+                records[targetfile] = IndexedFasta(targetfile)
+        return targetfolders, targetfiles, records
+
+    @staticmethod
+    def hit(row, program):
+        """
+        Add the calculated columns to a row of a BLAST report
+        :param row: Dictionary of a BLAST hit
+        :param program: BLAST program used in the analyses
+        :return: Percent identity of the hit
+        """
+        # If the sequences are translated (e.g. tblastx), the subject length is in nucleotides
+        if program == 'blastn' or program == 'blastp' or program == 'blastx':
+            subject_length = float(row['subject_length'])
+        else:
+            subject_length = float(row['subject_length']) / 3
+        # Percent identity is: (# matches - # gaps) / total subject length
+        percentidentity = float('{:0.2f}'.format((float(row['positives']) - float(row['gaps'])) /
+                                                 subject_length * 100))
+        row['percentidentity'] = percentidentity
+        row['percent_match'] = percentidentity
+        row['low'] = min([int(row['query_start']), int(row['query_end'])])
+        row['high'] = max([int(row['query_start']), int(row['query_end'])])
+        row['alignment_fraction'] = float('{:0.2f}'.format(float(float(row['alignment_length']) /
+                                                                 subject_length * 100)))
+        return percentidentity
+
+    @staticmethod
+    def query_sequence(row):
+        """
+        :param row: Dictionary of a BLAST hit
+        :return: Query sequence in the same orientation as the subject
+        """
+        if int(row['subject_end']) < int(row['subject_start']):
+            return str(Seq(row['query_sequence'], IUPAC.unambiguous_dna).reverse_complement())
+        return row['query_sequence']
+
+    @staticmethod
+    def parse_blast(metadata, analysistype, fieldnames, cutoff, program):
+        """
+        Parse the blast results, and store necessary data in dictionaries in metadata object
+        :param metadata: Metadata object
+        :param analysistype: Current analysis type
+        :param fieldnames: List of column names in BLAST report
+        :param cutoff: Percent identity threshold
+        :param program: BLAST program used in the analyses
+        :return: Updated metadata object
+        """
+        for sample in metadata:
+            sample[analysistype].blastlist = list()
+            sample[analysistype].targetsequence = dict()
+            resultdict = dict()
+            try:
+                csv.field_size_limit(sys.maxsize)
+                with open(sample[analysistype].report) as report:
+                    for row in DictReader(report, fieldnames=fieldnames, dialect='excel-tab'):
+                        # Ignore the headers
+                        if row['query_id'].startswith(fieldnames[0]):
+                            continue
+                        percentidentity = GeneSeekr.hit(row=row,
+                                                        program=program)
+                        if percentidentity < cutoff:
+                            continue
+                        # Remove unwanted pipes added to the name
+                        target = row['subject_id'].lstrip('gb|').rstrip('|') if '|' in row['subject_id'] else \
+                            row['subject_id']
+                        sample[analysistype].blastlist.append(row)
+                        resultdict.update({target: percentidentity})
+                        sample[analysistype].targetsequence.setdefault(target, list())\
+                            .append(GeneSeekr.query_sequence(row))
+                # Populate missing results with 'NA' values
+                sample[analysistype].blastresults = resultdict if resultdict else 'NA'
+            except FileNotFoundError:
+                sample[analysistype].blastresults = 'NA'
+        return metadata
+
+    @staticmethod
+    def unique_parse_blast(metadata, analysistype, fieldnames, cutoff, program):
+        """
+        Find the best BLAST hit at a location
+        :param metadata: Metadata object
+        :param analysistype: Current analysis type
+        :param fieldnames: List of column names in BLAST report
+        :param cutoff: Percent identity threshold
+        :param program: BLAST program used in the analyses
+        :return: Updated metadata object
+        """
+        for sample in metadata:
+            GeneSeekr.new_locations(results=sample[analysistype])
+            try:
+                # Allow the long sequence fields of large hits
+                csv.field_size_limit(sys.maxsize)
+                with open(sample[analysistype].report) as report:
+                    # Ignore the headers
+                    GeneSeekr.unique_locations(results=sample[analysistype],
+                                               rows=(row for row in DictReader(report,
+                                                                               fieldnames=fieldnames,
+                                                                               dialect='excel-tab')
+                                                     if not row['query_id'].startswith(fieldnames[0])),
+                                               cutoff=cutoff,
+                                               program=program)
+            except FileNotFoundError:
+                pass
+        # Return the updated metadata object
+        return metadata
+
+    @staticmethod
+    def new_locations(results):
+        """
+        Initialise the attributes used by unique_locations
+        :param results: Object in which the locations of the hits are stored e.g. sample[analysistype]
+        """
+        # Initialise a dictionary to store all the target sequences
+        results.targetsequence = dict()
+        results.queryranges = dict()
+        results.querypercent = dict()
+        results.queryscore = dict()
+        results.results = dict()
+
+    @staticmethod
+    def unique_locations(results, rows, cutoff, program):
+        """
+        Merge the query ranges of hits into locations, and add the hits to the results object
+        :param results: Object initialised with new_locations e.g. sample[analysistype]
+        :param rows: Iterable of dictionaries of BLAST hits
+        :param cutoff: Percent identity threshold
+        :param program: BLAST program used in the analyses
+        """
+        # Index of the query ranges of each contig
+        indices = {contig: RangeIndex(ranges=ranges) for contig, ranges in results.queryranges.items()}
+        for row in rows:
+            percentidentity = GeneSeekr.hit(row=row,
+                                            program=program)
+            target = row['subject_id'].lstrip('gb|').rstrip('|') if '|' in row['subject_id'] else \
+                row['subject_id']
+            contig = row['query_id']
+            low = row['low']
+            high = row['high']
+            score = row['bit_score']
+            if percentidentity < cutoff:
+                continue
+            if contig in indices:
+                results.results[contig].append(row)
+                # Merge the hit with the nearby ranges. Only hits at new locations are added
+                if indices[contig].add(low, high):
+                    results.querypercent[contig] = percentidentity
+                    results.queryscore[contig] = score
+            else:
+                results.queryranges[contig] = [[low, high]]
+                indices[contig] = RangeIndex(ranges=results.queryranges[contig])
+                results.querypercent[contig] = percentidentity
+                results.queryscore[contig] = score
+                results.results[contig] = HitTable()
+                results.results[contig].append(row)
+                results.targetsequence[target] = list()
+            # Use the reverse complement of the query sequence if it is in a different frame than the subject
+            results.targetsequence.setdefault(target, list()).append(GeneSeekr.query_sequence(row))
+
+    @staticmethod
+    def filter_unique(metadata, analysistype):
+        """
+        Filters multiple BLAST hits in a common region of the genome. Leaves only the best hit
+        :param metadata: Metadata object
+        :param analysistype: Current analysis type
+        :return: Updated metadata object
+        """
+        for sample in metadata:
+            GeneSeekr.best_hits(results=sample[analysistype])
+        # Return the updated metadata object
+        return metadata
+
+    @staticmethod
+    def best_hits(results):
+        """
+        Find the best hit at each location found by unique_locations. Populates the blastresults dictionary of
+        target: percent identity, and the blastlist (list of dictionaries of the best hits) of the results object
+        :param results: Object (e.g. sample[analysistype]) with the locations of the hits
+        """
+        results.blastresults = dict()
+        results.blastlist = list()
+        resultdict = dict()
+        rowdict = dict()
+        try:
+            for contig in results.queryranges:
+                table = results.results[contig]
+                percentidentity = table.array('percentidentity').tolist()
+                # The hits are half-open intervals, so genes located back-to-back in the genome e.g. strB
+                # (2557, 3393) and strA (3393, 4196) do not overlap
+                index = IntervalIndex(intervals=list(zip(table.array('low').tolist(),
+                                                         table.array('high').tolist())))
+                for location in results.queryranges[contig]:
+                    locstr = ','.join([str(x) for x in location])
+                    # Group the hits that overlap each location
+                    for number in index.overlaps(location[0], location[1]):
+                        resultdict.setdefault(contig, dict()).setdefault(locstr, list())\
+                            .append(percentidentity[number])
+                        rowdict.setdefault(contig, dict()).setdefault(locstr, list()).append(number)
+        except KeyError:
+            pass
+        best = dict()
+        # Find the best hit for each location based on percent identity
+        for contig in resultdict:
+            table = results.results[contig]
+            # Do not allow the same gene to be added to the dictionary more than once
+            genes = set()
+            best_hits = list()
+            for location in resultdict[contig]:
+                top = max(resultdict[contig][location])
+                for number in rowdict[contig][location]:
+                    hit = table[number]
+                    if hit['percentidentity'] == top and hit['subject_id'] not in genes:
+                        best_hits.append(number)
+                        best.update({hit['subject_id']: hit['percentidentity']})
+                        genes.add(hit['subject_id'])
+                        # Only the first best hit at each location is used
+                        break
+            results.blastlist.extend(dict(table[number]) for number in best_hits)
+        results.blastresults = best
+
+    @staticmethod
+    def group_hits(blastlist):
+        """
+        Group the BLAST hits of a sample by target
+        :param blastlist: List of dictionaries of the hits of a sample
+        :return: Dictionary of subject_id: list of the indices of the hits to the target, in the order of the hits
+        """
+        groups = dict()
+        for number, hit in enumerate(blastlist):
+            groups.setdefault(hit['subject_id'], list()).append(number)
+        return groups
+
+    @staticmethod
+    def target_hits(sample, analysistype, targets):
+        """
+        Find the hits of a sample to each target with results
+        :param sample: Metadata object
+        :param analysistype: Current analysis type
+        :param targets: Set of all the targets used in the analyses
+        :return: Dictionary of target: list of the indices of the hits to the target
+        """
+        if not isinstance(sample[analysistype].blastresults, dict):
+            return dict()
+        groups = GeneSeekr.group_hits(sample[analysistype].blastlist)
+        return {target: groups.get(target, list()) for target in sample[analysistype].blastresults
+                if target in targets}
+
+    def reporter(self, metadata, analysistype, reportpath, align, records, program, cutoff):
+        """
+        Custom reports for standard GeneSeekr analyses. The maximum number of hits to each target sets the columns of
+        the reports, so it is found first. The rows of each sample are then written as they are created, rather than
+        building the reports of all the samples in memory
+        :param metadata: Metadata object
+        :param analysistype: Current analysis type
+        :param reportpath: Path of folder in which report is to be created
+        :param align: Boolean of whether alignments between query and subject sequences are desired
+        :param records: Dictionary of target file: parsed sequence records
+        :param program: BLAST program used to perform analyses
+        :param cutoff: Cutoff value to use for the analyses
+        :return: Updated metadata object
+        """
+        # Create a sorted list of all the targets used in the analyses
+        targets = sorted(set(target for record in records for target in records[record]))
+        # Create the list of values of interest, which will be extracted from the .blastlist attribute
+        values_of_interest = ['percent_match', 'alignment_length', 'subject_length', 'evalue', 'positives',
+                              'mismatches', 'gaps']
+        # As a target can be present in the strain more than once, find the maximum number of times a target is
+        # present, as well as the number of times each target is present in each strain
+        target_count = {target: 0 for target in targets}
+        target_presence = dict()
+        samples = dict()
+        for sample in metadata:
+            samples[sample.name] = sample
+            target_presence[sample.name] = dict()
+            for target, numbers in self.target_hits(sample, analysistype, target_count).items():
+                target_presence[sample.name][target] = len(numbers)
+                target_count[target] = max(target_count[target], len(numbers))
+        # Create a detailed output file with percent match, alignment length, subject length, evalue, number of
+        # matches, mismatches, and gaps
+        csv_output = os.path.join(reportpath, '{at}_{program}_detailed.csv'.format(at=analysistype,
+                                                                                   program=program))
+        with open(csv_output, 'w') as outfile:
+            header = 'Strain'
+            for target in targets:
+                # Add the comma-separated target name + header value to the string e.g.
+                # C.jejuniNCTC11168_23S_2_percent_match
+                header += target_count[target] * ''.join(',{target}_{string}'.format(target=target,
+                                                                                     string=string)
+                                                         for string in values_of_interest)
+            outfile.write(header + '\n')
+            for name in sorted(samples):
+                sample = samples[name]
+                hits = self.target_hits(sample, analysistype, target_count)
+                outfile.write(name)
+                for target in targets:
+                    if target in hits:
+                        for number in hits[target]:
+                            hit = sample[analysistype].blastlist[number]
+                            outfile.write(''.join(',{value}'.format(value=hit[value]) for value in values_of_interest))
+                        entries = len(hits[target])
+                    # If the target was not found in the strain, write the appropriate number of comma-separated '-'.
+                    # These are counted character by character when determining whether padding is required
+                    else:
+                        outfile.write(',-' * len(values_of_interest))
+                        entries = 2 * len(values_of_interest)
+                    # Add dashes to strains that have fewer hits to this target than the maximum number of hits
+                    # encountered
+                    if entries < target_count[target]:
+                        outfile.write(len(values_of_interest) * ',-')
+                outfile.write('\n')
+        # Also make a CSV file with different formatting for portal parsing purposes
+        # Format as: Strain,Gene1,Gene2
+        #            ID,PercentID,PercentID for all strains input - have a zero when gene wasn't found.
+        csv_output = os.path.join(reportpath, '{at}_{program}.csv'.format(at=analysistype,
+                                                                          program=program))
+        with open(csv_output, 'w') as outfile:
+            header = 'Strain'
+            for target in targets:
+                header += target_count[target] * ',{target}'.format(target=target)
+            outfile.write(header + '\n')
+            for name in sorted(samples):
+                sample = samples[name]
+                hits = self.target_hits(sample, analysistype, target_count)
+                outfile.write(name)
+                for target in targets:
+                    if target in hits:
+                        for number in hits[target]:
+                            outfile.write(',{value}'.format(value=sample[analysistype].blastlist[number]
+                                                            ['percent_match']))
+                        entries = len(hits[target])
+                    else:
+                        outfile.write(',0')
+                        entries = 1
+                    # Pad results from strains that have fewer than the maximum observed hits to the target
+                    if entries < target_count[target]:
+                        outfile.write(',-')
+                outfile.write('\n')
+        # Create the headers as required for targets with alignments
+        headers = ['Strain']
+        header_length = 6
+        for sample in metadata:
+            if sample[analysistype].targetnames != 'NA':
+                if sample[analysistype].blastresults != 'NA':
+                    for target in sorted(sample[analysistype].targetnames):
+                        num_present = target_count[target]
+                        if align:
+                            if program in NUCLEOTIDE_PROGRAMS:
+                                # Add the appropriate headers
+                                headers.extend(
+                                    num_present * ['{target}_percent_match'.format(target=target),
+                                                   '{target}_FASTA_sequence'.format(target=target),
+                                                   '{target}_aa_Alignment'.format(target=target),
+                                                   '{target}_aa_SNP_location'.format(target=target),
+                                                   '{target}_nt_Alignment'.format(target=target),
+                                                   '{target}_nt_SNP_location'.format(target=target)
+                                                   ])
+                            else:
+                                headers.extend(num_present * ['{target}percent_match'.format(target=target),
+                                                              '{target}_FASTA_sequence'.format(target=target),
+                                                              '{target}_aa_Alignment'.format(target=target),
+                                                              '{target}_aa_SNP_location'.format(target=target),
+                                                              ])
+                            header_length = 4
+                        else:
+                            headers.extend(num_present * ['{target}_percent_match'.format(target=target)])
+                            header_length = 1
+                # Only need to iterate through this once
+                break
+        # Create a workbook to store the report. Using xlsxwriter rather than a simple csv format, as I want to be
+        # able to have appropriately sized, multi-line cells
+        writer = ReportWriter(path=os.path.join(reportpath, '{at}_{program}.xlsx'.format(at=analysistype,
+                                                                                       program=program)),
+                              parquet=self.parquet,
+                              numeric=lambda column: column.endswith('percent_match'))
+        writer.header(headers)
+        for sample in metadata:
+            # Initialise a list to store all the data for each strain
+            data = [sample.name]
+            found = sample[analysistype].targetnames != 'NA' and sample[analysistype].blastresults != 'NA'
+            groups = self.group_hits(sample[analysistype].blastlist) if found else dict()
+            if align and found:
+                self.prepare_alignments(hits=[sample[analysistype].blastlist[number]
+                                              for target in set(sample[analysistype].targetnames)
+                                              for number in groups.get(target, list())
+                                              if float(sample[analysistype].blastlist[number]['percent_match'])
+                                              >= cutoff],
+                                        program=program)
+            for target in sorted(sample[analysistype].targetnames):
+                # If there are no blast results at all, add a '-' for each hit
+                if not found:
+                    for _ in sample[analysistype].blastlist:
+                        data.extend(['-'] * header_length)
+                    continue
+                index = 0
+                # Only the hits to the current target are required
+                for number in groups.get(target, list()):
+                    hit = sample[analysistype].blastlist[number]
+                    try:
+                        # Only if the alignment option is selected, for inexact results, add alignments
+                        if align and float(hit['percent_match']) >= cutoff:
+                            # Align the protein (and nucleotide) sequences to the reference
+                            sample = self.alignprotein(sample=sample,
+                                                       analysistype=analysistype,
+                                                       target=target,
+                                                       program=program,
+                                                       index=index,
+                                                       hit=hit)
+                            # Create a FASTA-formatted sequence output of the query sequence
+                            if program in NUCLEOTIDE_PROGRAMS:
+                                record = SeqRecord(sample[analysistype].dnaseq[target][index],
+                                                   id='{}_{}'.format(sample.name, target),
+                                                   description='')
+                            else:
+                                record = SeqRecord(sample[analysistype].protseq[target][index],
+                                                   id='{}_{}'.format(sample.name, target),
+                                                   description='')
+                            # Add the alignment, and the location of mismatches for both nucleotide and amino
+                            # acid sequences
+                            if program in NUCLEOTIDE_PROGRAMS:
+                                data.extend([hit['percent_match'],
+                                             record.format('fasta'),
+                                             sample[analysistype].aaalign[target][index],
+                                             sample[analysistype].aaindex[target][index],
+                                             sample[analysistype].ntalign[target][index],
+                                             sample[analysistype].ntindex[target][index]
+                                             ])
+                            else:
+                                data.extend([hit['percent_match'],
+                                             record.format('fasta'),
+                                             sample[analysistype].aaalign[target][index],
+                                             sample[analysistype].aaindex[target][index],
+                                             ])
+                        # For non-aligned outputs above the cutoff, only add the percent match
+                        elif float(hit['percent_match']) >= cutoff:
+                            data.append(hit['percent_match'])
+                        else:
+                            data.extend(header_length * ['-'])
+                        # Add padding to strains with lower number of hits to targets
+                        num_present = target_count[target]
+                        if target_presence[sample.name].get(target, 0) < num_present:
+                            # Calculate the required number of '-' to add to the list
+                            diff = num_present - target_presence[sample.name].get(target, 0)
+                            # Add the number of hits below the maximum observed times the header length
+                            data.extend(diff * header_length * ['-'])
+                        index += 1
+                    # If there are no blast results for the target, add a '-'
+                    except (KeyError, TypeError):
+                        data.extend(['-'] * header_length)
+            writer.row(data)
+        writer.close()
+        self.shutdown()
+        # Return the updated metadata object
+        return metadata
+
+    @staticmethod
+    def resistance_classes(targetpath):
+        """
+        Use the .tfa files of the ResFinder database to determine the resistance class of the genes. As with
+        ResistanceNotes.classes, but the .tfa files can also be compressed
+        :param targetpath: Path to database files
+        :return: Dictionary of resistance class: gene set
+        """
+        resistance_dict = dict()
+        resistance_files = glob(os.path.join(targetpath, '*.tfa')) + compressed_glob(os.path.join(targetpath, '*.tfa'))
+        for fasta in sorted(resistance_files):
+            # Extract the resistance class from the file name e.g. beta-lactam.tfa.gz
+            resistance_class = os.path.splitext(uncompressed_name(os.path.basename(fasta)))[0]
+            with open_compressed(fasta, 'rt') as resistance:
+                # Dashes in the gene names are replaced with underscores in the combined targets
+                resistance_dict[resistance_class] = {record.id.replace('-', '_')
+                                                     for record in SeqIO.parse(resistance, 'fasta')}
+        return resistance_dict
+
+    def resfinder_reporter(self, metadata, analysistype, reportpath, align, program, targetpath, cutoff):
+        """
+        Custom reports for ResFinder analyses. These reports link the gene(s) found to their resistance phenotypes
+        :param metadata: Metadata object
+        :param analysistype: Current analysis type
+        :param reportpath: Path of folder in which report is to be created
+        :param align: Boolean of whether alignments between query and subject sequences are desired
+        :param program: BLAST program used in the analyses
+        :param targetpath: Name and path of the folder containing the targets
+        :param cutoff: Cutoff value to use for the analyses
+        :return: Updated metadata object
+        """
+        # Since the resfinder database is used for both sipping and assembled analyses, but the analysis type is
+        # different, strip off the _assembled, so the targets are set correctly
+        targetpath = targetpath if analysistype != 'resfinder_assembled' else targetpath.rstrip('_assembled')
+        resistance_classes = self.resistance_classes(targetpath)
+        percentage = 'PercentIdentity' if program in NUCLEOTIDE_PROGRAMS else 'PercentPositive'
+        headers = ['Strain', 'Gene', 'Allele', 'Resistance', percentage, 'PercentCovered', 'Contig', 'Location']
+        # Add the appropriate string to the headers based on whether the BLAST outputs are DNA/amino acids
+        headers.append('nt_sequence') if program in NUCLEOTIDE_PROGRAMS else headers.append('aa_sequence')
+        # The alignment columns depend only on the align option, so the header can be written before any sample is
+        # processed
+        if align:
+            headers.extend(['aa_Identity', 'aa_Alignment', 'aa_SNP_location'])
+            if program in NUCLEOTIDE_PROGRAMS:
+                headers.extend(['nt_Alignment', 'nt_SNP_location'])
+        # Create a workbook to store the report. Using xlsxwriter rather than a simple csv format, as I want to be
+        # able to have appropriately sized, multi-line cells
+        writer = ReportWriter(path=os.path.join(reportpath, '{at}_{program}.xlsx'.format(at=analysistype,
+                                                                                       program=program)),
+                              font_size=8,
+                              line_height=11,
+                              width_line=1,
+                              parquet=self.parquet,
+                              numeric=lambda column: column in [percentage, 'PercentCovered', 'aa_Identity'])
+        writer.header(headers)
+        for sample in metadata:
+            # The rows are also kept in the .sampledata attribute for compatibility with the assembly pipeline
+            sample[analysistype].sampledata = list()
+            sample[analysistype].pipelineresults = dict()
+            # Process the sample only if the script could find targets
+            if sample[analysistype].blastlist != 'NA' and sample[analysistype].blastlist:
+                if align:
+                    self.prepare_alignments(hits=[result for result in sample[analysistype].blastlist
+                                                  if result['percentidentity'] >= cutoff],
+                                            program=program)
+                for result in sample[analysistype].blastlist:
+                    index = 0
+                    # Set the name to avoid writing out the dictionary[key] multiple times
+                    name = result['subject_id']
+                    try:
+                        # Extract the necessary variables from the gene name string
+                        gname, genename, accession, allele = ResistanceNotes.gene_name(name)
+                    except ValueError:
+                        genename = name
+                        allele = str()
+                    # Determine resistance phenotype of the gene
+                    resistance = ResistanceNotes.resistance(name, resistance_classes)
+                    percentid = result['percentidentity']
+                    # Initialise a list to store all the data for each strain
+                    data = [genename, allele, resistance, percentid, result['alignment_fraction'], result['query_id'],
+                            '...'.join([str(result['low']), str(result['high'])])]
+                    # Populate the .pipelineresults attribute for compatibility with the assembly pipeline
+                    if percentid >= cutoff:
+                        pipelineresult = '{rgene} ({pid}%)'.format(rgene=genename,
+                                                                   pid=percentid)
+                        pipelineresults = sample[analysistype].pipelineresults.setdefault(resistance, list())
+                        if genename not in pipelineresults:
+                            pipelineresults.append(pipelineresult)
+                    try:
+                        # Only if the alignment option is selected, for inexact results, add alignments
+                        if align and percentid >= cutoff:
+                            # Align the protein (and nucleotide) sequences to the reference
+                            sample = self.alignprotein(sample=sample,
+                                                       analysistype=analysistype,
+                                                       target=name,
+                                                       program=program,
+                                                       index=index,
+                                                       hit=result)
+                            # Create a FASTA-formatted sequence output of the query sequence
+                            if program in NUCLEOTIDE_PROGRAMS:
+                                record = SeqRecord(sample[analysistype].dnaseq[name][index],
+                                                   id='{}_{}'.format(sample.name, name),
+                                                   description='')
+                            else:
+                                record = SeqRecord(sample[analysistype].protseq[name][index],
+                                                   id='{}_{}'.format(sample.name, name),
+                                                   description='')
+                            # Add the alignment, and the location of mismatches for both nucleotide and amino
+                            # acid sequences
+                            if program in NUCLEOTIDE_PROGRAMS:
+                                data.extend([record.format('fasta'),
+                                             sample[analysistype].aaidentity[name][index],
+                                             sample[analysistype].aaalign[name][index],
+                                             sample[analysistype].aaindex[name][index],
+                                             sample[analysistype].ntalign[name][index],
+                                             sample[analysistype].ntindex[name][index]
+                                             ])
+                            else:
+                                data.extend([record.format('fasta'),
+                                             sample[analysistype].aaidentity[name][index],
+                                             sample[analysistype].aaalign[name][index],
+                                             sample[analysistype].aaindex[name][index],
+                                             ])
+                        else:
+                            if program in NUCLEOTIDE_PROGRAMS:
+                                record = SeqRecord(Seq(result['query_sequence'], IUPAC.ambiguous_dna),
+                                                   id='{}_{}'.format(sample.name, name),
+                                                   description='')
+                            else:
+                                record = SeqRecord(Seq(result['query_sequence'], IUPAC.protein),
+                                                   id='{}_{}'.format(sample.name, name),
+                                                   description='')
+                            data.append(record.format('fasta'))
+                            if align:
+                                # Add '-'s for the empty results, as there are no alignments for exact matches
+                                data.extend(['-'] * (5 if program in NUCLEOTIDE_PROGRAMS else 3))
+                    # If there are no blast results for the target, add a '-'
+                    except (KeyError, TypeError, IndexError):
+                        data.append('-')
+                    sample[analysistype].sampledata.append(data)
+            # Write out the rows of the sample as soon as they are complete, rather than once every sample is done
+            if not sample[analysistype].sampledata:
+                writer.row([sample.name],
+                           resize=False)
+            for data in sample[analysistype].sampledata:
+                writer.set_width(0, len(sample.name) + 2)
+                writer.row([sample.name] + data)
+        self.shutdown()
+        writer.close()
+        # Return the updated metadata object
+        return metadata
+
+    @staticmethod
+    def translation_pair(hit):
+        """
+        Find the nucleotide sequences of a hit to translate. Both sequences are in the orientation of the target, and
+        start at the first complete codon of the target
+        :param hit: Dictionary of a BLAST hit
+        :return: Tuple of the query and subject nucleotide strings
+        """
+        query = GeneSeekr.query_sequence(hit).replace('-', '')
+        subject = hit['subject_sequence'].replace('-', '')
+        if int(hit['subject_end']) < int(hit['subject_start']):
+            subject = str(Seq(subject, IUPAC.unambiguous_dna).reverse_complement())
+        frame = (3 - (min(int(hit['subject_start']), int(hit['subject_end'])) - 1) % 3) % 3
+        return query[frame:], subject[frame:]
+
+    def alignments(self, pairs):
+        """
+        Translate, and align the amino acid sequences of, a batch of hits. The translations are performed in a single
+        vectorised batch, and the alignments are run in the worker pool
+        :param pairs: List of (query, subject) nucleotide strings created by translation_pair
+        :return: List of (aligned query, aligned subject) amino acid strings
+        """
+        proteins = translate([query for query, _ in pairs] + [subject for _, subject in pairs])
+        proteins = list(zip(proteins[:len(pairs)], proteins[len(pairs):]))
+        executor = self.executor() if len(pairs) > 1 else None
+        aligned = align_proteins(pairs=proteins,
+                                 executor=executor,
+                                 chunksize=max(1, len(pairs) // (4 * self.threads)))
+        results = list()
+        for (query, subject), (aligned_query, aligned_subject) in zip(proteins, aligned):
+            # Sequences that do not align are compared without gaps
+            if not aligned_query:
+                length = min(len(query), len(subject))
+                aligned_query, aligned_subject = query[:length], subject[:length]
+            results.append((aligned_query, aligned_subject))
+        return results
+
+    def prepare_alignments(self, hits, program):
+        """
+        Calculate the protein alignments of all the hits of a sample that will be aligned by alignprotein
+        :param hits: List of the hits to align
+        :param program: BLAST program used in the analyses
+        """
+        self.aligned = dict()
+        if program not in NUCLEOTIDE_PROGRAMS or not hits:
+            return
+        pairs = list(dict.fromkeys(self.translation_pair(hit) for hit in hits))
+        self.aligned = dict(zip(pairs, self.alignments(pairs)))
+
+    def executor(self):
+        """
+        Create the pool of worker processes used for the protein alignments the first time that it is required
+        :return: ProcessPoolExecutor, or None if only a single thread is to be used
+        """
+        if self.pool is None and self.threads > 1:
+            self.pool = ProcessPoolExecutor(max_workers=self.threads)
+        return self.pool
+
+    def shutdown(self):
+        """
+        Shut down the pool of worker processes, and remove the stored alignments
+        """
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        self.aligned = dict()
+
+    @staticmethod
+    def snp_index(query, subject):
+        """
+        Find the positions at which aligned sequences differ
+        :param query: Query sequence
+        :param subject: Subject sequence aligned to the query
+        :return: String of the 1-based positions of the differences, separated by ';' with a line break after every
+        15+ characters ('-' if the sequences are identical), and the number of matching positions
+        """
+        query = str(query)
+        subject = str(subject)
+        if len(subject) < len(query):
+            raise IndexError('string index out of range')
+        mismatches = numpy.flatnonzero(numpy.frombuffer(query.encode(), dtype=numpy.uint8) !=
+                                       numpy.frombuffer(subject[:len(query)].encode(), dtype=numpy.uint8)).tolist()
+        count = 0
+        index = str()
+        for i in mismatches:
+            # Append the current location (+1 due to zero indexing)
+            index += '{i};'.format(i=i + 1)
+            # Increment the count by the length of the current position - should make the output more uniform due to
+            # the fact that the numbers are not padded
+            count += len(str(i))
+            # If there are many SNPs, then insert line breaks for every 15+ characters
+            if count >= 15:
+                index += '\n'
+                count = 0
+        # Remove trailing ';' (or ';' followed by a newline)
+        index = index.rstrip(';').replace(';\n', '\n') if index else '-'
+        return index, len(query) - len(mismatches)
+
+    @staticmethod
+    def interleaveblastresults(query, subject):
+        """
+        Creates an interleaved string that resembles BLAST sequence comparisons
+        :param query: Query sequence
+        :param subject: Subject sequence
+        :return: Properly formatted BLAST-like sequence comparison
+        """
+        query = str(query)
+        subject = str(subject)
+        if len(subject) < len(query):
+            raise IndexError('string index out of range')
+        # '|' for identical positions in the query and subject, and ' ' for mismatches
+        matchstring = numpy.where(numpy.frombuffer(query.encode(), dtype=numpy.uint8) ==
+                                  numpy.frombuffer(subject[:len(query)].encode(), dtype=numpy.uint8),
+                                  ord('|'), ord(' ')).astype(numpy.uint8).tobytes().decode()
+        blaststring = str()
+        # The components are: current position (padded to four characters), 'OLC', query sequence, \n, matches, \n,
+        # 'ref', subject sequence. Repeated every 60 positions until all the sequence data are present
+        for j in range(0, len(query), 60):
+            blaststring += '{:04d} OLC {}\n         {}\n     ref {}\n' \
+                .format(j, query[j:j + 60], matchstring[j:j + 60], subject[j:j + 60])
+        return blaststring
+
+    def alignprotein(self, sample, analysistype, target, program, index, hit):
+        """
+        Create alignments of the sample nucleotide and amino acid sequences to the reference sequences. For BLASTn
+        analyses, the amino acid sequences are translated from the hit in the first frame of the target, and aligned,
+        rather than found with tblastx. The alignments calculated by prepare_alignments are used when available
+        :param sample: Metadata object
+        :param analysistype: Current analysis type
+        :param target: Current gene name
+        :param program: BLAST program used in the analyses
+        :param index: Current index to be used for accessing lists
+        :param hit: BLAST output dictionary
+        :return: updated sample object
+        """
+        # Initialise lists to store the outputs
+        if target not in sample[analysistype].dnaseq:
+            sample[analysistype].dnaseq[target] = list()
+            sample[analysistype].protseq[target] = list()
+            sample[analysistype].ntalign[target] = list()
+            sample[analysistype].ntindex[target] = list()
+            sample[analysistype].aaidentity[target] = list()
+            sample[analysistype].aaalign[target] = list()
+            sample[analysistype].aaindex[target] = list()
+        # Only BLASTn analyses require additional effort to find the protein sequence
+        if program in NUCLEOTIDE_PROGRAMS:
+            # Convert the extracted, properly-oriented DNA sequence to a Seq object
+            sample[analysistype].dnaseq[target].append(Seq(hit['query_sequence'], IUPAC.ambiguous_dna))
+            # Create the BLAST-like interleaved outputs with the query and subject sequences
+            sample[analysistype].ntalign[target].append(self.interleaveblastresults(query=hit['query_sequence'],
+                                                                                    subject=hit['subject_sequence']))
+            # Determine the number and position of SNPs
+            ntindex, _ = self.snp_index(query=hit['query_sequence'],
+                                        subject=hit['subject_sequence'])
+            sample[analysistype].ntindex[target].append(ntindex)
+            pair = self.translation_pair(hit)
+            query_prot, ref_prot = self.aligned[pair] if pair in self.aligned else self.alignments([pair])[0]
+            sample[analysistype].protseq[target].append(Seq(query_prot.upper(), IUPAC.protein))
+        else:
+            # Non-blastn analyses will already have the outputs as amino acid sequences. Populate variables as required
+            ref_prot = hit['subject_sequence']
+            sample[analysistype].protseq[target].append(Seq(hit['query_sequence'], IUPAC.protein))
+        # Create the BLAST-like alignment of the amino acid query and subject sequences
+        sample[analysistype].aaalign[target]\
+            .append(self.interleaveblastresults(query=sample[analysistype].protseq[target][index],
+                                                subject=ref_prot))
+        # Determine the number of matches, as well as the number and location of mismatches
+        aaindex, matches = self.snp_index(query=sample[analysistype].protseq[target][index],
+                                          subject=ref_prot)
+        sample[analysistype].aaindex[target].append(aaindex)
+        # Determine percent identity between the query and subject amino acid sequence by dividing the number of
+        # matches by the total length of the query sequence and multiplying this result by 100. Convert to two
+        # decimal places
+        length = len(sample[analysistype].protseq[target][index])
+        pid = float('{:.2f}'.format(matches / length * 100)) if length else 0.0
+        sample[analysistype].aaidentity[target].append(pid)
+        return sample
+
+    def __init__(self, parquet=False, threads=1):
+        """
+        :param parquet: Boolean of whether the Excel reports are also to be written as Parquet files
+        :param threads: Number of worker processes to use for the protein alignments
+        """
+        self.parquet = parquet
+        self.threads = max(threads, 1)
+        self.pool = None
+        # Dictionary of the protein alignments of the current sample: translation_pair: (aligned query, subject)
+        self.aligned = dict()
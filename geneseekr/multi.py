@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+from olctools.accessoryFunctions.accessoryFunctions import make_path
+from geneseekr.scheduler import threads_per_job
+from geneseekr.compression import uncompressed_name
+from genemethods.geneseekr.parser import objector
+from geneseekr.dbcache import DatabaseCache
+from geneseekr.faidx import IndexedFasta
+from geneseekr.timing import Profiler
+from geneseekr.karlin import relaxed_evalue, rescale, search_space
+from geneseekr.kmer import format_evalue
+from geneseekr.blast import BLAST
+import logging
+import shutil
+import math
+import os
+
+__author__ = 'adamkoziol'
+
+# Name of the option of each analysis: analysis type
+analyses = {
+    'resfinder': 'resfinder',
+    'virulence': 'virulence',
+    'mlst': 'mlst',
+    'rmlst': 'rmlst',
+    'cgmlst': 'cgmlst',
+    'sixteens': 'sixteens_full',
+    'gdcs': 'GDCS',
+    'genesippr': 'genesippr',
+    'serosippr': 'serosippr'
+}
+
+
+def analysistypes(kwargs):
+    """
+    Find the analyses selected on the command line
+    :param kwargs: Dictionary of the options of a subcommand
+    :return: List of the analysis types of the selected analyses
+    """
+    return [analysistype for option, analysistype in analyses.items() if kwargs.get(option)]
+
+
+def target_folder(targetpath, analysistype):
+    """
+    Find the folder of the targets of an analysis. The targets of each analysis are in a sub-folder of the target
+    path named for the analysis e.g. targets/resfinder, and targets/MLST. The case of the name is ignored
+    :param targetpath: Folder containing the target folders of the analyses
+    :param analysistype: Name of the analysis
+    :return: Name and path of the target folder
+    """
+    names = [analysistype.lower()]
+    if analysistype == 'sixteens_full':
+        names.append('sixteens')
+    for folder in sorted(os.listdir(targetpath)):
+        if folder.lower() in names and os.path.isdir(os.path.join(targetpath, folder)):
+            return os.path.join(targetpath, folder)
+    raise AssertionError('Cannot locate the {at} targets in {path}. The targets of each analysis must be in a folder '
+                         'named for the analysis e.g. {example}'.format(at=analysistype,
+                                                                        path=targetpath,
+                                                                        example=os.path.join(targetpath,
+                                                                                             analysistype)))
+
+
+class MultiBLAST(object):
+    """
+    Runs several analyses (e.g. ResFinder, virulence, and serotyping) with a single search of each sample. The combined
+    targets of the analyses are merged into one database, and every target is tagged with the analysis to which it
+    belongs. The hits are routed to the reports of their analysis as BLAST outputs them, and each analysis is then
+    parsed, and reported as if it had been run on its own
+    """
+
+    def seekr(self):
+        """
+        Run the methods in the proper order
+        """
+        with self.profiler.stage('merge_databases'):
+            self.merge_databases()
+        try:
+            with self.profiler.stage('run_blast'):
+                self.run_blast()
+        finally:
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        for analysis in self.analyses:
+            with self.profiler.stage(analysis.analysistype):
+                for stage in [analysis.parseable_blast_outputs, analysis.parse_results, analysis.create_reports]:
+                    with self.profiler.stage(stage.__name__):
+                        stage()
+                if analysis.export:
+                    with self.profiler.stage('export_fasta'):
+                        analysis.export_fasta()
+                if analysis.store:
+                    with self.profiler.stage('store_results'):
+                        analysis.store_results()
+            analysis.clean_object()
+            logging.info('{at} analyses complete'.format(at=analysis.analysistype))
+        self.profiler.write(self.analyses[0].reportpath)
+
+    def merge_databases(self):
+        """
+        Create the tagged database of the targets of all the analyses. Each target is renamed tag_name, where the tag
+        (e.g. gst0) identifies the analysis
+        """
+        logging.info('Merging the {ats} targets'.format(ats=', '.join(self.analysistypes)))
+        make_path(self.tmp_dir)
+        merged = os.path.join(self.tmp_dir, 'combinedtargets.fasta')
+        with open(merged, 'w') as combined:
+            for index, analysis in enumerate(self.analyses):
+                targets = IndexedFasta(analysis.combinedtargets)
+                self.sizes.append(sum(length for length, _, _, _ in targets.index.values()))
+                self.counts.append(len(targets.index))
+                for name in targets:
+                    combined.write('>gst{index}_{header}\n{sequence}\n'.format(index=index,
+                                                                               header=targets.header(name),
+                                                                               sequence=targets.sequence(name)))
+                targets.close()
+        if self.cachepath:
+            self.database = DatabaseCache(cachepath=self.cachepath,
+                                          max_size=self.cachesize,
+                                          timeout=self.analyses[0].timeout,
+                                          retries=self.analyses[0].retries)\
+                .database(targets=[analysis.combinedtargets for analysis in self.analyses],
+                          combinedtargets=merged,
+                          program=self.program)
+        else:
+            self.analyses[0].makeblastdb(fastas=[merged])
+            self.database = merged
+
+    def blast_settings(self, query_length):
+        """
+        Combine the BLAST parameters of the analyses. The search uses the most permissive value of each parameter,
+        and the hits are filtered with the values of their analysis as they are routed
+        :param query_length: Length of the largest query. The length adjustment grows with the query length, so the
+        e-value threshold is an upper bound for every shorter query
+        :return: Dictionary of BLAST parameters
+        """
+        total = sum(self.sizes)
+        settings = [analysis.blast_settings() for analysis in self.analyses]
+        # The merged database has more sequences, so its length adjustment is at least that of the database of each
+        # analysis. The ratio of the search spaces of a hit is at most the length of the merged database over the
+        # adjusted length of the database of the analysis, which is the relaxed threshold of a search of part of a
+        # database. The threshold is not rounded, so no hit that passes the threshold of its analysis is missed
+        evalue = max(relaxed_evalue(evalue=setting['evalue'],
+                                    query_length=query_length,
+                                    database_length=size,
+                                    sequences=count,
+                                    program=self.program) * total / size
+                     for setting, size, count in zip(settings, self.sizes, self.counts))
+        return {
+            'evalue': str(evalue),
+            'num_alignments': max(setting['num_alignments'] for setting in settings),
+            'perc_identity': min(setting['perc_identity'] for setting in settings),
+            'task': 'blastn'
+        }
+
+    def run_blast(self):
+        """
+        Search every sample once against the merged database. Samples with current reports for all the analyses are
+        not searched again
+        """
+        logging.info('Performing {program} analyses on {ats} targets'.format(program=self.program,
+                                                                             ats=', '.join(self.analysistypes)))
+        if self.analyses[0].queuepath:
+            logging.warning('The work queue is not available when several analyses are selected. The searches will be '
+                            'run by this process')
+        if self.analyses[0].shards > 1:
+            logging.warning('Database shards are not available when several analyses are selected. The merged database '
+                            'will be searched without shards')
+        pending = list()
+        # The analyses find the samples in the same (sorted) order
+        for samples in zip(*[analysis.metadata for analysis in self.analyses]):
+            for analysis, sample in zip(self.analyses, samples):
+                make_path(sample[analysis.analysistype].reportdir)
+                sample[analysis.analysistype].report = os.path.join(
+                    sample[analysis.analysistype].reportdir, '{name}_{program}_{at}.tsv'
+                    .format(name=sample.name,
+                            program=self.program,
+                            at=analysis.analysistype))
+            if not all([analysis.reusable(sample) for analysis, sample in zip(self.analyses, samples)]):
+                pending.append(samples)
+        settings = self.blast_settings(query_length=max([sum(BLAST.contig_lengths(samples[0]).values())
+                                                         for samples in pending] + [1]))
+        executor = self.analyses[0].executor()
+        jobs = dict()
+        database_size = os.path.getsize(self.database)
+        for i in range(0, len(pending), self.batchsize):
+            chunk = pending[i:i + self.batchsize]
+            name = chunk[0][0].name if len(chunk) == 1 else 'batch_{count}'.format(count=len(jobs))
+            jobs[name] = chunk
+            threads = threads_per_job(database_size=database_size,
+                                      query_size=sum(os.path.getsize(samples[0].general.bestassemblyfile)
+                                                     for samples in chunk),
+                                      cpus=self.cpus,
+                                      jobs=math.ceil(len(pending) / self.batchsize))
+            self.add_search(executor=executor,
+                            chunk=chunk,
+                            jobname=name,
+                            settings=settings,
+                            num_threads=threads)
+        times = executor.run()
+        for name, result in executor.results.items():
+            if not result['success']:
+                logging.warning('The search of {name} failed. It will be run again on the next run'.format(name=name))
+        for name, seconds in times.items():
+            for samples in jobs[name]:
+                for analysis, sample in zip(self.analyses, samples):
+                    sample[analysis.analysistype].blasttime = float('{:0.2f}'.format(seconds))
+            self.profiler.add(name=name,
+                              wall=seconds,
+                              sample=name if len(jobs[name]) == 1 else None)
+        for index, analysis in enumerate(self.analyses):
+            analysis.update_manifest([samples[index] for chunk in jobs.values() for samples in chunk])
+
+    def add_search(self, executor, chunk, jobname, settings, num_threads):
+        """
+        Add the search of one sample, or a batch of samples, against the merged database to the executor. The reports
+        of the analyses are created again before each attempt, and are only moved into place if the search succeeds
+        :param executor: ProcessExecutor object
+        :param chunk: List of tuples of the metadata objects of a sample in each analysis
+        :param jobname: Name of the job. Used to name the combined query of batches
+        :param settings: Dictionary of BLAST parameters
+        :param num_threads: Number of threads to use
+        """
+        tags = None
+        stdin = None
+        # Length of each query of the search, used to recalculate the e-values of the hits in the search space of the
+        # database of their analysis
+        lengths = BLAST.contig_lengths(chunk[0][0])
+        if len(chunk) == 1:
+            query = chunk[0][0].general.bestassemblyfile
+            # Compressed assemblies are decompressed into the stdin of BLAST
+            if query != uncompressed_name(query):
+                stdin = query
+                query = '-'
+        else:
+            query = os.path.join(self.tmp_dir, '{name}.fasta'.format(name=jobname))
+            tags = BLAST.batch_query(samples=[samples[0] for samples in chunk],
+                                     query=query)
+            sample_lengths = [BLAST.contig_lengths(samples[0]) for samples in chunk]
+            lengths = {query_id: sample_lengths[sample][contig] for query_id, (sample, contig) in tags.items()}
+        blast = self.analyses[0].blast_commandline(query=query,
+                                                   report='-',
+                                                   db=os.path.splitext(self.database)[0],
+                                                   settings=settings,
+                                                   threads=num_threads)
+        reports = list()
+        for index, analysis in enumerate(self.analyses):
+            for samples in chunk:
+                samples[index][analysis.analysistype].blastcommand = str(blast)
+                reports.append(samples[index][analysis.analysistype].report)
+        # List of the open reports of each analysis: one for every sample in the chunk
+        outputs = list()
+
+        def start():
+            outputs[:] = [[open(samples[index][analysis.analysistype].report + '.tmp', 'w') for samples in chunk]
+                          for index, analysis in enumerate(self.analyses)]
+            for parser, analysis_outputs in zip(self.parsers, outputs):
+                for output in analysis_outputs:
+                    output.write(parser.header())
+            return lambda lines: self.route(lines=lines,
+                                            outputs=outputs,
+                                            lengths=lengths,
+                                            tags=tags)
+
+        def finish(success):
+            BLAST.close_outputs(reports=reports,
+                                outputs=[output for analysis_outputs in outputs for output in analysis_outputs],
+                                success=success)
+        executor.add(name=jobname,
+                     command=BLAST.arguments(blast),
+                     threads=num_threads,
+                     stdin=stdin,
+                     start=start,
+                     finish=finish)
+
+    def route(self, lines, outputs, lengths, tags=None):
+        """
+        Write the hits of a merged search to the reports of their analyses. The tags are removed from the target
+        names, the e-values are recalculated in the search space of the database of the analysis, and the hits are
+        filtered with the settings of the analysis
+        :param lines: Iterable of lines of BLAST output
+        :param outputs: List of the lists of open reports of the samples in each analysis
+        :param lengths: Dictionary of query id: length of the queries of the search
+        :param tags: Optional dictionary of query id: (sample index, contig name) of batched searches
+        :return: Number of hits written
+        """
+        count = 0
+        # Dictionary of (analysis index, query id): effective search space
+        spaces = dict()
+        for line in lines:
+            values = line.rstrip('\n').split('\t')
+            if len(values) < 13:
+                continue
+            tag, values[1] = values[1].split('_', 1)
+            index = int(tag[3:])
+            if (index, values[0]) not in spaces:
+                spaces[(index, values[0])] = search_space(query_length=lengths[values[0]],
+                                                          database_length=self.sizes[index],
+                                                          sequences=self.counts[index],
+                                                          program=self.program)
+            hit = dict(zip(self.parsers[index].columns, values))
+            values[5] = format_evalue(rescale(bit_score=hit['bit_score'],
+                                              space=spaces[(index, values[0])],
+                                              program=self.program,
+                                              query_sequence=hit.get('query_sequence'),
+                                              subject_sequence=hit.get('subject_sequence')))
+            # blastn reports the identical positions as positives. The search used the lowest percent identity of the
+            # analyses
+            if self.program == 'blastn' and \
+                    100 * float(values[2]) / float(values[8]) < self.identities[index]:
+                continue
+            row = self.parsers[index].row('\t'.join(values))
+            if row is None:
+                continue
+            sample = 0
+            if tags:
+                sample, row[0] = tags[row[0]]
+            outputs[index][sample].write(self.parsers[index].line(row))
+            count += 1
+        return count
+
+    def __init__(self, kwargs, program, analysistypes, start, cache=None):
+        """
+        :param kwargs: Dictionary of the options of the subcommand
+        :param program: BLAST program to use
+        :param analysistypes: List of the analysis types to run
+        :param start: Time at which the analyses were started
+        :param cache: Optional WarmCache object with the indices of previous analyses
+        """
+        self.program = program
+        self.analysistypes = analysistypes
+        self.analyses = list()
+        # The analyses record their stages with the profiler of the merged search
+        self.profiler = Profiler(enabled=bool(kwargs.get('profile')))
+        for analysistype in analysistypes:
+            # Create the arguments of each analysis as if it had been selected on its own
+            options = dict(kwargs)
+            options.update({option: False for option in analyses})
+            metadata, pipeline = objector(options, start)
+            metadata.analysistype = analysistype
+            metadata.targetpath = target_folder(targetpath=kwargs['targetpath'],
+                                                analysistype=analysistype)
+            metadata.program = program
+            metadata.warmcache = cache
+            metadata.profiler = self.profiler
+            with self.profiler.stage(analysistype):
+                analysis = BLAST(args=metadata,
+                                 pipeline=pipeline)
+            # Exact allele calls, and the pre-filter reduce the database of a single analysis
+            analysis.exact = False
+            analysis.prefilter = False
+            analysis.merged = analysistypes
+            self.analyses.append(analysis)
+        # Share the manifest, so the analyses do not overwrite the entries of each other
+        for analysis in self.analyses[1:]:
+            analysis.manifest = self.analyses[0].manifest
+        self.cpus = max(self.analyses[0].cpus, 1)
+        self.batchsize = self.analyses[0].batchsize
+        self.cachepath = self.analyses[0].cachepath
+        self.cachesize = self.analyses[0].cachesize
+        self.tmp_dir = os.path.join(self.analyses[0].reportpath, 'tmp_multi')
+        self.parsers = [analysis.tabular_parser() for analysis in self.analyses]
+        self.identities = [analysis.blast_settings()['perc_identity'] for analysis in self.analyses]
+        # Length, and number of the targets of each analysis
+        self.sizes = list()
+        self.counts = list()
+        self.database = str()
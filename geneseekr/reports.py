@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+import xlsxwriter
+import logging
+import os
+try:
+    import pyarrow.parquet as pq
+    import pyarrow as pa
+except ImportError:
+    pa = pq = None
+
+__author__ = 'adamkoziol'
+
+
+def parquet_available():
+    """
+    :return: Boolean of whether pyarrow (required for Parquet reports) is installed
+    """
+    return pa is not None
+
+
+class ReportWriter(object):
+    """
+    Writes the rows of a report as they are created. The Excel workbook is written in constant-memory mode, so only
+    the current row is held in memory, and the rows can optionally be written to a Parquet file with the same columns
+    in batches of row groups. As rows are flushed as soon as the next row is started, they must be written in order,
+    starting with the header
+    """
+
+    def header(self, headers):
+        """
+        Write the header to the first row of the worksheet
+        :param headers: List of the column names
+        """
+        for col, header in enumerate(headers):
+            self.worksheet.write(self.position, col, header, self.bold)
+            self.widen(col, len(header))
+        self.position += 1
+        if self.parquet:
+            # Columns of targets with more than one hit are repeated in the header. Parquet requires unique names
+            names = list()
+            counts = dict()
+            for header in headers:
+                counts[header] = counts.get(header, 0) + 1
+                names.append(header if counts[header] == 1 else '{header}_{count}'.format(header=header,
+                                                                                          count=counts[header]))
+            self.schema = pa.schema([pa.field(name, pa.float64() if self.numeric(header) else pa.string())
+                                     for name, header in zip(names, headers)])
+
+    def widen(self, col, width):
+        """
+        Increase the width of a column, if necessary
+        :param col: Index of the column
+        :param width: Width of the content of the current cell
+        """
+        self.columnwidth[col] = max(width, self.columnwidth.get(col, width))
+        self.worksheet.set_column(col, col, self.columnwidth[col])
+
+    def set_width(self, col, width):
+        """
+        Set the width of a column, regardless of its current width
+        :param col: Index of the column
+        :param width: Width of the column
+        """
+        self.columnwidth[col] = width
+        self.worksheet.set_column(col, col, width)
+
+    def row(self, values, resize=True):
+        """
+        Write a row of data. Multi-line values (e.g. FASTA sequences, alignments) set the height of the row, and the
+        width of the column is based on a single line of the value
+        :param values: List of the values in the row
+        :param resize: Boolean of whether the widths of the columns, and the height of the row are to be adjusted
+        """
+        totallines = list()
+        for col, results in enumerate(values):
+            self.worksheet.write(self.position, col, results, self.courier)
+            if not resize:
+                continue
+            lines = str(results).split('\n')
+            # Counting the length of multi-line strings yields columns that are far too wide, only count the length
+            # of the string up to a line break
+            self.widen(col, len(lines[self.width_line]) if len(lines) > self.width_line else len(lines[0]))
+            totallines.append(max(results.count('\n'), 1) if isinstance(results, str) else 1)
+        if resize:
+            self.worksheet.set_row(self.position, max(totallines) * self.line_height if totallines else 1)
+        self.position += 1
+        if self.parquet:
+            self.rows.append(values)
+            if len(self.rows) >= self.batchsize:
+                self.flush()
+
+    def flush(self):
+        """
+        Write the stored rows to the Parquet file as a row group
+        """
+        if not self.rows:
+            return
+        columns = list()
+        for col, field in enumerate(self.schema):
+            column = list()
+            for values in self.rows:
+                value = values[col] if col < len(values) else None
+                if value is None or value == '-':
+                    column.append(None)
+                elif field.type == pa.float64():
+                    try:
+                        column.append(float(value))
+                    except (TypeError, ValueError):
+                        column.append(None)
+                else:
+                    column.append(str(value))
+            columns.append(pa.array(column, type=field.type))
+        if self.parquet_writer is None:
+            self.parquet_writer = pq.ParquetWriter(self.parquet, self.schema)
+        self.parquet_writer.write_table(pa.Table.from_arrays(columns, schema=self.schema))
+        self.rows = list()
+
+    def close(self):
+        """
+        Close the workbook and the Parquet file
+        """
+        self.workbook.close()
+        if self.parquet:
+            self.flush()
+            if self.parquet_writer is None:
+                # No rows were written, but the file should still have the columns of the report
+                self.parquet_writer = pq.ParquetWriter(self.parquet, self.schema)
+            self.parquet_writer.close()
+
+    def __init__(self, path, font_size=10, line_height=15, width_line=0, parquet=False, numeric=None,
+                 batchsize=1000):
+        """
+        :param path: Name and path of the Excel workbook to create
+        :param font_size: Size of the Courier New font used in the worksheet
+        :param line_height: Height of each line of text in a row
+        :param width_line: Index of the line of multi-line values to use when setting the width of a column
+        :param parquet: Boolean of whether a Parquet file (with the same name as the workbook) is also to be created
+        :param numeric: Function that returns whether a column, identified by its header, contains numbers
+        :param batchsize: Number of rows in each row group of the Parquet file
+        """
+        self.workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+        # New worksheet to store the data
+        self.worksheet = self.workbook.add_worksheet()
+        # Add a bold format for header cells. Using a monotype font
+        self.bold = self.workbook.add_format({'bold': True, 'font_name': 'Courier New', 'font_size': font_size})
+        # Format for data cells. Monotype, top vertically justified
+        self.courier = self.workbook.add_format({'font_name': 'Courier New', 'font_size': font_size})
+        self.courier.set_align('top')
+        self.line_height = line_height
+        self.width_line = width_line
+        self.position = 0
+        # A dictionary to store the column widths for every header
+        self.columnwidth = dict()
+        self.parquet = os.path.splitext(path)[0] + '.parquet' if parquet else str()
+        if self.parquet:
+            assert parquet_available(), 'Parquet reports require pyarrow. Please install it e.g. pip install pyarrow'
+            logging.debug('Writing Parquet report {parquet}'.format(parquet=self.parquet))
+        self.numeric = numeric if numeric is not None else lambda header: False
+        self.batchsize = batchsize
+        self.schema = None
+        self.rows = list()
+        self.parquet_writer = None
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+__author__ = 'adamkoziol'
+
+
+def threads_per_job(database_size, query_size, cpus, jobs=1):
+    """
+    Determine the number of threads to give a single search. BLAST only splits the work between threads when there
+    is enough of it, so small databases run best with one or two threads, and the remaining cores are better spent
+    running other samples. When there are fewer searches than cores, the cores are shared between the searches instead
+    :param database_size: Size of the database in bases (or residues)
+    :param query_size: Size of the query in bases (or residues)
+    :param cpus: Total number of cores available to the analyses
+    :param jobs: Number of searches that will be run at the same time
+    :return: Number of threads to use for the search
+    """
+    if database_size < 10 ** 7:
+        threads = 1
+    elif database_size < 10 ** 8:
+        threads = 2
+    elif database_size < 10 ** 9:
+        threads = 4
+    else:
+        threads = 8
+    # Very large queries (e.g. metagenomes, or batches of samples) have enough work to keep more threads busy
+    if query_size > 5 * 10 ** 7:
+        threads *= 2
+    # Cores that are not required by the other searches would otherwise sit idle
+    threads = max(threads, cpus // max(1, jobs))
+    return max(1, min(threads, cpus))
+
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+from olctools.accessoryFunctions.accessoryFunctions import GenObject
+from geneseekr.methods import GeneSeekr
+from geneseekr.kmer import KmerIndex
+from collections.abc import Mapping
+
+__author__ = 'adamkoziol'
+
+
+def records(sequences):
+    """
+    Iterate over the names and sequences of in-memory sequences
+    :param sequences: String of a single sequence, dictionary of name: sequence, or iterable of (name, sequence)
+    tuples or SeqRecords
+    :return: Generator of (name, sequence) tuples
+    """
+    if isinstance(sequences, str):
+        yield 'query', sequences
+        return
+    if isinstance(sequences, Mapping):
+        sequences = sequences.items()
+    for record in sequences:
+        if isinstance(record, tuple):
+            name, sequence = record
+        else:
+            name, sequence = record.id, record.seq
+        yield name, str(sequence)
+
+
+class TargetHit(object):
+    """
+    Target found in a query sequence. The counts and coordinates are integers, the scores are floats, and the
+    coordinates are BLAST-style: 1-based, on the forward strand of the query, with the subject start greater than the
+    subject end for hits on the reverse strand
+    """
+    fieldnames = ['query_id', 'subject_id', 'positives', 'mismatches', 'gaps', 'evalue', 'bit_score', 'subject_length',
+                  'alignment_length', 'query_start', 'query_end', 'subject_start', 'subject_end', 'percent_match',
+                  'alignment_fraction', 'query_sequence', 'subject_sequence']
+
+    @property
+    def strand(self):
+        """
+        :return: 1 if the target is on the forward strand of the query, otherwise -1
+        """
+        return 1 if self.subject_start <= self.subject_end else -1
+
+    def as_dict(self):
+        """
+        :return: Dictionary of fieldname: value
+        """
+        return {field: getattr(self, field) for field in self.fieldnames}
+
+    def __eq__(self, other):
+        return isinstance(other, TargetHit) and self.as_dict() == other.as_dict()
+
+    def __repr__(self):
+        return 'TargetHit({subject} in {query}:{start}-{end}, {percent}%)'.format(subject=self.subject_id,
+                                                                                 query=self.query_id,
+                                                                                 start=self.query_start,
+                                                                                 end=self.query_end,
+                                                                                 percent=self.percent_match)
+
+    def __init__(self, row):
+        """
+        :param row: Dictionary of a hit with the calculated columns added by the GeneSeekr.hit method
+        """
+        self.query_id = str(row['query_id'])
+        self.subject_id = str(row['subject_id'])
+        self.positives = int(row['positives'])
+        self.mismatches = int(row['mismatches'])
+        self.gaps = int(row['gaps'])
+        self.evalue = float(row['evalue'])
+        self.bit_score = float(row['bit_score'])
+        self.subject_length = int(row['subject_length'])
+        self.alignment_length = int(row['alignment_length'])
+        self.query_start = int(row['query_start'])
+        self.query_end = int(row['query_end'])
+        self.subject_start = int(row['subject_start'])
+        self.subject_end = int(row['subject_end'])
+        self.percent_match = float(row['percent_match'])
+        self.alignment_fraction = float(row['alignment_fraction'])
+        self.query_sequence = str(row['query_sequence'])
+        self.subject_sequence = str(row['subject_sequence'])
+
+
+class TargetDatabase(object):
+    """
+    Targets indexed for k-mer alignment, so that they can be loaded once, and used to screen any number of sequences
+    """
+
+    def search(self, name, sequence, evalue=1e-5):
+        """
+        Align the targets to a sequence
+        :param name: Name of the sequence
+        :param sequence: String of the sequence
+        :param evalue: Maximum e-value of the alignments
+        :return: List of hit dictionaries
+        """
+        return self.index.search(contig=name,
+                                 sequence=sequence,
+                                 evalue=evalue)
+
+    def __len__(self):
+        return len(self.index.names)
+
+    def __init__(self, targets, kmer_size=16):
+        """
+        :param targets: Name and path of a FASTA file of targets, dictionary of name: sequence, or iterable of (name,
+        sequence) tuples or SeqRecords. The k-mer index of a FASTA file is stored next to the file, as with the kma
+        subcommand, and the index of in-memory targets is only kept in memory
+        :param kmer_size: Length of the k-mers used to seed alignments. Must be between 8 and 31
+        """
+        if isinstance(targets, str):
+            self.index = KmerIndex(fasta=targets,
+                                   kmer_size=kmer_size)
+            self.index.main()
+        else:
+            self.index = KmerIndex(fasta=None,
+                                   kmer_size=kmer_size)
+            self.index.add_targets(records(targets))
+
+
+def screen(sequences, database, cutoff=70, evalue=1e-5, unique=False):
+    """
+    Find the targets present in sequences without any files being read or written. The hits are the same as those of
+    the kma subcommand
+    :param sequences: String of a single sequence, dictionary of name: sequence, or iterable of (name, sequence)
+    tuples or SeqRecords e.g. the contigs of an assembly. Sequences are aligned one at a time, so iterators are not
+    read into memory
+    :param database: TargetDatabase object
+    :param cutoff: Minimum percent match (percent identity over the length of the target) of reported hits
+    :param evalue: Maximum e-value of reported hits
+    :param unique: Only report the best hit at each location of a sequence, as with --unique
+    :return: List of TargetHit objects
+    """
+    rows = (row for name, sequence in records(sequences)
+            for row in database.search(name=name,
+                                       sequence=sequence,
+                                       evalue=float(evalue)))
+    if unique:
+        results = GenObject()
+        GeneSeekr.new_locations(results=results)
+        GeneSeekr.unique_locations(results=results,
+                                   rows=rows,
+                                   cutoff=cutoff,
+                                   program='blastn')
+        GeneSeekr.best_hits(results=results)
+        return [TargetHit(hit) for hit in results.blastlist]
+    return [TargetHit(row) for row in rows if GeneSeekr.hit(row=row, program='blastn') >= cutoff]
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from genemethods.geneseekr.parser import objector
+from socketserver import UnixStreamServer
+from collections import OrderedDict
+from geneseekr.multi import analysistypes, MultiBLAST
+from geneseekr.blast import BLAST
+from geneseekr.kma import KMA
+from threading import Lock
+from time import time
+import logging
+import secrets
+import click
+import hmac
+import json
+import stat
+import os
+
+__author__ = 'adamkoziol'
+
+# Options of the subcommands that name files, or folders, that the jobs read, or write
+PATH_OPTIONS = ['sequencepath', 'targetpath', 'reportpath', 'cachepath', 'queue', 'store']
+
+
+class WarmCache(object):
+    """
+    Indices of target files kept in memory between the jobs of a server. An index is created (or loaded from disk) by
+    the first job that uses a target file, and is reused by later jobs until the file changes. Once the cache is full,
+    the least recently used index is dropped, so a long-running server does not grow as the sets of targets change
+    """
+
+    def get(self, cls, fasta, **kwargs):
+        """
+        Find the index of a target file, and create it if necessary
+        :param cls: Class of the index e.g. KmerIndex. Must accept the fasta keyword, and have a main method
+        :param fasta: Name and path of the target file
+        :param kwargs: Other arguments used to create the index
+        :return: Index object
+        """
+        key = (cls.__name__, os.path.abspath(fasta), tuple(sorted(kwargs.items())))
+        mtime = os.path.getmtime(fasta)
+        with self.lock:
+            cached = self.entries.get(key)
+            if cached is not None and cached[0] == mtime:
+                logging.debug('Using the cached {cls} of {fasta}'.format(cls=cls.__name__,
+                                                                          fasta=fasta))
+                self.entries.move_to_end(key)
+                return cached[1]
+            index = cls(fasta=fasta, **kwargs)
+            index.main()
+            self.entries[key] = (mtime, index)
+            self.entries.move_to_end(key)
+            # The dropped indices are not closed, as the current job may still be using them
+            while len(self.entries) > self.max_entries:
+                dropped, _ = self.entries.popitem(last=False)
+                logging.debug('Dropping the cached {cls} of {fasta}'.format(cls=dropped[0],
+                                                                             fasta=dropped[1]))
+            return index
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __init__(self, max_entries=8):
+        """
+        :param max_entries: Maximum number of indices to keep in memory
+        """
+        self.max_entries = max(1, max_entries)
+        # Dictionary of (class name, target file, arguments): (modification time of the file, index) from the least
+        # to the most recently used
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+
+def analysis(program, kwargs, start=None, cache=None):
+    """
+    Run an analysis in the same way as the GeneSeekr subcommands. If several analyses are selected for a BLAST
+    program, they are run with a single search of each sample
+    :param program: Name of the subcommand e.g. blastn
+    :param kwargs: Dictionary of the options of the subcommand
+    :param start: Optional time at which the analysis was started. Defaults to now
+    :param cache: Optional WarmCache object with the indices of previous analyses
+    :return: Dictionary of the results of each sample. With several analyses, dictionary of analysis type: results
+    """
+    start = start if start is not None else time()
+    selected = analysistypes(kwargs)
+    if program != 'kma' and len(selected) > 1:
+        method = MultiBLAST(kwargs=kwargs,
+                            program=program,
+                            analysistypes=selected,
+                            start=start,
+                            cache=cache)
+        # The genemethods clean up step does not return the metadata, so keep a reference to the samples
+        samples = [analysis.metadata for analysis in method.analyses]
+        method.seekr()
+        return {analysis.analysistype: sample_results(metadata=metadata,
+                                                      analysistype=analysis.analysistype)
+                for analysis, metadata in zip(method.analyses, samples)}
+    metadata, pipeline = objector(kwargs, start)
+    metadata.program = program
+    metadata.warmcache = cache
+    if program == 'kma':
+        method = KMA(args=metadata,
+                     pipeline=pipeline)
+    else:
+        method = BLAST(args=metadata,
+                       pipeline=pipeline)
+    # The genemethods clean up step does not return the metadata, so keep a reference to the samples
+    samples = method.metadata
+    method.seekr()
+    return sample_results(metadata=samples,
+                          analysistype=method.analysistype)
+
+
+def sample_results(metadata, analysistype):
+    """
+    Extract the results of each sample
+    :param metadata: List of metadata objects of the analysed samples
+    :param analysistype: Name of the analysis
+    :return: Dictionary of sample name: dictionary of the report, and the target: percent identity of the hits
+    """
+    results = dict()
+    for sample in metadata:
+        try:
+            report = sample[analysistype].report
+        except AttributeError:
+            report = None
+        try:
+            hits = sample[analysistype].blastresults
+        except AttributeError:
+            hits = 'NA'
+        results[sample.name] = {
+            'report': report,
+            'results': hits if hits else 'NA'
+        }
+    return results
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    Handles the requests to a GeneSeekrServer. Analyses are submitted as a POST to /<subcommand> (e.g. /blastn) with
+    a JSON object of the options of the subcommand e.g. {"sequencepath": "/sequences", "targetpath": "/targets",
+    "reportpath": "/reports", "resfinder": true}. A GET of / returns the status of the server. The body of a POST must
+    have the application/json content type, which web browsers cannot send to another site without asking it first, and
+    servers on a port also require their token in an Authorization: Bearer header
+    """
+
+    def do_GET(self):
+        if self.path.rstrip('/'):
+            self.reply(404, {'error': 'Unknown path {path}'.format(path=self.path)})
+            return
+        self.reply(200, {
+            'programs': sorted(self.server.geneseekr.commands),
+            'jobs': self.server.geneseekr.jobs,
+            'cached': len(self.server.geneseekr.cache)
+        })
+
+    def do_POST(self):
+        program = self.path.strip('/')
+        if not self.server.geneseekr.authorised(self.headers.get('Authorization')):
+            self.reply(401, {'error': 'Missing or incorrect token'})
+            return
+        if self.headers.get('Content-Type', str()).split(';')[0].strip().lower() != 'application/json':
+            self.reply(415, {'error': 'The options must be sent as application/json'})
+            return
+        if program not in self.server.geneseekr.commands:
+            self.reply(404, {'error': 'Unknown subcommand {program}'.format(program=program)})
+            return
+        try:
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            options = json.loads(body) if body else dict()
+            assert isinstance(options, dict), 'The options must be a JSON object'
+            kwargs = self.server.geneseekr.options(program=program,
+                                                   options=options)
+        except (AssertionError, ValueError, click.ClickException) as exc:
+            message = exc.format_message() if isinstance(exc, click.ClickException) else str(exc)
+            self.reply(400, {'error': message})
+            return
+        try:
+            results = self.server.geneseekr.run(program=program,
+                                                kwargs=kwargs)
+        except Exception as exc:
+            logging.exception('{program} analysis failed'.format(program=program))
+            self.reply(500, {'error': str(exc)})
+            return
+        self.reply(200, results)
+
+    def reply(self, code, body):
+        """
+        Send a JSON response
+        :param code: HTTP status code
+        :param body: Object to encode
+        """
+        data = json.dumps(body, default=str).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # Unix socket clients do not have an address, so the default log message cannot be used
+        logging.debug('{command} {path}'.format(command=self.command,
+                                                path=self.path))
+
+
+def is_socket(path):
+    """
+    :param path: Name and path of a file
+    :return: Boolean of whether the file exists, and is a Unix socket. Links are not followed
+    """
+    try:
+        return stat.S_ISSOCK(os.lstat(path).st_mode)
+    except FileNotFoundError:
+        return False
+
+
+class UnixHTTPServer(UnixStreamServer):
+    """
+    HTTP server listening on a Unix socket. Only the user running the server can connect to the socket
+    """
+
+    def server_bind(self):
+        # Remove the socket of a previous server. Any other file at the path is left alone
+        if is_socket(self.server_address):
+            os.remove(self.server_address)
+        assert not os.path.lexists(self.server_address), \
+            '{path} already exists, and is not a socket. Please choose another path for the socket' \
+            .format(path=self.server_address)
+        super().server_bind()
+        os.chmod(self.server_address, stat.S_IRUSR | stat.S_IWUSR)
+
+
+class GeneSeekrServer(object):
+    """
+    Long-running server of GeneSeekr analyses. The imports, the logging setup, and the indices of the targets (e.g.
+    k-mer indices, minimizer sketches, and exact-match allele indices) are only loaded once, rather than for every
+    sample. Jobs are run one at a time in the order that they are received, so each job can use all the cores.
+    The server listens on a Unix socket that only its user can use. Any local process (e.g. a web browser) can
+    connect to a port of localhost, so servers on a port require a token, and only read, and write, the files in
+    their root folders
+    """
+
+    def authorised(self, authorisation):
+        """
+        Check the token of a request. Servers on a Unix socket do not have a token
+        :param authorisation: Value of the Authorization header of the request, or None
+        :return: Boolean of whether the request may be run
+        """
+        if self.token is None:
+            return True
+        return hmac.compare_digest((authorisation or str()).encode(),
+                                   'Bearer {token}'.format(token=self.token).encode())
+
+    def check_paths(self, kwargs):
+        """
+        Ensure that the files, and folders of a job are in the root folders of the server
+        :param kwargs: Dictionary of the parsed arguments of the subcommand
+        """
+        if not self.roots:
+            return
+        for name in PATH_OPTIONS:
+            if not kwargs.get(name):
+                continue
+            path = os.path.realpath(kwargs[name])
+            assert any(os.path.commonpath([root, path]) == root for root in self.roots), \
+                'The {name} {path} is not in the root folders of the server: {roots}'\
+                .format(name=name,
+                        path=kwargs[name],
+                        roots=', '.join(self.roots))
+
+    def options(self, program, options):
+        """
+        Convert the options of a job into the arguments of a subcommand. The options are parsed by the subcommand, so
+        they are validated, and have the same defaults, as on the command line
+        :param program: Name of the subcommand
+        :param options: Dictionary of option name: value. Flags are set with booleans
+        :return: Dictionary of the parsed arguments
+        """
+        command = self.commands[program]
+        # The --version and --help options are not passed to the subcommands
+        names = {param.name: param for param in command.params
+                 if isinstance(param, click.Option) and param.expose_value}
+        args = list()
+        for name, value in options.items():
+            assert name in names, 'Unknown option {name} for {program}'.format(name=name,
+                                                                            program=program)
+            flag = names[name].opts[-1]
+            if names[name].is_flag:
+                if value:
+                    args.append(flag)
+            elif value is not None:
+                args.extend([flag, str(value)])
+        with command.make_context(program, args) as context:
+            self.check_paths(context.params)
+            return context.params
+
+    def run(self, program, kwargs):
+        """
+        Run a job
+        :param program: Name of the subcommand
+        :param kwargs: Dictionary of the parsed arguments of the subcommand
+        :return: Dictionary of the results of each sample
+        """
+        start = time()
+        results = analysis(program=program,
+                           kwargs=kwargs,
+                           cache=self.cache)
+        self.jobs += 1
+        logging.info('Job {count} ({program}) completed in {seconds:.2f} seconds'.format(count=self.jobs,
+                                                                                        program=program,
+                                                                                        seconds=time() - start))
+        return results
+
+    def serve_forever(self):
+        """
+        Handle requests until the server is interrupted
+        """
+        logging.info('GeneSeekr server listening on {address}'.format(address=self.address))
+        if self.tokenfile:
+            logging.info('The token of the server is in {tokenfile}'.format(tokenfile=self.tokenfile))
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        """
+        Stop listening, and remove the Unix socket, and the token file
+        """
+        self.server.server_close()
+        if self.socketpath and is_socket(self.socketpath):
+            os.remove(self.socketpath)
+        if self.tokenfile and os.path.isfile(self.tokenfile):
+            os.remove(self.tokenfile)
+
+    def __init__(self, commands, socketpath=None, port=None, tokenfile=None, roots=None, cachesize=8):
+        """
+        :param commands: Dictionary of subcommand name: click command of the analyses that can be submitted
+        :param socketpath: Unix socket on which to listen
+        :param port: Optional port on localhost on which to listen instead of a socket. 0 picks a free port
+        :param tokenfile: Name and path of the file to which the token of a server on a port is written. Only the user
+        running the server can read the file
+        :param roots: Optional list of the folders that contain the files, and folders of the jobs. Defaults to the
+        current working directory for servers on a port
+        :param cachesize: Maximum number of target indices to keep in memory between jobs
+        """
+        assert socketpath or port is not None, 'The server requires a Unix socket, or a port'
+        self.commands = commands
+        self.socketpath = socketpath if port is None else None
+        self.tokenfile = None
+        self.token = None
+        if port is None:
+            self.server = UnixHTTPServer(socketpath, RequestHandler)
+            self.address = socketpath
+            roots = roots if roots else list()
+        else:
+            assert tokenfile, 'Servers on a port require a token file'
+            # Only listen on the loopback interface. The jobs read, and write to the local file system
+            self.server = HTTPServer(('127.0.0.1', port), RequestHandler)
+            self.address = 'http://127.0.0.1:{port}'.format(port=self.server.server_address[1])
+            self.token = secrets.token_urlsafe(32)
+            self.tokenfile = tokenfile
+            if os.path.lexists(tokenfile):
+                os.remove(tokenfile)
+            with os.fdopen(os.open(tokenfile, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'w') as token:
+                token.write(self.token + '\n')
+            roots = roots if roots else [os.getcwd()]
+        self.roots = [os.path.realpath(root) for root in roots]
+        self.server.geneseekr = self
+        self.cache = WarmCache(max_entries=cachesize)
+        self.jobs = 0
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+from geneseekr.faidx import IndexedFasta
+from geneseekr.alleles import locus
+import logging
+import heapq
+import json
+import os
+
+__author__ = 'adamkoziol'
+
+
+class TargetShards(object):
+    """
+    Splits a combined targets file into shards of similar size, so each sample can be searched against the shards in
+    parallel. Targets are assigned whole (or, by locus, with all the alleles of each locus) to the shard with the
+    fewest bases, starting with the longest. The shards are stored in a folder next to the combined targets file, so
+    they are only created once for a set of targets. The hits of the shards are merged in the order that BLAST ranks
+    the hits of a single database
+    """
+
+    def main(self):
+        """
+        Load the shards from disk if they are current. Otherwise, create them
+        """
+        if os.path.isfile(self.indexfile) and os.path.getmtime(self.indexfile) >= os.path.getmtime(self.fasta):
+            self.load()
+        else:
+            logging.info('Splitting {fasta} into {count} shards'.format(fasta=self.fasta,
+                                                                        count=self.count))
+            self.build()
+            self.save()
+
+    def partition(self, targets):
+        """
+        Assign the targets to the shards. The groups of targets are placed from the longest to the shortest, each in
+        the shard with the fewest bases so far
+        :param targets: IndexedFasta object of the combined targets
+        :return: List of the lists of the names of the targets in each shard, in the order of the combined targets
+        """
+        groups = dict()
+        for name in targets:
+            groups.setdefault(locus(name) if self.by == 'locus' else name, list()).append(name)
+        sizes = {key: sum(targets.index[name][0] for name in names) for key, names in groups.items()}
+        # Heap of (bases, shard index) of the shards. Shards with the same number of bases are filled in order
+        heap = [(0, index) for index in range(min(self.count, len(groups)))]
+        assigned = dict()
+        for key in sorted(groups, key=lambda key: sizes[key], reverse=True):
+            bases, index = heapq.heappop(heap)
+            for name in groups[key]:
+                assigned[name] = index
+            heapq.heappush(heap, (bases + sizes[key], index))
+        shards = [list() for _ in heap]
+        for name in targets:
+            shards[assigned[name]].append(name)
+        return shards
+
+    def build(self):
+        """
+        Write the targets of each shard to a FASTA file in the shard folder
+        """
+        targets = IndexedFasta(self.fasta)
+        try:
+            self.names = list(targets)
+            self.dbsize = sum(length for length, _, _, _ in targets.index.values())
+            os.makedirs(self.shardpath, exist_ok=True)
+            self.files = list()
+            for index, names in enumerate(self.partition(targets)):
+                shard = os.path.join(self.shardpath, 'shard_{index}.fasta'.format(index=index))
+                # The shards are only moved into place once they are complete
+                with open(shard + '.tmp', 'w') as fasta:
+                    for name in names:
+                        fasta.write('>{header}\n{sequence}\n'.format(header=targets.header(name),
+                                                                     sequence=targets.sequence(name)))
+                os.rename(shard + '.tmp', shard)
+                self.files.append(shard)
+        finally:
+            targets.close()
+
+    def save(self):
+        """
+        Write the list of the shards, the names of the targets, and the size of the complete database. The file is
+        written last, so an interrupted split is created again on the next run
+        """
+        with open(self.indexfile + '.tmp', 'w') as index:
+            json.dump({
+                'files': [os.path.basename(shard) for shard in self.files],
+                'names': self.names,
+                'dbsize': self.dbsize
+            }, index)
+        os.rename(self.indexfile + '.tmp', self.indexfile)
+
+    def load(self):
+        """
+        Read the list of the shards from disk
+        """
+        with open(self.indexfile) as index:
+            shards = json.load(index)
+        self.files = [os.path.join(self.shardpath, shard) for shard in shards['files']]
+        self.names = shards['names']
+        self.dbsize = shards['dbsize']
+
+    def merge(self, shard_reports, report, header, exacthits, contigs, limit, cutoff, rescale=None):
+        """
+        Merge the reports of the searches of a sample against each shard into the report of the sample. BLAST lists
+        the hits of each query contig by subject, from the best e-value (then bit score) of the subject to the worst,
+        and keeps the alignments of a subject together. The subjects of the shards are interleaved in the same order,
+        with ties broken by the order of the targets in the combined targets file. The shards are searched without
+        the cutoff, so the limit on the number of subjects of each contig is applied before the cutoff, as it is by
+        BLAST. The e-values of the hits are recalculated in the search space of the complete database before the hits
+        are ranked. The shard reports are removed
+        :param shard_reports: List of the names and paths of the header-annotated reports of each shard
+        :param report: Name and path of the merged report to create
+        :param header: Header line of the annotated reports
+        :param exacthits: List of the annotated lines of the exact matches of the sample, written ahead of the hits
+        :param contigs: Dictionary of contig name: position in the assembly
+        :param limit: Maximum number of subjects of each contig (the num_alignments of the search)
+        :param cutoff: Minimum percent match of the hits
+        :param rescale: Optional function that recalculates the e-value of a line, and returns the updated line, or None
+        if the hit is above the e-value threshold of a search of the complete database
+        :return: Number of hits written
+        """
+        fieldnames = header.rstrip('\n').split('\t')
+        query, subject, evalue, bit_score, percent_match = [fieldnames.index(field) for field in
+                                                            ['query_id', 'subject_id', 'evalue', 'bit_score',
+                                                             'percent_match']]
+        ranks = self.ranks()
+        # Dictionary of (query, subject): list of [lines, best e-value, best bit score]
+        subjects = dict()
+        for shard_report in shard_reports:
+            with open(shard_report) as shard:
+                next(shard, None)
+                for line in shard:
+                    if rescale is not None:
+                        line = rescale(line)
+                        # Hits that a search of the complete database would not report do not count towards the limit
+                        if line is None:
+                            continue
+                    values = line.split('\t')
+                    key = (values[query], values[subject])
+                    if key not in subjects:
+                        subjects[key] = [list(), float(values[evalue]), float(values[bit_score])]
+                    hit = subjects[key]
+                    hit[0].append((line, float(values[percent_match])))
+                    hit[1] = min(hit[1], float(values[evalue]))
+                    hit[2] = max(hit[2], float(values[bit_score]))
+        order = sorted(subjects, key=lambda key: (contigs.get(key[0], len(contigs)), key[0], subjects[key][1],
+                                                  -subjects[key][2], ranks.get(key[1], len(ranks))))
+        count = 0
+        listed = dict()
+        with open(report + '.tmp', 'w') as merged:
+            merged.write(header)
+            merged.writelines(exacthits)
+            for key in order:
+                listed[key[0]] = listed.get(key[0], 0) + 1
+                if listed[key[0]] > limit:
+                    continue
+                for line, percent in subjects[key][0]:
+                    if percent >= cutoff:
+                        merged.write(line)
+                        count += 1
+        os.rename(report + '.tmp', report)
+        for shard_report in shard_reports:
+            os.remove(shard_report)
+        return count
+
+    def ranks(self):
+        """
+        :return: Dictionary of target name: position in the combined targets file
+        """
+        if self.rank is None:
+            self.rank = {name: index for index, name in enumerate(self.names)}
+        return self.rank
+
+    def __init__(self, fasta, count, by='size'):
+        """
+        :param fasta: Name and path of the combined targets file
+        :param count: Number of shards. Fewer shards are created if there are fewer targets (or loci)
+        :param by: Split the targets by 'size', or keep the alleles of each locus in the same shard with 'locus'
+        """
+        assert by in ['size', 'locus'], 'Shards are split by size, or by locus, not {by}'.format(by=by)
+        self.fasta = fasta
+        self.count = max(1, count)
+        self.by = by
+        self.shardpath = '{base}_shards_{count}_{by}'.format(base=os.path.splitext(fasta)[0],
+                                                             count=self.count,
+                                                             by=by)
+        self.indexfile = os.path.join(self.shardpath, 'shards.json')
+        self.files = list()
+        self.names = list()
+        # Total length of the targets, used as the size of the database of the searches of every shard
+        self.dbsize = 0
+        self.rank = None
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+from numpy.lib.stride_tricks import sliding_window_view
+from geneseekr.kmer import kmer_codes, reverse_complement
+from geneseekr.faidx import IndexedFasta
+import logging
+import numpy
+import os
+
+__author__ = 'adamkoziol'
+
+
+def canonical_hashes(sequence, kmer_size):
+    """
+    Hash the canonical (the lesser of the forward and reverse complement) value of every k-mer in a sequence, so
+    sequences match regardless of strand. The values are scrambled with the finaliser of MurmurHash3, so the
+    minimizers are not biased towards poly-A k-mers
+    :param sequence: String of the sequence
+    :param kmer_size: Length of the k-mers
+    :return: numpy array of the hashes, in the order of the k-mers in the sequence. K-mers that overlap ambiguous bases
+    are not included
+    """
+    sequence = sequence.upper()
+    forward, _ = kmer_codes(sequence, kmer_size)
+    reverse, _ = kmer_codes(reverse_complement(sequence), kmer_size)
+    # The k-mers of the reverse complement are in the opposite order to the k-mers of the sequence
+    hashes = numpy.minimum(forward, reverse[::-1])
+    with numpy.errstate(over='ignore'):
+        hashes ^= hashes >> numpy.uint64(33)
+        hashes *= numpy.uint64(0xff51afd7ed558ccd)
+        hashes ^= hashes >> numpy.uint64(33)
+        hashes *= numpy.uint64(0xc4ceb9fe1a85ec53)
+        hashes ^= hashes >> numpy.uint64(33)
+    return hashes
+
+
+def minimizers(sequence, kmer_size, window):
+    """
+    Find the minimizers of a sequence: the lowest hash in every window of consecutive k-mers
+    :param sequence: String of the sequence
+    :param kmer_size: Length of the k-mers
+    :param window: Number of consecutive k-mers in each window
+    :return: Sorted numpy array of the unique minimizer hashes
+    """
+    hashes = canonical_hashes(sequence, kmer_size)
+    if len(hashes) <= window:
+        return numpy.unique(hashes)
+    return numpy.unique(sliding_window_view(hashes, window).min(axis=1))
+
+
+def sample_hashes(fasta, kmer_size):
+    """
+    Hash every k-mer in an assembly
+    :param fasta: Name and path of the FASTA file of the assembly
+    :param kmer_size: Length of the k-mers
+    :return: Sorted numpy array of the unique hashes
+    """
+    assembly = IndexedFasta(fasta)
+    try:
+        hashes = [canonical_hashes(assembly.sequence(contig), kmer_size) for contig in assembly]
+    finally:
+        assembly.close()
+    return numpy.unique(numpy.concatenate(hashes)) if hashes else numpy.zeros(0, dtype=numpy.uint64)
+
+
+class TargetSketch(object):
+    """
+    Minimizer sketches of all the targets in a combined targets file. The sketches are stored next to the file, so
+    they are only created once. A sample is compared to the sketches to find the targets that share enough k-mers with
+    it to possibly pass the cutoff, so the remaining targets do not need to be searched
+    """
+
+    def main(self):
+        """
+        Load the sketches from disk if they are current. Otherwise, create, and save them
+        """
+        if os.path.isfile(self.sketchfile) and os.path.getmtime(self.sketchfile) >= os.path.getmtime(self.fasta):
+            self.load()
+        else:
+            logging.info('Creating minimizer sketches of {fasta}'.format(fasta=self.fasta))
+            self.build()
+            self.save()
+
+    def build(self):
+        """
+        Create the minimizer sketch of every target
+        """
+        targets = IndexedFasta(self.fasta)
+        sketches = list()
+        try:
+            for name in targets:
+                self.names.append(name)
+                sketches.append(minimizers(targets.sequence(name), self.kmer_size, self.window))
+        finally:
+            targets.close()
+        self.hashes = numpy.concatenate(sketches) if sketches else numpy.zeros(0, dtype=numpy.uint64)
+        self.offsets = numpy.concatenate(([0], numpy.cumsum([len(sketch) for sketch in sketches]))).astype(numpy.int64)
+
+    def save(self):
+        """
+        Write the sketches to disk
+        """
+        numpy.savez(self.sketchfile,
+                    names=numpy.array(self.names, dtype=str),
+                    hashes=self.hashes,
+                    offsets=self.offsets)
+        # numpy.savez appends .npz to file names that do not already have the extension
+        if not os.path.isfile(self.sketchfile):
+            os.rename(self.sketchfile + '.npz', self.sketchfile)
+
+    def load(self):
+        """
+        Read the sketches from disk
+        """
+        with numpy.load(self.sketchfile) as sketch:
+            self.names = sketch['names'].tolist()
+            self.hashes = sketch['hashes']
+            self.offsets = sketch['offsets']
+
+    def threshold(self, cutoff):
+        """
+        Determine the minimum containment of a target. A k-mer of a target that matches a sample with an identity of
+        p is only conserved if all its bases match, which has a probability of p^k. Half of this value is used, as
+        the differences are not spread evenly along real genes
+        :param cutoff: Percent identity threshold of the analyses
+        :return: Minimum fraction of the minimizers of a target that must be present in the sample
+        """
+        return (cutoff / 100) ** self.kmer_size / 2
+
+    def containment(self, hashes):
+        """
+        Calculate the fraction of the minimizers of each target present in a sample
+        :param hashes: Sorted numpy array of the k-mer hashes of the sample
+        :return: numpy arrays of the number of shared minimizers, and the containment of every target
+        """
+        present = numpy.concatenate(([0], numpy.cumsum(numpy.isin(self.hashes, hashes, assume_unique=True))))
+        shared = present[self.offsets[1:]] - present[self.offsets[:-1]]
+        sizes = numpy.diff(self.offsets)
+        return shared, shared / numpy.maximum(sizes, 1)
+
+    def select(self, fasta, cutoff):
+        """
+        Find the targets that may be present in a sample
+        :param fasta: Name and path of the assembly of the sample
+        :param cutoff: Percent identity threshold of the analyses
+        :return: List of the names of the targets that share at least one minimizer with the sample, and pass the
+        containment threshold, in the order of the combined targets file
+        """
+        shared, containment = self.containment(sample_hashes(fasta, self.kmer_size))
+        keep = numpy.flatnonzero((shared > 0) & (containment >= self.threshold(cutoff)))
+        return [self.names[i] for i in keep.tolist()]
+
+    def __init__(self, fasta, kmer_size=16, window=8):
+        """
+        :param fasta: Name and path of the FASTA file of targets e.g. combinedtargets.fasta
+        :param kmer_size: Length of the k-mers. Must be between 8 and 31
+        :param window: Number of consecutive k-mers from which each minimizer is chosen
+        """
+        assert 8 <= kmer_size <= 31, 'The k-mer size must be between 8 and 31, not {k}'.format(k=kmer_size)
+        self.fasta = fasta
+        self.kmer_size = kmer_size
+        self.window = window
+        self.sketchfile = '{base}.sketch.k{k}w{w}.npz'.format(base=os.path.splitext(fasta)[0],
+                                                              k=kmer_size,
+                                                              w=window)
+        self.names = list()
+        self.hashes = numpy.zeros(0, dtype=numpy.uint64)
+        self.offsets = numpy.zeros(1, dtype=numpy.int64)
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+from urllib.parse import quote
+import sqlite3
+import json
+import time
+import os
+
+__author__ = 'adamkoziol'
+
+schema = [
+    'CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, started REAL, program TEXT, analysistype TEXT)',
+    'CREATE TABLE IF NOT EXISTS parameters (run INTEGER, name TEXT, value TEXT, PRIMARY KEY (run, name))',
+    # Each sample has one entry per analysis type and program: the results of the most recent run
+    'CREATE TABLE IF NOT EXISTS samples (id INTEGER PRIMARY KEY, name TEXT, analysistype TEXT, program TEXT, '
+    'assembly TEXT, run INTEGER, UNIQUE (name, analysistype, program))',
+    'CREATE TABLE IF NOT EXISTS hits (sample INTEGER, target TEXT, percent_match REAL, percent_identity REAL, '
+    'alignment_fraction REAL, contig TEXT, query_start INTEGER, query_end INTEGER, subject_start INTEGER, '
+    'subject_end INTEGER, subject_length INTEGER, evalue REAL, bit_score REAL)',
+    'CREATE TABLE IF NOT EXISTS alleles (sample INTEGER, locus TEXT, allele TEXT, percent_match REAL)',
+    'CREATE INDEX IF NOT EXISTS hits_target ON hits (target, percent_match)',
+    'CREATE INDEX IF NOT EXISTS hits_sample ON hits (sample)',
+    'CREATE INDEX IF NOT EXISTS alleles_locus ON alleles (locus, allele)',
+    'CREATE INDEX IF NOT EXISTS alleles_sample ON alleles (sample)',
+]
+
+
+def glob_escape(value):
+    """
+    Escape the wildcards of an SQLite GLOB pattern
+    :param value: String to match literally
+    :return: Escaped string
+    """
+    return ''.join('[{char}]'.format(char=char) if char in '*?[' else char for char in value)
+
+
+class ResultStore(object):
+    """
+    SQLite database of the results of every run. The samples, their hits, the allele calls of typing analyses, and the
+    parameters of each run are stored in indexed tables, so the results of thousands of samples can be queried without
+    reading the reports. A sample that is analysed again replaces its previous results
+    """
+
+    def add_run(self, program, analysistype, parameters):
+        """
+        Record a run, and its parameters
+        :param program: Name of the program e.g. blastn
+        :param analysistype: Name of the analysis
+        :param parameters: Dictionary of the parameters of the run. Values are stored as JSON
+        :return: ID of the run
+        """
+        with self.connection:
+            run = self.connection.execute('INSERT INTO runs (started, program, analysistype) VALUES (?, ?, ?)',
+                                          (time.time(), program, analysistype)).lastrowid
+            self.connection.executemany('INSERT INTO parameters (run, name, value) VALUES (?, ?, ?)',
+                                        [(run, name, json.dumps(value, sort_keys=True))
+                                         for name, value in sorted(parameters.items())])
+        return run
+
+    def add_samples(self, run, results):
+        """
+        Store the results of the samples of a run. The samples are written in batches, with one transaction per batch
+        :param run: ID of the run
+        :param results: Iterable of dictionaries with the name, analysistype, program, assembly, hits (list of
+        dictionaries with the columns of the hits table), and alleles (list of (locus, allele, percent_match) tuples)
+        of each sample
+        :return: Number of samples stored
+        """
+        count = 0
+        batch = list()
+        for result in results:
+            batch.append(result)
+            if len(batch) == self.batchsize:
+                count += self.write(run=run,
+                                    batch=batch)
+                batch = list()
+        return count + self.write(run=run,
+                                  batch=batch)
+
+    def write(self, run, batch):
+        """
+        Write a batch of samples in a single transaction
+        :param run: ID of the run
+        :param batch: List of dictionaries of the results of the samples
+        :return: Number of samples written
+        """
+        with self.connection:
+            for result in batch:
+                key = (result['name'], result['analysistype'], result['program'])
+                previous = self.connection.execute('SELECT id FROM samples WHERE name = ? AND analysistype = ? AND '
+                                                   'program = ?', key).fetchone()
+                if previous:
+                    for table in ['hits', 'alleles']:
+                        self.connection.execute('DELETE FROM {table} WHERE sample = ?'.format(table=table),
+                                                previous)
+                    self.connection.execute('DELETE FROM samples WHERE id = ?', previous)
+                sample = self.connection.execute('INSERT INTO samples (name, analysistype, program, assembly, run) '
+                                                 'VALUES (?, ?, ?, ?, ?)', key + (result['assembly'], run)).lastrowid
+                self.connection.executemany('INSERT INTO hits (sample, {columns}) VALUES (?, {values})'
+                                            .format(columns=', '.join(self.hit_columns),
+                                                    values=', '.join('?' * len(self.hit_columns))),
+                                            [(sample,) + tuple(hit[column] for column in self.hit_columns)
+                                             for hit in result['hits']])
+                self.connection.executemany('INSERT INTO alleles (sample, locus, allele, percent_match) '
+                                            'VALUES (?, ?, ?, ?)',
+                                            [(sample,) + tuple(allele) for allele in result['alleles']])
+        return len(batch)
+
+    @staticmethod
+    def filters(conditions):
+        """
+        Create the WHERE clause of a query
+        :param conditions: List of (SQL condition, value) tuples. Conditions with a value of None are ignored
+        :return: WHERE clause, and list of the values of its parameters
+        """
+        used = [(condition, value) for condition, value in conditions if value is not None]
+        if not used:
+            return str(), list()
+        return ' WHERE ' + ' AND '.join(condition for condition, _ in used), [value for _, value in used]
+
+    def hits(self, gene=None, identity=None, sample=None, analysistype=None, program=None):
+        """
+        Find the hits that match all the supplied conditions
+        :param gene: Name of a gene. Matches the targets that are named for the gene e.g. blaOXA-48 matches
+        blaOXA_48_1_AY236073. Dashes are replaced with underscores, as they are in the combined targets
+        :param identity: Minimum percent match of the hits
+        :param sample: Name of a sample
+        :param analysistype: Name of an analysis
+        :param program: Name of a program
+        :return: List of (sample, analysistype, program, target, percent_match, contig, query_start, query_end)
+        tuples sorted by sample and target
+        """
+        where, values = self.filters([
+            ('hits.percent_match >= ?', identity),
+            ('samples.name = ?', sample),
+            ('samples.analysistype = ?', analysistype),
+            ('samples.program = ?', program)
+        ])
+        if gene is not None:
+            gene = gene.replace('-', '_')
+            # The prefix of a GLOB pattern can be found with the index of the targets
+            where += (' AND ' if where else ' WHERE ') + '(hits.target = ? OR hits.target GLOB ?)'
+            values += [gene, glob_escape(gene) + '_*']
+        return self.connection.execute(
+            'SELECT samples.name, samples.analysistype, samples.program, hits.target, hits.percent_match, '
+            'hits.contig, hits.query_start, hits.query_end FROM hits JOIN samples ON hits.sample = samples.id'
+            '{where} ORDER BY samples.name, hits.target, hits.percent_match DESC'.format(where=where),
+            values).fetchall()
+
+    def alleles(self, locus=None, allele=None, sample=None, analysistype=None, program=None):
+        """
+        Find the allele calls that match all the supplied conditions
+        :param locus: Name of a locus e.g. adk
+        :param allele: Name of an allele e.g. adk_1
+        :param sample: Name of a sample
+        :param analysistype: Name of an analysis
+        :param program: Name of a program
+        :return: List of (sample, analysistype, program, locus, allele, percent_match) tuples sorted by sample and
+        locus
+        """
+        where, values = self.filters([
+            ('alleles.locus = ?', locus),
+            ('alleles.allele = ?', allele),
+            ('samples.name = ?', sample),
+            ('samples.analysistype = ?', analysistype),
+            ('samples.program = ?', program)
+        ])
+        return self.connection.execute(
+            'SELECT samples.name, samples.analysistype, samples.program, alleles.locus, alleles.allele, '
+            'alleles.percent_match FROM alleles JOIN samples ON alleles.sample = samples.id{where} '
+            'ORDER BY samples.name, alleles.locus, alleles.allele'.format(where=where),
+            values).fetchall()
+
+    def parameters(self, run):
+        """
+        :param run: ID of a run
+        :return: Dictionary of the parameters of the run
+        """
+        return {name: json.loads(value) for name, value in
+                self.connection.execute('SELECT name, value FROM parameters WHERE run = ?', (run,))}
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __init__(self, path, batchsize=500, readonly=False):
+        """
+        :param path: Name and path of the SQLite database. Created if it does not exist
+        :param batchsize: Number of samples to write in each transaction
+        :param readonly: Open an existing database for queries only. The database is not created or changed, and no
+        write locks are taken, so stores on read-only shares can be queried
+        """
+        self.path = os.path.abspath(path)
+        self.batchsize = batchsize
+        self.hit_columns = ['target', 'percent_match', 'percent_identity', 'alignment_fraction', 'contig',
+                            'query_start', 'query_end', 'subject_start', 'subject_end', 'subject_length', 'evalue',
+                            'bit_score']
+        if readonly:
+            self.connection = sqlite3.connect('file:{path}?mode=ro'.format(path=quote(self.path)),
+                                              uri=True,
+                                              timeout=60)
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # Wait for the transactions of other runs that share the store. The default rollback journal is used rather
+        # than write-ahead logging, which does not work on network filesystems
+        self.connection = sqlite3.connect(self.path,
+                                          timeout=60)
+        with self.connection:
+            for statement in schema:
+                self.connection.execute(statement)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+from geneseekr.kmer import format_evalue
+from geneseekr.karlin import rescale
+import logging
+import os
+
+__author__ = 'adamkoziol'
+
+
+class TabularParser(object):
+    """
+    Single-pass parser of BLAST tabular (outfmt 6) output. Rows are read as BLAST writes them, the percent match is
+    calculated, hits below the cutoff or above the e-value threshold are discarded, and the remaining rows are written
+    to the header-annotated reports used by the genemethods parsers. Only one row is held in memory at a time
+    """
+
+    def header(self):
+        """
+        :return: Header line of the annotated reports
+        """
+        return '{headers}\n'.format(headers='\t'.join(self.fieldnames))
+
+    def is_parseable(self, report):
+        """
+        Determine whether a report already has the header and the percent match column
+        :param report: Name and path of the report
+        :return: Boolean of whether the report has been annotated
+        """
+        try:
+            with open(report, 'r') as blast_report:
+                return blast_report.readline() == self.header()
+        except FileNotFoundError:
+            return False
+
+    def percent_match(self, positives, gaps, subject_length):
+        """
+        Calculate the percent match of a hit: the number of identical positions less the gaps, over the entire subject
+        length. Uses the same calculation (and rounding) as the genemethods parsers
+        :param positives: Number of positive-scoring matches
+        :param gaps: Number of gaps
+        :param subject_length: Length of the subject sequence
+        :return: Percent match of the hit
+        """
+        subject_length = float(subject_length)
+        # If the sequences are translated (e.g. tblastx), the subject length is in nucleotides, and the other values
+        # are in residues
+        if self.program not in ['blastn', 'blastp', 'blastx']:
+            subject_length /= 3
+        return float('{:0.2f}'.format((float(positives) - float(gaps)) / subject_length * 100))
+
+    def row(self, line):
+        """
+        Parse a single row of BLAST output
+        :param line: Tab-delimited line of BLAST output (without the percent match column)
+        :return: List of the values of the row in the order of the fieldnames, or None if the hit fails the filters
+        """
+        values = line.rstrip('\n').split('\t')
+        if len(values) != len(self.columns):
+            return None
+        row = dict(zip(self.columns, values))
+        if float(row['evalue']) > self.evalue:
+            return None
+        row['percent_match'] = self.percent_match(positives=row['positives'],
+                                                  gaps=row['gaps'],
+                                                  subject_length=row['subject_length'])
+        if row['percent_match'] < self.cutoff:
+            return None
+        return [row[field] for field in self.fieldnames]
+
+    def rescale(self, line, space):
+        """
+        Recalculate the e-value of an annotated hit in a different search space e.g. that of the complete database for
+        a hit from a search of part of the database
+        :param line: Tab-delimited line of the annotated reports
+        :param space: Effective search space of the query contig of the hit
+        :return: Line with the new e-value, or None if the hit is above the e-value threshold
+        """
+        values = line.split('\t')
+        row = dict(zip(self.fieldnames, values))
+        evalue = rescale(bit_score=row['bit_score'],
+                         space=space,
+                         program=self.program,
+                         query_sequence=row.get('query_sequence'),
+                         subject_sequence=row.get('subject_sequence'))
+        if evalue > self.evalue:
+            return None
+        values[self.fieldnames.index('evalue')] = format_evalue(evalue)
+        return '\t'.join(values)
+
+    @staticmethod
+    def line(values):
+        """
+        :param values: List of the values of a row
+        :return: Tab-delimited line of the annotated reports
+        """
+        # Trailing tab matches the reports created by genemethods
+        return '\t'.join(str(value) for value in values) + '\t\n'
+
+    def stream(self, lines, outputs, tags=None):
+        """
+        Parse BLAST output, and write the hits to the annotated reports
+        :param lines: Iterable of lines of BLAST output e.g. the stdout of a running BLAST process
+        :param outputs: List of open files to which the hits are written. The headers must already be written
+        :param tags: Optional dictionary of query id: (output index, original query id) used to split the output of
+        batched searches into the reports of the individual samples. Without tags, all hits are written to the first
+        output
+        :return: Number of hits written
+        """
+        count = 0
+        for line in lines:
+            values = self.row(line)
+            if values is None:
+                continue
+            index = 0
+            if tags:
+                index, values[0] = tags[values[0]]
+            outputs[index].write(self.line(values))
+            count += 1
+        return count
+
+    def annotate(self, report):
+        """
+        Add the header and the percent match column to an existing raw BLAST report e.g. one created by a previous
+        version of the pipeline
+        :param report: Name and path of the report
+        """
+        if not os.path.isfile(report) or self.is_parseable(report):
+            return
+        logging.debug('Annotating {report}'.format(report=report))
+        tmp_report = report + '.tmp'
+        with open(report, 'r') as blast_report, open(tmp_report, 'w') as annotated:
+            annotated.write(self.header())
+            self.stream(lines=blast_report,
+                        outputs=[annotated])
+        os.rename(tmp_report, report)
+
+    def __init__(self, fieldnames, program, cutoff, evalue):
+        """
+        :param fieldnames: List of column names of the annotated reports
+        :param program: BLAST program used in the analyses
+        :param cutoff: Percent match threshold
+        :param evalue: Maximum e-value of a hit
+        """
+        self.fieldnames = fieldnames
+        # The BLAST output has every column except the calculated percent match
+        self.columns = [field for field in self.fieldnames if field != 'percent_match']
+        self.program = program
+        self.cutoff = float(cutoff)
+        self.evalue = float(evalue)
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+from contextlib import contextmanager
+from functools import wraps
+from threading import Lock
+import resource
+import logging
+import json
+import time
+import sys
+import os
+
+__author__ = 'adamkoziol'
+
+# Resources recorded for every stage
+metrics = ['wall', 'cpu', 'child_cpu', 'peak_rss', 'child_peak_rss', 'read_bytes', 'write_bytes']
+
+
+def io_counters():
+    """
+    Find the number of bytes read and written by this process. /proc/self/io is used where available, as it includes
+    reads served from the page cache. Elsewhere, the block I/O from resource.getrusage is used
+    :return: Bytes read, bytes written
+    """
+    try:
+        with open('/proc/self/io') as io:
+            counters = dict(line.split(': ') for line in io.read().splitlines())
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_inblock * 512, usage.ru_oublock * 512
+
+
+def peak(maxrss):
+    """
+    :param maxrss: ru_maxrss from resource.getrusage. Linux reports kilobytes, and macOS reports bytes
+    :return: Peak resident set size in bytes
+    """
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def snapshot():
+    """
+    Record the resources used so far by this process, and by its finished subprocesses (e.g. BLAST)
+    :return: Dictionary of metric: value
+    """
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    read_bytes, write_bytes = io_counters()
+    return {
+        'wall': time.perf_counter(),
+        'cpu': own.ru_utime + own.ru_stime,
+        'child_cpu': children.ru_utime + children.ru_stime,
+        'peak_rss': peak(own.ru_maxrss),
+        'child_peak_rss': peak(children.ru_maxrss),
+        'read_bytes': read_bytes,
+        'write_bytes': write_bytes
+    }
+
+
+class Profiler(object):
+    """
+    Records the wall time, CPU time, peak memory, and I/O of each stage of an analysis, and of each sample within the
+    stages that process samples one at a time. Stages are nested, so the records form a tree that is written as a JSON
+    timing report, and as a folded-stack trace for flame graph tools (e.g. flamegraph.pl, or speedscope). The CPU time
+    and I/O are those of the whole process, so stages that run searches concurrently cannot be split by sample, and
+    are recorded with their wall time. A disabled profiler records nothing
+    """
+
+    @contextmanager
+    def stage(self, name, sample=None):
+        """
+        Record the resources used by a stage
+        :param name: Name of the stage e.g. run_blast
+        :param sample: Optional name of the sample processed by the stage
+        """
+        if not self.enabled:
+            yield
+            return
+        self.stack.append(name)
+        path = list(self.stack)
+        start = snapshot()
+        try:
+            yield
+        finally:
+            end = snapshot()
+            self.stack.pop()
+            values = {metric: end[metric] - start[metric] for metric in metrics}
+            # Peak memory is a high-water mark, so record the peak reached by the end of the stage
+            values['peak_rss'] = end['peak_rss']
+            values['child_peak_rss'] = end['child_peak_rss']
+            self.record(path=path,
+                        sample=sample,
+                        **values)
+
+    def add(self, name, wall, sample=None):
+        """
+        Record a sub-stage of the current stage that was timed elsewhere e.g. a search run by the executor
+        :param name: Name of the sub-stage
+        :param wall: Wall time in seconds
+        :param sample: Optional name of the sample processed by the sub-stage
+        """
+        if self.enabled:
+            self.record(path=self.stack + [name],
+                        sample=sample,
+                        wall=wall)
+
+    def record(self, path, sample=None, **values):
+        """
+        :param path: List of the names of the stage, and the stages that contain it
+        :param sample: Optional name of the sample processed by the stage
+        :param values: Metric: value of the resources used by the stage
+        """
+        entry = {'stage': ';'.join(path),
+                 'sample': sample}
+        entry.update(values)
+        with self.lock:
+            self.records.append(entry)
+
+    def timed(self, name, function, samples=False):
+        """
+        Wrap a function so that every call is recorded as a stage
+        :param name: Name of the stage
+        :param function: Function to wrap
+        :param samples: Call the function with one sample at a time, and record each sample. Only suitable for
+        functions that process the samples in the metadata keyword argument independently, and update them in place
+        :return: Wrapped function
+        """
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not self.enabled or not samples or 'metadata' not in kwargs:
+                with self.stage(name):
+                    return function(*args, **kwargs)
+            metadata = kwargs.pop('metadata')
+            with self.stage(name):
+                for sample in metadata:
+                    with self.stage(sample.name,
+                                    sample=sample.name):
+                        function(*args, metadata=[sample], **kwargs)
+            return metadata
+        return wrapper
+
+    def instrument(self, obj, stages, samples=()):
+        """
+        Record every call to methods of an object
+        :param obj: Object with the methods e.g. a GeneSeekr object
+        :param stages: Iterable of the names of the methods
+        :param samples: Iterable of the names of the methods that are recorded sample by sample
+        """
+        if not self.enabled:
+            return
+        for name in stages:
+            setattr(obj, name, self.timed(name=name,
+                                          function=getattr(obj, name),
+                                          samples=name in samples))
+
+    def report(self):
+        """
+        Summarise the records
+        :return: Dictionary of the totals of each stage, and of each sample in each stage
+        """
+        stages = dict()
+        samples = dict()
+        for entry in self.records:
+            if entry['sample'] is None:
+                summary = stages.setdefault(entry['stage'], {'calls': 0})
+            else:
+                # The resources of a sample are listed under the stage that processed it
+                summary = samples.setdefault(entry['sample'], dict())\
+                    .setdefault(entry['stage'].rsplit(';', 1)[0], {'calls': 0})
+            summary['calls'] += 1
+            for metric in metrics:
+                if metric not in entry:
+                    continue
+                if metric.endswith('peak_rss'):
+                    summary[metric] = max(summary.get(metric, 0), entry[metric])
+                else:
+                    summary[metric] = summary.get(metric, 0) + entry[metric]
+        return {
+            'command': ' '.join(sys.argv),
+            'wall': time.perf_counter() - self.start,
+            'peak_rss': snapshot()['peak_rss'],
+            'stages': stages,
+            'samples': samples
+        }
+
+    def folded(self):
+        """
+        Create a folded-stack trace of the wall time of the stages. The width of each frame is its own time in
+        microseconds i.e. the time not spent in the stages it contains
+        :return: List of 'stage;sub-stage time' lines
+        """
+        totals = dict()
+        for entry in self.records:
+            totals[entry['stage']] = totals.get(entry['stage'], 0) + entry['wall']
+        own = dict(totals)
+        for stage, wall in totals.items():
+            if ';' in stage:
+                parent = stage.rsplit(';', 1)[0]
+                if parent in own:
+                    own[parent] -= wall
+        # Concurrent sub-stages can add up to more than the wall time of their parent
+        return ['{stage} {time}'.format(stage=stage.replace(' ', '_'),
+                                        time=int(max(wall, 0) * 1e6))
+                for stage, wall in sorted(own.items())]
+
+    def write(self, reportpath):
+        """
+        Write the JSON timing report (profile.json), and the flame graph trace (profile.folded) to the report path
+        :param reportpath: Folder in which the files are to be written
+        """
+        if not self.enabled:
+            return
+        os.makedirs(reportpath, exist_ok=True)
+        report = os.path.join(reportpath, 'profile.json')
+        with open(report, 'w') as profile:
+            json.dump(self.report(), profile, indent=4, sort_keys=True)
+        with open(os.path.join(reportpath, 'profile.folded'), 'w') as trace:
+            trace.write(''.join(line + '\n' for line in self.folded()))
+        logging.info('Timing report written to {report}'.format(report=report))
+
+    def __init__(self, enabled=True):
+        """
+        :param enabled: Boolean of whether to record the stages
+        """
+        self.enabled = enabled
+        self.start = time.perf_counter()
+        self.stack = list()
+        self.records = list()
+        self.lock = Lock()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+from Bio.Align import substitution_matrices, PairwiseAligner
+from Bio.Data.CodonTable import TranslationError
+from Bio.Seq import translate as translate_codon
+import numpy
+
+__author__ = 'adamkoziol'
+
+# IUPAC nucleotide codes. Each base of a codon is encoded with four bits, so a codon is an index into a table of 4096
+# amino acids. All other characters are encoded as 15, and the codons that contain them are translated as X
+NUCLEOTIDES = 'ACGTRYSWKMBDHVN'
+ENCODE = numpy.full(256, 15, dtype=numpy.uint16)
+for _code, _base in enumerate(NUCLEOTIDES):
+    ENCODE[ord(_base)] = _code
+    ENCODE[ord(_base.lower())] = _code
+ENCODE[ord('U')] = ENCODE[ord('u')] = ENCODE[ord('T')]
+# Lookup table of the amino acid (as an ASCII code) of every codon. Populated the first time that it is required
+CODONS = numpy.zeros(0, dtype=numpy.uint8)
+# Scoring scheme used by tblastx, which the protein alignments replace
+GAP_OPEN = -11
+GAP_EXTEND = -1
+# Aligner of each process. Created the first time that an alignment is requested
+ALIGNER = None
+
+
+def codon_table():
+    """
+    Create the lookup table of the standard genetic code. The amino acid of each codon, including codons with
+    ambiguous bases, is the one assigned by Biopython, so the outputs match those of Seq.translate
+    :return: numpy array of the ASCII codes of the amino acids
+    """
+    global CODONS
+    if not len(CODONS):
+        table = numpy.full(4096, ord('X'), dtype=numpy.uint8)
+        for first, second, third in ((a, b, c) for a in range(15) for b in range(15) for c in range(15)):
+            codon = NUCLEOTIDES[first] + NUCLEOTIDES[second] + NUCLEOTIDES[third]
+            try:
+                table[(first << 8) | (second << 4) | third] = ord(translate_codon(codon))
+            except TranslationError:
+                pass
+        CODONS = table
+    return CODONS
+
+
+def translate(sequences):
+    """
+    Translate a batch of nucleotide sequences in the first frame. All the sequences are encoded in a single array, so
+    every codon is translated with one lookup, rather than one codon at a time. Incomplete trailing codons are ignored
+    :param sequences: List of nucleotide strings
+    :return: List of amino acid strings, in the same order as the sequences
+    """
+    lengths = [len(sequence) // 3 for sequence in sequences]
+    if not sum(lengths):
+        return [str() for _ in sequences]
+    joined = ''.join(sequence[:length * 3] for sequence, length in zip(sequences, lengths))
+    codes = ENCODE[numpy.frombuffer(joined.encode(), dtype=numpy.uint8)].reshape(-1, 3)
+    proteins = codon_table()[(codes[:, 0] << 8) | (codes[:, 1] << 4) | codes[:, 2]].tobytes().decode()
+    offsets = numpy.concatenate(([0], numpy.cumsum(lengths))).tolist()
+    return [proteins[offsets[i]:offsets[i + 1]] for i in range(len(sequences))]
+
+
+def protein_alignment(query, subject):
+    """
+    Local alignment of two amino acid sequences with BLOSUM62, and the gap costs of tblastx
+    :param query: Amino acid string of the query
+    :param subject: Amino acid string of the subject
+    :return: Aligned query and subject strings, with '-' for gaps. Empty strings if the sequences do not align
+    """
+    global ALIGNER
+    if ALIGNER is None:
+        ALIGNER = PairwiseAligner()
+        ALIGNER.mode = 'local'
+        ALIGNER.substitution_matrix = substitution_matrices.load('BLOSUM62')
+        ALIGNER.open_gap_score = GAP_OPEN
+        ALIGNER.extend_gap_score = GAP_EXTEND
+    if not query or not subject:
+        return str(), str()
+    alignment = next(iter(ALIGNER.align(query, subject)), None)
+    if alignment is None or alignment.score <= 0:
+        return str(), str()
+    aligned_query = str()
+    aligned_subject = str()
+    previous = None
+    # Rebuild the gapped strings from the aligned blocks. Any sequence between two blocks is a gap in the other sequence
+    for (query_start, query_end), (subject_start, subject_end) in zip(*alignment.aligned):
+        if previous is not None:
+            aligned_query += query[previous[0]:query_start] + '-' * (subject_start - previous[1])
+            aligned_subject += '-' * (query_start - previous[0]) + subject[previous[1]:subject_start]
+        aligned_query += query[query_start:query_end]
+        aligned_subject += subject[subject_start:subject_end]
+        previous = (query_end, subject_end)
+    return aligned_query, aligned_subject
+
+
+def align_proteins(pairs, executor=None, chunksize=1):
+    """
+    Align a batch of amino acid sequences
+    :param pairs: List of (query, subject) amino acid strings
+    :param executor: Optional concurrent.futures executor in which to run the alignments
+    :param chunksize: Number of alignments sent to a worker at a time
+    :return: List of (aligned query, aligned subject) strings, in the same order as the pairs
+    """
+    queries = [query for query, _ in pairs]
+    subjects = [subject for _, subject in pairs]
+    if executor is None or len(pairs) < 2:
+        return list(map(protein_alignment, queries, subjects))
+    return list(executor.map(protein_alignment, queries, subjects, chunksize=chunksize))
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+from contextlib import contextmanager
+from threading import Event, Thread
+import socket
+import logging
+import fcntl
+import json
+import time
+import uuid
+import os
+
+__author__ = 'adamkoziol'
+
+
+class WorkQueue(object):
+    """
+    Queue of work items in a folder on shared storage. Each item is a JSON file that moves between the pending,
+    claimed, done, and failed folders with atomic renames, so only one worker can claim an item. Workers update the
+    modification time of the items they have claimed (a heartbeat), and items that have not been updated within the
+    timeout belong to dead workers, and are returned to the pending folder. Claims and re-queues are made while
+    holding a lock on the queue, so an item cannot be re-queued while it is being claimed
+    """
+    states = ['pending', 'claimed', 'done', 'failed']
+    # Fields added to the items by the queue, and the workers
+    fields = ['attempts', 'worker', 'seconds']
+
+    def path(self, state, name):
+        """
+        :param state: Folder of the item e.g. pending
+        :param name: File name of the item
+        :return: Name and path of the item
+        """
+        return os.path.join(self.queuepath, state, name)
+
+    @contextmanager
+    def lock(self):
+        """
+        Hold an exclusive lock on the queue. POSIX locks (lockf) are used, as these work on NFS
+        """
+        with open(os.path.join(self.queuepath, '.lock'), 'a') as lockfile:
+            fcntl.lockf(lockfile, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.lockf(lockfile, fcntl.LOCK_UN)
+
+    def now(self):
+        """
+        Find the current time of the shared file system. The clocks of the nodes may differ, but the modification
+        times of the heartbeats are set by the file system
+        :return: Current time in seconds since the epoch
+        """
+        clock = os.path.join(self.queuepath, '.clock')
+        with open(clock, 'a'):
+            pass
+        os.utime(clock)
+        return os.path.getmtime(clock)
+
+    def read(self, state, name):
+        """
+        :param state: Folder of the item
+        :param name: File name of the item
+        :return: Dictionary of the item
+        """
+        with open(self.path(state, name)) as item:
+            return json.load(item)
+
+    def write(self, state, name, item):
+        """
+        Write an item atomically, so other processes never read a partial file
+        :param state: Folder of the item
+        :param name: File name of the item
+        :param item: Dictionary of the item
+        """
+        tmp = os.path.join(self.queuepath, '.tmp_{id}'.format(id=uuid.uuid4().hex))
+        with open(tmp, 'w') as item_file:
+            json.dump(item, item_file)
+        os.rename(tmp, self.path(state, name))
+
+    def put(self, item, prefix='item'):
+        """
+        Add an item to the queue
+        :param item: JSON-serialisable dictionary of the work to do
+        :param prefix: Prefix of the file name of the item e.g. the name of the run
+        :return: File name of the item
+        """
+        name = '{prefix}_{id}.json'.format(prefix=prefix,
+                                           id=uuid.uuid4().hex)
+        item['attempts'] = 0
+        self.write(state='pending',
+                   name=name,
+                   item=item)
+        return name
+
+    def claim(self, worker):
+        """
+        Claim the oldest pending item. Items of dead workers are re-queued first. Items that have already been claimed
+        the maximum number of times (e.g. items that crash the workers) are failed instead
+        :param worker: Name of the worker
+        :return: File name and dictionary of the item, or None if the queue is empty
+        """
+        with self.lock():
+            self.requeue()
+            pending = sorted(os.listdir(os.path.join(self.queuepath, 'pending')),
+                             key=lambda name: os.path.getmtime(self.path('pending', name)))
+            for name in pending:
+                try:
+                    os.rename(self.path('pending', name), self.path('claimed', name))
+                except FileNotFoundError:
+                    continue
+                item = self.read('claimed', name)
+                item['attempts'] += 1
+                item['worker'] = worker
+                if item['attempts'] > self.attempts:
+                    logging.warning('Failing {name} after {attempts} attempts'.format(name=name,
+                                                                                     attempts=self.attempts))
+                    self.write(state='failed',
+                               name=name,
+                               item=item)
+                    os.remove(self.path('claimed', name))
+                    continue
+                # Rewriting the item also starts its heartbeat
+                self.write(state='claimed',
+                           name=name,
+                           item=item)
+                return name, item
+        return None
+
+    def heartbeat(self, name):
+        """
+        Record that the worker of a claimed item is alive
+        :param name: File name of the item
+        :return: Boolean of whether the item is still claimed
+        """
+        try:
+            os.utime(self.path('claimed', name))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def requeue(self):
+        """
+        Return the claimed items without a recent heartbeat to the pending folder. Must be called with the lock held
+        :return: Number of items re-queued
+        """
+        count = 0
+        now = self.now()
+        for name in os.listdir(os.path.join(self.queuepath, 'claimed')):
+            try:
+                if now - os.path.getmtime(self.path('claimed', name)) < self.timeout:
+                    continue
+                logging.warning('Re-queuing {name}. Its worker has not responded in {timeout} seconds'
+                                .format(name=name,
+                                        timeout=self.timeout))
+                os.rename(self.path('claimed', name), self.path('pending', name))
+                count += 1
+            except FileNotFoundError:
+                continue
+        return count
+
+    def complete(self, name, item, success=True):
+        """
+        Move a claimed item to the done (or failed) folder
+        :param name: File name of the item
+        :param item: Dictionary of the item, which can include the outputs of the work
+        :param success: Boolean of whether the work succeeded
+        """
+        with self.lock():
+            if not os.path.isfile(self.path('claimed', name)):
+                # The item was re-queued, and may be claimed by another worker. The outputs are written atomically,
+                # so they are the same whichever worker finishes last
+                logging.warning('{name} was re-queued before it was completed'.format(name=name))
+                return
+            self.write(state='done' if success else 'failed',
+                       name=name,
+                       item=item)
+            os.remove(self.path('claimed', name))
+
+    def finished(self, names):
+        """
+        Find the items that have been completed
+        :param names: Iterable of the file names of the items
+        :return: Dictionary of file name: (Boolean of success, dictionary of the item) of the completed items
+        """
+        finished = dict()
+        for name in names:
+            for state in ['done', 'failed']:
+                try:
+                    finished[name] = (state == 'done', self.read(state, name))
+                    break
+                except FileNotFoundError:
+                    continue
+        return finished
+
+    def wait(self, names, interval=5, max_wait=None):
+        """
+        Wait until items have been completed by the workers
+        :param names: List of the file names of the items
+        :param interval: Number of seconds between checks of the queue
+        :param max_wait: Optional number of seconds after which to stop waiting e.g. if there are no workers
+        :return: Dictionary of file name: (Boolean of success, dictionary of the item)
+        """
+        finished = dict()
+        reported = 0
+        start = time.time()
+        while True:
+            finished.update(self.finished([name for name in names if name not in finished]))
+            if len(finished) == len(names):
+                return finished
+            if max_wait is not None and time.time() - start >= max_wait:
+                raise TimeoutError('{count} of {total} work items were not completed within {seconds} seconds. Ensure '
+                                   'that GeneSeekr workers are running on {queue}'
+                                   .format(count=len(names) - len(finished),
+                                           total=len(names),
+                                           seconds=max_wait,
+                                           queue=self.queuepath))
+            if time.time() - reported >= 60:
+                logging.info('{count} of {total} work items complete. Waiting for GeneSeekr workers on {queue}'
+                             .format(count=len(finished),
+                                     total=len(names),
+                                     queue=self.queuepath))
+                reported = time.time()
+            time.sleep(interval)
+
+    def remove(self, names):
+        """
+        Remove items from the queue. Items that are still pending are withdrawn, so no worker will run them
+        :param names: Iterable of the file names of the items
+        """
+        for name in names:
+            for state in ['pending', 'done', 'failed']:
+                try:
+                    os.remove(self.path(state, name))
+                except FileNotFoundError:
+                    pass
+
+    def __init__(self, queuepath, timeout=300, attempts=3):
+        """
+        :param queuepath: Folder of the queue on storage shared by the coordinator and the workers
+        :param timeout: Number of seconds without a heartbeat after which the worker of an item is considered dead
+        :param attempts: Maximum number of times an item is claimed before it is failed
+        """
+        self.queuepath = os.path.abspath(queuepath)
+        self.timeout = timeout
+        self.attempts = attempts
+        for state in self.states:
+            os.makedirs(os.path.join(self.queuepath, state), exist_ok=True)
+
+
+class Worker(object):
+    """
+    Claims the items of a WorkQueue one at a time, and runs them. A thread keeps the heartbeat of the claimed item
+    while it runs
+    """
+
+    def run(self):
+        """
+        Process items until the worker has been idle for too long
+        :return: Number of items processed
+        """
+        count = 0
+        idle = time.time()
+        logging.info('Worker {name} waiting for work on {queue}'.format(name=self.name,
+                                                                        queue=self.queue.queuepath))
+        while True:
+            claimed = self.queue.claim(worker=self.name)
+            if claimed is None:
+                if self.idle and time.time() - idle >= self.idle:
+                    return count
+                time.sleep(self.interval)
+                continue
+            self.process(*claimed)
+            count += 1
+            idle = time.time()
+
+    def process(self, name, item):
+        """
+        Run a claimed item, and record the outcome in the queue
+        :param name: File name of the item
+        :param item: Dictionary of the item
+        """
+        logging.info('Running {name}'.format(name=name))
+        stop = Event()
+        heartbeat = Thread(target=self.beat,
+                           args=(name, stop),
+                           daemon=True)
+        heartbeat.start()
+        start = time.time()
+        try:
+            success = self.function(item) is not False
+        except Exception:
+            logging.exception('{name} failed'.format(name=name))
+            success = False
+        finally:
+            stop.set()
+            heartbeat.join()
+        item['seconds'] = time.time() - start
+        self.queue.complete(name=name,
+                            item=item,
+                            success=success)
+
+    def beat(self, name, stop):
+        """
+        Update the heartbeat of an item until the work is done
+        :param name: File name of the item
+        :param stop: Event set once the work is done
+        """
+        while not stop.wait(self.queue.timeout / 5):
+            if not self.queue.heartbeat(name):
+                return
+
+    def __init__(self, queue, function, idle=0, interval=5):
+        """
+        :param queue: WorkQueue object
+        :param function: Function that runs an item. Returns False (or raises an exception) if the work failed
+        :param idle: Number of seconds without work after which the worker exits. 0 runs until interrupted
+        :param interval: Number of seconds between checks of an empty queue
+        """
+        self.queue = queue
+        self.function = function
+        self.idle = idle
+        self.interval = interval
+        self.name = '{host}:{pid}'.format(host=socket.gethostname(),
+                                          pid=os.getpid())
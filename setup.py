@@ -4,7 +4,8 @@ import os
 setup(
     name="geneseekr",
     version="0.4.1",
-    packages=find_packages(),
+    # The benchmarks are run from a checkout of the repository, and are not installed
+    packages=find_packages(exclude=['benchmarks']),
     scripts=[
         os.path.join('geneseekr', 'GeneSeekr')
     ],
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+from olctools.accessoryFunctions.accessoryFunctions import MetadataObject
+from geneseekr.alleles import AlleleIndex, locus
+from geneseekr.kmer import bit_score, format_bit_score, format_evalue, reverse_complement
+from geneseekr.karlin import expect_value, search_space
+from geneseekr.blast import BLAST
+from time import time
+from glob import glob
+import random
+import shutil
+import os
+
+test_path = os.path.abspath(os.path.dirname(__file__))
+
+__author__ = 'adamkoziol'
+
+datapath = os.path.join(test_path, 'testdata', 'alleles')
+targetpath = os.path.join(datapath, 'MLST')
+sequencepath = os.path.join(datapath, 'sequences')
+reportpath = os.path.join(datapath, 'reports')
+scheme = os.path.join(targetpath, 'combinedtargets.fasta')
+assembly = os.path.join(sequencepath, '2018-SEQ-0552.fasta')
+
+random.seed(14)
+
+
+def sequence(length):
+    return ''.join(random.choice('ACGT') for _ in range(length))
+
+
+adk_1 = sequence(450)
+# adk_2 has a single substitution
+adk_2 = adk_1[:200] + ('A' if adk_1[200] != 'A' else 'C') + adk_1[201:]
+gyrB_1 = sequence(300)
+# gyrB_2 is contained in gyrB_1, so both match in full
+gyrB_2 = gyrB_1[:-3]
+recA_1 = sequence(500)
+alleles = [('adk_1', adk_1), ('adk_2', adk_2), ('gyrB_1', gyrB_1), ('gyrB_2', gyrB_2), ('recA_1', recA_1)]
+contig = sequence(1000) + adk_2 + sequence(500) + reverse_complement(recA_1) + sequence(300) + gyrB_1 + sequence(100)
+# A second copy of adk that does not match any allele exactly
+adk_copy = adk_1[:100] + ('A' if adk_1[100] != 'A' else 'C') + adk_1[101:300] + \
+    ('A' if adk_1[300] != 'A' else 'C') + adk_1[301:]
+duplicated = contig + sequence(400) + adk_copy + sequence(200)
+
+
+def variables():
+    v = MetadataObject()
+    v.sequencepath = sequencepath
+    v.targetpath = targetpath
+    v.reportpath = reportpath
+    v.cutoff = 70
+    v.evalue = '1E-05'
+    v.align = False
+    v.unique = True
+    v.resfinder = False
+    v.virulencefinder = False
+    v.numthreads = 1
+    v.start = time()
+    v.analysistype = 'mlst'
+    v.program = 'blastn'
+    v.exact = True
+    return v
+
+
+def write_assembly(sequence):
+    with open(assembly, 'w') as fasta:
+        fasta.write('>Contig_1 length={length}\n'.format(length=len(sequence)))
+        for i in range(0, len(sequence), 60):
+            fasta.write(sequence[i:i + 60] + '\n')
+
+
+def test_scheme():
+    os.makedirs(targetpath)
+    os.makedirs(sequencepath)
+    with open(scheme, 'w') as targets:
+        for name, allele in alleles:
+            targets.write('>{name}\n{allele}\n'.format(name=name,
+                                                       allele=allele))
+    write_assembly(contig)
+
+
+def test_locus():
+    assert locus('adk_1') == 'adk'
+    assert locus('AEJV01_03887_1') == 'AEJV01_03887'
+    assert locus('BACT000001-12') == 'BACT000001'
+
+
+def test_format_scores():
+    assert format_evalue(1e-200) == '0.0'
+    assert format_evalue(2.5e-50) == '2e-50'
+    assert format_evalue(0.05) == '0.050'
+    assert format_bit_score(812.8) == '812'
+    assert format_bit_score(45.26) == '45.3'
+
+
+def test_index():
+    global index
+    index = AlleleIndex(fasta=scheme)
+    index.main()
+    assert os.path.isfile(os.path.join(targetpath, 'combinedtargets.alleles.k31.npz'))
+    assert index.names == [name for name, _ in alleles]
+    assert index.indexed.all()
+
+
+def test_index_load():
+    loaded = AlleleIndex(fasta=scheme)
+    loaded.main()
+    assert loaded.names == index.names
+    assert (loaded.digests == index.digests).all()
+    assert loaded.database_length == sum(len(allele) for _, allele in alleles)
+    loaded.close()
+
+
+def test_search():
+    assert sorted(index.search(contig)) == [(1, 1000), (2, 2750), (3, 2750)]
+
+
+def test_calls():
+    global calls
+    calls = index.calls(fasta=assembly)
+    # gyrB has two exact matches, so it is left to BLAST
+    assert sorted(calls) == ['adk', 'recA']
+    assert calls['adk'] == (1, 'Contig_1', len(contig), 1, 1000)
+    assert calls['recA'] == (4, 'Contig_1', len(contig), -1, len(contig) - 1950 - len(recA_1))
+
+
+def test_hit_forward():
+    values = index.hit(calls['adk']).rstrip('\n').split('\t')
+    assert values[:5] == ['Contig_1', 'adk_2', '450', '0', '0']
+    assert values[7:13] == ['450', '450', '1001', '1450', '1', '450']
+    assert values[13] == values[14] == adk_2
+    # The e-value is calculated in the effective search space of BLAST
+    space = search_space(query_length=len(contig),
+                         database_length=index.database_length,
+                         sequences=len(alleles))
+    assert values[5] == format_evalue(expect_value(score=900,
+                                                   space=space))
+    assert values[6] == format_bit_score(bit_score(900))
+
+
+def test_hit_reverse():
+    values = index.hit(calls['recA']).rstrip('\n').split('\t')
+    assert values[9:13] == ['1951', '2450', '500', '1']
+    # The aligned sequences are on the forward strand of the contig
+    assert values[13] == contig[1950:2450]
+
+
+def test_index_clean():
+    index.close()
+    os.remove(index.indexfile)
+    # The index of the assembly would be found as a sample by the BLAST pipeline
+    os.remove(assembly + '.fai')
+
+
+def test_exact_option():
+    # Exact allele calls are only made when they are requested
+    v = variables()
+    v.exact = False
+    assert not BLAST(v).exact
+
+
+def test_exact_blastn():
+    global method
+    method = BLAST(variables())
+    assert method.exact
+    sample = method.metadata[0]
+    sample.mlst.report = os.path.join(reportpath, '{name}_blastn_mlst.tsv'.format(name=sample.name))
+    # gyrB is the only locus without an exact match, so only its alleles remain to be searched
+    databases, skipped = method.reduce_databases(databases={method.combinedtargets: method.metadata},
+                                                 tmp_dir=os.path.join(reportpath, 'tmp_batch'),
+                                                 parser=method.tabular_parser())
+    assert sample.mlst.exactloci == 2
+    assert not skipped
+    subset = list(databases)[0]
+    with open(subset) as reduced:
+        assert [line.rstrip() for line in reduced if line.startswith('>')] == ['>gyrB_1', '>gyrB_2']
+    assert method.dbsizes[subset] == (sum(len(allele) for _, allele in alleles), len(alleles))
+    assert len(method.exacthits[sample.mlst.report]) == 2
+
+
+def test_duplicated_calls():
+    write_assembly(duplicated)
+    duplicates = AlleleIndex(fasta=scheme)
+    duplicates.main()
+    # The second copy of adk shares k-mers with the exact match, so adk is left to BLAST
+    assert sorted(duplicates.calls(fasta=assembly)) == ['recA']
+    duplicates.close()
+    os.remove(assembly + '.fai')
+
+
+def report_lines(exact, shards=1):
+    v = variables()
+    v.exact = exact
+    v.shards = shards
+    method = BLAST(v)
+    method.blast_db()
+    method.run_blast()
+    with open(method.metadata[0].mlst.report) as report:
+        lines = report.readlines()
+    shutil.rmtree(reportpath)
+    for fai in glob(os.path.join(sequencepath, '*.fai')):
+        os.remove(fai)
+    return lines
+
+
+def adk_hits(lines):
+    return [line for line in lines if line.split('\t')[1].startswith('adk_')]
+
+
+def test_duplicated_locus():
+    global exact_report
+    # The hits of adk at both copies are the same as those of a search without exact matches
+    blast_only = adk_hits(report_lines(exact=False))
+    assert blast_only
+    exact_report = report_lines(exact=True)
+    assert adk_hits(exact_report) == blast_only
+
+
+def test_exact_shards():
+    # The databases left to search after the exact matches are still sharded
+    assert report_lines(exact=True,
+                        shards=2) == exact_report
+    shutil.rmtree(os.path.join(targetpath, 'combinedtargets_shards_2_size'))
+
+
+def test_remove_data_path():
+    shutil.rmtree(datapath)
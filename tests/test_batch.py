@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+from olctools.accessoryFunctions.accessoryFunctions import GenObject, MetadataObject
+from geneseekr.blast import BLAST
+import multiprocessing
+from glob import glob
+from time import time
+from io import StringIO
+import shutil
+import os
+
+test_path = os.path.abspath(os.path.dirname(__file__))
+
+__author__ = 'adamkoziol'
+
+
+def variables():
+    v = MetadataObject()
+    datapath = os.path.join(test_path, 'testdata')
+    v.sequencepath = os.path.join(datapath, 'sequences')
+    v.targetpath = os.path.join(datapath, 'databases', 'resfinder')
+    v.reportpath = os.path.join(datapath, 'reports')
+    v.cutoff = 70
+    v.evalue = '1E-05'
+    v.align = False
+    v.unique = True
+    v.resfinder = False
+    v.virulencefinder = False
+    v.numthreads = multiprocessing.cpu_count()
+    v.batchsize = 10
+    v.start = time()
+    return v
+
+
+def method_init(analysistype, program):
+    global var
+    var = variables()
+    var.analysistype = analysistype
+    var.program = program
+    method = BLAST(var)
+    return method
+
+
+batch_method = method_init(analysistype='resfinder',
+                           program='blastn')
+
+
+def sample_copy(name):
+    sample = MetadataObject()
+    sample.name = name
+    sample.general = GenObject()
+    sample.general.bestassemblyfile = batch_method.strains[0]
+    setattr(sample, 'resfinder', GenObject())
+    sample.resfinder.report = os.path.join(var.reportpath, '{name}.tsv'.format(name=name))
+    return sample
+
+
+def test_batchsize():
+    assert batch_method.batchsize == 10
+
+
+def test_batch_query():
+    global tags, samples, query
+    samples = [sample_copy('first'), sample_copy('second')]
+    query = os.path.join(var.reportpath, 'batch_0.fasta')
+    tags = batch_method.batch_query(samples=samples,
+                                    query=query)
+    assert len(tags) == 2
+    assert tags['gsq0'] == (0, 'Contig_54_76.3617')
+    assert tags['gsq1'] == (1, 'Contig_54_76.3617')
+
+
+def test_stream_tags():
+    parser = batch_method.tabular_parser()
+    outputs = [StringIO(), StringIO()]
+    lines = ['gsq0\tblaOXA_427_1_KX827604\t795\t0\t0\t0.0\t1469\t795\t795\t1\t795\t1\t795\tACGT\tACGT\n',
+             'gsq1\tampH_2_HQ586946\t1134\t0\t0\t0.0\t2095\t1134\t1134\t1\t1134\t1\t1134\tACGT\tACGT\n']
+    assert parser.stream(lines=lines,
+                         outputs=outputs,
+                         tags=tags) == 2
+    assert outputs[1].getvalue().startswith('Contig_54_76.3617\tampH_2_HQ586946\t')
+
+
+def test_batch_clean():
+    os.remove(query)
+
+
+def test_makeblastdb():
+    batch_method.blast_db()
+    assert os.path.isfile(os.path.join(var.targetpath, 'combinedtargets.nsq'))
+
+
+def test_unbatched_blastn():
+    global unbatched_report
+    batch_method.batchsize = 1
+    batch_method.run_blast()
+    report = batch_method.metadata[0].resfinder.report
+    with open(report) as blast_report:
+        unbatched_report = blast_report.read()
+    os.remove(report)
+    assert unbatched_report
+
+
+def test_batched_blastn():
+    batch_method.batchsize = 10
+    batch_method.run_blast()
+    with open(batch_method.metadata[0].resfinder.report) as blast_report:
+        assert blast_report.read() == unbatched_report
+    assert unbatched_report.startswith('query_id\t')
+    assert not os.path.isdir(os.path.join(var.reportpath, 'tmp_batch'))
+
+
+def test_prefilter_blastn():
+    batch_method.prefilter = True
+    batch_method.run_blast()
+    sample = batch_method.metadata[0]
+    with open(sample.resfinder.report) as blast_report:
+        assert blast_report.read() == unbatched_report
+    assert sample.resfinder.prefiltertargets == 2
+    # Both targets pass the pre-filter, so the complete database is searched
+    assert ' -dbsize ' not in sample.resfinder.blastcommand
+    assert os.path.isfile(os.path.join(var.targetpath, 'combinedtargets.sketch.k16w8.npz'))
+
+
+def test_assembly_index_not_sample():
+    assert os.path.isfile(batch_method.strains[0] + '.fai')
+    method = BLAST(var)
+    assert [sample.name for sample in method.metadata] == ['2018-SEQ-0552']
+
+
+def test_combined_targets_clean():
+    os.remove(batch_method.combinedtargets)
+    os.remove(os.path.join(var.targetpath, 'combinedtargets.sketch.k16w8.npz'))
+
+
+def test_makeblastdb_clean():
+    databasefiles = glob(os.path.join(var.targetpath, 'combinedtargets.n*'))
+    for dbfile in databasefiles:
+        os.remove(dbfile)
+
+
+def test_assembly_index_clean():
+    os.remove(batch_method.strains[0] + '.fai')
+
+
+def test_remove_report_path():
+    shutil.rmtree(batch_method.reportpath)
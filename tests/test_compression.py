@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+from olctools.accessoryFunctions.accessoryFunctions import make_path, MetadataObject
+from geneseekr.compression import BGZFile, compression, gzi, open_compressed, uncompressed_name, zstandard
+from geneseekr.methods import GeneSeekr
+from geneseekr.faidx import IndexedFasta
+from geneseekr.blast import BLAST
+from geneseekr.kma import KMA
+import multiprocessing
+from time import time
+import subprocess
+import struct
+import shutil
+import gzip
+import zlib
+import os
+
+test_path = os.path.abspath(os.path.dirname(__file__))
+
+__author__ = 'adamkoziol'
+
+datapath = os.path.join(test_path, 'testdata')
+assembly = os.path.join(datapath, 'sequences', '2018-SEQ-0552.fasta')
+targets = os.path.join(datapath, 'databases', 'resfinder', 'beta-lactam.tfa')
+compressedpath = os.path.join(datapath, 'compressed')
+sequencepath = os.path.join(compressedpath, 'sequences')
+targetpath = os.path.join(compressedpath, 'resfinder')
+
+
+def bgzip(source, destination, block_size=65280):
+    """
+    Compress a file into BGZF blocks of block_size uncompressed bytes, followed by the empty end-of-file block
+    """
+    with open(source, 'rb') as plain, open(destination, 'wb') as compressed:
+        while True:
+            data = plain.read(block_size)
+            deflate = zlib.compressobj(6, zlib.DEFLATED, -15)
+            cdata = deflate.compress(data) + deflate.flush()
+            compressed.write(b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00')
+            compressed.write(struct.pack('<H', len(cdata) + 25))
+            compressed.write(cdata)
+            compressed.write(struct.pack('<II', zlib.crc32(data), len(data)))
+            if not data:
+                break
+
+
+def zstd(source, destination):
+    if zstandard is not None:
+        with open(source, 'rb') as plain, open(destination, 'wb') as compressed:
+            compressed.write(zstandard.ZstdCompressor().compress(plain.read()))
+    else:
+        subprocess.run(['zstd', '-q', '-f', source, '-o', destination], check=True)
+
+
+def variables():
+    v = MetadataObject()
+    v.sequencepath = sequencepath
+    v.targetpath = targetpath
+    v.reportpath = os.path.join(compressedpath, 'reports')
+    v.cutoff = 70
+    v.evalue = '1E-05'
+    v.align = False
+    v.unique = True
+    v.resfinder = False
+    v.virulencefinder = False
+    v.numthreads = multiprocessing.cpu_count()
+    v.kmer_size = 16
+    v.start = time()
+    v.analysistype = 'resfinder'
+    v.program = 'kma'
+    return v
+
+
+def test_compress():
+    make_path(sequencepath)
+    make_path(targetpath)
+    with open(assembly, 'rb') as plain, gzip.open(os.path.join(sequencepath, '2018-SEQ-0552.fasta.gz'), 'wb') as gz:
+        shutil.copyfileobj(plain, gz)
+    bgzip(source=assembly,
+          destination=os.path.join(compressedpath, '2018-SEQ-0552.fasta.bgz'),
+          block_size=10000)
+    zstd(source=assembly,
+         destination=os.path.join(compressedpath, '2018-SEQ-0552.fasta.zst'))
+    zstd(source=targets,
+         destination=os.path.join(targetpath, 'beta-lactam.tfa.zst'))
+
+
+def test_compression():
+    assert compression(os.path.join(sequencepath, '2018-SEQ-0552.fasta.gz')) == 'gzip'
+    assert compression(os.path.join(compressedpath, '2018-SEQ-0552.fasta.bgz')) == 'bgzip'
+    assert compression(os.path.join(compressedpath, '2018-SEQ-0552.fasta.zst')) == 'zstd'
+    assert compression(assembly) is None
+
+
+def test_uncompressed_name():
+    assert uncompressed_name('2018-SEQ-0552.fasta.gz') == '2018-SEQ-0552.fasta'
+    assert uncompressed_name('2018-SEQ-0552.fasta') == '2018-SEQ-0552.fasta'
+
+
+def test_open_compressed():
+    global contents
+    with open(assembly, 'rb') as plain:
+        contents = plain.read()
+    for fasta in [os.path.join(sequencepath, '2018-SEQ-0552.fasta.gz'),
+                  os.path.join(compressedpath, '2018-SEQ-0552.fasta.bgz'),
+                  os.path.join(compressedpath, '2018-SEQ-0552.fasta.zst')]:
+        with open_compressed(fasta) as handle:
+            assert handle.read() == contents
+    with open_compressed(os.path.join(compressedpath, '2018-SEQ-0552.fasta.zst'), 'rt') as handle:
+        assert handle.readline().startswith('>')
+
+
+def test_gzi():
+    bgz = os.path.join(compressedpath, '2018-SEQ-0552.fasta.bgz')
+    blocks = gzi(bgz)
+    assert blocks[0] == (0, 0)
+    assert [uncompressed for _, uncompressed in blocks] == list(range(0, len(contents), 10000))
+    assert os.path.isfile(bgz + '.gzi')
+    # The index is read from the .gzi file on the next use
+    assert gzi(bgz) == blocks
+
+
+def test_bgzfile():
+    bgzfile = BGZFile(os.path.join(compressedpath, '2018-SEQ-0552.fasta.bgz'))
+    for start, end in [(0, 10), (9990, 10010), (5000, 45000), (len(contents) - 5, len(contents) + 5)]:
+        assert bgzfile[start:end] == contents[start:end]
+    assert bgzfile.rfind(b'>', 0, 30000) == contents.rfind(b'>', 0, 30000)
+    bgzfile.close()
+
+
+def test_indexed_fasta():
+    plain = IndexedFasta(assembly)
+    for fasta in [os.path.join(sequencepath, '2018-SEQ-0552.fasta.gz'),
+                  os.path.join(compressedpath, '2018-SEQ-0552.fasta.bgz'),
+                  os.path.join(compressedpath, '2018-SEQ-0552.fasta.zst')]:
+        records = IndexedFasta(fasta)
+        assert records.index == plain.index
+        for name in list(plain)[:5]:
+            assert records.sequence(name) == plain.sequence(name)
+            assert records.sequence(name, 100, 250) == plain.sequence(name, 100, 250)
+        records.close()
+    plain.close()
+
+
+def test_resistance_classes():
+    classes = GeneSeekr.resistance_classes(targetpath)
+    assert list(classes) == ['beta-lactam']
+    assert 'blaOXA_427_1_KX827604' in classes['beta-lactam']
+
+
+def test_pipe_stdin():
+    lines = list()
+    output = os.path.join(compressedpath, 'stdin.txt')
+    assert BLAST.pipe(arguments=['cat'],
+                      reports=[output],
+                      outputs=[open(output + '.tmp', 'w')],
+                      parse=lines.extend,
+                      stdin=os.path.join(sequencepath, '2018-SEQ-0552.fasta.gz'))
+    assert ''.join(lines) == contents.decode()
+
+
+def test_kma_compressed():
+    global method
+    method = KMA(variables())
+    # The combined targets are created from the compressed .tfa file
+    assert [os.path.basename(target) for target in method.targets] == ['beta-lactam.tfa.zst']
+    assert os.path.isfile(os.path.join(targetpath, 'combinedtargets.fasta'))
+    assert [sample.name for sample in method.metadata] == ['2018-SEQ-0552']
+    method.blast_db()
+    method.run_blast()
+    assert os.path.isfile(os.path.join(compressedpath, 'reports', '2018-SEQ-0552_kma_resfinder.tsv'))
+    method.parseable_blast_outputs()
+    method.parse_results()
+
+
+def test_kma_compressed_results():
+    for sample in method.metadata:
+        assert sample.resfinder.blastresults['blaOXA_427_1_KX827604'] == 86.16
+    method.create_reports()
+    assert os.path.isfile(os.path.join(compressedpath, 'reports', 'resfinder_kma.xlsx'))
+
+
+def test_clean():
+    shutil.rmtree(compressedpath)
+    os.remove(assembly + '.fai')
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+from geneseekr.dbcache import DatabaseCache
+from glob import glob
+import shutil
+import time
+import os
+
+test_path = os.path.abspath(os.path.dirname(__file__))
+
+__author__ = 'adamkoziol'
+
+datapath = os.path.join(test_path, 'testdata')
+targetpath = os.path.join(datapath, 'databases', 'resfinder')
+cachepath = os.path.join(datapath, 'dbcache')
+targets = sorted(glob(os.path.join(targetpath, '*.tfa')))
+combinedtargets = os.path.join(cachepath, 'combinedtargets.fasta')
+
+
+def test_cache_init():
+    global cache
+    cache = DatabaseCache(cachepath=cachepath,
+                          max_size=1)
+    assert os.path.isdir(cachepath)
+
+
+def test_key_deterministic():
+    assert cache.key(targets=targets, program='blastn') == cache.key(targets=list(reversed(targets)),
+                                                                     program='blastn')
+
+
+def test_key_dbtype():
+    assert cache.key(targets=targets, program='blastn') == cache.key(targets=targets, program='tblastx')
+    assert cache.key(targets=targets, program='blastn') != cache.key(targets=targets, program='blastp')
+
+
+def test_cached_database():
+    global database
+    shutil.copyfile(targets[0], combinedtargets)
+    database = cache.database(targets=targets,
+                              combinedtargets=combinedtargets,
+                              program='blastn')
+    assert os.path.isfile(os.path.join(os.path.dirname(database), 'combinedtargets.nsq'))
+
+
+def test_cache_hit():
+    assert cache.database(targets=targets,
+                          combinedtargets=combinedtargets,
+                          program='blastn') == database
+
+
+def test_evict():
+    # Create two stale entries that push the cache over its size limit
+    for key, last_used in [('old', 100), ('older', 50)]:
+        os.makedirs(os.path.join(cachepath, key))
+        with open(os.path.join(cachepath, key, 'combinedtargets.nsq'), 'wb') as entry:
+            entry.write(b'\0' * 1024)
+        with open(os.path.join(cachepath, key, '.last_used'), 'w'):
+            pass
+        os.utime(os.path.join(cachepath, key, '.last_used'), (last_used, last_used))
+    # Only removing the least recently used entry is required to bring the cache under the limit
+    total = sum(size for _, size, _ in cache.entries())
+    small = DatabaseCache(cachepath=cachepath,
+                          max_size=(total - 1024) / 1024 ** 3,
+                          grace=0)
+    small.evict()
+    assert not os.path.isdir(os.path.join(cachepath, 'older'))
+    assert os.path.isdir(os.path.join(cachepath, 'old'))
+
+
+def test_evict_grace():
+    os.utime(os.path.join(cachepath, 'old', '.last_used'), (time.time(), time.time()))
+    small = DatabaseCache(cachepath=cachepath,
+                          max_size=0)
+    small.evict()
+    assert os.path.isdir(os.path.join(cachepath, 'old'))
+
+
+def test_remove_cache():
+    shutil.rmtree(cachepath)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+from geneseekr.executor import ProcessExecutor
+import shutil
+import gzip
+import time
+import os
+
+test_path = os.path.abspath(os.path.dirname(__file__))
+
+__author__ = 'adamkoziol'
+
+workdir = os.path.join(test_path, 'testdata', 'executor')
+
+
+def test_stdout():
+    global lines
+    lines = list()
+    executor = ProcessExecutor(cpus=1)
+    # The output is larger than the buffer of a pipe, so it must be read as the process writes it
+    executor.add(name='seq',
+                 command='seq 1 200000',
+                 start=lambda: lines.extend)
+    times = executor.run()
+    assert list(times) == ['seq']
+    assert executor.results['seq']['success']
+    assert len(lines) == 200000
+    assert lines[-1] == '200000\n'
+
+
+def test_stderr():
+    executor = ProcessExecutor(cpus=1)
+    executor.add(name='stderr',
+                 command='seq 1 200000 1>&2')
+    executor.run()
+    assert executor.results['stderr']['success']
+
+
+def test_arguments():
+    lines = list()
+    executor = ProcessExecutor(cpus=1)
+    # Commands given as lists of arguments are run without a shell, so shell syntax is passed to the program as is
+    executor.add(name='echo',
+                 command=['echo', '$HOME; exit 3'],
+                 start=lambda: lines.extend)
+    executor.run()
+    assert executor.results['echo']['success']
+    assert lines == ['$HOME; exit 3\n']
+
+
+def test_stdin():
+    os.makedirs(workdir, exist_ok=True)
+    compressed = os.path.join(workdir, 'lines.txt.gz')
+    with gzip.open(compressed, 'wt') as handle:
+        handle.write(''.join('{number}\n'.format(number=number) for number in range(100000)))
+    received = list()
+    executor = ProcessExecutor(cpus=1)
+    executor.add(name='cat',
+                 command='cat',
+                 stdin=compressed,
+                 start=lambda: received.extend)
+    executor.run()
+    assert len(received) == 100000
+    assert received[-1] == '99999\n'
+
+
+def test_process_limit():
+    executor = ProcessExecutor(cpus=4,
+                               processes=1)
+    for number in range(3):
+        executor.add(name='sleep_{number}'.format(number=number),
+                     command='sleep 0.2')
+    start = time.time()
+    executor.run()
+    assert time.time() - start >= 0.6
+
+
+def test_thread_budget():
+    executor = ProcessExecutor(cpus=2)
+    for number in range(2):
+        executor.add(name='sleep_{number}'.format(number=number),
+                     command='sleep 0.2',
+                     threads=2)
+    executor.add(name='short',
+                 command='sleep 0.2')
+    start = time.time()
+    executor.run()
+    assert time.time() - start >= 0.6
+
+
+def test_timeout():
+    finished = list()
+    progress = list()
+    executor = ProcessExecutor(cpus=2,
+                               timeout=1,
+                               retries=1,
+                               delay=0,
+                               progress=lambda name, done, total: progress.append((name, done, total)))
+    executor.add(name='stalled',
+                 command='sleep 30',
+                 finish=finished.append)
+    executor.add(name='quick',
+                 command='true')
+    start = time.time()
+    executor.run()
+    # The stalled job is stopped, and retried once, without holding up the other job
+    assert time.time() - start < 10
+    assert executor.results['stalled'] == dict(executor.results['stalled'], success=False, attempts=2)
+    assert finished == [False, False]
+    assert executor.results['quick']['success']
+    assert progress[0] == ('quick', 1, 2)
+    assert progress[1] == ('stalled', 2, 2)
+
+
+def test_transient_failure():
+    marker = os.path.join(workdir, 'killed')
+    executor = ProcessExecutor(cpus=1,
+                               delay=0)
+    # The process is killed the first time that it runs
+    executor.add(name='killed',
+                 command='if [ -f {marker} ]; then exit 0; else touch {marker}; kill -9 $$; fi'.format(marker=marker))
+    # The child of the shell is killed the first time that it runs, so the shell exits with 128 + 9
+    executor.add(name='child',
+                 command='if [ -f {marker}_child ]; then exit 0; else touch {marker}_child; sh -c \'kill -9 $$\'; fi'
+                 .format(marker=marker))
+    executor.add(name='failed',
+                 command='exit 3')
+    executor.add(name='error',
+                 command='exit 255')
+    executor.run()
+    assert executor.results['killed']['success']
+    assert executor.results['killed']['attempts'] == 2
+    assert executor.results['child']['success']
+    assert executor.results['child']['attempts'] == 2
+    # Programs that exit with an error are not retried, even with return codes over 128
+    for name in ['failed', 'error']:
+        assert not executor.results[name]['success']
+        assert executor.results[name]['attempts'] == 1
+
+
+def test_parse_error():
+    def parse(lines):
+        raise ValueError('unexpected output')
+    executor = ProcessExecutor(cpus=1)
+    executor.add(name='error',
+                 command='echo hit',
+                 start=lambda: parse)
+    executor.add(name='other',
+                 command='true')
+    try:
+        executor.run()
+        raise AssertionError('The error was not raised')
+    except ValueError:
+        pass
+    assert executor.results['other']['success']
+
+
+def test_clean():
+    shutil.rmtree(workdir)
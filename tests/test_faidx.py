@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+from olctools.accessoryFunctions.accessoryFunctions import GenObject, MetadataObject
+from geneseekr.faidx import IndexedFasta, read_index
+from geneseekr.methods import GeneSeekr
+from Bio import SeqIO
+import shutil
+import os
+
+test_path = os.path.abspath(os.path.dirname(__file__))
+
+__author__ = 'adamkoziol'
+
+datapath = os.path.join(test_path, 'testdata')
+targetpath = os.path.join(datapath, 'faidx')
+fasta = os.path.join(targetpath, 'combinedtargets.fasta')
+
+
+def test_fasta():
+    os.makedirs(targetpath, exist_ok=True)
+    records = list(SeqIO.parse(os.path.join(datapath, 'databases', 'resfinder', 'beta-lactam.tfa'), 'fasta'))
+    # Wrap the sequences at different widths
+    with open(fasta, 'w') as fasta_file:
+        for count, record in enumerate(records):
+            width = 60 if count % 2 else 17
+            sequence = str(record.seq)
+            fasta_file.write('>{description}\n'.format(description=record.description))
+            for start in range(0, len(sequence), width):
+                fasta_file.write(sequence[start:start + width] + '\n')
+    assert os.path.isfile(fasta)
+
+
+def test_read_index():
+    index = read_index(fasta)
+    assert index[0][0] == 'blaOXA-427_1_KX827604'
+    assert index[0][1:] == (795, 23, 17, 18)
+
+
+def test_index_created():
+    global indexed
+    indexed = IndexedFasta(fasta)
+    assert os.path.isfile(fasta + '.fai')
+
+
+def test_lazy():
+    assert 'ampH_2_HQ586946' in indexed
+    assert indexed.map is None
+
+
+def test_records():
+    records = SeqIO.to_dict(SeqIO.parse(fasta, 'fasta'))
+    assert list(indexed) == list(records)
+    for name, record in records.items():
+        assert str(indexed[name].seq) == str(record.seq)
+        assert indexed[name].description == record.description
+
+
+def test_subsequence():
+    sequence = str(indexed['ampH_2_HQ586946'].seq)
+    assert indexed.sequence('ampH_2_HQ586946', 55, 130) == sequence[55:130]
+    assert indexed.sequence('ampH_2_HQ586946', 790, 900) == sequence[790:]
+
+
+def test_region():
+    region = indexed.region('ampH_2_HQ586946', 20, 40)
+    assert isinstance(region, memoryview)
+    assert bytes(region) == indexed.sequence('ampH_2_HQ586946', 20, 40).encode()
+    region.release()
+
+
+def test_stale_index():
+    with open(fasta + '.fai', 'w') as fai:
+        fai.write('stale\t1\t1\t1\t2\n')
+    os.utime(fasta + '.fai', (0, 0))
+    assert 'stale' not in IndexedFasta(fasta)
+
+
+def test_target_folders():
+    sample = MetadataObject()
+    sample.name = 'faidx'
+    setattr(sample, 'resfinder', GenObject())
+    sample.resfinder.combinedtargets = fasta
+    sample.resfinder.targetpath = targetpath
+    targetfolders, targetfiles, records = GeneSeekr.target_folders(metadata=[sample],
+                                                                   analysistype='resfinder')
+    assert targetfiles == [fasta]
+    assert records[fasta]['blaOXA-427_1_KX827604']
+
+
+def test_remove_targets():
+    indexed.close()
+    shutil.rmtree(targetpath)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+from geneseekr.hits import HitTable
+import numpy as np
+import pytest
+
+__author__ = 'adamkoziol'
+
+
+def row(subject_id, percent_match, alignment_fraction, evalue):
+    return {
+        'query_id': 'Contig_54_76.3617',
+        'subject_id': subject_id,
+        'positives': '795',
+        'mismatches': '0',
+        'gaps': '0',
+        'evalue': evalue,
+        'bit_score': '1469',
+        'subject_length': '795',
+        'alignment_length': '795',
+        'query_start': '11848',
+        'query_end': '11054',
+        'subject_start': '1',
+        'subject_end': '795',
+        'percent_match': percent_match,
+        'query_sequence': 'ACGT',
+        'subject_sequence': 'ACGA',
+        'low': 11054,
+        'high': 11848,
+        'percentidentity': percent_match,
+        'alignment_fraction': alignment_fraction
+    }
+
+
+def test_append():
+    global table
+    table = HitTable()
+    table.append(row('blaOXA_427_1_KX827604', 100.0, 100.0, '0.0'))
+    table.append(row('ampH_2_HQ586946', 86.16, 90.0, '1e-50'))
+    table.append(row('blaOXA_427_1_KX827604', 75.0, 60.0, '0.5'))
+    assert len(table) == 3
+
+
+def test_interned():
+    assert table.strings.count('blaOXA_427_1_KX827604') == 1
+
+
+def test_hit_view():
+    hit = table[1]
+    assert hit['subject_id'] == 'ampH_2_HQ586946'
+    assert hit['percentidentity'] == 86.16
+    assert hit['positives'] == '795'
+    assert hit['evalue'] == '1e-50'
+    assert hit['low'] == 11054
+    assert hit['subject_sequence'] == 'ACGA'
+
+
+def test_hit_view_dict():
+    assert dict(table[0]) == {key: value for key, value in row('blaOXA_427_1_KX827604', 100.0, 100.0, '0.0').items()}
+
+
+def test_hit_missing_key():
+    with pytest.raises(KeyError):
+        table[0]['missing']
+
+
+def test_index_error():
+    with pytest.raises(IndexError):
+        table[3]
+
+
+def test_iterate():
+    assert [hit['subject_id'] for hit in table] == ['blaOXA_427_1_KX827604', 'ampH_2_HQ586946',
+                                                    'blaOXA_427_1_KX827604']
+
+
+def test_column():
+    assert np.array_equal(table.column('evalue'), np.array([0.0, 1e-50, 0.5]))
+    assert list(table.column('subject_id')) == ['blaOXA_427_1_KX827604', 'ampH_2_HQ586946', 'blaOXA_427_1_KX827604']
+
+
+def test_filter_identity():
+    assert [hit['percent_match'] for hit in table.filter(identity=80)] == [100.0, 86.16]
+
+
+def test_filter_combined():
+    filtered = table.filter(identity=70, coverage=80, evalue=1e-10)
+    assert [hit['subject_id'] for hit in filtered] == ['blaOXA_427_1_KX827604', 'ampH_2_HQ586946']
+    assert filtered[1]['query_sequence'] == 'ACGT'
+
+
+def test_extend():
+    other = HitTable()
+    other.append(row('tet_M', 99.0, 100.0, '0.0'))
+    other.extend(table=table,
+                 numbers=[1])
+    assert [hit['subject_id'] for hit in other] == ['tet_M', 'ampH_2_HQ586946']
+    assert other[1]['evalue'] == '1e-50'
+
+
+def test_empty():
+    empty = HitTable()
+    assert not empty
+    assert len(empty.filter(identity=90)) == 0
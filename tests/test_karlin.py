@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+from geneseekr.karlin import expect_value, length_adjustment, PARAMETERS, protein_score, raw_score, relaxed_evalue, \
+    rescale, search_space
+from geneseekr.kmer import bit_score
+import math
+
+__author__ = 'adamkoziol'
+
+
+def fixed_point(ell, query_length, database_length, sequences, program='blastn'):
+    lam, k, _, alpha, beta = PARAMETERS[program]
+    return alpha / lam * (math.log(k) + math.log((query_length - ell) * (database_length - sequences * ell))) + beta
+
+
+def test_length_adjustment():
+    # The adjustment is the largest length that is no longer than the expected length of a reported alignment
+    for program, query_length, database_length, sequences in [('blastn', 5000, 10 ** 6, 2000),
+                                                              ('blastn', 10 ** 6, 3 * 10 ** 6, 3000),
+                                                              ('blastn', 300, 60000, 1000),
+                                                              ('blastp', 400, 10 ** 5, 300)]:
+        ell = length_adjustment(query_length=query_length,
+                                database_length=database_length,
+                                sequences=sequences,
+                                program=program)
+        assert ell > 0
+        assert fixed_point(ell, query_length, database_length, sequences, program) >= ell
+        assert fixed_point(ell + 1, query_length, database_length, sequences, program) < ell + 1
+
+
+def test_length_adjustment_short():
+    # Searches too small to report any alignment are not adjusted
+    assert length_adjustment(query_length=2,
+                             database_length=2,
+                             sequences=1) == 0
+
+
+def test_search_space():
+    ell = length_adjustment(query_length=5000,
+                            database_length=10 ** 6,
+                            sequences=2000)
+    assert search_space(query_length=5000,
+                        database_length=10 ** 6,
+                        sequences=2000) == (5000 - ell) * (10 ** 6 - 2000 * ell)
+    # Fewer sequences lose less of the database to the length adjustment
+    assert search_space(query_length=5000,
+                        database_length=10 ** 6,
+                        sequences=1000) > search_space(query_length=5000,
+                                                       database_length=10 ** 6,
+                                                       sequences=2000)
+
+
+def test_search_space_translated():
+    # Translated sequences are searched in residues
+    assert search_space(query_length=3000,
+                        database_length=10 ** 5,
+                        sequences=300,
+                        program='blastx') == search_space(query_length=1000,
+                                                          database_length=10 ** 5,
+                                                          sequences=300,
+                                                          program='blastp')
+    assert search_space(query_length=1000,
+                        database_length=3 * 10 ** 5,
+                        sequences=300,
+                        program='tblastn') == search_space(query_length=1000,
+                                                           database_length=10 ** 5,
+                                                           sequences=300,
+                                                           program='blastp')
+
+
+def test_raw_score():
+    assert raw_score('ACGTACGT', 'ACGTACGT') == 16
+    assert raw_score('ACGTACGT', 'ACGAACGT') == 11
+    # A gap of length k costs 5 + 2k
+    assert raw_score('ACGT-ACGT', 'ACGTAACGT') == 16 - 7
+    assert raw_score('ACGT--ACGT', 'ACGTAAACGT') == 16 - 9
+    # Gaps in the query and in the subject are opened separately
+    assert raw_score('ACGT-AACGT', 'ACGTA-ACGT') == 16 - 14
+    assert raw_score('ACGTNCGT', 'ACGTACGT') is None
+
+
+def test_protein_score():
+    assert protein_score('WCA', 'WCA') == 11 + 9 + 4
+    assert protein_score('WCA', 'WCR') == 11 + 9 - 1
+    # Stop codons of translated sequences are in the matrix
+    assert protein_score('W*', 'W*') == 11 + 1
+    assert protein_score('WC-A', 'WCRA') is None
+
+
+def test_rescale_alignment():
+    space = search_space(query_length=5000,
+                         database_length=10 ** 6,
+                         sequences=2000)
+    # The raw score of blastn hits is recovered from the alignment, so the e-value is exact
+    assert rescale(bit_score='40.1',
+                   space=space,
+                   query_sequence='ACGT' * 10,
+                   subject_sequence='ACGT' * 10) == expect_value(score=80,
+                                                                 space=space)
+
+
+def test_rescale_tblastx():
+    space = search_space(query_length=3000,
+                         database_length=3 * 10 ** 5,
+                         sequences=300,
+                         program='tblastx')
+    # The hits of tblastx are ungapped, and are not adjusted for composition, so the e-value is exact
+    assert rescale(bit_score='30.0',
+                   space=space,
+                   program='tblastx',
+                   query_sequence='WCAWCA',
+                   subject_sequence='WCAWCA') == expect_value(score=48,
+                                                              space=space,
+                                                              program='tblastx')
+
+
+def test_rescale_bit_score():
+    space = search_space(query_length=1000,
+                         database_length=10 ** 5,
+                         sequences=300,
+                         program='blastp')
+    assert rescale(bit_score='50.0',
+                   space=space,
+                   program='blastp') == space * 2 ** -50
+    # Without the alignment, the e-value is calculated from the bit score, which is rounded by BLAST
+    evalue = rescale(bit_score='{:.1f}'.format(bit_score(80)),
+                     space=space)
+    assert abs(evalue / expect_value(score=80, space=space) - 1) < 0.04
+
+
+def test_relaxed_evalue():
+    database_length = 300 * 60
+    relaxed = relaxed_evalue(evalue='1E-05',
+                             query_length=5 * 10 ** 6,
+                             database_length=database_length,
+                             sequences=300)
+    assert relaxed > 1e-05
+    # The searches of part of the database use the length of the complete database. No hit that passes the threshold
+    # in the complete database fails the relaxed threshold in a part
+    for query_length in [100, 5000, 10 ** 6, 5 * 10 ** 6]:
+        complete = search_space(query_length=query_length,
+                                database_length=database_length,
+                                sequences=300)
+        for sequences in [1, 100, 150, 299]:
+            part = search_space(query_length=query_length,
+                                database_length=database_length,
+                                sequences=sequences)
+            assert part * 1e-05 <= complete * relaxed
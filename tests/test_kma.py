@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+from olctools.accessoryFunctions.accessoryFunctions import MetadataObject
+from geneseekr.kmer import banded_alignment, KmerIndex, reverse_complement
+from geneseekr.kma import KMA
+import multiprocessing
+from glob import glob
+from time import time
+import os
+
+test_path = os.path.abspath(os.path.dirname(__file__))
+
+__author__ = 'adamkoziol'
+
+
+def variables():
+    v = MetadataObject()
+    datapath = os.path.join(test_path, 'testdata')
+    v.sequencepath = os.path.join(datapath, 'sequences')
+    v.targetpath = os.path.join(datapath, 'databases', 'resfinder')
+    v.reportpath = os.path.join(datapath, 'reports')
+    v.cutoff = 70
+    v.evalue = '1E-05'
+    v.align = False
+    v.unique = False
+    v.resfinder = False
+    v.virulencefinder = False
+    v.numthreads = multiprocessing.cpu_count()
+    v.kmer_size = 16
+    v.start = time()
+    return v
+
+
+def method_init(analysistype, program, align, unique):
+    global var
+    var = variables()
+    var.analysistype = analysistype
+    var.program = program
+    var.align = align
+    var.unique = unique
+    method = KMA(var)
+    return method
+
+
+kma_method = method_init(analysistype='resfinder',
+                         program='kma',
+                         align=True,
+                         unique=True)
+
+
+def test_parser():
+    assert os.path.basename(kma_method.targets[0]) == 'beta-lactam.tfa'
+
+
+def test_combined_files():
+    assert os.path.isfile(kma_method.combinedtargets)
+
+
+def test_strain():
+    assert os.path.basename(kma_method.strains[0]) == '2018-SEQ-0552.fasta'
+
+
+def test_reverse_complement():
+    assert reverse_complement('AACGTN') == 'NACGTT'
+
+
+def test_banded_alignment():
+    subject = 'ATGAAGAAGATATTTGTAGCGGCTTTATTTGCTTTTGTTTCTGTTAATGCAATGGCAGCT'
+    query = 'GG' + subject[:30] + subject[33:] + 'TT'
+    score, aligned_query, aligned_subject, start, end = banded_alignment(query=query,
+                                                                         subject=subject,
+                                                                         low=-8,
+                                                                         high=8)
+    assert aligned_query.count('-') == 3
+    assert aligned_query.replace('-', '') == query[start:end]
+    assert aligned_subject == subject
+
+
+def test_kmer_index():
+    kma_method.blast_db()
+    assert os.path.isfile(os.path.join(var.targetpath, 'combinedtargets.k16.npz'))
+
+
+def test_kmer_index_load():
+    index = KmerIndex(fasta=kma_method.combinedtargets)
+    index.main()
+    assert len(index.keys) == len(kma_method.indices[kma_method.combinedtargets].keys)
+
+
+def test_kma():
+    global kma_report
+    kma_method.run_blast()
+    kma_report = os.path.join(var.reportpath, '2018-SEQ-0552_kma_resfinder.tsv')
+    assert os.path.isfile(kma_report)
+
+
+def test_enhance_report_parsing():
+    kma_method.parseable_blast_outputs()
+    header = open(kma_report).readline()
+    assert header.split('\t')[0] == 'query_id'
+
+
+def test_kma_reuse():
+    modified = os.path.getmtime(kma_report)
+    kma_method.run_blast()
+    assert os.path.getmtime(kma_report) == modified
+    assert os.path.isfile(os.path.join(var.reportpath, 'geneseekr_manifest.json'))
+
+
+def test_kma_results():
+    with open(kma_report) as kma_results:
+        next(kma_results)
+        data = kma_results.readline()
+        results = data.split('\t')
+        assert int(results[2]) >= 179
+        # The e-values, and bit scores are formatted in the same way as the BLAST reports
+        assert results[5] == '0.0'
+        assert results[6] == str(int(results[6]))
+
+
+def test_kma_parse():
+    kma_method.parse_results()
+    for sample in kma_method.metadata:
+        assert sample.resfinder.queryranges['Contig_54_76.3617'] == [[11054, 11848]]
+
+
+def test_parse_results():
+    for sample in kma_method.metadata:
+        assert sample.resfinder.blastresults['blaOXA_427_1_KX827604'] == 86.16
+
+
+def test_report_creation():
+    kma_method.create_reports()
+
+
+def test_report_existance():
+    global geneseekr_report
+    geneseekr_report = os.path.join(kma_method.reportpath, 'resfinder_kma.xlsx')
+    assert os.path.isfile(geneseekr_report)
+
+
+def test_report_row():
+    for sample in kma_method.metadata:
+        assert sorted(sample.resfinder.sampledata)[0][0] == 'blaOXA'
+
+
+def test_report_alignment():
+    for sample in kma_method.metadata:
+        # The k-mer alignments are reported as nucleotide alignments, with both the amino acid and the nucleotide
+        # alignment columns
+        row = sorted(sample.resfinder.sampledata)[0]
+        assert len(row) == 13
+        assert row[3] == 86.16
+        assert row[-2].startswith('0000 OLC ')
+
+
+def test_fasta_create():
+    global fasta_file
+    kma_method.export_fasta()
+    fasta_file = os.path.join(var.reportpath, '2018-SEQ-0552_resfinder.fasta')
+    assert os.path.isfile(fasta_file)
+    header = open(fasta_file, 'r').readline().rstrip()
+    assert header == '>2018-SEQ-0552_blaOXA_427_1_KX827604'
+
+
+def test_combined_targets_clean():
+    os.remove(kma_method.combinedtargets)
+
+
+def test_kmer_index_clean():
+    for indexfile in glob(os.path.join(var.targetpath, 'combinedtargets.k*.npz')):
+        os.remove(indexfile)
+
+
+def test_assembly_index_clean():
+    for sample in kma_method.metadata:
+        os.remove(sample.general.bestassemblyfile + '.fai')
+
+
+def test_remove_kma_report():
+    os.remove(kma_report)
+
+
+def test_remove_geneseekr_report():
+    os.remove(geneseekr_report)
+
+
+def test_remove_fasta_file():
+    os.remove(fasta_file)
+
+
+def test_remove_manifest():
+    os.remove(os.path.join(var.reportpath, 'geneseekr_manifest.json'))
+
+
+def test_remove_report_path():
+    os.rmdir(kma_method.reportpath)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+from geneseekr.manifest import Manifest
+import shutil
+import os
+
+test_path = os.path.abspath(os.path.dirname(__file__))
+
+__author__ = 'adamkoziol'
+
+reportpath = os.path.join(test_path, 'testdata', 'manifest')
+report = os.path.join(reportpath, 'sample_blastn_resfinder.tsv')
+sequence = os.path.join(reportpath, 'sample.fasta')
+
+
+def entry(manifest):
+    return {
+        'sample': manifest.fingerprint(sequence),
+        'program': 'blastn',
+        'cutoff': 70
+    }
+
+
+def test_init():
+    global manifest
+    os.makedirs(reportpath, exist_ok=True)
+    with open(sequence, 'w') as fasta:
+        fasta.write('>contig\nACGT\n')
+    manifest = Manifest(reportpath=reportpath)
+    assert manifest.data['reports'] == dict()
+
+
+def test_fingerprint():
+    assert manifest.fingerprint(sequence) == 'a1b40f62ba24f495e06ce75260025e330a0ca0d216f3a717a1fc76d3c7390502'
+
+
+def test_missing_report():
+    assert not manifest.current(report=report,
+                                entry=entry(manifest))
+
+
+def test_update():
+    with open(report, 'w') as blast_report:
+        blast_report.write('query_id\n')
+    manifest.update(report=report,
+                    entry=entry(manifest))
+    manifest.save()
+    assert manifest.current(report=report,
+                            entry=entry(manifest))
+
+
+def test_load():
+    loaded = Manifest(reportpath=reportpath)
+    assert loaded.current(report=report,
+                          entry=entry(loaded))
+
+
+def test_settings_changed():
+    changed = entry(manifest)
+    changed['cutoff'] = 90
+    assert not manifest.current(report=report,
+                                entry=changed)
+
+
+def test_sample_changed():
+    with open(sequence, 'w') as fasta:
+        fasta.write('>contig\nACGTT\n')
+    loaded = Manifest(reportpath=reportpath)
+    assert not loaded.current(report=report,
+                              entry=entry(loaded))
+
+
+def test_remove_reportpath():
+    shutil.rmtree(reportpath)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+from geneseekr.karlin import expect_value, relaxed_evalue, search_space
+from geneseekr.multi import analysistypes, MultiBLAST, target_folder
+from geneseekr.kmer import format_evalue
+from Bio import SeqIO
+from time import time
+from io import StringIO
+import random
+import pytest
+import shutil
+import os
+
+test_path = os.path.abspath(os.path.dirname(__file__))
+
+__author__ = 'adamkoziol'
+
+datapath = os.path.join(test_path, 'testdata')
+multipath = os.path.join(datapath, 'multi')
+targetpath = os.path.join(multipath, 'targets')
+reportpath = os.path.join(multipath, 'reports')
+
+
+def variables():
+    return {
+        'sequencepath': os.path.join(datapath, 'sequences'),
+        'targetpath': targetpath,
+        'reportpath': reportpath,
+        'cutoff': 70,
+        'numthreads': 1,
+        'align': False,
+        'unique': False,
+        'fasta_output': False,
+        'evalue': '1E-5',
+        'resfinder': True,
+        'virulence': True
+    }
+
+
+def test_targets():
+    # Split the beta-lactam targets into the databases of two analyses
+    records = list(SeqIO.parse(os.path.join(datapath, 'databases', 'resfinder', 'beta-lactam.tfa'), 'fasta'))
+    for folder, record in zip(['resfinder', 'Virulence'], records):
+        os.makedirs(os.path.join(targetpath, folder))
+        SeqIO.write([record], os.path.join(targetpath, folder, '{name}.tfa'.format(name=record.id)), 'fasta')
+
+
+def test_analysistypes():
+    assert analysistypes(variables()) == ['resfinder', 'virulence']
+    assert analysistypes({'sixteens': True, 'gdcs': True, 'mlst': False}) == ['sixteens_full', 'GDCS']
+
+
+def test_target_folder():
+    assert target_folder(targetpath=targetpath,
+                         analysistype='virulence') == os.path.join(targetpath, 'Virulence')
+    with pytest.raises(AssertionError):
+        target_folder(targetpath=targetpath,
+                      analysistype='mlst')
+
+
+def test_multi_init():
+    global method
+    method = MultiBLAST(kwargs=variables(),
+                        program='blastn',
+                        analysistypes=['resfinder', 'virulence'],
+                        start=time())
+    assert [analysis.analysistype for analysis in method.analyses] == ['resfinder', 'virulence']
+    assert method.analyses[0].manifest is method.analyses[1].manifest
+
+
+def test_merge_databases():
+    method.merge_databases()
+    with open(method.database) as merged:
+        assert [line.split()[0] for line in merged if line.startswith('>')] == ['>gst0_blaOXA_427_1_KX827604',
+                                                                                '>gst1_ampH_2_HQ586946']
+    assert method.sizes == [795, 795]
+    assert method.counts == [1, 1]
+
+
+def test_blast_settings():
+    # The e-value threshold is scaled to the size of the merged database, and is not rounded
+    evalue = method.blast_settings(query_length=5 * 10 ** 6)['evalue']
+    assert evalue == str(relaxed_evalue(evalue='1E-5',
+                                        query_length=5 * 10 ** 6,
+                                        database_length=795,
+                                        sequences=1) * 2)
+    assert float(evalue) > 1e-5 * 2
+    # No hit that passes the threshold of an analysis is above the threshold of the merged search
+    for query_length in [100, 5000, 10 ** 6, 5 * 10 ** 6]:
+        assert search_space(query_length=query_length,
+                            database_length=795 * 2,
+                            sequences=2) * 1e-5 <= search_space(query_length=query_length,
+                                                                database_length=795,
+                                                                sequences=1) * float(evalue)
+
+
+def test_route():
+    outputs = [[StringIO()], [StringIO()]]
+    random.seed(18)
+    aligned = ''.join(random.choice('ACGT') for _ in range(60))
+    query = ''.join(random.choice('ACGT') for _ in range(795))
+    # 95 mismatches at the end of the alignment
+    subject = query[:700] + ''.join('A' if base != 'A' else 'C' for base in query[700:])
+    hits = [
+        ['Contig_1', 'gst0_blaOXA_427_1_KX827604', 60, 0, 0, 1e-20, 110, 60, 60, 1, 60, 1, 60, aligned, aligned],
+        ['Contig_1', 'gst1_ampH_2_HQ586946', 700, 95, 0, 1e-100, 1100, 795, 795, 1, 795, 1, 795, query,
+         subject],
+        # Below the cutoff
+        ['Contig_1', 'gst1_ampH_2_HQ586946', 100, 0, 0, 1e-20, 200, 795, 100, 1, 100, 1, 100, 'A', 'A']
+    ]
+    count = method.route(lines=['\t'.join(str(value) for value in hit) + '\n' for hit in hits],
+                         outputs=outputs,
+                         lengths={'Contig_1': 5000})
+    assert count == 2
+    resfinder = outputs[0][0].getvalue().split('\t')
+    virulence = outputs[1][0].getvalue().split('\t')
+    assert resfinder[1] == 'blaOXA_427_1_KX827604'
+    # The e-values are recalculated in the search space of the database of the analysis
+    assert resfinder[5] == format_evalue(expect_value(score=120,
+                                                      space=search_space(query_length=5000,
+                                                                         database_length=795,
+                                                                         sequences=1)))
+    assert virulence[1] == 'ampH_2_HQ586946'
+    assert virulence[13] == '88.05'
+
+
+def test_multi_seekr():
+    samples = [analysis.metadata for analysis in method.analyses]
+    method.seekr()
+    resfinder, virulence = samples[0][0], samples[1][0]
+    # Each sample is searched once
+    assert resfinder.resfinder.blastcommand == virulence.virulence.blastcommand
+    assert os.path.isfile(resfinder.resfinder.report)
+    assert os.path.isfile(virulence.virulence.report)
+    assert not os.path.isdir(method.tmp_dir)
+    # Each report only has the hits of its own analysis
+    with open(virulence.virulence.report) as report:
+        assert {line.split('\t')[1] for line in report.readlines()[1:]} <= {'ampH_2_HQ586946'}
+
+
+def test_clean():
+    shutil.rmtree(multipath)
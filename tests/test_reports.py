@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+from olctools.accessoryFunctions.accessoryFunctions import GenObject, MetadataObject
+from genemethods.geneseekr.geneseekr import GeneSeekr as Upstream
+from geneseekr.reports import parquet_available, ReportWriter
+from geneseekr.methods import GeneSeekr
+import filecmp
+import pytest
+import shutil
+import os
+
+test_path = os.path.abspath(os.path.dirname(__file__))
+
+__author__ = 'adamkoziol'
+
+report_path = os.path.join(test_path, 'testdata', 'reports_streaming')
+upstream_path = os.path.join(report_path, 'upstream')
+targets = ['blaOXA_427_1_KX827604', 'ampH_2_HQ586946', 'tetA_1_AJ517790', 'sul1_5_EU780013']
+
+
+def hit(subject, percent_match, contig, start):
+    return {
+        'query_id': contig,
+        'subject_id': subject,
+        'positives': '180',
+        'mismatches': str(int(100 - percent_match)),
+        'gaps': '0',
+        'evalue': '1e-50',
+        'bit_score': '350',
+        'subject_length': '200',
+        'alignment_length': '190',
+        'query_start': str(start),
+        'query_end': str(start + 189),
+        'subject_start': '1',
+        'subject_end': '190',
+        'percent_match': percent_match,
+        'query_sequence': 'ATG' * 10,
+        'subject_sequence': 'ATG' * 10,
+        'low': start,
+        'high': start + 189,
+        'percentidentity': percent_match,
+        'alignment_fraction': 95.0
+    }
+
+
+def sample_init(name, hits):
+    sample = MetadataObject()
+    sample.name = name
+    sample.analysis = GenObject()
+    sample.analysis.targetnames = targets
+    sample.analysis.blastlist = list(hits)
+    sample.analysis.blastresults = {row['subject_id']: row['percent_match'] for row in hits} if hits else 'NA'
+    return sample
+
+
+def metadata_init():
+    # The samples have different numbers of hits to the same targets, and one sample has no hits at all, so the
+    # reports require padding
+    return [
+        sample_init('2018-SEQ-0002', [hit('ampH_2_HQ586946', 99.5, 'contig_1', 100),
+                                      hit('ampH_2_HQ586946', 91.2, 'contig_2', 5000),
+                                      hit('tetA_1_AJ517790', 100.0, 'contig_1', 2000)]),
+        sample_init('2018-SEQ-0001', [hit('tetA_1_AJ517790', 85.0, 'contig_1', 300),
+                                      hit('sul1_5_EU780013', 72.4, 'contig_3', 800)]),
+        sample_init('2018-SEQ-0003', list())
+    ]
+
+
+records = {'combinedtargets.fasta': {target: None for target in targets}}
+
+
+def test_report_writer():
+    os.makedirs(report_path)
+    writer = ReportWriter(path=os.path.join(report_path, 'writer.xlsx'))
+    writer.header(['Strain', 'gene_percent_match'])
+    writer.row(['2018-SEQ-0001', 100.0])
+    writer.row(['2018-SEQ-0002', '>2018-SEQ-0002_gene\nATGATG\n'])
+    writer.close()
+    assert writer.position == 3
+    assert writer.columnwidth == {0: len('2018-SEQ-0001'), 1: len('>2018-SEQ-0002_gene')}
+    assert os.path.isfile(os.path.join(report_path, 'writer.xlsx'))
+
+
+def test_reporter():
+    GeneSeekr().reporter(metadata=metadata_init(),
+                         analysistype='analysis',
+                         reportpath=report_path,
+                         align=False,
+                         records=records,
+                         program='blastn',
+                         cutoff=70)
+    assert os.path.isfile(os.path.join(report_path, 'analysis_blastn.xlsx'))
+
+
+def test_reporter_upstream():
+    os.makedirs(upstream_path)
+    Upstream().reporter(metadata=metadata_init(),
+                        analysistype='analysis',
+                        reportpath=upstream_path,
+                        align=False,
+                        records=records,
+                        program='blastn',
+                        cutoff=70)
+
+
+def test_detailed_report():
+    assert filecmp.cmp(os.path.join(report_path, 'analysis_blastn_detailed.csv'),
+                       os.path.join(upstream_path, 'analysis_blastn_detailed.csv'),
+                       shallow=False)
+
+
+def test_summary_report():
+    assert filecmp.cmp(os.path.join(report_path, 'analysis_blastn.csv'),
+                       os.path.join(upstream_path, 'analysis_blastn.csv'),
+                       shallow=False)
+
+
+def test_summary_header():
+    with open(os.path.join(report_path, 'analysis_blastn.csv')) as summary:
+        header = summary.readline().rstrip()
+    assert header == 'Strain,ampH_2_HQ586946,ampH_2_HQ586946,sul1_5_EU780013,tetA_1_AJ517790'
+
+
+def test_parquet_report():
+    if not parquet_available():
+        pytest.skip('pyarrow is not installed')
+    import pyarrow.parquet as pq
+    GeneSeekr(parquet=True).reporter(metadata=metadata_init(),
+                                     analysistype='analysis',
+                                     reportpath=report_path,
+                                     align=False,
+                                     records=records,
+                                     program='blastn',
+                                     cutoff=70)
+    table = pq.read_table(os.path.join(report_path, 'analysis_blastn.parquet'))
+    assert table.column_names == ['Strain', 'ampH_2_HQ586946_percent_match', 'ampH_2_HQ586946_percent_match_2',
+                                  'sul1_5_EU780013_percent_match', 'tetA_1_AJ517790_percent_match']
+    assert table.column('Strain').to_pylist() == ['2018-SEQ-0002', '2018-SEQ-0001', '2018-SEQ-0003']
+    assert table.column('ampH_2_HQ586946_percent_match').to_pylist()[0] == 99.5
+
+
+def test_remove_report_path():
+    shutil.rmtree(report_path)
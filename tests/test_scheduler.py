@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+from geneseekr.scheduler import threads_per_job
+
+__author__ = 'adamkoziol'
+
+
+def test_threads_small_database():
+    assert threads_per_job(database_size=10 ** 5, query_size=5 * 10 ** 6, cpus=16, jobs=16) == 1
+
+
+def test_threads_single_job():
+    # A single search of a small database is given every core, rather than leaving the other cores idle
+    assert threads_per_job(database_size=10 ** 5, query_size=5 * 10 ** 6, cpus=16, jobs=1) == 16
+
+
+def test_threads_shared_cores():
+    assert threads_per_job(database_size=10 ** 5, query_size=5 * 10 ** 6, cpus=16, jobs=4) == 4
+
+
+def test_threads_large_database():
+    assert threads_per_job(database_size=5 * 10 ** 8, query_size=5 * 10 ** 6, cpus=16, jobs=16) == 4
+
+
+def test_threads_large_query():
+    assert threads_per_job(database_size=5 * 10 ** 7, query_size=10 ** 8, cpus=16, jobs=16) == 4
+
+
+def test_threads_cpus():
+    assert threads_per_job(database_size=10 ** 10, query_size=10 ** 8, cpus=6) == 6
+
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+from geneseekr.screen import records, screen, TargetDatabase, TargetHit
+from geneseekr.kmer import reverse_complement
+from Bio import SeqIO
+import os
+
+test_path = os.path.abspath(os.path.dirname(__file__))
+
+__author__ = 'adamkoziol'
+
+datapath = os.path.join(test_path, 'testdata')
+assembly = os.path.join(datapath, 'sequences', '2018-SEQ-0552.fasta')
+targets = os.path.join(datapath, 'databases', 'resfinder', 'beta-lactam.tfa')
+
+
+def listing():
+    return sorted(os.path.join(path, name) for path, _, names in os.walk(datapath) for name in names)
+
+
+def test_listing():
+    global files
+    # Other test modules may leave files in the test data, so the files are listed as this module starts
+    files = listing()
+
+
+def test_records():
+    assert list(records('ACGT')) == [('query', 'ACGT')]
+    assert list(records({'contig': 'ACGT'})) == [('contig', 'ACGT')]
+    assert [name for name, _ in records(SeqIO.parse(assembly, 'fasta'))] == ['Contig_54_76.3617']
+
+
+def test_database():
+    global database
+    database = TargetDatabase(targets=SeqIO.parse(targets, 'fasta'))
+    assert len(database) == 2
+
+
+def test_screen():
+    global hits
+    # The contigs are aligned as they are read from the file
+    hits = screen(sequences=SeqIO.parse(assembly, 'fasta'),
+                  database=database)
+    assert [(hit.subject_id, hit.percent_match) for hit in hits] == [('blaOXA-427_1_KX827604', 86.16),
+                                                                    ('ampH_2_HQ586946', 85.41)]
+
+
+def test_typed_hit():
+    hit = hits[0]
+    assert isinstance(hit, TargetHit)
+    assert (hit.query_id, hit.query_start, hit.query_end, hit.strand) == ('Contig_54_76.3617', 11054, 11848, 1)
+    assert isinstance(hit.evalue, float)
+    assert isinstance(hit.positives, int)
+    assert hit.as_dict()['subject_length'] == hit.subject_length
+
+
+def test_screen_unique():
+    unique = screen(sequences=SeqIO.parse(assembly, 'fasta'),
+                    database=database,
+                    unique=True)
+    assert unique == hits[:1]
+
+
+def test_screen_cutoff():
+    assert [hit.subject_id for hit in screen(sequences=SeqIO.parse(assembly, 'fasta'),
+                                             database=database,
+                                             cutoff=86)] == ['blaOXA-427_1_KX827604']
+
+
+def test_screen_string():
+    hit = hits[0]
+    sequence = reverse_complement(hit.query_sequence.replace('-', ''))
+    reverse = screen(sequences=sequence,
+                     database=database,
+                     unique=True)[0]
+    assert (reverse.query_id, reverse.subject_id, reverse.strand) == ('query', hit.subject_id, -1)
+    assert reverse.percent_match == hit.percent_match
+
+
+def test_no_files():
+    # Neither the database, nor the screens wrote any files
+    assert listing() == files
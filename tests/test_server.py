@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+from geneseekr.server import GeneSeekrServer, UnixHTTPServer, WarmCache
+from urllib.request import Request, urlopen
+from http.server import BaseHTTPRequestHandler
+from geneseekr.kmer import KmerIndex
+from urllib.error import HTTPError
+from threading import Thread
+from glob import glob
+import shutil
+import runpy
+import json
+import stat
+import sys
+import os
+
+test_path = os.path.abspath(os.path.dirname(__file__))
+
+__author__ = 'adamkoziol'
+
+datapath = os.path.join(test_path, 'testdata')
+sequencepath = os.path.join(datapath, 'sequences')
+targetpath = os.path.join(datapath, 'databases', 'resfinder')
+reportpath = os.path.join(datapath, 'server_reports')
+tokenfile = os.path.join(reportpath, 'geneseekr.token')
+script = os.path.join(os.path.dirname(test_path), 'geneseekr', 'GeneSeekr')
+
+
+def subcommand(name):
+    """
+    Load a subcommand from the GeneSeekr script, so the jobs are parsed with the options of the real subcommand
+    """
+    argv = sys.argv
+    # The script shows the help when it is not given a subcommand. The serve subcommand does not change click
+    sys.argv = [script, 'serve']
+    try:
+        return runpy.run_path(script)['subcommand_dict'][name]
+    finally:
+        sys.argv = argv
+
+
+def request(path, options=None, token=True, content_type='application/json'):
+    data = json.dumps(options).encode() if options is not None else None
+    headers = {'Content-Type': content_type}
+    if token:
+        with open(tokenfile) as token_file:
+            headers['Authorization'] = 'Bearer {token}'.format(token=token_file.read().strip())
+    try:
+        with urlopen(Request(server.address + path, data=data, headers=headers)) as response:
+            return response.status, json.loads(response.read())
+    except HTTPError as error:
+        return error.code, json.loads(error.read())
+
+
+def job(name):
+    return {
+        'sequencepath': sequencepath,
+        'targetpath': targetpath,
+        'reportpath': os.path.join(reportpath, name),
+        'unique': True,
+        'numthreads': 1
+    }
+
+
+def test_warm_cache():
+    cache = WarmCache()
+    fasta = os.path.join(targetpath, 'beta-lactam.tfa')
+    index = cache.get(cls=KmerIndex, fasta=fasta, kmer_size=16)
+    assert cache.get(cls=KmerIndex, fasta=fasta, kmer_size=16) is index
+    assert cache.get(cls=KmerIndex, fasta=fasta, kmer_size=20) is not index
+    assert len(cache) == 2
+    for indexfile in glob(os.path.join(targetpath, 'beta-lactam.k*.npz')):
+        os.remove(indexfile)
+
+
+def test_warm_cache_limit():
+    cache = WarmCache(max_entries=2)
+    fasta = os.path.join(targetpath, 'beta-lactam.tfa')
+    first_index = cache.get(cls=KmerIndex, fasta=fasta, kmer_size=16)
+    cache.get(cls=KmerIndex, fasta=fasta, kmer_size=18)
+    # Using the first index makes the second one the least recently used, so it is dropped
+    assert cache.get(cls=KmerIndex, fasta=fasta, kmer_size=16) is first_index
+    cache.get(cls=KmerIndex, fasta=fasta, kmer_size=20)
+    assert len(cache) == 2
+    assert [key[2] for key in cache.entries] == [(('kmer_size', 16),), (('kmer_size', 20),)]
+    for indexfile in glob(os.path.join(targetpath, 'beta-lactam.k*.npz')):
+        os.remove(indexfile)
+
+
+def test_socket_path():
+    os.makedirs(reportpath, exist_ok=True)
+    socketpath = os.path.join(reportpath, 'geneseekr.sock')
+    # Files that are not sockets are never removed
+    with open(socketpath, 'w') as regular:
+        regular.write('data')
+    message = None
+    try:
+        UnixHTTPServer(socketpath, BaseHTTPRequestHandler)
+    except AssertionError as error:
+        message = str(error)
+    assert 'is not a socket' in message
+    with open(socketpath) as regular:
+        assert regular.read() == 'data'
+    os.remove(socketpath)
+    # The socket of a previous server is replaced
+    UnixHTTPServer(socketpath, BaseHTTPRequestHandler).server_close()
+    assert os.path.exists(socketpath)
+    unix_server = GeneSeekrServer(commands=dict(),
+                                  socketpath=socketpath)
+    # Only the user running the server can connect to the socket, so it does not have a token
+    assert stat.S_IMODE(os.stat(socketpath).st_mode) == 0o600
+    assert unix_server.authorised(None)
+    unix_server.close()
+    assert not os.path.exists(socketpath)
+
+
+def test_server_init():
+    global server
+    server = GeneSeekrServer(commands={'kma': subcommand('kma')},
+                             port=0,
+                             tokenfile=tokenfile,
+                             roots=[datapath])
+    Thread(target=server.server.serve_forever, daemon=True).start()
+    assert server.address.startswith('http://127.0.0.1:')
+    assert stat.S_IMODE(os.stat(tokenfile).st_mode) == 0o600
+
+
+def test_token():
+    code, response = request('/kma', job('token'), token=False)
+    assert code == 401
+    assert not os.path.isdir(os.path.join(reportpath, 'token'))
+
+
+def test_content_type():
+    # Web pages can send forms, and plain text to other sites without asking first, but not JSON
+    code, _ = request('/kma', job('form'), content_type='application/x-www-form-urlencoded')
+    assert code == 415
+    code, _ = request('/kma', job('text'), content_type='text/plain')
+    assert code == 415
+
+
+def test_root():
+    options = job('outside')
+    options['reportpath'] = os.path.join(os.path.dirname(test_path), 'outside')
+    code, response = request('/kma', options)
+    assert code == 400
+    assert 'root' in response['error']
+    assert not os.path.isdir(options['reportpath'])
+
+
+def test_status():
+    assert request('/') == (200, {'programs': ['kma'], 'jobs': 0, 'cached': 0})
+
+
+def test_unknown_subcommand():
+    code, _ = request('/blastn', job('unknown'))
+    assert code == 404
+
+
+def test_unknown_option():
+    code, response = request('/kma', {'cutof': 90})
+    assert code == 400
+    assert 'cutof' in response['error']
+
+
+def test_missing_option():
+    code, response = request('/kma', {'sequencepath': sequencepath})
+    assert code == 400
+    assert '--targetpath' in response['error']
+
+
+def test_job():
+    global first
+    code, first = request('/kma', job('first'))
+    assert code == 200
+    assert os.path.isfile(first['2018-SEQ-0552']['report'])
+    assert first['2018-SEQ-0552']['results'] == {'blaOXA_427_1_KX827604': 86.16}
+
+
+def test_warm_job():
+    index = list(server.cache.entries.values())[0][1]
+    code, second = request('/kma', job('second'))
+    assert code == 200
+    assert second['2018-SEQ-0552']['results'] == first['2018-SEQ-0552']['results']
+    # The k-mer index of the targets was reused
+    assert list(server.cache.entries.values())[0][1] is index
+    assert request('/') == (200, {'programs': ['kma'], 'jobs': 2, 'cached': 1})
+
+
+def test_server_close():
+    server.server.shutdown()
+    server.close()
+    assert not os.path.isfile(tokenfile)
+
+
+def test_clean():
+    shutil.rmtree(reportpath)
+    os.remove(os.path.join(targetpath, 'combinedtargets.fasta'))
+    for indexfile in glob(os.path.join(targetpath, 'combinedtargets.k*.npz')):
+        os.remove(indexfile)
+    for fai in glob(os.path.join(sequencepath, '*.fai')):
+        os.remove(fai)
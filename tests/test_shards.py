@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+from olctools.accessoryFunctions.accessoryFunctions import make_path, MetadataObject
+from geneseekr.tabular import TabularParser
+from geneseekr.shards import TargetShards
+from geneseekr.blast import BLAST
+from Bio import SeqIO
+import multiprocessing
+from glob import glob
+from time import time
+import shutil
+import os
+
+test_path = os.path.abspath(os.path.dirname(__file__))
+
+__author__ = 'adamkoziol'
+
+datapath = os.path.join(test_path, 'testdata')
+shardpath = os.path.join(datapath, 'shards')
+targets = os.path.join(shardpath, 'combinedtargets.fasta')
+shortpath = os.path.join(shardpath, 'short')
+fieldnames = ['query_id', 'subject_id', 'positives', 'mismatches', 'gaps', 'evalue', 'bit_score', 'subject_length',
+              'alignment_length', 'query_start', 'query_end', 'subject_start', 'subject_end', 'percent_match',
+              'query_sequence', 'subject_sequence']
+
+
+def variables(shards):
+    v = MetadataObject()
+    v.sequencepath = os.path.join(datapath, 'sequences')
+    v.targetpath = os.path.join(datapath, 'databases', 'resfinder')
+    v.reportpath = os.path.join(shardpath, 'reports_{shards}'.format(shards=shards))
+    v.cutoff = 70
+    v.evalue = '1E-05'
+    v.align = False
+    v.unique = True
+    v.resfinder = False
+    v.virulencefinder = False
+    v.numthreads = multiprocessing.cpu_count()
+    v.shards = shards
+    v.start = time()
+    v.analysistype = 'resfinder'
+    v.program = 'blastn'
+    return v
+
+
+def hit(query, subject, evalue, bit_score, percent_match=100.0):
+    values = [query, subject, 100, 0, 0, evalue, bit_score, 100, 100, 1, 100, 1, 100, percent_match, 'A', 'A']
+    return TabularParser.line(values)
+
+
+def test_targets():
+    make_path(shardpath)
+    # Three alleles of each of four loci, with one long locus
+    with open(targets, 'w') as fasta:
+        for number, length in enumerate([900, 300, 200, 100]):
+            for allele in range(1, 4):
+                fasta.write('>locus{number}_{allele}\n{sequence}\n'.format(number=number,
+                                                                           allele=allele,
+                                                                           sequence='ACGT' * (length // 4)))
+
+
+def test_shards_by_size():
+    global shards
+    shards = TargetShards(fasta=targets,
+                          count=3)
+    shards.main()
+    assert [os.path.basename(shard) for shard in shards.files] == ['shard_0.fasta', 'shard_1.fasta', 'shard_2.fasta']
+    assert shards.dbsize == 3 * (900 + 300 + 200 + 100)
+    sizes = [os.path.getsize(shard) for shard in shards.files]
+    # Each of the long alleles is placed in a different shard
+    assert max(sizes) - min(sizes) < 300
+    for shard in shards.files:
+        with open(shard) as fasta:
+            names = [line[1:].rstrip() for line in fasta if line.startswith('>')]
+        assert names[0].startswith('locus0_')
+        # The targets of each shard are in the order of the combined targets
+        assert names == sorted(names, key=shards.names.index)
+
+
+def test_shards_by_locus():
+    by_locus = TargetShards(fasta=targets,
+                            count=3,
+                            by='locus')
+    by_locus.main()
+    loci = list()
+    for shard in by_locus.files:
+        with open(shard) as fasta:
+            loci.append({line[1:].rsplit('_', 1)[0] for line in fasta if line.startswith('>')})
+    # The alleles of each locus are in the same shard
+    assert loci == [{'locus0'}, {'locus1'}, {'locus2', 'locus3'}]
+
+
+def test_fewer_targets_than_shards():
+    many = TargetShards(fasta=targets,
+                        count=20,
+                        by='locus')
+    many.main()
+    assert len(many.files) == 4
+
+
+def test_shards_reused():
+    modified = os.path.getmtime(shards.indexfile)
+    reused = TargetShards(fasta=targets,
+                          count=3)
+    reused.main()
+    assert os.path.getmtime(reused.indexfile) == modified
+    assert reused.files == shards.files
+    assert reused.dbsize == shards.dbsize
+
+
+def test_merge():
+    header = '\t'.join(fieldnames) + '\n'
+    shard_reports = [os.path.join(shardpath, 'sample.tsv.shard{index}'.format(index=index)) for index in range(2)]
+    with open(shard_reports[0], 'w') as report:
+        report.write(header)
+        report.writelines([hit('contig_2', 'locus0_1', '1e-100', 400),
+                           hit('contig_1', 'locus1_1', '1e-50', 200),
+                           hit('contig_1', 'locus1_1', '1e-20', 90),
+                           hit('contig_1', 'locus2_1', '1e-10', 50, 60.0)])
+    with open(shard_reports[1], 'w') as report:
+        report.write(header)
+        report.writelines([hit('contig_1', 'locus0_2', '1e-60', 240),
+                           hit('contig_1', 'locus0_3', '1e-50', 200)])
+    merged = os.path.join(shardpath, 'sample.tsv')
+    count = shards.merge(shard_reports=shard_reports,
+                         report=merged,
+                         header=header,
+                         exacthits=[hit('contig_1', 'locus3_1', '0.0', 180)],
+                         contigs={'contig_1': 0, 'contig_2': 1},
+                         limit=3,
+                         cutoff=70)
+    with open(merged) as report:
+        lines = report.readlines()
+    assert lines[0] == header
+    # The subjects of each contig are ranked by their best e-value. Ties are broken by the order of the targets, and
+    # the alignments of each subject stay together
+    assert [tuple(line.split('\t')[:2]) + (line.split('\t')[5],) for line in lines[1:]] == [
+        ('contig_1', 'locus3_1', '0.0'),
+        ('contig_1', 'locus0_2', '1e-60'),
+        ('contig_1', 'locus0_3', '1e-50'),
+        ('contig_1', 'locus1_1', '1e-50'),
+        ('contig_1', 'locus1_1', '1e-20'),
+        ('contig_2', 'locus0_1', '1e-100')]
+    assert count == 5
+    assert not any(os.path.isfile(shard_report) for shard_report in shard_reports)
+
+
+def test_merge_limit():
+    header = '\t'.join(fieldnames) + '\n'
+    shard_report = os.path.join(shardpath, 'limit.tsv.shard0')
+    with open(shard_report, 'w') as report:
+        report.write(header)
+        report.writelines([hit('contig_1', 'locus0_1', '1e-100', 400, 50.0),
+                           hit('contig_1', 'locus0_2', '1e-90', 300)])
+    merged = os.path.join(shardpath, 'limit.tsv')
+    # The limit counts the subjects below the cutoff, as BLAST does
+    assert shards.merge(shard_reports=[shard_report],
+                        report=merged,
+                        header=header,
+                        exacthits=list(),
+                        contigs=dict(),
+                        limit=1,
+                        cutoff=70) == 0
+
+
+def test_unsharded_search():
+    global unsharded
+    method = BLAST(variables(shards=1))
+    method.blast_db()
+    method.run_blast()
+    assert not method.shardsets
+    with open(method.metadata[0].resfinder.report) as report:
+        unsharded = report.read()
+
+
+def test_sharded_search():
+    global method
+    method = BLAST(variables(shards=2))
+    method.blast_db()
+    combinedtargets = method.metadata[0].resfinder.combinedtargets
+    assert len(method.shardsets[combinedtargets].files) == 2
+    assert all(os.path.isfile(os.path.splitext(shard)[0] + '.nhr') for shard in method.shardsets[combinedtargets].files)
+    method.run_blast()
+    sample = method.metadata[0]
+    # The searches of the shards use the size of the complete database
+    assert ' -dbsize {size} '.format(size=method.shardsets[combinedtargets].dbsize) in sample.resfinder.blastcommand
+    with open(sample.resfinder.report) as report:
+        assert report.read() == unsharded
+    assert not glob(sample.resfinder.report + '.shard*')
+
+
+def test_failed_shard():
+    sample = method.metadata[0]
+    os.remove(sample.resfinder.report)
+    shard_report = sample.resfinder.report + '.shard0'
+    with open(shard_report, 'w') as report:
+        report.write('\t'.join(fieldnames) + '\n')
+    # Without the report of the other shard, the sample is not given a report, so it is searched again on the next run
+    method.merge_shards(databases={sample.resfinder.combinedtargets: [sample]},
+                        settings=method.blast_settings())
+    assert not os.path.isfile(sample.resfinder.report)
+    assert not os.path.isfile(shard_report)
+
+
+def test_merge_rescale():
+    header = '\t'.join(fieldnames) + '\n'
+    shard_report = os.path.join(shardpath, 'rescale.tsv.shard0')
+    with open(shard_report, 'w') as report:
+        report.write(header)
+        report.writelines([hit('contig_1', 'locus0_1', '1e-10', 40),
+                           hit('contig_1', 'locus0_2', '1e-04', 20)])
+    merged = os.path.join(shardpath, 'rescale.tsv')
+
+    def rescale(line):
+        values = line.split('\t')
+        # Only the hit with a bit score of 40 passes the threshold in the search space of the complete database
+        if float(values[6]) < 30:
+            return None
+        values[5] = '2e-10'
+        return '\t'.join(values)
+    # Hits above the threshold do not count towards the limit
+    assert shards.merge(shard_reports=[shard_report],
+                        report=merged,
+                        header=header,
+                        exacthits=list(),
+                        contigs=dict(),
+                        limit=1,
+                        cutoff=70,
+                        rescale=rescale) == 1
+    with open(merged) as report:
+        assert [line.split('\t')[5] for line in report.readlines()[1:]] == ['2e-10']
+
+
+def test_short_targets():
+    # Short targets lose much of their length to the length adjustment, so BLAST calculates the e-values of the
+    # searches of their shards in a much larger search space than that of the complete database
+    make_path(shortpath)
+    contigs = [str(record.seq) for record in SeqIO.parse(os.path.join(datapath, 'sequences', '2018-SEQ-0552.fasta'),
+                                                          'fasta') if len(record.seq) > 1000]
+    with open(os.path.join(shortpath, 'short.tfa'), 'w') as fasta:
+        for number in range(200):
+            contig = contigs[number % len(contigs)]
+            start = number * 997 % (len(contig) - 100)
+            sequence = list(contig[start:start + 60])
+            # Mismatches bring the e-values of some of the hits close to the threshold
+            for position in range(5, 60, 60 // (1 + number % 6)):
+                sequence[position] = 'A' if sequence[position] != 'A' else 'C'
+            fasta.write('>short{number}_1_ACC{number}\n{sequence}\n'.format(number=number,
+                                                                           sequence=''.join(sequence)))
+
+
+def test_short_sharded_search():
+    reports = list()
+    for count in [1, 3]:
+        var = variables(shards=count)
+        var.targetpath = shortpath
+        var.analysistype = 'geneseekr'
+        method = BLAST(var)
+        method.blast_db()
+        method.run_blast()
+        with open(method.metadata[0].geneseekr.report) as report:
+            reports.append(report.read())
+    # The e-values are recalculated in the search space of the complete database, so the hits, and their e-values
+    # are the same
+    assert len(reports[0].splitlines()) > 1
+    assert reports[1] == reports[0]
+
+
+def test_protein_shards():
+    proteinpath = os.path.join(datapath, 'databases', 'card_aa')
+    reports = list()
+    for count in [1, 2]:
+        var = variables(shards=count)
+        var.sequencepath = os.path.join(datapath, 'aa_sequences')
+        var.targetpath = proteinpath
+        var.analysistype = 'geneseekr'
+        var.program = 'blastp'
+        method = BLAST(var)
+        method.blast_db()
+        method.run_blast()
+        with open(method.metadata[0].geneseekr.report) as report:
+            reports.append([line.split('\t') for line in report])
+    # The raw scores of blastp hits cannot be recovered, so the e-values of the shards are calculated from the rounded
+    # bit scores. The hits are the same as those of the complete database, and the e-values are close
+    unsharded, sharded = reports
+    assert len(unsharded) > 1
+    assert [values[:5] + values[6:] for values in sharded] == [values[:5] + values[6:] for values in unsharded]
+    for sharded_values, values in zip(sharded[1:], unsharded[1:]):
+        assert 0.5 <= float(sharded_values[5]) / max(float(values[5]), 1e-300) <= 2
+    shutil.rmtree(os.path.join(proteinpath, 'combinedtargets_shards_2_size'))
+    os.remove(os.path.join(proteinpath, 'combinedtargets.fasta'))
+    for dbfile in glob(os.path.join(proteinpath, 'combinedtargets.p*')):
+        os.remove(dbfile)
+
+
+def test_clean():
+    shutil.rmtree(shardpath)
+    targetpath = os.path.join(datapath, 'databases', 'resfinder')
+    shutil.rmtree(os.path.join(targetpath, 'combinedtargets_shards_2_size'))
+    os.remove(os.path.join(targetpath, 'combinedtargets.fasta'))
+    for dbfile in glob(os.path.join(targetpath, 'combinedtargets.n*')):
+        os.remove(dbfile)
+    for fai in glob(os.path.join(datapath, 'sequences', '*.fai')):
+        os.remove(fai)
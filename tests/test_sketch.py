@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+from geneseekr.sketch import canonical_hashes, minimizers, sample_hashes, TargetSketch
+from geneseekr.kmer import reverse_complement
+import os
+
+test_path = os.path.abspath(os.path.dirname(__file__))
+
+__author__ = 'adamkoziol'
+
+targets = os.path.join(test_path, 'testdata', 'databases', 'resfinder', 'beta-lactam.tfa')
+assembly = os.path.join(test_path, 'testdata', 'sequences', '2018-SEQ-0552.fasta')
+sequence = 'ATGAAGAAGATATTTGTAGCGGCTTTATTTGCTTTTGTTTCTGTTAATGCAATGGCAGCTNNGATTGTGCAAAAGGTAAAATTGAGTTC'
+
+
+def test_canonical_hashes():
+    assert sorted(canonical_hashes(sequence, 16).tolist()) == \
+        sorted(canonical_hashes(reverse_complement(sequence), 16).tolist())
+
+
+def test_ambiguous_kmers():
+    # The k-mers that overlap the two Ns are not included
+    assert len(canonical_hashes(sequence, 16)) == len(sequence) - 15 - 17
+
+
+def test_minimizers():
+    sketch = minimizers(sequence, 16, 8)
+    assert 0 < len(sketch) < len(canonical_hashes(sequence, 16))
+    assert set(sketch.tolist()) <= set(canonical_hashes(sequence, 16).tolist())
+
+
+def test_sketch():
+    global sketch
+    sketch = TargetSketch(fasta=targets)
+    sketch.main()
+    assert os.path.isfile(os.path.join(os.path.dirname(targets), 'beta-lactam.sketch.k16w8.npz'))
+    assert sketch.names == ['blaOXA-427_1_KX827604', 'ampH_2_HQ586946']
+
+
+def test_sketch_load():
+    loaded = TargetSketch(fasta=targets)
+    loaded.main()
+    assert loaded.names == sketch.names
+    assert (loaded.hashes == sketch.hashes).all()
+
+
+def test_containment():
+    shared, containment = sketch.containment(sample_hashes(assembly, 16))
+    assert (shared > 0).all()
+    assert (containment < 0.5).all()
+
+
+def test_select():
+    assert sketch.select(fasta=assembly, cutoff=90) == sketch.names
+
+
+def test_select_cutoff():
+    # Hits below 100% identity cannot pass a cutoff of 100, so the targets are removed
+    assert sketch.select(fasta=assembly, cutoff=100) == list()
+
+
+def test_clean():
+    os.remove(sketch.sketchfile)
+    os.remove(targets + '.fai')
+    os.remove(assembly + '.fai')
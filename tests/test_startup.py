@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+from benchmarks.startup import cases, light, measure
+
+__author__ = 'adamkoziol'
+
+
+def test_startup_imports():
+    # The analysis packages (genemethods, Bio, numpy...) are not imported by --help, or --version. The start up time
+    # depends on the machine, so it is only checked by benchmarks/startup.py
+    for name, (run_name, args) in cases:
+        if name not in light:
+            continue
+        _, imported = measure(run_name=run_name,
+                              args=args,
+                              repeats=1)
+        assert not imported, '{name} imported {packages}'.format(name=name,
+                                                                 packages=', '.join(imported))
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+from olctools.accessoryFunctions.accessoryFunctions import MetadataObject
+from geneseekr.store import ResultStore
+from geneseekr.kma import KMA
+import multiprocessing
+from glob import glob
+from time import time
+import subprocess
+import sqlite3
+import shutil
+import sys
+import os
+
+test_path = os.path.abspath(os.path.dirname(__file__))
+
+__author__ = 'adamkoziol'
+
+datapath = os.path.join(test_path, 'testdata')
+reportpath = os.path.join(datapath, 'store_reports')
+store_file = os.path.join(reportpath, 'results.sqlite')
+script = os.path.join(os.path.dirname(test_path), 'geneseekr', 'GeneSeekr')
+
+
+def hit(target, percent_match, contig='contig_1'):
+    return {
+        'target': target,
+        'percent_match': percent_match,
+        'percent_identity': percent_match,
+        'alignment_fraction': 1.0,
+        'contig': contig,
+        'query_start': 1,
+        'query_end': 100,
+        'subject_start': 1,
+        'subject_end': 100,
+        'subject_length': 100,
+        'evalue': 1e-50,
+        'bit_score': 200.0
+    }
+
+
+def result(name, hits, alleles=None, analysistype='resfinder'):
+    return {
+        'name': name,
+        'analysistype': analysistype,
+        'program': 'blastn',
+        'assembly': '/sequences/{name}.fasta'.format(name=name),
+        'hits': hits,
+        'alleles': alleles if alleles else list()
+    }
+
+
+def test_add_samples():
+    global store, run
+    store = ResultStore(path=store_file,
+                        batchsize=2)
+    run = store.add_run(program='blastn',
+                        analysistype='resfinder',
+                        parameters={'cutoff': 70, 'unique': True})
+    count = store.add_samples(run=run,
+                              results=[result('first', [hit('blaOXA_48_1_AY236073', 99.5)]),
+                                       result('second', [hit('blaOXA_48_1_AY236073', 91.0),
+                                                         hit('blaOXA_481_1_KX523901', 100.0)]),
+                                       result('third', [hit('blaTEM_1B_1_AY458016', 100.0)])])
+    assert count == 3
+
+
+def test_parameters():
+    assert store.parameters(run) == {'cutoff': 70, 'unique': True}
+
+
+def test_gene_hits():
+    # blaOXA-48 does not match blaOXA-481
+    assert [(row[0], row[3]) for row in store.hits(gene='blaOXA-48')] == [('first', 'blaOXA_48_1_AY236073'),
+                                                                           ('second', 'blaOXA_48_1_AY236073')]
+    assert [row[0] for row in store.hits(gene='blaOXA-48', identity=95)] == ['first']
+    assert [row[3] for row in store.hits(sample='second')] == ['blaOXA_481_1_KX523901', 'blaOXA_48_1_AY236073']
+
+
+def test_replace_sample():
+    store.add_samples(run=store.add_run(program='blastn',
+                                        analysistype='resfinder',
+                                        parameters=dict()),
+                      results=[result('first', list())])
+    assert [row[0] for row in store.hits(gene='blaOXA-48')] == ['second']
+    assert store.connection.execute('SELECT COUNT(*) FROM samples').fetchone()[0] == 3
+
+
+def test_alleles():
+    store.add_samples(run=run,
+                      results=[result(name='first',
+                                      hits=list(),
+                                      alleles=[('adk', 'adk_1', 100.0), ('fumC', 'fumC_11', 100.0)],
+                                      analysistype='mlst')])
+    assert store.alleles(locus='adk') == [('first', 'mlst', 'blastn', 'adk', 'adk_1', 100.0)]
+    assert store.alleles(sample='first', analysistype='resfinder') == []
+    store.close()
+
+
+def test_kma_store():
+    v = MetadataObject()
+    v.sequencepath = os.path.join(datapath, 'sequences')
+    v.targetpath = os.path.join(datapath, 'databases', 'resfinder')
+    v.reportpath = reportpath
+    v.cutoff = 70
+    v.evalue = '1E-05'
+    v.align = False
+    v.unique = True
+    v.resfinder = True
+    v.virulencefinder = False
+    v.numthreads = multiprocessing.cpu_count()
+    v.kmer_size = 16
+    v.start = time()
+    v.analysistype = 'resfinder'
+    v.program = 'kma'
+    v.store = store_file
+    KMA(v).seekr()
+    with ResultStore(path=store_file) as results:
+        rows = results.hits(gene='blaOXA-427',
+                            program='kma')
+        assert [(row[0], row[3], row[4]) for row in rows] == [('2018-SEQ-0552', 'blaOXA_427_1_KX827604', 86.16)]
+        run_id = results.connection.execute('SELECT MAX(id) FROM runs').fetchone()[0]
+        assert results.parameters(run_id)['kmer_size'] == 16
+
+
+def test_readonly():
+    with ResultStore(path=store_file,
+                     readonly=True) as results:
+        assert [row[0] for row in results.hits(gene='blaOXA-427')] == ['2018-SEQ-0552']
+        try:
+            results.add_run(program='blastn',
+                            analysistype='resfinder',
+                            parameters=dict())
+            raise AssertionError('The read-only store was changed')
+        except sqlite3.OperationalError:
+            pass
+    # Read-only stores are never created
+    missing = os.path.join(reportpath, 'missing', 'results.sqlite')
+    try:
+        ResultStore(path=missing,
+                    readonly=True)
+        raise AssertionError('The missing store was opened')
+    except sqlite3.OperationalError:
+        pass
+    assert not os.path.isdir(os.path.dirname(missing))
+
+
+def test_query_command():
+    global env
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [os.path.dirname(test_path), env.get('PYTHONPATH')]))
+    command = [sys.executable, script, 'query', '-d', store_file, '-g', 'blaOXA-427', '-i', '80']
+    output = subprocess.run(command,
+                            stdout=subprocess.PIPE,
+                            universal_newlines=True,
+                            env=env,
+                            check=True).stdout.splitlines()
+    assert output[0].split('\t')[:5] == ['Sample', 'Analysis', 'Program', 'Gene', 'PercentIdentity']
+    assert output[1].split('\t')[0] == '2018-SEQ-0552'
+    names = subprocess.run(command[:-2] + ['-i', '90', '-n'],
+                           stdout=subprocess.PIPE,
+                           universal_newlines=True,
+                           env=env,
+                           check=True).stdout
+    assert names == ''
+
+
+def test_clean():
+    shutil.rmtree(reportpath)
+    targetpath = os.path.join(datapath, 'databases', 'resfinder')
+    os.remove(os.path.join(targetpath, 'combinedtargets.fasta'))
+    for index in glob(os.path.join(targetpath, 'combinedtargets.*.npz')):
+        os.remove(index)
+    for fai in glob(os.path.join(datapath, 'sequences', '*.fai')):
+        os.remove(fai)
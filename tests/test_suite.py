@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+from benchmarks.suite import benchmark, compare, dataset, protein_identity, scaling, targets, variant
+import random
+import shutil
+import os
+
+test_path = os.path.abspath(os.path.dirname(__file__))
+
+__author__ = 'adamkoziol'
+
+workdir = os.path.join(test_path, 'testdata', 'benchmark')
+
+
+def test_seeded_targets():
+    first = targets(count=5, seed=1)
+    second = targets(count=5, seed=1)
+    assert [gene.nucleotide for gene in first] == [gene.nucleotide for gene in second]
+    assert [gene.nucleotide for gene in targets(count=5, seed=2)] != [gene.nucleotide for gene in first]
+    for gene in first:
+        assert len(gene.nucleotide) == 3 * len(gene.protein)
+        assert gene.protein.startswith('M')
+
+
+def test_planted_identity():
+    gene = targets(count=1)[0]
+    planted, nucleotide_identity = variant(generator=random.Random(0),
+                                           gene=gene,
+                                           identity=90)
+    assert abs(protein_identity(gene=gene, planted=planted) - 90) < 1
+    assert 80 < nucleotide_identity < 100
+
+
+def test_dataset():
+    global truth
+    target_files, sample_files, truth = dataset(workdir=workdir,
+                                                target_count=10,
+                                                sample_count=2,
+                                                genome_size=10000,
+                                                planted=3)
+    assert sorted(truth) == ['sample_0000', 'sample_0001']
+    assert all(len(planted) == 3 for planted in truth.values())
+    assert [os.path.basename(sample_file) for sample_file in sample_files['nt']] == ['sample_0000.fasta',
+                                                                                     'sample_0001.fasta']
+    assert os.path.isfile(target_files['aa'])
+
+
+def test_dataset_reused():
+    _, _, reused = dataset(workdir=workdir,
+                           target_count=10,
+                           sample_count=1,
+                           genome_size=10000,
+                           planted=3)
+    assert reused == {'sample_0000': truth['sample_0000']}
+
+
+def test_benchmark_kma():
+    global report
+    report = benchmark(workdir=workdir,
+                       programs=['kma'],
+                       samples=[1, 2],
+                       targets=[10],
+                       genome_size=10000,
+                       planted=3,
+                       threads=1)
+    assert [(result['samples'], result['exit_code']) for result in report['results']] == [(1, 0), (2, 0)]
+    assert [result['recall'] for result in report['results']] == [1.0, 1.0]
+    assert report['results'][1]['planted'] == 6
+    assert report['results'][0]['peak_rss'] > 0
+    assert report['scaling']['samples'][0]['samples'] == [1, 2]
+
+
+def test_compare():
+    assert compare(results=report['results'],
+                   baseline=report) == []
+    faster = {'results': [dict(result, seconds=result['seconds'] / 2) for result in report['results']]}
+    regressions = compare(results=report['results'],
+                          baseline=faster)
+    assert len(regressions) == 2
+    assert 'seconds increased' in regressions[0]
+
+
+def test_shard_scaling():
+    results = [{'program': 'blastn', 'samples': 10, 'targets': 1000, 'shards': shards, 'seconds': seconds,
+                'recall': 1.0, 'unexpected': 0} for shards, seconds in [(1, 8.0), (2, 4.0), (4, 2.5)]]
+    curves = scaling(results)
+    assert [(curve['shards'], curve['speedup']) for curve in curves['shards']] == [(2, 2.0), (4, 3.2)]
+    assert all(curve['same_recall'] for curve in curves['shards'])
+    # Runs with different numbers of shards are not compared with each other
+    assert compare(results=results[1:],
+                   baseline={'results': results[:1]}) == []
+
+
+def test_clean():
+    shutil.rmtree(workdir)
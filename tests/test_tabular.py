@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+from geneseekr.tabular import TabularParser
+from io import StringIO
+import os
+
+test_path = os.path.abspath(os.path.dirname(__file__))
+
+__author__ = 'adamkoziol'
+
+fieldnames = ['query_id', 'subject_id', 'positives', 'mismatches', 'gaps', 'evalue', 'bit_score', 'subject_length',
+              'alignment_length', 'query_start', 'query_end', 'subject_start', 'subject_end', 'percent_match',
+              'query_sequence', 'subject_sequence']
+# Full-length hit, a partial hit (50% of the subject), and a full-length hit with a high e-value
+lines = ['contig1\tgeneA\t100\t0\t0\t1e-50\t185\t100\t100\t1\t100\t1\t100\tACGT\tACGT\n',
+         'contig1\tgeneB\t60\t0\t10\t1e-20\t90\t100\t60\t200\t259\t1\t60\tACGT\tACGT\n',
+         'contig2\tgeneC\t100\t0\t0\t0.5\t185\t100\t100\t1\t100\t1\t100\tACGT\tACGT\n']
+report = os.path.join(test_path, 'testdata', 'tabular.tsv')
+
+
+def test_header():
+    global parser
+    parser = TabularParser(fieldnames=fieldnames,
+                           program='blastn',
+                           cutoff=70,
+                           evalue='1E-05')
+    assert parser.header() == '\t'.join(fieldnames) + '\n'
+
+
+def test_percent_match():
+    assert parser.percent_match(positives=60, gaps=10, subject_length=100) == 50.0
+
+
+def test_percent_match_translated():
+    translated = TabularParser(fieldnames=fieldnames,
+                               program='tblastx',
+                               cutoff=70,
+                               evalue='1E-05')
+    assert translated.percent_match(positives=100, gaps=0, subject_length=300) == 100.0
+
+
+def test_row():
+    assert parser.row(lines[0])[13] == 100.0
+
+
+def test_row_cutoff():
+    assert parser.row(lines[1]) is None
+
+
+def test_row_evalue():
+    assert parser.row(lines[2]) is None
+
+
+def test_row_truncated():
+    assert parser.row('contig1\tgeneA\t100\n') is None
+
+
+def test_stream():
+    output = StringIO()
+    assert parser.stream(lines=iter(lines),
+                         outputs=[output]) == 1
+    assert output.getvalue() == 'contig1\tgeneA\t100\t0\t0\t1e-50\t185\t100\t100\t1\t100\t1\t100\t100.0\tACGT\tACGT\t\n'
+
+
+def test_annotate():
+    with open(report, 'w') as raw:
+        raw.write(''.join(lines))
+    assert not parser.is_parseable(report)
+    parser.annotate(report)
+    assert parser.is_parseable(report)
+    with open(report) as annotated:
+        assert len(annotated.readlines()) == 2
+
+
+def test_annotate_twice():
+    parser.annotate(report)
+    with open(report) as annotated:
+        assert len(annotated.readlines()) == 2
+
+
+def test_remove_report():
+    os.remove(report)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+from olctools.accessoryFunctions.accessoryFunctions import MetadataObject
+from geneseekr.timing import Profiler
+from geneseekr.blast import BLAST
+import multiprocessing
+from glob import glob
+from time import time
+import shutil
+import json
+import os
+
+test_path = os.path.abspath(os.path.dirname(__file__))
+
+__author__ = 'adamkoziol'
+
+datapath = os.path.join(test_path, 'testdata')
+
+
+def variables():
+    v = MetadataObject()
+    v.sequencepath = os.path.join(datapath, 'sequences')
+    v.targetpath = os.path.join(datapath, 'databases', 'resfinder')
+    v.reportpath = os.path.join(datapath, 'profile_reports')
+    v.cutoff = 70
+    v.evalue = '1E-05'
+    v.align = False
+    v.unique = True
+    v.resfinder = True
+    v.virulencefinder = False
+    v.numthreads = multiprocessing.cpu_count()
+    v.start = time()
+    v.analysistype = 'resfinder'
+    v.program = 'blastn'
+    v.profile = True
+    return v
+
+
+class Samples(object):
+
+    @staticmethod
+    def count(metadata, seen):
+        seen.append([sample.name for sample in metadata])
+        return metadata
+
+    @staticmethod
+    def total(metadata, seen):
+        seen.append([sample.name for sample in metadata])
+        return metadata
+
+
+def sample(name):
+    sample = MetadataObject()
+    sample.name = name
+    return sample
+
+
+def test_disabled():
+    profiler = Profiler(enabled=False)
+    with profiler.stage('stage'):
+        profiler.add(name='search',
+                     wall=1)
+    assert profiler.records == []
+
+
+def test_nested_stages():
+    global profiler
+    profiler = Profiler()
+    with profiler.stage('outer'):
+        with profiler.stage('inner'):
+            bytearray(1048576)
+        profiler.add(name='first',
+                     wall=0.5,
+                     sample='first')
+    assert [entry['stage'] for entry in profiler.records] == ['outer;inner', 'outer;first', 'outer']
+    inner = profiler.records[0]
+    assert inner['wall'] > 0
+    assert inner['peak_rss'] > 0
+    assert inner['sample'] is None
+
+
+def test_instrument():
+    global seen
+    seen = list()
+    samples = Samples()
+    profiler.instrument(obj=samples,
+                        stages=['count', 'total'],
+                        samples=['count'])
+    metadata = [sample('first'), sample('second')]
+    assert samples.count(metadata=metadata, seen=seen) is metadata
+    samples.total(metadata=metadata, seen=seen)
+    # Stages recorded sample by sample are called with one sample at a time
+    assert seen == [['first'], ['second'], ['first', 'second']]
+    stages = [entry['stage'] for entry in profiler.records[3:]]
+    assert stages == ['count;first', 'count;second', 'count', 'total']
+
+
+def test_report():
+    report = profiler.report()
+    assert set(report['samples']) == {'first', 'second'}
+    assert report['samples']['first']['outer'] == {'calls': 1, 'wall': 0.5}
+    assert report['samples']['second']['count']['calls'] == 1
+    assert report['stages']['count']['calls'] == 1
+    assert 'outer;first' not in report['stages']
+
+
+def test_folded():
+    folded = dict(line.rsplit(' ', 1) for line in profiler.folded())
+    # The own time of a stage does not include the time of the stages it contains
+    outer = [entry['wall'] for entry in profiler.records if entry['stage'] == 'outer'][0]
+    inner = [entry['wall'] for entry in profiler.records if entry['stage'] == 'outer;inner'][0]
+    assert int(folded['outer']) == int(max(outer - inner - 0.5, 0) * 1e6)
+    assert int(folded['outer;first']) == 500000
+
+
+def test_profile_blastn():
+    global var
+    var = variables()
+    method = BLAST(var)
+    assert method.profiler.enabled
+    method.seekr()
+    with open(os.path.join(var.reportpath, 'profile.json')) as profile:
+        report = json.load(profile)
+    for stage in ['combine_targets', 'blast_db;makeblastdb', 'run_blast', 'parseable_blast_outputs',
+                  'parse_results;unique_parse_blast', 'parse_results;filter_unique', 'create_reports;dict_initialise',
+                  'create_reports;resfinder_reporter']:
+        assert stage in report['stages']
+    for stage in ['run_blast', 'parse_results;unique_parse_blast', 'parse_results;filter_unique']:
+        assert stage in report['samples']['2018-SEQ-0552']
+    with open(os.path.join(var.reportpath, 'profile.folded')) as trace:
+        assert 'parse_results;unique_parse_blast;2018-SEQ-0552 ' in trace.read()
+
+
+def test_clean():
+    shutil.rmtree(var.reportpath)
+    os.remove(os.path.join(var.targetpath, 'combinedtargets.fasta'))
+    for dbfile in glob(os.path.join(var.targetpath, 'combinedtargets.n*')):
+        os.remove(dbfile)
+    for fai in glob(os.path.join(var.sequencepath, '*.fai')):
+        os.remove(fai)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+from olctools.accessoryFunctions.accessoryFunctions import GenObject, MetadataObject
+from geneseekr.translate import align_proteins, protein_alignment, translate
+from genemethods.geneseekr.geneseekr import GeneSeekr as Upstream
+from concurrent.futures import ProcessPoolExecutor
+from geneseekr.methods import GeneSeekr
+from Bio.Seq import Seq
+import random
+
+__author__ = 'adamkoziol'
+
+random.seed(12)
+subject = ''.join(random.choice('ACGT') for _ in range(600))
+# Query with two substitutions, and a three base deletion
+query = subject[:30] + 'T' + subject[31:300] + subject[303:450] + 'GGG' + subject[453:]
+
+
+def test_translate():
+    sequences = [subject, query, subject[1:], str(), 'ATGNNNTTYTAR', 'atgcc']
+    assert translate(sequences) == [str(Seq(sequence[:len(sequence) // 3 * 3]).translate()) for sequence in sequences]
+
+
+def test_translate_empty():
+    assert translate([str(), 'AT']) == [str(), str()]
+
+
+def test_protein_alignment():
+    aligned_query, aligned_subject = protein_alignment('MKVLAAGIWRTSE', 'MKVLGIWRTSE')
+    assert aligned_query == 'MKVLAAGIWRTSE'
+    assert aligned_subject == 'MKVL--GIWRTSE'
+
+
+def test_align_proteins_pool():
+    pairs = list(zip(translate([query, subject[3:]]), translate([subject, subject])))
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        assert align_proteins(pairs, executor=executor) == align_proteins(pairs)
+
+
+def test_snp_index():
+    index, matches = GeneSeekr.snp_index('ACGTACGTAC', 'ACTTACGTAA')
+    assert index == '3;10'
+    assert matches == 8
+
+
+def test_interleave():
+    assert GeneSeekr.interleaveblastresults(query, subject) == Upstream.interleaveblastresults(query, subject)
+
+
+def test_alignprotein():
+    sample = MetadataObject()
+    sample.name = '2018-SEQ-0552'
+    sample.analysis = GenObject()
+    for attribute in ['dnaseq', 'protseq', 'ntalign', 'ntindex', 'aaidentity', 'aaalign', 'aaindex']:
+        setattr(sample.analysis, attribute, dict())
+    hit = {
+        'query_sequence': query[:300] + '---' + query[300:],
+        'subject_sequence': subject,
+        'subject_start': '1',
+        'subject_end': '600'
+    }
+    method = GeneSeekr()
+    method.prepare_alignments(hits=[hit],
+                              program='blastn')
+    sample = method.alignprotein(sample=sample,
+                                 analysistype='analysis',
+                                 target='gene',
+                                 program='blastn',
+                                 index=0,
+                                 hit=hit)
+    assert str(sample.analysis.protseq['gene'][0]).startswith(str(Seq(subject[:30]).translate()))
+    assert 0 < sample.analysis.aaidentity['gene'][0] < 100
+    assert sample.analysis.aaindex['gene'][0] != '-'
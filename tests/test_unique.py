@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+from olctools.accessoryFunctions.accessoryFunctions import GenObject, MetadataObject
+from genemethods.geneseekr.geneseekr import GeneSeekr as LegacyGeneSeekr
+from geneseekr.intervals import IntervalIndex, RangeIndex
+from geneseekr.methods import GeneSeekr
+from geneseekr.hits import HitTable
+import random
+import pickle
+import json
+import os
+
+test_path = os.path.abspath(os.path.dirname(__file__))
+
+__author__ = 'adamkoziol'
+
+fieldnames = ['query_id', 'subject_id', 'positives', 'mismatches', 'gaps', 'evalue', 'bit_score', 'subject_length',
+              'alignment_length', 'query_start', 'query_end', 'subject_start', 'subject_end', 'percent_match',
+              'query_sequence', 'subject_sequence']
+report = os.path.join(test_path, 'testdata', 'unique.tsv')
+
+
+def method_init(methods):
+    sample = MetadataObject()
+    sample.name = 'unique'
+    sample.general = GenObject()
+    setattr(sample, 'resfinder', GenObject())
+    sample.resfinder.report = report
+    metadata = methods.unique_parse_blast(metadata=[sample],
+                                          analysistype='resfinder',
+                                          fieldnames=fieldnames,
+                                          cutoff=90,
+                                          program='blastn')
+    return methods.filter_unique(metadata=metadata,
+                                 analysistype='resfinder')[0]
+
+
+def test_range_index_extend():
+    ranges = [[2494, 3296]]
+    index = RangeIndex(ranges=ranges)
+    assert not index.add(2493, 3293)
+    assert ranges == [[2493, 3296]]
+
+
+def test_range_index_append():
+    ranges = [[2493, 3296]]
+    index = RangeIndex(ranges=ranges)
+    assert index.add(3296, 4132)
+    assert ranges == [[2493, 3296], [3296, 4132]]
+
+
+def test_range_index_duplicate():
+    ranges = [[2493, 3296]]
+    index = RangeIndex(ranges=ranges)
+    assert not index.add(2493, 3296)
+    assert ranges == [[2493, 3296]]
+
+
+def test_interval_index_back_to_back():
+    index = IntervalIndex(intervals=[(2557, 3393), (3393, 4196), (100, 200)])
+    assert index.overlaps(2557, 3393) == [0]
+    assert index.overlaps(150, 3000) == [0, 2]
+
+
+def test_interval_index_empty():
+    index = IntervalIndex(intervals=[(5, 5), (1, 10)])
+    assert index.overlaps(4, 6) == [1]
+    assert index.overlaps(6, 6) == []
+
+
+def test_synthetic_report():
+    # Overlapping hits to several alleles of each locus, on two contigs, in both orientations
+    generator = random.Random(1)
+    with open(report, 'w') as blast_report:
+        blast_report.write('\t'.join(fieldnames) + '\n')
+        for number in range(400):
+            locus = generator.randint(0, 60)
+            length = generator.randint(300, 1500)
+            start = locus * 800 + generator.randint(0, 150)
+            end = start + length - generator.randint(0, 150)
+            positives = length - generator.randint(0, 100)
+            values = ['contig_{contig}'.format(contig=number % 2), 'locus{locus}_{allele}'
+                      .format(locus=locus, allele=generator.randint(0, 5)), positives, 0, generator.randint(0, 2),
+                      '0.0', positives * 2, length, end - start, start, end, 1, end - start, 0, 'ACGT', 'ACGT']
+            if generator.random() < 0.5:
+                values[9], values[10] = end, start
+                values[11], values[12] = values[12], values[11]
+            blast_report.write('\t'.join(str(value) for value in values) + '\t\n')
+
+
+def test_unique_matches_legacy():
+    sample = method_init(GeneSeekr)
+    legacy = method_init(LegacyGeneSeekr)
+    assert sample.resfinder.queryranges == legacy.resfinder.queryranges
+    assert sample.resfinder.targetsequence == legacy.resfinder.targetsequence
+    assert sample.resfinder.blastresults == legacy.resfinder.blastresults
+    assert sample.resfinder.blastlist == \
+        [{key: row[key] for key in HitTable.fieldnames} for row in legacy.resfinder.blastlist]
+
+
+def test_blastlist_interface():
+    # The blastlist is a list of dictionaries, as it is in genemethods, so it can be modified, and serialised
+    blastlist = method_init(GeneSeekr).resfinder.blastlist
+    assert isinstance(blastlist, list)
+    assert all(isinstance(hit, dict) for hit in blastlist)
+    assert json.loads(json.dumps(blastlist)) == blastlist
+    assert pickle.loads(pickle.dumps(blastlist)) == blastlist
+    blastlist[0]['percent_match'] = 0.0
+    blastlist.append(dict(blastlist[0]))
+    assert blastlist[-1]['percent_match'] == 0.0
+
+
+def test_remove_report():
+    os.remove(report)
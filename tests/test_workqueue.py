@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+from olctools.accessoryFunctions.accessoryFunctions import MetadataObject
+from geneseekr.workqueue import WorkQueue, Worker
+from geneseekr.blast import BLAST
+import multiprocessing
+import subprocess
+from glob import glob
+from time import time
+import pytest
+import shutil
+import sys
+import os
+
+test_path = os.path.abspath(os.path.dirname(__file__))
+
+__author__ = 'adamkoziol'
+
+datapath = os.path.join(test_path, 'testdata')
+queuepath = os.path.join(datapath, 'queue')
+script = os.path.join(os.path.dirname(test_path), 'geneseekr', 'GeneSeekr')
+
+
+def variables():
+    v = MetadataObject()
+    v.sequencepath = os.path.join(datapath, 'sequences')
+    v.targetpath = os.path.join(datapath, 'databases', 'resfinder')
+    v.reportpath = os.path.join(datapath, 'queue_reports')
+    v.cutoff = 70
+    v.evalue = '1E-05'
+    v.align = False
+    v.unique = True
+    v.resfinder = False
+    v.virulencefinder = False
+    v.numthreads = multiprocessing.cpu_count()
+    v.start = time()
+    v.analysistype = 'resfinder'
+    v.program = 'blastn'
+    return v
+
+
+def age(state, name):
+    # Make the heartbeat of a claimed item look old
+    os.utime(queue.path(state, name), (0, 0))
+
+
+def test_queue_init():
+    global queue
+    queue = WorkQueue(queuepath=queuepath,
+                      timeout=60,
+                      attempts=2)
+    for state in WorkQueue.states:
+        assert os.path.isdir(os.path.join(queuepath, state))
+
+
+def test_put_claim_complete():
+    name = queue.put(item={'value': 1},
+                     prefix='sample')
+    assert name.startswith('sample_')
+    claimed_name, item = queue.claim(worker='first')
+    assert claimed_name == name
+    assert item == {'value': 1, 'attempts': 1, 'worker': 'first'}
+    assert queue.claim(worker='second') is None
+    item['result'] = 2
+    queue.complete(name=name,
+                   item=item)
+    assert queue.finished([name]) == {name: (True, item)}
+    queue.remove([name])
+    assert not os.listdir(os.path.join(queuepath, 'done'))
+
+
+def test_single_claim():
+    # Two queue objects (e.g. on different nodes) claim the same item
+    name = queue.put(item={'value': 1})
+    other = WorkQueue(queuepath=queuepath)
+    claims = [queue.claim(worker='first'), other.claim(worker='second')]
+    assert [claim[0] for claim in claims if claim] == [name]
+    queue.complete(name=name,
+                   item=claims[0][1])
+    queue.remove([name])
+
+
+def test_requeue_dead_worker():
+    global stale
+    stale = queue.put(item={'value': 1})
+    queue.claim(worker='dead')
+    age('claimed', stale)
+    name, item = queue.claim(worker='alive')
+    assert name == stale
+    assert item['attempts'] == 2
+    assert item['worker'] == 'alive'
+
+
+def test_complete_requeued():
+    # The item is re-queued while its worker is still running, so the late completion is ignored
+    age('claimed', stale)
+    with queue.lock():
+        assert queue.requeue() == 1
+    queue.complete(name=stale,
+                   item={'value': 1})
+    assert queue.finished([stale]) == {}
+
+
+def test_attempts_fail():
+    assert queue.claim(worker='third') is None
+    success, item = queue.finished([stale])[stale]
+    assert not success
+    assert item['attempts'] == 3
+    queue.remove([stale])
+
+
+def test_worker():
+    names = [queue.put(item={'value': value}) for value in range(3)]
+    worker = Worker(queue=queue,
+                    function=lambda item: item['value'] != 1,
+                    idle=0.1,
+                    interval=0.1)
+    assert worker.run() == 3
+    finished = queue.wait(names=names,
+                          interval=0.1)
+    assert [finished[name][0] for name in names] == [True, False, True]
+    assert all(finished[name][1]['worker'] == worker.name for name in names)
+    queue.remove(names)
+
+
+def test_worker_exception():
+    def function(item):
+        raise ValueError(item['value'])
+    name = queue.put(item={'value': 1})
+    Worker(queue=queue,
+           function=function,
+           idle=0.1,
+           interval=0.1).run()
+    success, item = queue.wait(names=[name],
+                               interval=0.1)[name]
+    assert not success
+    assert 'seconds' in item
+    queue.remove([name])
+
+
+def test_wait_timeout():
+    # Without workers, the items are never completed
+    name = queue.put(item={'value': 1})
+    with pytest.raises(TimeoutError):
+        queue.wait(names=[name],
+                   interval=0.1,
+                   max_wait=0.2)
+    # Pending items are withdrawn, so they are not run once a worker starts
+    queue.remove([name])
+    assert queue.claim(worker='late') is None
+
+
+def test_worker_rejects_commands():
+    # Work items that carry a command line rather than the parameters of a search are never run
+    marker = os.path.join(queuepath, 'marker')
+    name = queue.put(item={'name': 'rogue',
+                           'command': 'touch {marker}'.format(marker=marker),
+                           'reports': list(),
+                           'exacthits': list(),
+                           'tags': None,
+                           'stdin': None,
+                           'parser': dict()})
+    Worker(queue=queue,
+           function=BLAST.run_item,
+           idle=0.1,
+           interval=0.1).run()
+    success, item = queue.wait(names=[name],
+                               interval=0.1)[name]
+    assert not success
+    assert not os.path.isfile(marker)
+    queue.remove([name])
+
+
+def test_search_commandline():
+    search = {'program': 'blastn',
+              'query': 'query.fasta',
+              'db': 'combinedtargets',
+              'settings': {'evalue': '1E-05', 'num_alignments': 10, 'perc_identity': 70, 'task': 'blastn'},
+              'threads': 2,
+              'dbsize': 5000}
+    blast = str(BLAST.search_commandline(search))
+    assert blast.startswith('blastn ')
+    assert ' -dbsize 5000 ' in blast
+    # Values that are not those of a search are rejected before a command is created
+    for key, value in [('program', 'rm'), ('db', '-remote'), ('threads', '2; rm -rf /'), ('dbsize', -1)]:
+        with pytest.raises(AssertionError):
+            BLAST.search_commandline(dict(search, **{key: value}))
+    with pytest.raises(ValueError):
+        BLAST.search_commandline(dict(search, settings=dict(search['settings'], evalue='1E-05; rm -rf /')))
+    with pytest.raises(AssertionError):
+        BLAST.search_commandline(dict(search, command='rm -rf /'))
+
+
+def test_local_blastn():
+    global local_report, var
+    var = variables()
+    method = BLAST(var)
+    method.blast_db()
+    method.run_blast()
+    report = method.metadata[0].resfinder.report
+    with open(report) as blast_report:
+        local_report = blast_report.read()
+    shutil.rmtree(var.reportpath)
+    assert local_report.startswith('query_id\t')
+
+
+def test_distributed_blastn():
+    var.queue = queuepath
+    method = BLAST(var)
+    assert method.queuepath == queuepath
+    method.blast_db()
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [os.path.dirname(test_path), env.get('PYTHONPATH')]))
+    workers = [subprocess.Popen([sys.executable, script, 'worker', '-q', queuepath, '-i', '10'],
+                                stdout=subprocess.DEVNULL,
+                                stderr=subprocess.DEVNULL,
+                                env=env)
+               for _ in range(2)]
+    try:
+        method.run_blast()
+    finally:
+        for worker in workers:
+            worker.wait()
+    sample = method.metadata[0]
+    with open(sample.resfinder.report) as blast_report:
+        assert blast_report.read() == local_report
+    assert sample.resfinder.blasttime >= 0
+    # The completed items are removed from the queue
+    for state in WorkQueue.states:
+        assert not os.listdir(os.path.join(queuepath, state))
+
+
+def test_distributed_timeout():
+    # The searches are not run again unless the reports are missing
+    shutil.rmtree(var.reportpath)
+    var.timeout = 1
+    method = BLAST(var)
+    method.blast_db()
+    with pytest.raises(TimeoutError):
+        method.run_blast()
+    # The searches are withdrawn from the queue
+    for state in WorkQueue.states:
+        assert not os.listdir(os.path.join(queuepath, state))
+
+
+def test_clean():
+    shutil.rmtree(queuepath)
+    shutil.rmtree(var.reportpath)
+    os.remove(os.path.join(var.targetpath, 'combinedtargets.fasta'))
+    for dbfile in glob(os.path.join(var.targetpath, 'combinedtargets.n*')):
+        os.remove(dbfile)
+    for fai in glob(os.path.join(var.sequencepath, '*.fai')):
+        os.remove(fai)